@@ -0,0 +1,138 @@
+"""partition_usage_logs_by_month
+
+将 usage_logs 改为按 created_at 月度范围分区的声明式分区表：
+- 主键改为 (id, created_at)（分区表主键必须包含分区键），id 继续使用原序列
+- 按现有数据范围创建月度分区，并额外创建未来 2 个月的分区；另建 DEFAULT 分区兜底
+- 原表数据整体复制后删除
+- 新增 (user_id, config_type, created_at) 复合索引，供按渠道保留上限的批量清理使用
+
+之后由 UsageLogRetentionJob 定期预建分区、DROP 过期分区并批量执行每渠道条数上限。
+
+Revision ID: 3f9a7c1e5b2d
+Revises: b2c3d4e5f6a7
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "3f9a7c1e5b2d"
+down_revision: Union[str, None] = "b2c3d4e5f6a7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+_COLUMNS = """
+    id INTEGER NOT NULL DEFAULT nextval('usage_logs_id_seq'::regclass),
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    api_key_id INTEGER REFERENCES api_keys(id) ON DELETE SET NULL,
+    endpoint VARCHAR(255) NOT NULL,
+    method VARCHAR(10) NOT NULL,
+    model_name VARCHAR(100),
+    config_type VARCHAR(20),
+    stream BOOLEAN NOT NULL DEFAULT false,
+    quota_consumed DOUBLE PRECISION NOT NULL,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    total_tokens INTEGER NOT NULL DEFAULT 0,
+    success BOOLEAN NOT NULL DEFAULT true,
+    status_code INTEGER,
+    error_message TEXT,
+    tts_voice_id VARCHAR(128),
+    tts_account_id VARCHAR(128),
+    duration_ms INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+"""
+
+_COLUMN_NAMES = (
+    "id, user_id, api_key_id, endpoint, method, model_name, config_type, stream, "
+    "quota_consumed, input_tokens, output_tokens, total_tokens, success, status_code, "
+    "error_message, tts_voice_id, tts_account_id, duration_ms, created_at"
+)
+
+_INDEXES = (
+    ("ix_usage_logs_id", ["id"]),
+    ("ix_usage_logs_user_id", ["user_id"]),
+    ("ix_usage_logs_created_at", ["created_at"]),
+    ("ix_usage_logs_config_type", ["config_type"]),
+    ("ix_usage_logs_success", ["success"]),
+    ("ix_usage_logs_endpoint", ["endpoint"]),
+)
+
+
+def upgrade() -> None:
+    # 1. 原表改名（索引名随之改名，避免与新表冲突）
+    op.rename_table("usage_logs", "usage_logs_legacy")
+    op.execute("ALTER TABLE usage_logs_legacy RENAME CONSTRAINT usage_logs_pkey TO usage_logs_legacy_pkey")
+    for name, _ in _INDEXES:
+        op.execute(f"ALTER INDEX IF EXISTS {name} RENAME TO {name.replace('usage_logs', 'usage_logs_legacy')}")
+
+    # 2. 新建分区父表（沿用原 id 序列）
+    op.execute(
+        f"CREATE TABLE usage_logs ({_COLUMNS}, PRIMARY KEY (id, created_at)) PARTITION BY RANGE (created_at)"
+    )
+    op.execute("ALTER SEQUENCE usage_logs_id_seq OWNED BY usage_logs.id")
+
+    for name, columns in _INDEXES:
+        op.create_index(name, "usage_logs", columns, unique=False)
+    op.create_index(
+        "ix_usage_logs_user_config_created",
+        "usage_logs",
+        ["user_id", "config_type", "created_at"],
+        unique=False,
+    )
+
+    # 3. 月度分区：覆盖已有数据范围，并预建未来 2 个月
+    op.execute(
+        """
+        DO $$
+        DECLARE
+            start_month date;
+            end_month date := (date_trunc('month', now()) + interval '3 month')::date;
+            m date;
+        BEGIN
+            SELECT COALESCE(date_trunc('month', min(created_at))::date, date_trunc('month', now())::date)
+              INTO start_month
+              FROM usage_logs_legacy;
+            m := start_month;
+            WHILE m < end_month LOOP
+                EXECUTE format(
+                    'CREATE TABLE IF NOT EXISTS %I PARTITION OF usage_logs FOR VALUES FROM (%L) TO (%L)',
+                    'usage_logs_p' || to_char(m, 'YYYYMM'),
+                    m,
+                    (m + interval '1 month')::date
+                );
+                m := (m + interval '1 month')::date;
+            END LOOP;
+        END $$;
+        """
+    )
+    op.execute("CREATE TABLE usage_logs_default PARTITION OF usage_logs DEFAULT")
+
+    # 4. 迁移数据并删除原表
+    op.execute(f"INSERT INTO usage_logs ({_COLUMN_NAMES}) SELECT {_COLUMN_NAMES} FROM usage_logs_legacy")
+    op.drop_table("usage_logs_legacy")
+
+
+def downgrade() -> None:
+    op.rename_table("usage_logs", "usage_logs_partitioned")
+    op.execute(
+        "ALTER TABLE usage_logs_partitioned RENAME CONSTRAINT usage_logs_pkey TO usage_logs_partitioned_pkey"
+    )
+    for name, _ in _INDEXES:
+        op.execute(f"ALTER INDEX IF EXISTS {name} RENAME TO {name.replace('usage_logs', 'usage_logs_partitioned')}")
+    op.drop_index("ix_usage_logs_user_config_created", table_name="usage_logs_partitioned")
+
+    op.execute(f"CREATE TABLE usage_logs ({_COLUMNS}, CONSTRAINT usage_logs_pkey PRIMARY KEY (id))")
+    op.execute("ALTER SEQUENCE usage_logs_id_seq OWNED BY usage_logs.id")
+    for name, columns in _INDEXES:
+        op.create_index(name, "usage_logs", columns, unique=False)
+
+    op.execute(
+        f"INSERT INTO usage_logs ({_COLUMN_NAMES}) SELECT {_COLUMN_NAMES} FROM usage_logs_partitioned"
+    )
+    # 分区随父表一并删除
+    op.execute("DROP TABLE usage_logs_partitioned CASCADE")
@@ -0,0 +1,80 @@
+"""add_usage_rollups_hourly
+
+新增 usage_rollups_hourly 小时汇总表，并由现有 usage_logs 回填：
+- 主键为汇总维度 (user_id, hour, api_key_id, config_type, model_name, endpoint)
+- 维度列中的 NULL 以哨兵值（0 / 空串）存储，以便 ON CONFLICT 增量累加
+- 之后由 usage_log 批量写入器在同一事务内维护
+
+Revision ID: 5d8e2a4c6b1f
+Revises: 3f9a7c1e5b2d
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "5d8e2a4c6b1f"
+down_revision: Union[str, None] = "3f9a7c1e5b2d"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "usage_rollups_hourly",
+        sa.Column(
+            "user_id",
+            sa.Integer(),
+            sa.ForeignKey("users.id", ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.Column("hour", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("api_key_id", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("config_type", sa.String(length=20), nullable=False, server_default=""),
+        sa.Column("model_name", sa.String(length=100), nullable=False, server_default=""),
+        sa.Column("endpoint", sa.String(length=255), nullable=False),
+        sa.Column("request_count", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("success_count", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("input_tokens", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("output_tokens", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("total_tokens", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("quota_consumed", sa.Float(), nullable=False, server_default="0"),
+        sa.Column("duration_ms_sum", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.PrimaryKeyConstraint(
+            "user_id", "hour", "api_key_id", "config_type", "model_name", "endpoint",
+            name="usage_rollups_hourly_pkey",
+        ),
+    )
+
+    op.execute(
+        """
+        INSERT INTO usage_rollups_hourly (
+            user_id, hour, api_key_id, config_type, model_name, endpoint,
+            request_count, success_count, input_tokens, output_tokens, total_tokens,
+            quota_consumed, duration_ms_sum
+        )
+        SELECT
+            user_id,
+            date_trunc('hour', created_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+            COALESCE(api_key_id, 0),
+            COALESCE(config_type, ''),
+            COALESCE(model_name, ''),
+            endpoint,
+            count(*),
+            sum(CASE WHEN success THEN 1 ELSE 0 END),
+            sum(input_tokens),
+            sum(output_tokens),
+            sum(total_tokens),
+            sum(quota_consumed),
+            sum(duration_ms)
+        FROM usage_logs
+        GROUP BY 1, 2, 3, 4, 5, 6
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("usage_rollups_hourly")
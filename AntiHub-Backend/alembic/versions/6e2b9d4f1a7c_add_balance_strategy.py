@@ -0,0 +1,42 @@
+"""add_balance_strategy
+
+users / api_keys 新增 balance_strategy：多账号负载均衡策略
+（fill-first / round-robin / least-in-flight / weighted-quota）。
+API key 上的设置优先；都为 NULL 时沿用 fill-first。
+
+Revision ID: 6e2b9d4f1a7c
+Revises: 8b4f1d7e9c3a
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "6e2b9d4f1a7c"
+down_revision: Union[str, None] = "8b4f1d7e9c3a"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "users",
+        sa.Column("balance_strategy", sa.String(length=32), nullable=True, comment="多账号负载均衡策略"),
+    )
+    op.add_column(
+        "api_keys",
+        sa.Column(
+            "balance_strategy",
+            sa.String(length=32),
+            nullable=True,
+            comment="多账号负载均衡策略；NULL=跟随用户设置",
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("api_keys", "balance_strategy")
+    op.drop_column("users", "balance_strategy")
@@ -0,0 +1,32 @@
+"""add_usage_logs_keyset_index
+
+新增 usage_logs (user_id, created_at, id) 复合索引，
+供按 (created_at, id) 的游标分页与流式导出按序扫描使用。
+
+Revision ID: 8b4f1d7e9c3a
+Revises: 5d8e2a4c6b1f
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = "8b4f1d7e9c3a"
+down_revision: Union[str, None] = "5d8e2a4c6b1f"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_usage_logs_user_created_id",
+        "usage_logs",
+        ["user_id", "created_at", "id"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_usage_logs_user_created_id", table_name="usage_logs")
@@ -9,8 +9,8 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.session import get_db
-from app.cache import get_redis_client, RedisClient
-from app.services.auth_service import AuthService
+from app.cache import get_redis_client, get_auth_cache, RedisClient
+from app.services.auth_service import AuthService, user_from_cache, user_to_cache
 from app.services.user_service import UserService
 from app.services.plugin_api_service import PluginAPIService
 from app.models.user import User
@@ -35,6 +35,7 @@ async def update_api_key_last_used_background(api_key: str):
     后台任务：更新 API key 最后使用时间
     
     优化：使用 Redis 限流，避免频繁写入数据库
+    （调用方已先经过进程内节流，见 AuthCache.should_touch_last_used）
     """
     try:
         # 1. 检查 Redis 限流
@@ -62,6 +63,101 @@ async def update_api_key_last_used_background(api_key: str):
         logger.warning(f"后台更新 API key 使用时间失败: {e}")
 
 
+async def authenticate_api_key(
+    api_key: str,
+    db: AsyncSession,
+    background_tasks: BackgroundTasks
+) -> User:
+    """
+    通过 API key 认证用户
+    
+    优化策略：
+    1. 优先从进程内 L1 缓存获取（无网络往返），其次 Redis
+    2. 缓存未命中时查询数据库，并写入两级缓存（60秒）
+    3. 禁用/删除/修改类型时通过 pub/sub 失效各 worker 的 L1
+    4. last_used 先经进程内节流，再交给后台任务更新
+    
+    Args:
+        api_key: API 密钥
+        db: 数据库会话
+        background_tasks: 后台任务
+        
+    Returns:
+        User: 用户对象（附带 _config_type / _api_key_id / _balance_strategy）
+        
+    Raises:
+        HTTPException: 认证失败
+    """
+    auth_cache = get_auth_cache()
+    
+    # 1. 尝试从缓存获取
+    cached_data = await auth_cache.get_api_key(api_key)
+    if cached_data:
+        logger.debug(f"从缓存获取 API key 认证结果: {api_key[:10]}...")
+        user = user_from_cache(cached_data)
+        user._config_type = cached_data.get("_config_type")
+        user._api_key_id = cached_data.get("_api_key_id")
+        user._balance_strategy = cached_data.get("_balance_strategy")
+    else:
+        # 2. 缓存未命中，查询数据库
+        repo = APIKeyRepository(db)
+        key_record = await repo.get_by_key(api_key)
+        
+        if not key_record:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="无效的API密钥",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        
+        if not key_record.is_active:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="API密钥已被禁用",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        
+        # 获取用户
+        user_repo = UserRepository(db)
+        user = await user_repo.get_by_id(key_record.user_id)
+        
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="用户不存在"
+            )
+        
+        if not user.is_active:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="用户账号已被禁用"
+            )
+        
+        # 将config_type附加到user对象上，供路由使用
+        user._config_type = key_record.config_type
+        user._api_key_id = key_record.id
+        user._balance_strategy = key_record.balance_strategy
+        
+        # 3. 存入缓存 - 包含所有必需字段
+        await auth_cache.set_api_key(
+            api_key,
+            user_to_cache(
+                user,
+                _config_type=key_record.config_type,
+                _api_key_id=key_record.id,
+                _balance_strategy=key_record.balance_strategy,
+            ),
+            expire=API_KEY_AUTH_CACHE_TTL,
+        )
+        logger.debug(f"API key 认证结果已缓存: {api_key[:10]}..., TTL={API_KEY_AUTH_CACHE_TTL}s")
+    
+    # 4. 后台更新 last_used（不阻塞）
+    if auth_cache.should_touch_last_used(api_key):
+        background_tasks.add_task(update_api_key_last_used_background, api_key)
+    
+    return user
+
+
 # HTTP Bearer 认证方案
 security = HTTPBearer()
 
@@ -232,7 +328,7 @@ async def get_user_from_api_key(
     用于OpenAI兼容的API端点
     
     优化：
-    1. 使用 Redis 缓存认证结果
+    1. 使用进程内 L1 + Redis 两级缓存认证结果
     2. update_last_used 改为后台任务
     
     Args:
@@ -248,101 +344,7 @@ async def get_user_from_api_key(
         HTTPException: 认证失败时抛出 401 错误
     """
     try:
-        # 提取API key
-        api_key = credentials.credentials
-        
-        cache_key = f"api_key_auth:{api_key}"
-        
-        # 1. 尝试从 Redis 缓存获取
-        try:
-            cached_data = await redis.get_json(cache_key)
-            if cached_data:
-                logger.debug(f"从缓存获取 API key 认证结果: {api_key[:10]}...")
-                # 从缓存重建完整的 User 对象
-                from datetime import datetime
-                user = User(
-                    id=cached_data["id"],
-                    username=cached_data["username"],
-                    is_active=cached_data["is_active"],
-                    beta=cached_data.get("beta", 0),
-                    trust_level=cached_data.get("trust_level", 0),
-                    is_silenced=cached_data.get("is_silenced", False),
-                    created_at=datetime.fromisoformat(cached_data["created_at"]) if cached_data.get("created_at") else datetime.utcnow(),
-                    avatar_url=cached_data.get("avatar_url"),
-                    last_login_at=datetime.fromisoformat(cached_data["last_login_at"]) if cached_data.get("last_login_at") else None
-                )
-                user._config_type = cached_data.get("_config_type")
-                user._api_key_id = cached_data.get("_api_key_id")
-                
-                # 后台更新 last_used（不阻塞）
-                background_tasks.add_task(update_api_key_last_used_background, api_key)
-                
-                return user
-        except Exception as e:
-            logger.warning(f"Redis 缓存读取失败: {e}")
-        
-        # 2. 缓存未命中，查询数据库
-        repo = APIKeyRepository(db)
-        key_record = await repo.get_by_key(api_key)
-        
-        if not key_record:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="无效的API密钥",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        
-        if not key_record.is_active:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="API密钥已被禁用",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        
-        # 获取用户
-        user_repo = UserRepository(db)
-        user = await user_repo.get_by_id(key_record.user_id)
-        
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="用户不存在"
-            )
-        
-        if not user.is_active:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="用户账号已被禁用"
-            )
-        
-        # 将config_type附加到user对象上，供路由使用
-        user._config_type = key_record.config_type
-        user._api_key_id = key_record.id
-        
-        # 3. 存入缓存 - 包含所有必需字段
-        try:
-            user_data = {
-                "id": user.id,
-                "username": user.username,
-                "is_active": user.is_active,
-                "beta": user.beta,
-                "trust_level": user.trust_level,
-                "is_silenced": user.is_silenced,
-                "created_at": user.created_at.isoformat() if user.created_at else None,
-                "avatar_url": user.avatar_url,
-                "last_login_at": user.last_login_at.isoformat() if user.last_login_at else None,
-                "_config_type": key_record.config_type,
-                "_api_key_id": key_record.id,
-            }
-            await redis.set_json(cache_key, user_data, expire=API_KEY_AUTH_CACHE_TTL)
-            logger.debug(f"API key 认证结果已缓存: {api_key[:10]}..., TTL={API_KEY_AUTH_CACHE_TTL}s")
-        except Exception as e:
-            logger.warning(f"Redis 缓存写入失败: {e}")
-        
-        # 4. 后台更新 last_used
-        background_tasks.add_task(update_api_key_last_used_background, api_key)
-        
-        return user
+        return await authenticate_api_key(credentials.credentials, db, background_tasks)
         
     except HTTPException:
         raise
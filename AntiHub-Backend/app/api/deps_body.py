@@ -0,0 +1,113 @@
+"""
+请求体解析依赖（原始 JSON 快速路径）
+
+/v1/chat/completions 的请求体若声明为 ChatCompletionRequest，FastAPI 会先把整棵 JSON 校验为模型，
+路由里再 model_dump() 还原成 dict 交给下游：携带大段历史 / base64 图片的请求要多走两遍完整的树遍历与复制。
+
+开启 RAW_BODY_FAST_PATH_ENABLED 后，这里只解析一次原始 JSON（jsonx），只检查路由与下游依赖的顶层字段
+（model / messages / stream / temperature / max_tokens / tools），类型规范时补齐模型默认值后直接返回解析出的 dict；
+任何不规范的输入都退回完整的模型校验，结果与错误格式（422）和 FastAPI 自动校验一致。
+"""
+from typing import Any, Dict
+
+from fastapi import Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+
+from app.core.config import get_settings
+from app.schemas.plugin_api import ChatCompletionRequest
+from app.utils import jsonx
+
+# 模型中带默认值的字段（stream / temperature / max_tokens / tools），快速路径按同样的默认值补齐
+_CHAT_COMPLETION_DEFAULTS: Dict[str, Any] = {
+    name: field.default for name, field in ChatCompletionRequest.model_fields.items() if not field.is_required()
+}
+
+
+async def read_json_body(raw_request: Request) -> Any:
+    """读取并解析 JSON 请求体；解析失败时抛出与 FastAPI 一致的 RequestValidationError"""
+    body = await raw_request.body()
+    if not body:
+        raise RequestValidationError([{"type": "missing", "loc": ("body",), "msg": "Field required", "input": None}])
+    try:
+        return jsonx.loads(body)
+    except jsonx.JSONDecodeError as e:
+        raise RequestValidationError(
+            [
+                {
+                    "type": "json_invalid",
+                    "loc": ("body", e.pos),
+                    "msg": "JSON decode error",
+                    "input": {},
+                    "ctx": {"error": e.msg},
+                }
+            ],
+            body=e.doc,
+        ) from e
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _fast_chat_completion_data(data: Any) -> Any:
+    """
+    顶层字段类型都规范时返回补齐默认值后的 data（与 model_dump() 结果相等），否则返回 None
+
+    只接受 JSON 解析可能产生的规范类型；需要 Pydantic 宽松转换（如 "true" -> True）的输入一律返回 None。
+    """
+    if not isinstance(data, dict):
+        return None
+    if type(data.get("model")) is not str:
+        return None
+    messages = data.get("messages")
+    if type(messages) is not list or not all(type(m) is dict for m in messages):
+        return None
+
+    for name, default in _CHAT_COMPLETION_DEFAULTS.items():
+        if name not in data:
+            data[name] = default
+
+    if type(data["stream"]) is not bool:
+        return None
+    temperature = data["temperature"]
+    if temperature is not None:
+        if not _is_number(temperature):
+            return None
+        data["temperature"] = float(temperature)
+    max_tokens = data["max_tokens"]
+    if max_tokens is not None and type(max_tokens) is not int:
+        return None
+    tools = data["tools"]
+    if tools is not None and (type(tools) is not list or not all(type(t) is dict for t in tools)):
+        return None
+    return data
+
+
+def parse_chat_completion_request(data: Any, *, fast_path: bool) -> Dict[str, Any]:
+    """
+    把解析后的请求体转换为下游使用的 dict（等价于 ChatCompletionRequest.model_validate(data).model_dump()）
+
+    Raises:
+        RequestValidationError: 请求体不符合 ChatCompletionRequest
+    """
+    if fast_path:
+        fast = _fast_chat_completion_data(data)
+        if fast is not None:
+            return fast
+    try:
+        return ChatCompletionRequest.model_validate(data).model_dump()
+    except ValidationError as e:
+        errors = [{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)]
+        raise RequestValidationError(errors, body=data) from e
+
+
+async def get_chat_completion_request_data(raw_request: Request) -> Dict[str, Any]:
+    """
+    /v1/chat/completions 请求体依赖
+
+    Returns:
+        Dict[str, Any]: 请求体 dict（字段与 ChatCompletionRequest.model_dump() 一致）
+    """
+    data = await read_json_body(raw_request)
+    return parse_chat_completion_request(data, fast_path=get_settings().raw_body_fast_path_enabled)
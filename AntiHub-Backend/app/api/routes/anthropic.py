@@ -16,11 +16,14 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps_flexible import get_user_flexible_with_x_api_key
 from app.api.deps import get_plugin_api_service, get_db_session, get_redis
+from app.core.config import get_settings
 from app.core.spec_guard import ensure_spec_allowed
 from app.models.user import User
 from app.services.plugin_api_service import PluginAPIService
 from app.services.kiro_service import KiroService
 from app.services.anthropic_adapter import AnthropicAdapter
+from app.services.account_balancer import resolve_balance_strategy
+from app.services.token_calibration import get_token_calibrator
 from app.services.kiro_anthropic_converter import KiroAnthropicConverter
 from app.utils.kiro_converters import is_thinking_enabled
 from app.schemas.anthropic import (
@@ -98,6 +101,32 @@ def get_kiro_service(
     return KiroService(db, redis)
 
 
+def _build_cc_estimate_kwargs(request: AnthropicMessagesRequest) -> dict:
+    """
+    /cc/v1 预估模式：按请求内容预估 input_tokens，并在拿到真实 usage 后回填校准样本
+    """
+    payload = request.model_dump(exclude_none=True)
+    raw_estimate = count_all_tokens(
+        messages=payload.get("messages", []),
+        system=payload.get("system"),
+        tools=payload.get("tools"),
+    )
+
+    if not get_settings().cc_token_calibration_enabled:
+        return {"estimated_input_tokens": raw_estimate}
+
+    calibrator = get_token_calibrator()
+    model = request.model
+
+    def on_usage(input_tokens: int, output_tokens: int) -> None:
+        calibrator.observe(model, raw_estimate, input_tokens)
+
+    return {
+        "estimated_input_tokens": calibrator.calibrate(model, raw_estimate),
+        "on_usage": on_usage,
+    }
+
+
 async def _create_message_impl(
     request: AnthropicMessagesRequest,
     raw_request: Request,
@@ -113,8 +142,9 @@ async def _create_message_impl(
     """
     /v1/messages 与 /cc/v1/messages 共用逻辑。
 
-    buffer_for_claude_code=True 时，会缓冲 SSE 直到拿到真实 usage，
-    再把 tokens 写入 message_start（用于 Claude Code 2.1.9+ 上下文压缩逻辑）。
+    buffer_for_claude_code=True 时，message_start 需要带上 input_tokens（用于 Claude Code 2.1.9+ 上下文压缩逻辑）：
+    - CC_STREAM_MODE=estimate（默认）：按请求预估 input_tokens（按模型校准）并立即开始流式输出
+    - CC_STREAM_MODE=buffer：缓冲 SSE 直到拿到真实 usage，再把 tokens 写入 message_start
     """
     try:
         if not anthropic_version:
@@ -164,6 +194,13 @@ async def _create_message_impl(
         if use_custom:
             import httpx
             import time
+            from app.core.circuit_breaker import circuit_key, get_circuit_breaker
+            from app.core.http_client import (
+                UPSTREAM_CUSTOM,
+                UPSTREAM_POOL_EXHAUSTED_MESSAGE,
+                lease_upstream_client,
+                request_timeout,
+            )
             from app.services.custom_account_service import CustomAccountService
             from app.db.session import get_session_maker
             from app.services.usage_log_service import UsageLogService
@@ -172,7 +209,9 @@ async def _create_message_impl(
             async with session_maker() as custom_db:
                 custom_svc = CustomAccountService(custom_db)
                 allowed_ids = getattr(current_user, "_allowed_account_ids", None)
-                account = await custom_svc.select_active_account(current_user.id, allowed_ids)
+                account = await custom_svc.select_active_account(
+                    current_user.id, allowed_ids, strategy=resolve_balance_strategy(current_user)
+                )
                 if not account:
                     error_response = AnthropicAdapter.create_error_response(
                         error_type="permission_error",
@@ -194,6 +233,17 @@ async def _create_message_impl(
                 await custom_svc.mark_last_used(account.id)
                 await custom_db.commit()
 
+            # 上游熔断中（或半开探测名额已被占用）：直接返回 503，不再等上游超时
+            breaker = get_circuit_breaker()
+            upstream_circuit = circuit_key("custom", upstream_base_url)
+            circuit_open_message = "自定义账号上游持续出错（熔断中），请稍后重试"
+            circuit_open_response = AnthropicAdapter.create_error_response(
+                error_type="api_error",
+                message=circuit_open_message,
+            )
+            if breaker.is_open(upstream_circuit):
+                return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=circuit_open_response.model_dump())
+
             upstream_url = f"{upstream_base_url}/v1/messages"
             upstream_headers = {
                 "x-api-key": upstream_api_key,
@@ -204,27 +254,51 @@ async def _create_message_impl(
                 upstream_headers["anthropic-beta"] = anthropic_beta
 
             request_body = request.model_dump(exclude_none=True)
-            transport = httpx.AsyncHTTPTransport(proxy=upstream_proxy) if upstream_proxy else None
+            upstream_timeout = request_timeout(UPSTREAM_CUSTOM, 300.0, connect=30.0)
             start_time = time.monotonic()
 
             if request.stream:
                 async def generate_custom_anthropic():
-                    client = None
                     success = True
                     status_code = 200
                     error_message = None
                     try:
-                        client = httpx.AsyncClient(transport=transport, timeout=httpx.Timeout(300.0, connect=30.0))
-                        async with client.stream("POST", upstream_url, json=request_body, headers=upstream_headers) as resp:
-                            if resp.status_code != 200:
-                                body = await resp.aread()
-                                success = False
-                                status_code = resp.status_code
-                                error_message = body.decode("utf-8", errors="replace")[:500]
-                                yield body
-                                return
-                            async for chunk in resp.aiter_bytes():
-                                yield chunk
+                        # 紧挨着上游请求再占用（可能是半开探测名额），生成器未被消费时不会占着名额
+                        permit = breaker.try_acquire(upstream_circuit)
+                        if permit is None:
+                            success = False
+                            status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+                            error_message = circuit_open_message
+                            error_event = {
+                                "type": "error",
+                                "error": {"type": "overloaded_error", "message": circuit_open_message},
+                            }
+                            yield f"event: error\ndata: {json.dumps(error_event)}\n\n"
+                            return
+                        with permit:
+                            async with lease_upstream_client(upstream_base_url, upstream_proxy) as client:
+                                async with client.stream(
+                                    "POST", upstream_url, json=request_body, headers=upstream_headers, timeout=upstream_timeout
+                                ) as resp:
+                                    permit.observe_status(resp.status_code)
+                                    if resp.status_code != 200:
+                                        body = await resp.aread()
+                                        success = False
+                                        status_code = resp.status_code
+                                        error_message = body.decode("utf-8", errors="replace")[:500]
+                                        yield body
+                                        return
+                                    async for chunk in resp.aiter_bytes():
+                                        yield chunk
+                    except httpx.PoolTimeout:
+                        success = False
+                        status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+                        error_message = UPSTREAM_POOL_EXHAUSTED_MESSAGE
+                        error_event = {
+                            "type": "error",
+                            "error": {"type": "overloaded_error", "message": UPSTREAM_POOL_EXHAUSTED_MESSAGE},
+                        }
+                        yield f"event: error\ndata: {json.dumps(error_event)}\n\n"
                     except Exception as e:
                         success = False
                         status_code = 500
@@ -245,11 +319,6 @@ async def _create_message_impl(
                             error_message=error_message,
                             duration_ms=duration_ms,
                         )
-                        if client:
-                            try:
-                                await client.aclose()
-                            except Exception:
-                                pass
 
                 return StreamingResponse(
                     generate_custom_anthropic(),
@@ -262,9 +331,14 @@ async def _create_message_impl(
                 )
 
             # 非流式
+            permit = breaker.try_acquire(upstream_circuit)
+            if permit is None:
+                return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=circuit_open_response.model_dump())
             try:
-                async with httpx.AsyncClient(transport=transport, timeout=httpx.Timeout(300.0, connect=30.0)) as client:
-                    resp = await client.post(upstream_url, json=request_body, headers=upstream_headers)
+                with permit:
+                    async with lease_upstream_client(upstream_base_url, upstream_proxy) as client:
+                        resp = await client.post(upstream_url, json=request_body, headers=upstream_headers, timeout=upstream_timeout)
+                    permit.observe_status(resp.status_code, timed=False)
 
                 duration_ms = int((time.monotonic() - start_time) * 1000)
                 if resp.status_code != 200:
@@ -310,6 +384,9 @@ async def _create_message_impl(
                 return JSONResponse(status_code=200, content=result)
             except Exception as e:
                 duration_ms = int((time.monotonic() - start_time) * 1000)
+                # 本进程到上游的连接池已满：返回 503，客户端可稍后重试
+                pool_exhausted = isinstance(e, httpx.PoolTimeout)
+                error_status = 503 if pool_exhausted else 500
                 await UsageLogService.record(
                     user_id=current_user.id,
                     api_key_id=api_key_id,
@@ -319,15 +396,21 @@ async def _create_message_impl(
                     config_type="custom",
                     stream=False,
                     success=False,
-                    status_code=500,
+                    status_code=error_status,
                     error_message=str(e),
                     duration_ms=duration_ms,
                 )
-                error_response = AnthropicAdapter.create_error_response(
-                    error_type="api_error",
-                    message=f"自定义代理转发失败: {str(e)}",
-                )
-                return JSONResponse(status_code=500, content=error_response.model_dump())
+                if pool_exhausted:
+                    error_response = AnthropicAdapter.create_error_response(
+                        error_type="overloaded_error",
+                        message=UPSTREAM_POOL_EXHAUSTED_MESSAGE,
+                    )
+                else:
+                    error_response = AnthropicAdapter.create_error_response(
+                        error_type="api_error",
+                        message=f"自定义代理转发失败: {str(e)}",
+                    )
+                return JSONResponse(status_code=error_status, content=error_response.model_dump())
 
         # Kiro 通道：直接把 Anthropic Messages 转为 conversationState（参考 kiro.rs 结构）
         # 其它通道：继续走 Anthropic -> OpenAI 转换，转发到 plug-in chat/completions
@@ -346,6 +429,10 @@ async def _create_message_impl(
 
         # 如果是流式请求
         if request.stream:
+            cc_stream_kwargs = {}
+            if buffer_for_claude_code and get_settings().cc_stream_mode == "estimate":
+                cc_stream_kwargs = _build_cc_estimate_kwargs(request)
+
             async def generate():
                 try:
                     if use_kiro:
@@ -377,6 +464,7 @@ async def _create_message_impl(
                         model=request.model,
                         request_id=request_id,
                         thinking_enabled=thinking_enabled,
+                        **cc_stream_kwargs,
                     ):
                         yield event
 
@@ -8,11 +8,12 @@ from datetime import datetime, timezone
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.api.deps import get_current_user, get_db, get_redis, get_db_session
-from app.cache import RedisClient
+from app.api.deps import get_current_user, get_db, get_db_session
+from app.cache import get_auth_cache
 from app.models.user import User
 from app.repositories.api_key_repository import APIKeyRepository
 from app.repositories.usage_log_repository import UsageLogRepository
+from app.services.usage_log_retention import clamp_stats_start
 from app.schemas.api_key import (
     APIKeyCreate,
     APIKeyResponse,
@@ -20,6 +21,7 @@ from app.schemas.api_key import (
     APIKeyUpdateStatus,
     APIKeyUpdateType,
     APIKeyUpdateAccounts,
+    APIKeyUpdateBalanceStrategy,
     AccountSummary,
 )
 
@@ -48,6 +50,7 @@ async def create_api_key(
             name=request.name,
             config_type=request.config_type,
             allowed_account_ids=request.allowed_account_ids,
+            balance_strategy=request.balance_strategy,
         )
         await db.commit()
         return APIKeyResponse.model_validate(api_key)
@@ -90,6 +93,7 @@ async def list_api_keys(
                 expires_at=key.expires_at,
                 allowed_account_ids=key.allowed_account_ids,
                 allowed_account_count=len(key.allowed_account_ids) if key.allowed_account_ids is not None else None,
+                balance_strategy=key.balance_strategy,
             )
             for key in keys
         ]
@@ -166,6 +170,10 @@ async def update_api_key_status(
             )
         
         await db.commit()
+
+        # 清理 API Key 认证缓存（含各 worker 的进程内缓存），禁用立即生效
+        await get_auth_cache().invalidate_api_key(api_key.key)
+
         return APIKeyResponse.model_validate(api_key)
     except HTTPException:
         raise
@@ -188,7 +196,6 @@ async def update_api_key_type(
     request: APIKeyUpdateType,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
-    redis: RedisClient = Depends(get_redis),
 ):
     """更新API密钥类型"""
     try:
@@ -226,11 +233,8 @@ async def update_api_key_type(
         )
 
         # 清理 API Key 认证缓存，避免 config_type 变更后短时间内继续走旧路由
-        try:
-            await redis.delete(f"api_key_auth:{api_key.key}")
-        except Exception:
-            # Redis 不可用不应阻塞更新
-            pass
+        # （失效失败只记录日志，不阻塞更新）
+        await get_auth_cache().invalidate_api_key(api_key.key)
 
         return APIKeyResponse.model_validate(api_key)
     except HTTPException:
@@ -254,7 +258,6 @@ async def update_api_key_accounts(
     request: APIKeyUpdateAccounts,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
-    redis: RedisClient = Depends(get_redis),
 ):
     """更新API密钥允许的账号"""
     try:
@@ -292,10 +295,7 @@ async def update_api_key_accounts(
         )
 
         # 清理 API Key 认证缓存
-        try:
-            await redis.delete(f"api_key_auth:{api_key.key}")
-        except Exception:
-            pass
+        await get_auth_cache().invalidate_api_key(api_key.key)
 
         return APIKeyResponse.model_validate(api_key)
     except HTTPException:
@@ -308,6 +308,56 @@ async def update_api_key_accounts(
         )
 
 
+@router.patch(
+    "/{key_id}/balance-strategy",
+    response_model=APIKeyResponse,
+    summary="更新API密钥的负载均衡策略",
+    description="修改指定API密钥在多账号间的选号策略；NULL=跟随用户设置"
+)
+async def update_api_key_balance_strategy(
+    key_id: int,
+    request: APIKeyUpdateBalanceStrategy,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """更新API密钥的负载均衡策略"""
+    try:
+        repo = APIKeyRepository(db)
+        api_key = await repo.update_balance_strategy(
+            key_id=key_id,
+            user_id=current_user.id,
+            balance_strategy=request.balance_strategy,
+        )
+
+        if not api_key:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="API密钥不存在或无权访问"
+            )
+
+        await db.commit()
+
+        logger.info(
+            "api_key balance_strategy updated: user_id=%s key_id=%s to=%s",
+            current_user.id,
+            key_id,
+            request.balance_strategy,
+        )
+
+        # 清理 API Key 认证缓存（策略随认证结果缓存）
+        await get_auth_cache().invalidate_api_key(api_key.key)
+
+        return APIKeyResponse.model_validate(api_key)
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"更新API密钥负载均衡策略失败"
+        )
+
+
 @router.get(
     "/config-accounts/{config_type}",
     response_model=List[AccountSummary],
@@ -429,6 +479,7 @@ async def delete_api_key(
     """删除API密钥"""
     try:
         repo = APIKeyRepository(db)
+        api_key = await repo.get_by_id(key_id)
         success = await repo.delete(key_id, current_user.id)
 
         if not success:
@@ -438,6 +489,9 @@ async def delete_api_key(
             )
 
         await db.commit()
+
+        # 清理 API Key 认证缓存，删除后立即不可用
+        await get_auth_cache().invalidate_api_key(api_key.key)
         return {"message": "API密钥已删除", "success": True}
     except HTTPException:
         raise
@@ -471,7 +525,11 @@ def _parse_iso_datetime(value: Optional[str]) -> Optional[datetime]:
 @router.get(
     "/{key_id}/usage/stats",
     summary="获取API密钥用量统计",
-    description="获取指定API密钥的用量统计信息（Kiro 从插件API，其他类型从本地用量日志）"
+    description=(
+        "获取指定API密钥的用量统计信息（Kiro 从插件API，其他类型从本地用量小时汇总）；"
+        "本地统计覆盖保留窗口（USAGE_LOG_RETENTION_MONTHS 个月，含当月）内的全部请求，"
+        "可能大于请求明细的条数，实际起始时间见返回的 range.start_date"
+    )
 )
 async def get_api_key_usage_stats(
     key_id: int,
@@ -508,6 +566,7 @@ async def get_api_key_usage_stats(
             # Kiro 类型 — 调用插件 API 获取统计数据
             import httpx
             from app.core.config import settings
+            from app.core.http_client import UPSTREAM_PLUGIN, get_http_client
 
             plugin_url = f"{settings.plugin_api_base_url}/api/kiro/usage/by-api-key/{key_id}"
             params = {}
@@ -520,82 +579,11 @@ async def get_api_key_usage_stats(
                 "Authorization": f"Bearer {settings.plugin_api_admin_key}"
             }
 
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.get(plugin_url, params=params, headers=headers)
-
-                if response.status_code != 200:
-                    logger.error(f"插件API调用失败: {response.status_code} - {response.text}")
-                    return {
-                        "success": True,
-                        "data": {
-                            "api_key_id": key_id,
-                            "api_key_name": api_key.name,
-                            "range": {
-                                "start_date": start_date,
-                                "end_date": end_date,
-                            },
-                            "total_requests": 0,
-                            "success_requests": 0,
-                            "failed_requests": 0,
-                            "success_rate": 0.0,
-                            "input_tokens": 0,
-                            "output_tokens": 0,
-                            "total_tokens": 0,
-                            "total_quota_consumed": 0.0,
-                            "avg_duration_ms": 0.0,
-                            "by_config_type": {"kiro": {"total_requests": 0, "success_requests": 0, "failed_requests": 0, "success_rate": 0.0, "total_tokens": 0, "total_quota_consumed": 0.0}},
-                            "by_model": {},
-                            "by_endpoint": {},
-                            "hourly_model_stats": [],
-                            "recent_requests": []
-                        }
-                    }
-
-                plugin_data = response.json()
-                if not plugin_data.get("success"):
-                    raise HTTPException(
-                        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                        detail="获取统计数据失败"
-                    )
-
-                stats = plugin_data["data"]
-                base_stats = stats["base"]
-
-                total_reqs = int(base_stats.get("total_requests") or 0)
-                success_reqs = int(base_stats.get("success_requests") or 0)
-                success_rate = round((success_reqs / total_reqs * 100), 1) if total_reqs > 0 else 0.0
-
-                by_model = {}
-                for row in stats.get("by_model", []):
-                    model_name = row.get("model_id") or "unknown"
-                    model_total = int(row.get("total_requests") or 0)
-                    model_success = int(row.get("success_requests") or 0)
-                    by_model[model_name] = {
-                        "total_requests": model_total,
-                        "success_requests": model_success,
-                        "failed_requests": int(row.get("failed_requests") or 0),
-                        "success_rate": round((model_success / model_total * 100), 1) if model_total > 0 else 0.0,
-                        "total_tokens": int(row.get("total_tokens") or 0),
-                        "total_quota_consumed": float(row.get("total_quota_consumed") or 0.0)
-                    }
-
-                by_endpoint = {}
-                for row in stats.get("by_endpoint", []):
-                    endpoint_name = row.get("endpoint") or "unknown"
-                    endpoint_total = int(row.get("total_requests") or 0)
-                    endpoint_success = int(row.get("success_requests") or 0)
-                    by_endpoint[endpoint_name] = {
-                        "total_requests": endpoint_total,
-                        "success_requests": endpoint_success,
-                        "failed_requests": int(row.get("failed_requests") or 0),
-                        "success_rate": round((endpoint_success / endpoint_total * 100), 1) if endpoint_total > 0 else 0.0,
-                        "input_tokens": int(row.get("input_tokens") or 0),
-                        "output_tokens": int(row.get("output_tokens") or 0),
-                        "total_tokens": int(row.get("total_tokens") or 0),
-                        "total_quota_consumed": float(row.get("total_quota_consumed") or 0.0),
-                        "avg_duration_ms": float(row.get("avg_duration_ms") or 0.0)
-                    }
+            client = get_http_client(UPSTREAM_PLUGIN)
+            response = await client.get(plugin_url, params=params, headers=headers, timeout=30.0)
 
+            if response.status_code != 200:
+                logger.error(f"插件API调用失败: {response.status_code} - {response.text}")
                 return {
                     "success": True,
                     "data": {
@@ -605,34 +593,105 @@ async def get_api_key_usage_stats(
                             "start_date": start_date,
                             "end_date": end_date,
                         },
-                        "total_requests": total_reqs,
-                        "success_requests": success_reqs,
-                        "failed_requests": int(base_stats.get("failed_requests") or 0),
-                        "success_rate": success_rate,
-                        "input_tokens": int(base_stats.get("input_tokens") or 0),
-                        "output_tokens": int(base_stats.get("output_tokens") or 0),
-                        "total_tokens": int(base_stats.get("total_tokens") or 0),
-                        "total_quota_consumed": float(base_stats.get("total_quota_consumed") or 0.0),
-                        "avg_duration_ms": float(base_stats.get("avg_duration_ms") or 0.0),
-                        "by_config_type": {
-                            "kiro": {
-                                "total_requests": total_reqs,
-                                "success_requests": success_reqs,
-                                "failed_requests": int(base_stats.get("failed_requests") or 0),
-                                "success_rate": success_rate,
-                                "total_tokens": int(base_stats.get("total_tokens") or 0),
-                                "total_quota_consumed": float(base_stats.get("total_quota_consumed") or 0.0)
-                            }
-                        },
-                        "by_model": by_model,
-                        "by_endpoint": by_endpoint,
-                        "hourly_model_stats": stats.get("hourly_model_stats", []),
-                        "recent_requests": stats.get("recent_requests", [])
-                    },
+                        "total_requests": 0,
+                        "success_requests": 0,
+                        "failed_requests": 0,
+                        "success_rate": 0.0,
+                        "input_tokens": 0,
+                        "output_tokens": 0,
+                        "total_tokens": 0,
+                        "total_quota_consumed": 0.0,
+                        "avg_duration_ms": 0.0,
+                        "by_config_type": {"kiro": {"total_requests": 0, "success_requests": 0, "failed_requests": 0, "success_rate": 0.0, "total_tokens": 0, "total_quota_consumed": 0.0}},
+                        "by_model": {},
+                        "by_endpoint": {},
+                        "hourly_model_stats": [],
+                        "recent_requests": []
+                    }
+                }
+
+            plugin_data = response.json()
+            if not plugin_data.get("success"):
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail="获取统计数据失败"
+                )
+
+            stats = plugin_data["data"]
+            base_stats = stats["base"]
+
+            total_reqs = int(base_stats.get("total_requests") or 0)
+            success_reqs = int(base_stats.get("success_requests") or 0)
+            success_rate = round((success_reqs / total_reqs * 100), 1) if total_reqs > 0 else 0.0
+
+            by_model = {}
+            for row in stats.get("by_model", []):
+                model_name = row.get("model_id") or "unknown"
+                model_total = int(row.get("total_requests") or 0)
+                model_success = int(row.get("success_requests") or 0)
+                by_model[model_name] = {
+                    "total_requests": model_total,
+                    "success_requests": model_success,
+                    "failed_requests": int(row.get("failed_requests") or 0),
+                    "success_rate": round((model_success / model_total * 100), 1) if model_total > 0 else 0.0,
+                    "total_tokens": int(row.get("total_tokens") or 0),
+                    "total_quota_consumed": float(row.get("total_quota_consumed") or 0.0)
                 }
+
+            by_endpoint = {}
+            for row in stats.get("by_endpoint", []):
+                endpoint_name = row.get("endpoint") or "unknown"
+                endpoint_total = int(row.get("total_requests") or 0)
+                endpoint_success = int(row.get("success_requests") or 0)
+                by_endpoint[endpoint_name] = {
+                    "total_requests": endpoint_total,
+                    "success_requests": endpoint_success,
+                    "failed_requests": int(row.get("failed_requests") or 0),
+                    "success_rate": round((endpoint_success / endpoint_total * 100), 1) if endpoint_total > 0 else 0.0,
+                    "input_tokens": int(row.get("input_tokens") or 0),
+                    "output_tokens": int(row.get("output_tokens") or 0),
+                    "total_tokens": int(row.get("total_tokens") or 0),
+                    "total_quota_consumed": float(row.get("total_quota_consumed") or 0.0),
+                    "avg_duration_ms": float(row.get("avg_duration_ms") or 0.0)
+                }
+
+            return {
+                "success": True,
+                "data": {
+                    "api_key_id": key_id,
+                    "api_key_name": api_key.name,
+                    "range": {
+                        "start_date": start_date,
+                        "end_date": end_date,
+                    },
+                    "total_requests": total_reqs,
+                    "success_requests": success_reqs,
+                    "failed_requests": int(base_stats.get("failed_requests") or 0),
+                    "success_rate": success_rate,
+                    "input_tokens": int(base_stats.get("input_tokens") or 0),
+                    "output_tokens": int(base_stats.get("output_tokens") or 0),
+                    "total_tokens": int(base_stats.get("total_tokens") or 0),
+                    "total_quota_consumed": float(base_stats.get("total_quota_consumed") or 0.0),
+                    "avg_duration_ms": float(base_stats.get("avg_duration_ms") or 0.0),
+                    "by_config_type": {
+                        "kiro": {
+                            "total_requests": total_reqs,
+                            "success_requests": success_reqs,
+                            "failed_requests": int(base_stats.get("failed_requests") or 0),
+                            "success_rate": success_rate,
+                            "total_tokens": int(base_stats.get("total_tokens") or 0),
+                            "total_quota_consumed": float(base_stats.get("total_quota_consumed") or 0.0)
+                        }
+                    },
+                    "by_model": by_model,
+                    "by_endpoint": by_endpoint,
+                    "hourly_model_stats": stats.get("hourly_model_stats", []),
+                    "recent_requests": stats.get("recent_requests", [])
+                },
+            }
         else:
             # 非 kiro 类型（custom, codex, gemini-cli 等）— 使用本地 UsageLogRepository
-            start_at = _parse_iso_datetime(start_date)
+            start_at = clamp_stats_start(_parse_iso_datetime(start_date))
             end_at = _parse_iso_datetime(end_date)
 
             repo = UsageLogRepository(db)
@@ -657,7 +716,7 @@ async def get_api_key_usage_stats(
                     "api_key_id": key_id,
                     "api_key_name": api_key.name,
                     "range": {
-                        "start_date": start_date,
+                        "start_date": start_at.isoformat() if start_at else None,
                         "end_date": end_date,
                     },
                     **stats_data,
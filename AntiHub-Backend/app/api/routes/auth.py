@@ -22,7 +22,12 @@ from app.schemas.auth import (
     RefreshTokenRequest,
     RefreshTokenResponse,
 )
-from app.schemas.user import UserResponse, JoinBetaResponse
+from app.schemas.user import (
+    UserResponse,
+    JoinBetaResponse,
+    BalanceStrategyUpdate,
+    BalanceStrategyResponse,
+)
 from app.core.config import get_settings
 from app.core.exceptions import (
     InvalidCredentialsError,
@@ -435,3 +440,49 @@ async def get_beta_status(
         message="已加入 Beta 计划" if latest_user.beta == 1 else "未加入 Beta 计划",
         beta=latest_user.beta
     )
+
+
+# ==================== 负载均衡策略 ====================
+
+@router.get(
+    "/balance-strategy",
+    response_model=BalanceStrategyResponse,
+    summary="获取多账号负载均衡策略",
+    description="获取当前用户在多账号间的选号策略（API key 上单独设置的策略优先）"
+)
+async def get_balance_strategy(
+    current_user: User = Depends(get_current_user),
+    user_service: UserService = Depends(get_user_service)
+):
+    """获取当前用户的负载均衡策略"""
+    latest_user = await user_service.get_user_by_id(current_user.id)
+    if not latest_user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="用户不存在"
+        )
+    
+    return BalanceStrategyResponse(success=True, balance_strategy=latest_user.balance_strategy)
+
+
+@router.put(
+    "/balance-strategy",
+    response_model=BalanceStrategyResponse,
+    summary="设置多账号负载均衡策略",
+    description="设置当前用户在多账号间的选号策略：fill-first / round-robin / least-in-flight / weighted-quota"
+)
+async def update_balance_strategy(
+    request: BalanceStrategyUpdate,
+    current_user: User = Depends(get_current_user),
+    user_service: UserService = Depends(get_user_service)
+):
+    """设置当前用户的负载均衡策略"""
+    try:
+        updated_user = await user_service.update_balance_strategy(current_user.id, request.balance_strategy)
+    except UserNotFoundError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=e.message
+        )
+    
+    return BalanceStrategyResponse(success=True, balance_strategy=updated_user.balance_strategy)
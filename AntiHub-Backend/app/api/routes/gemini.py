@@ -21,10 +21,12 @@ from app.core.spec_guard import ensure_spec_allowed
 from app.models.user import User
 from app.services.plugin_api_service import PluginAPIService
 from app.services.gemini_cli_api_service import GeminiCLIAPIService
+from app.services.account_balancer import resolve_balance_strategy
 from app.schemas.plugin_api import GenerateContentRequest
 from app.services.usage_log_service import SSEUsageTracker, extract_openai_usage
 from app.services.usage_log_service import UsageLogService
 from app.services.zai_image_service import ZaiImageService
+from app.utils.sse import SSELineBuffer, parse_data_line
 from app.utils.gemini_openai_chat_compat import (
     ChatCompletionsSSEToGeminiSSETranslator,
     gemini_generate_content_request_to_openai_chat_request,
@@ -43,7 +45,6 @@ LOCAL_IMAGE_MODELS = (
 
 class GeminiSSEUsageTracker:
     def __init__(self) -> None:
-        self.buffer = ""
         self.input_tokens = 0
         self.output_tokens = 0
         self.total_tokens = 0
@@ -51,57 +52,57 @@ class GeminiSSEUsageTracker:
         self.status_code: Optional[int] = None
         self.error_message: Optional[str] = None
         self._seen_usage = False
+        self._lines = SSELineBuffer()
 
     def feed(self, chunk: bytes) -> None:
-        try:
-            self.buffer += chunk.decode("utf-8", errors="replace")
-        except Exception:
-            return
+        for line in self._lines.feed(chunk):
+            self._handle_line(line)
 
-        while "\n" in self.buffer:
-            line, self.buffer = self.buffer.split("\n", 1)
-            line = line.strip()
-            if not line or not line.startswith("data:"):
-                continue
+    def _handle_line(self, line: str) -> None:
+        data_str = parse_data_line(line.strip())
+        if data_str is None:
+            return
 
-            data_str = line[5:].strip()
-            if not data_str:
-                continue
+        data_str = data_str.strip()
+        if not data_str:
+            return
 
-            try:
-                payload = json.loads(data_str)
-            except Exception:
-                continue
+        try:
+            payload = json.loads(data_str)
+        except Exception:
+            return
 
-            if not isinstance(payload, dict):
-                continue
+        if not isinstance(payload, dict):
+            return
 
-            # error: {"error": {"message": "...", "code": 429}}
-            err = payload.get("error")
-            if err is not None:
-                self.success = False
-                if isinstance(err, dict):
-                    self.error_message = str(err.get("message") or err.get("detail") or err)
-                    try:
-                        self.status_code = int(err.get("code") or err.get("status") or 500)
-                    except Exception:
-                        self.status_code = self.status_code or 500
-                else:
-                    self.error_message = str(err)
+        # error: {"error": {"message": "...", "code": 429}}
+        err = payload.get("error")
+        if err is not None:
+            self.success = False
+            if isinstance(err, dict):
+                self.error_message = str(err.get("message") or err.get("detail") or err)
+                try:
+                    self.status_code = int(err.get("code") or err.get("status") or 500)
+                except Exception:
                     self.status_code = self.status_code or 500
-
-            usage = payload.get("usageMetadata")
-            if isinstance(usage, dict):
-                prompt = int(usage.get("promptTokenCount") or 0)
-                thoughts = int(usage.get("thoughtsTokenCount") or 0)
-                completion = int(usage.get("candidatesTokenCount") or 0)
-                total = int(usage.get("totalTokenCount") or (prompt + completion))
-                self.input_tokens = prompt + thoughts
-                self.output_tokens = completion
-                self.total_tokens = total
-                self._seen_usage = True
+            else:
+                self.error_message = str(err)
+                self.status_code = self.status_code or 500
+
+        usage = payload.get("usageMetadata")
+        if isinstance(usage, dict):
+            prompt = int(usage.get("promptTokenCount") or 0)
+            thoughts = int(usage.get("thoughtsTokenCount") or 0)
+            completion = int(usage.get("candidatesTokenCount") or 0)
+            total = int(usage.get("totalTokenCount") or (prompt + completion))
+            self.input_tokens = prompt + thoughts
+            self.output_tokens = completion
+            self.total_tokens = total
+            self._seen_usage = True
 
     def finalize(self) -> None:
+        for line in self._lines.flush():
+            self._handle_line(line)
         if not self._seen_usage and self.total_tokens == 0:
             self.total_tokens = int(self.input_tokens) + int(self.output_tokens)
 
@@ -208,7 +209,9 @@ async def generate_content(
                     ratio = getattr(image_cfg, "aspectRatio", None) if image_cfg else None
                     resolution = getattr(image_cfg, "imageSize", None) if image_cfg else None
 
-                    account = await zai_image_service.select_active_account(current_user.id)
+                    account = await zai_image_service.select_active_account(
+                        current_user.id, strategy=resolve_balance_strategy(current_user)
+                    )
                     info = await zai_image_service.generate_image(
                         account=account,
                         prompt=prompt,
@@ -334,6 +337,7 @@ async def generate_content(
             user_id=current_user.id,
             model=model,
             request_data=request.model_dump(),
+            strategy=resolve_balance_strategy(current_user),
         )
 
         usage = result.get("usageMetadata") if isinstance(result, dict) else None
@@ -559,6 +563,7 @@ async def stream_generate_content(
                         user_id=current_user.id,
                         model=model,
                         request_data=request.model_dump(),
+                        strategy=resolve_balance_strategy(current_user),
                     ):
                         tracker.feed(chunk)
                         yield chunk
@@ -622,7 +627,9 @@ async def stream_generate_content(
                 ratio = getattr(image_cfg, "aspectRatio", None) if image_cfg else None
                 resolution = getattr(image_cfg, "imageSize", None) if image_cfg else None
 
-                account = await zai_image_service.select_active_account(current_user.id)
+                account = await zai_image_service.select_active_account(
+                    current_user.id, strategy=resolve_balance_strategy(current_user)
+                )
                 info = await zai_image_service.generate_image(
                     account=account,
                     prompt=prompt,
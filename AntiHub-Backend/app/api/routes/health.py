@@ -9,6 +9,14 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps import get_db_session, get_redis
 from app.cache.redis_client import RedisClient
+from app.cache.auth_cache import get_auth_cache
+from app.cache.codex_account_pool import get_codex_account_pool
+from app.cache.content_cache import get_content_cache
+from app.cache.kiro_history_cache import get_kiro_history_cache
+from app.cache.token_refresh_lock import get_token_refresh_coordinator
+from app.cache.credentials_cache import get_credentials_cache
+from app.core.circuit_breaker import get_circuit_breaker
+from app.services.token_refresher import get_token_refresher
 
 
 router = APIRouter(prefix="/health", tags=["健康检查"])
@@ -30,6 +38,9 @@ async def health_check(
     - API 服务本身
     - PostgreSQL 数据库连接
     - Redis 缓存连接
+    - 认证缓存命中率
+    - system / tools token 计数缓存命中率
+    - Kiro history 转换缓存复用率
     
     返回各组件的健康状态
     """
@@ -89,6 +100,49 @@ async def health_check(
             "type": "Redis"
         }
     
+    # 认证缓存命中统计（进程内，仅反映当前 worker）
+    health_status["components"]["auth_cache"] = {
+        "status": "healthy",
+        **get_auth_cache().stats(),
+    }
+    
+    # system / tools token 计数缓存命中统计（进程内，仅反映当前 worker）
+    health_status["components"]["content_cache"] = {
+        "status": "healthy",
+        **get_content_cache().stats(),
+    }
+    
+    # Kiro history 转换缓存统计（进程内，仅反映当前 worker）
+    health_status["components"]["kiro_history_cache"] = {
+        "status": "healthy",
+        **get_kiro_history_cache().stats(),
+    }
+    
+    # Codex 账号池统计（进程内，仅反映当前 worker）
+    health_status["components"]["codex_account_pool"] = {
+        "status": "healthy",
+        **get_codex_account_pool().stats(),
+    }
+    
+    # OAuth token 刷新合并统计（进程内，仅反映当前 worker）
+    health_status["components"]["token_refresh"] = {
+        "status": "healthy",
+        **get_token_refresh_coordinator().stats(),
+    }
+    
+    # token 后台预刷新与解密凭证缓存统计（进程内，仅反映当前 worker）
+    health_status["components"]["token_refresher"] = {
+        "status": "healthy",
+        **get_token_refresher().stats(),
+        "credentials_cache": get_credentials_cache().stats(),
+    }
+    
+    # 上游熔断状态（进程内，仅反映当前 worker；上游熔断不影响本服务的健康状态）
+    health_status["components"]["circuit_breaker"] = {
+        "status": "healthy",
+        **get_circuit_breaker().stats(),
+    }
+    
     # 根据整体状态设置 HTTP 状态码
     status_code = (
         status.HTTP_200_OK 
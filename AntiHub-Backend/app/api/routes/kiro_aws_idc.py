@@ -24,6 +24,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps import get_current_user, get_db_session, get_redis
 from app.cache import RedisClient
+from app.core.http_client import UPSTREAM_DEFAULT, get_http_client
 from app.models.user import User
 from app.schemas.kiro_aws_idc import (
     KiroAwsIdcDeviceAuthorizeRequest,
@@ -257,57 +258,59 @@ async def start_kiro_builder_id_device_flow(
         headers = {"Content-Type": "application/json", "User-Agent": "KiroIDE"}
         timeout = httpx.Timeout(15.0, connect=5.0)
 
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            # 1) Register OIDC client
-            reg_resp = await client.post(
-                f"{aws_oidc_base_url}/client/register",
-                json={
-                    "clientName": "Kiro IDE",
-                    "clientType": "public",
-                    "scopes": AWS_OIDC_SCOPES,
-                    "grantTypes": [AWS_GRANT_TYPE_DEVICE_CODE, "refresh_token"],
+        client = get_http_client(UPSTREAM_DEFAULT)
+        # 1) Register OIDC client
+        reg_resp = await client.post(
+            f"{aws_oidc_base_url}/client/register",
+            json={
+                "clientName": "Kiro IDE",
+                "clientType": "public",
+                "scopes": AWS_OIDC_SCOPES,
+                "grantTypes": [AWS_GRANT_TYPE_DEVICE_CODE, "refresh_token"],
+            },
+            headers=headers,
+            timeout=timeout,
+        )
+        reg_data = reg_resp.json() if reg_resp.content else {}
+        if reg_resp.status_code != 200:
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail={
+                    "message": "AWS OIDC client/register 失败",
+                    "upstream_status": reg_resp.status_code,
+                    "upstream_response": reg_data or reg_resp.text,
                 },
-                headers=headers,
             )
-            reg_data = reg_resp.json() if reg_resp.content else {}
-            if reg_resp.status_code != 200:
-                raise HTTPException(
-                    status_code=status.HTTP_502_BAD_GATEWAY,
-                    detail={
-                        "message": "AWS OIDC client/register 失败",
-                        "upstream_status": reg_resp.status_code,
-                        "upstream_response": reg_data or reg_resp.text,
-                    },
-                )
 
-            client_id = reg_data.get("clientId")
-            client_secret = reg_data.get("clientSecret")
-            if not client_id or not client_secret:
-                raise HTTPException(
-                    status_code=status.HTTP_502_BAD_GATEWAY,
-                    detail="AWS OIDC 注册返回缺少 clientId/clientSecret",
-                )
+        client_id = reg_data.get("clientId")
+        client_secret = reg_data.get("clientSecret")
+        if not client_id or not client_secret:
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail="AWS OIDC 注册返回缺少 clientId/clientSecret",
+            )
 
-            # 2) Start device authorization
-            auth_resp = await client.post(
-                f"{aws_oidc_base_url}/device_authorization",
-                json={
-                    "clientId": client_id,
-                    "clientSecret": client_secret,
-                    "startUrl": AWS_BUILDER_ID_START_URL,
-                },
-                headers=headers,
+        # 2) Start device authorization
+        auth_resp = await client.post(
+            f"{aws_oidc_base_url}/device_authorization",
+            json={
+                "clientId": client_id,
+                "clientSecret": client_secret,
+                "startUrl": AWS_BUILDER_ID_START_URL,
+            },
+            headers=headers,
+            timeout=timeout,
+        )
+        auth_data = auth_resp.json() if auth_resp.content else {}
+        if auth_resp.status_code != 200:
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail={
+                    "message": "AWS OIDC device_authorization 失败",
+                    "upstream_status": auth_resp.status_code,
+                    "upstream_response": auth_data or auth_resp.text,
+                },
             )
-            auth_data = auth_resp.json() if auth_resp.content else {}
-            if auth_resp.status_code != 200:
-                raise HTTPException(
-                    status_code=status.HTTP_502_BAD_GATEWAY,
-                    detail={
-                        "message": "AWS OIDC device_authorization 失败",
-                        "upstream_status": auth_resp.status_code,
-                        "upstream_response": auth_data or auth_resp.text,
-                    },
-                )
 
         device_code = auth_data.get("deviceCode")
         user_code = auth_data.get("userCode")
@@ -449,18 +452,19 @@ async def get_kiro_builder_id_device_status(
 
         headers = {"Content-Type": "application/json", "User-Agent": "KiroIDE"}
         timeout = httpx.Timeout(15.0, connect=5.0)
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            token_resp = await client.post(
-                f"{aws_oidc_base_url}/token",
-                json={
-                    "clientId": client_id,
-                    "clientSecret": client_secret,
-                    "deviceCode": device_code,
-                    "grantType": AWS_GRANT_TYPE_DEVICE_CODE,
-                },
-                headers=headers,
-            )
-            token_data = token_resp.json() if token_resp.content else {}
+        client = get_http_client(UPSTREAM_DEFAULT)
+        token_resp = await client.post(
+            f"{aws_oidc_base_url}/token",
+            json={
+                "clientId": client_id,
+                "clientSecret": client_secret,
+                "deviceCode": device_code,
+                "grantType": AWS_GRANT_TYPE_DEVICE_CODE,
+            },
+            headers=headers,
+            timeout=timeout,
+        )
+        token_data = token_resp.json() if token_resp.content else {}
 
         # 成功：拿到 token，立即落库（不把 token 回传给前端）
         if token_resp.status_code == 200 and token_data.get("accessToken"):
@@ -2,16 +2,21 @@
 用量统计路由
 显示用户的使用记录和剩余配额
 """
-from typing import Optional
+import csv
+import io
+import json
+from typing import Any, AsyncIterator, Optional
 from datetime import datetime, timezone
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps import get_current_user, get_plugin_api_service, get_db_session
+from app.db.session import get_session_maker
 from app.models.user import User
 from app.services.plugin_api_service import PluginAPIService
 from app.repositories.usage_log_repository import UsageLogRepository
-from app.models.usage_log import UsageLog
+from app.services.usage_log_retention import clamp_stats_start
 
 
 router = APIRouter(prefix="/usage", tags=["用量统计"])
@@ -318,7 +323,32 @@ def _parse_iso_datetime(value: Optional[str]) -> Optional[datetime]:
     return dt
 
 
-def _usage_log_to_dict(log: UsageLog) -> dict:
+# 导出时每批从服务端游标读取的行数
+EXPORT_BATCH_SIZE = 1000
+
+USAGE_LOG_FIELDS = (
+    "id",
+    "endpoint",
+    "method",
+    "model_name",
+    "config_type",
+    "stream",
+    "success",
+    "status_code",
+    "error_message",
+    "quota_consumed",
+    "input_tokens",
+    "output_tokens",
+    "total_tokens",
+    "duration_ms",
+    "tts_voice_id",
+    "tts_account_id",
+    "created_at",
+)
+
+
+def _usage_log_to_dict(log: Any) -> dict:
+    """UsageLog 实体或 EXPORT_COLUMNS 查询出的行（按属性访问）转为 dict"""
     return {
         "id": log.id,
         "endpoint": log.endpoint,
@@ -348,6 +378,10 @@ def _usage_log_to_dict(log: UsageLog) -> dict:
 async def get_request_usage_logs(
     limit: int = Query(50, description="每页数量（1-200）"),
     offset: int = Query(0, description="偏移量（>=0）"),
+    cursor: Optional[str] = Query(
+        None,
+        description="游标分页：传空字符串取第一页，之后传上一页返回的 next_cursor；传入时忽略 offset 且不返回 total",
+    ),
     start_date: Optional[str] = Query(None, description="开始时间（ISO8601）"),
     end_date: Optional[str] = Query(None, description="结束时间（ISO8601）"),
     config_type: Optional[str] = Query(None, description="antigravity/kiro/qwen/codex/gemini-cli/zai-tts/zai-image"),
@@ -369,6 +403,26 @@ async def get_request_usage_logs(
         end_at = _parse_iso_datetime(end_date)
 
         repo = UsageLogRepository(db)
+        if cursor is not None:
+            logs, next_cursor = await repo.list_logs_after(
+                user_id=current_user.id,
+                cursor=cursor,
+                limit=limit,
+                start_at=start_at,
+                end_at=end_at,
+                config_type=config_type,
+                success=success,
+                model_name=model_name,
+                endpoint=endpoint,
+            )
+            return {
+                "success": True,
+                "data": {
+                    "logs": [_usage_log_to_dict(l) for l in logs],
+                    "pagination": {"limit": limit, "next_cursor": next_cursor},
+                },
+            }
+
         total = await repo.count_logs(
             user_id=current_user.id,
             start_at=start_at,
@@ -406,10 +460,92 @@ async def get_request_usage_logs(
         )
 
 
+def _export_ndjson(rows) -> str:
+    return "".join(
+        json.dumps(_usage_log_to_dict(row), ensure_ascii=False) + "\n" for row in rows
+    )
+
+
+def _export_csv(rows, *, header: bool) -> str:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    if header:
+        writer.writerow(USAGE_LOG_FIELDS)
+    for row in rows:
+        item = _usage_log_to_dict(row)
+        writer.writerow([item[name] for name in USAGE_LOG_FIELDS])
+    return buf.getvalue()
+
+
+@router.get(
+    "/requests/export",
+    summary="导出请求用量日志",
+    description="以 NDJSON 或 CSV 流式导出请求日志（过滤条件同 /requests/logs），服务端游标分批读取，内存占用恒定。",
+)
+async def export_request_usage_logs(
+    format: str = Query("ndjson", description="ndjson / csv"),
+    start_date: Optional[str] = Query(None, description="开始时间（ISO8601）"),
+    end_date: Optional[str] = Query(None, description="结束时间（ISO8601）"),
+    config_type: Optional[str] = Query(None, description="antigravity/kiro/qwen/codex/gemini-cli/zai-tts/zai-image"),
+    success: Optional[bool] = Query(None, description="true=只看成功，false=只看失败，不传=全部"),
+    model_name: Optional[str] = Query(None, description="模型名过滤"),
+    endpoint: Optional[str] = Query(None, description="API端点过滤"),
+    current_user: User = Depends(get_current_user),
+):
+    try:
+        if format not in ("ndjson", "csv"):
+            raise ValueError("format 必须是 ndjson / csv")
+        if config_type and config_type not in ("antigravity", "kiro", "qwen", "codex", "gemini-cli", "zai-tts", "zai-image", "custom"):
+            raise ValueError("config_type 必须是 antigravity / kiro / qwen / codex / gemini-cli / zai-tts / zai-image / custom")
+
+        start_at = _parse_iso_datetime(start_date)
+        end_at = _parse_iso_datetime(end_date)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    user_id = current_user.id
+
+    async def generate() -> AsyncIterator[str]:
+        # 请求级会话在响应头发出时即被释放，导出使用独立会话并在流结束时关闭
+        async with get_session_maker()() as db:
+            repo = UsageLogRepository(db)
+            first = True
+            async for rows in repo.stream_logs(
+                user_id=user_id,
+                batch_size=EXPORT_BATCH_SIZE,
+                start_at=start_at,
+                end_at=end_at,
+                config_type=config_type,
+                success=success,
+                model_name=model_name,
+                endpoint=endpoint,
+            ):
+                if format == "csv":
+                    yield _export_csv(rows, header=first)
+                else:
+                    yield _export_ndjson(rows)
+                first = False
+            if first and format == "csv":
+                yield _export_csv([], header=True)
+
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    filename = f"usage_logs_{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')}.{format}"
+    return StreamingResponse(
+        generate(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
 @router.get(
     "/requests/stats",
     summary="获取请求用量统计",
-    description="按时间范围聚合统计请求次数、token 用量、成功/失败数。",
+    description=(
+        "按时间范围聚合统计请求次数、token 用量、成功/失败数。"
+        "统计来自小时汇总，覆盖保留窗口（USAGE_LOG_RETENTION_MONTHS 个月，含当月）内的全部请求；"
+        "请求明细每个渠道只保留最近若干条，因此统计总数可能大于明细条数。"
+        "未指定 start_date（或早于保留窗口）时从保留窗口起点开始统计，实际范围见返回的 range。"
+    ),
 )
 async def get_request_usage_stats(
     start_date: Optional[str] = Query(None, description="开始时间（ISO8601）"),
@@ -423,7 +559,7 @@ async def get_request_usage_stats(
         if config_type and config_type not in ("antigravity", "kiro", "qwen", "codex", "gemini-cli", "zai-tts", "zai-image", "custom"):
             raise ValueError("config_type 必须是 antigravity / kiro / qwen / codex / gemini-cli / zai-tts / zai-image / custom")
 
-        start_at = _parse_iso_datetime(start_date)
+        start_at = clamp_stats_start(_parse_iso_datetime(start_date))
         end_at = _parse_iso_datetime(end_date)
 
         repo = UsageLogRepository(db)
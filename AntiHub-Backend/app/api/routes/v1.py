@@ -6,7 +6,6 @@ OpenAI兼容的API端点
 """
 import asyncio
 import base64
-import json
 import logging
 import os
 from typing import List, Dict, Any, Optional, Tuple
@@ -18,6 +17,7 @@ from fastapi.responses import StreamingResponse, JSONResponse, FileResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps_flexible import get_user_flexible
+from app.api.deps_body import get_chat_completion_request_data
 from app.api.deps import get_plugin_api_service, get_db_session, get_redis
 from app.models.user import User
 from app.services.plugin_api_service import PluginAPIService
@@ -27,6 +27,7 @@ from app.services.gemini_cli_api_service import GeminiCLIAPIService
 from app.services.zai_tts_service import ZaiTTSService
 from app.services.zai_image_service import ZaiImageService
 from app.services.anthropic_adapter import AnthropicAdapter
+from app.services.account_balancer import resolve_balance_strategy
 from app.services.usage_log_service import (
     UsageLogService,
     SSEUsageTracker,
@@ -35,7 +36,15 @@ from app.services.usage_log_service import (
 )
 from app.schemas.plugin_api import ChatCompletionRequest
 from app.cache import RedisClient
+from app.core.circuit_breaker import circuit_key, get_circuit_breaker
+from app.core.http_client import (
+    UPSTREAM_CUSTOM,
+    UPSTREAM_POOL_EXHAUSTED_MESSAGE,
+    lease_upstream_client,
+    request_timeout,
+)
 from app.core.spec_guard import ensure_spec_allowed
+from app.utils import jsonx
 from app.utils.openai_responses_compat import (
     ResponsesToChatCompletionsSSETranslator,
     chat_completions_request_to_responses_request,
@@ -84,8 +93,7 @@ def _responses_sse_error(
             "code": int(code or 500),
         },
     }
-    data = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
-    return f"event: error\ndata: {data}\n\n".encode("utf-8")
+    return b"event: error\ndata: " + jsonx.dumps(payload) + b"\n\n"
 
 
 LOCAL_IMAGE_MODEL_ID = "glm-image"
@@ -466,7 +474,11 @@ async def audio_speech(
 
     # 选择账号：voice 必须匹配已保存的音色ID，否则拒绝（403）
     try:
-        account = await zai_tts_service.select_active_account(current_user.id, voice_id=voice_id or None)
+        account = await zai_tts_service.select_active_account(
+            current_user.id,
+            voice_id=voice_id or None,
+            strategy=resolve_balance_strategy(current_user),
+        )
     except PermissionError as e:
         await _record_usage(False, status.HTTP_403_FORBIDDEN, str(e), tts_voice_id=voice_id or None, tts_account_id=None)
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=str(e))
@@ -641,7 +653,9 @@ async def image_generations(
             resolution = quality_resolution
 
     try:
-        account = await zai_image_service.select_active_account(current_user.id)
+        account = await zai_image_service.select_active_account(
+            current_user.id, strategy=resolve_balance_strategy(current_user)
+        )
         data_items: list[dict] = []
 
         for _ in range(n):
@@ -714,10 +728,11 @@ async def responses(
 
             if stream:
                 tracker = SSEUsageTracker()
-                client, resp, _account = await codex_service.open_codex_responses_stream(
+                _client, resp, _account = await codex_service.open_codex_responses_stream(
                     user_id=current_user.id,
                     request_data=request_json,
                     user_agent=raw_request.headers.get("User-Agent"),
+                    strategy=resolve_balance_strategy(current_user),
                 )
 
                 async def generate():
@@ -794,11 +809,6 @@ async def responses(
                                 await resp.aclose()
                             except Exception:
                                 pass
-                        if client is not None:
-                            try:
-                                await client.aclose()
-                            except Exception:
-                                pass
 
                 return StreamingResponse(
                     generate(),
@@ -810,6 +820,7 @@ async def responses(
                 user_id=current_user.id,
                 request_data=request_json,
                 user_agent=raw_request.headers.get("User-Agent"),
+                strategy=resolve_balance_strategy(current_user),
             )
 
             duration_ms = int((time.monotonic() - start_time) * 1000)
@@ -952,12 +963,19 @@ async def responses(
 @router.post(
     "/chat/completions",
     summary="聊天补全",
-    description="使用plug-in-api进行聊天补全（OpenAI兼容）。根据API key的config_type自动选择Antigravity / Kiro / Qwen配置"
+    description="使用plug-in-api进行聊天补全（OpenAI兼容）。根据API key的config_type自动选择Antigravity / Kiro / Qwen配置",
+    # 请求体由 get_chat_completion_request_data 解析，这里补回文档中的请求体结构
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": ChatCompletionRequest.model_json_schema()}},
+        }
+    },
 )
 async def chat_completions(
-    request: ChatCompletionRequest,
     raw_request: Request,
     current_user: User = Depends(get_user_flexible),
+    request_data: Dict[str, Any] = Depends(get_chat_completion_request_data),
     antigravity_service: PluginAPIService = Depends(get_plugin_api_service),
     kiro_service: KiroService = Depends(get_kiro_service),
     codex_service: CodexService = Depends(get_codex_service),
@@ -981,7 +999,8 @@ async def chat_completions(
     endpoint = raw_request.url.path
     method = raw_request.method
     api_key_id = getattr(current_user, "_api_key_id", None)
-    model_name = getattr(request, "model", None)
+    model_name = request_data.get("model")
+    stream = bool(request_data.get("stream"))
 
     config_type = getattr(current_user, "_config_type", None)
     if config_type is None:
@@ -999,8 +1018,6 @@ async def chat_completions(
         if effective_config_type != "zai-image":
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="config_type must be zai-image")
 
-        request_data = request.model_dump()
-
         try:
             prompt = _extract_openai_chat_text_prompt(request_data.get("messages"))
             if not prompt:
@@ -1036,7 +1053,9 @@ async def chat_completions(
                 if quality_resolution:
                     resolution = quality_resolution
 
-            account = await zai_image_service.select_active_account(current_user.id)
+            account = await zai_image_service.select_active_account(
+                current_user.id, strategy=resolve_balance_strategy(current_user)
+            )
             outputs: list[str] = []
 
             for _ in range(n):
@@ -1060,7 +1079,7 @@ async def chat_completions(
                 method=method,
                 model_name=LOCAL_IMAGE_MODEL_ID,
                 config_type="zai-image",
-                stream=bool(request.stream),
+                stream=stream,
                 quota_consumed=float(n),
                 input_tokens=0,
                 output_tokens=0,
@@ -1074,7 +1093,7 @@ async def chat_completions(
             completion_id = f"chatcmpl-{uuid.uuid4().hex}"
             response_model = str(model_name or LOCAL_IMAGE_MODEL_ID)
 
-            if request.stream:
+            if stream:
 
                 async def generate():
                     for idx, out in enumerate(outputs):
@@ -1091,7 +1110,7 @@ async def chat_completions(
                                 }
                             ],
                         }
-                        yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                        yield f"data: {jsonx.dumps_str(chunk)}\n\n"
 
                         done_chunk = {
                             "id": completion_id,
@@ -1106,7 +1125,7 @@ async def chat_completions(
                                 }
                             ],
                         }
-                        yield f"data: {json.dumps(done_chunk, ensure_ascii=False)}\n\n"
+                        yield f"data: {jsonx.dumps_str(done_chunk)}\n\n"
 
                     yield "data: [DONE]\n\n"
 
@@ -1142,7 +1161,7 @@ async def chat_completions(
                 method=method,
                 model_name=LOCAL_IMAGE_MODEL_ID,
                 config_type="zai-image",
-                stream=bool(request.stream),
+                stream=stream,
                 quota_consumed=0.0,
                 input_tokens=0,
                 output_tokens=0,
@@ -1162,7 +1181,7 @@ async def chat_completions(
                 method=method,
                 model_name=LOCAL_IMAGE_MODEL_ID,
                 config_type="zai-image",
-                stream=bool(request.stream),
+                stream=stream,
                 quota_consumed=0.0,
                 input_tokens=0,
                 output_tokens=0,
@@ -1189,7 +1208,9 @@ async def chat_completions(
 
             # 获取 allowed_account_ids
             allowed_ids = getattr(current_user, "_allowed_account_ids", None)
-            account = await custom_svc.select_active_account(current_user.id, allowed_ids)
+            account = await custom_svc.select_active_account(
+                current_user.id, allowed_ids, strategy=resolve_balance_strategy(current_user)
+            )
             if not account:
                 raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="没有可用的自定义账号")
 
@@ -1207,35 +1228,61 @@ async def chat_completions(
             await custom_svc.mark_last_used(account.id)
             await custom_db.commit()
 
-        request_data = request.model_dump()
+        # 上游熔断中（或半开探测名额已被占用）：直接返回 503，不再等上游超时
+        breaker = get_circuit_breaker()
+        upstream_circuit = circuit_key("custom", upstream_base_url)
+        circuit_open_message = "自定义账号上游持续出错（熔断中），请稍后重试"
+        if breaker.is_open(upstream_circuit):
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=circuit_open_message)
+
         upstream_url = f"{upstream_base_url}/chat/completions"
         upstream_headers = {
             "Authorization": f"Bearer {upstream_api_key}",
             "Content-Type": "application/json",
         }
 
-        transport = httpx.AsyncHTTPTransport(proxy=upstream_proxy) if upstream_proxy else None
+        upstream_timeout = request_timeout(UPSTREAM_CUSTOM, 300.0, connect=30.0)
 
-        if request.stream:
+        if stream:
             tracker = SSEUsageTracker()
 
             async def generate_custom():
-                client = None
                 try:
-                    client = httpx.AsyncClient(transport=transport, timeout=httpx.Timeout(300.0, connect=30.0))
-                    async with client.stream("POST", upstream_url, json=request_data, headers=upstream_headers) as resp:
-                        if resp.status_code != 200:
-                            body = await resp.aread()
-                            tracker.success = False
-                            tracker.status_code = resp.status_code
-                            tracker.error_message = body.decode("utf-8", errors="replace")[:500]
-                            err = {"error": {"message": tracker.error_message, "type": "upstream_error", "code": resp.status_code}}
-                            yield f"data: {json.dumps(err, ensure_ascii=False)}\n\n".encode("utf-8")
-                            yield b"data: [DONE]\n\n"
-                            return
-                        async for chunk in resp.aiter_bytes():
-                            tracker.feed(chunk)
-                            yield chunk
+                    # 紧挨着上游请求再占用（可能是半开探测名额），生成器未被消费时不会占着名额
+                    permit = breaker.try_acquire(upstream_circuit)
+                    if permit is None:
+                        tracker.success = False
+                        tracker.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+                        tracker.error_message = circuit_open_message
+                        err = {"error": {"message": circuit_open_message, "type": "upstream_error", "code": 503}}
+                        yield b"data: " + jsonx.dumps(err) + b"\n\n"
+                        yield b"data: [DONE]\n\n"
+                        return
+                    with permit:
+                        async with lease_upstream_client(upstream_base_url, upstream_proxy) as client:
+                            async with client.stream(
+                                "POST", upstream_url, json=request_data, headers=upstream_headers, timeout=upstream_timeout
+                            ) as resp:
+                                permit.observe_status(resp.status_code)
+                                if resp.status_code != 200:
+                                    body = await resp.aread()
+                                    tracker.success = False
+                                    tracker.status_code = resp.status_code
+                                    tracker.error_message = body.decode("utf-8", errors="replace")[:500]
+                                    err = {"error": {"message": tracker.error_message, "type": "upstream_error", "code": resp.status_code}}
+                                    yield b"data: " + jsonx.dumps(err) + b"\n\n"
+                                    yield b"data: [DONE]\n\n"
+                                    return
+                                async for chunk in resp.aiter_bytes():
+                                    tracker.feed(chunk)
+                                    yield chunk
+                except httpx.PoolTimeout:
+                    tracker.success = False
+                    tracker.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+                    tracker.error_message = UPSTREAM_POOL_EXHAUSTED_MESSAGE
+                    err = {"error": {"message": UPSTREAM_POOL_EXHAUSTED_MESSAGE, "type": "upstream_error", "code": 503}}
+                    yield b"data: " + jsonx.dumps(err) + b"\n\n"
+                    yield b"data: [DONE]\n\n"
                 except Exception as e:
                     tracker.success = False
                     tracker.status_code = tracker.status_code or 500
@@ -1260,11 +1307,6 @@ async def chat_completions(
                         error_message=tracker.error_message,
                         duration_ms=duration_ms,
                     )
-                    if client:
-                        try:
-                            await client.aclose()
-                        except Exception:
-                            pass
 
             return StreamingResponse(
                 generate_custom(),
@@ -1273,9 +1315,14 @@ async def chat_completions(
             )
 
         # 非流式
+        permit = breaker.try_acquire(upstream_circuit)
+        if permit is None:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=circuit_open_message)
         try:
-            async with httpx.AsyncClient(transport=transport, timeout=httpx.Timeout(300.0, connect=30.0)) as client:
-                resp = await client.post(upstream_url, json=request_data, headers=upstream_headers)
+            with permit:
+                async with lease_upstream_client(upstream_base_url, upstream_proxy) as client:
+                    resp = await client.post(upstream_url, json=request_data, headers=upstream_headers, timeout=upstream_timeout)
+                permit.observe_status(resp.status_code, timed=False)
 
             duration_ms = int((time.monotonic() - start_time) * 1000)
             if resp.status_code != 200:
@@ -1339,6 +1386,9 @@ async def chat_completions(
             return JSONResponse(status_code=e.response.status_code, content=upstream_response)
         except Exception as e:
             duration_ms = int((time.monotonic() - start_time) * 1000)
+            # 本进程到上游的连接池已满：返回 503，客户端可稍后重试
+            pool_exhausted = isinstance(e, httpx.PoolTimeout)
+            error_status = status.HTTP_503_SERVICE_UNAVAILABLE if pool_exhausted else status.HTTP_500_INTERNAL_SERVER_ERROR
             await UsageLogService.record(
                 user_id=current_user.id,
                 api_key_id=api_key_id,
@@ -1348,24 +1398,26 @@ async def chat_completions(
                 config_type="custom",
                 stream=False,
                 success=False,
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                status_code=error_status,
                 error_message=str(e),
                 duration_ms=duration_ms,
             )
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"自定义代理转发失败: {str(e)}")
+            if pool_exhausted:
+                raise HTTPException(status_code=error_status, detail=UPSTREAM_POOL_EXHAUSTED_MESSAGE)
+            raise HTTPException(status_code=error_status, detail=f"自定义代理转发失败: {str(e)}")
 
     try:
         if use_codex:
-            request_data = request.model_dump()
             responses_request = chat_completions_request_to_responses_request(request_data)
 
-            if request.stream:
+            if stream:
                 tracker = SSEUsageTracker()
                 translator = ResponsesToChatCompletionsSSETranslator(original_request=request_data)
-                client, resp, _account = await codex_service.open_codex_responses_stream(
+                _client, resp, _account = await codex_service.open_codex_responses_stream(
                     user_id=current_user.id,
                     request_data=responses_request,
                     user_agent=raw_request.headers.get("User-Agent"),
+                    strategy=resolve_balance_strategy(current_user),
                 )
 
                 async def generate():
@@ -1410,8 +1462,7 @@ async def chat_completions(
                                 "code": int(tracker.status_code or 500),
                             }
                         }
-                        data = json.dumps(err_payload, ensure_ascii=False, separators=(",", ":"))
-                        yield f"data: {data}\n\n".encode("utf-8")
+                        yield b"data: " + jsonx.dumps(err_payload) + b"\n\n"
                         yield b"data: [DONE]\n\n"
                         return
                     finally:
@@ -1455,11 +1506,6 @@ async def chat_completions(
                                 await resp.aclose()
                             except Exception:
                                 pass
-                        if client is not None:
-                            try:
-                                await client.aclose()
-                            except Exception:
-                                pass
 
                 return StreamingResponse(
                     generate(),
@@ -1471,6 +1517,7 @@ async def chat_completions(
                 user_id=current_user.id,
                 request_data=responses_request,
                 user_agent=raw_request.headers.get("User-Agent"),
+                strategy=resolve_balance_strategy(current_user),
             )
             result = responses_response_to_chat_completions_response(
                 resp_obj,
@@ -1518,7 +1565,7 @@ async def chat_completions(
         if config_type:
             extra_headers["X-Account-Type"] = config_type
 
-        if request.stream:
+        if stream:
             tracker = SSEUsageTracker()
 
             async def generate():
@@ -1526,14 +1573,15 @@ async def chat_completions(
                     if use_gemini_cli:
                         async for chunk in gemini_cli_service.openai_chat_completions_stream(
                             user_id=current_user.id,
-                            request_data=request.model_dump(),
+                            request_data=request_data,
+                            strategy=resolve_balance_strategy(current_user),
                         ):
                             tracker.feed(chunk)
                             yield chunk
                     elif use_kiro:
                         async for chunk in kiro_service.chat_completions_stream(
                             user_id=current_user.id,
-                            request_data=request.model_dump(),
+                            request_data=request_data,
                             api_key_id=api_key_id
                         ):
                             if isinstance(chunk, (bytes, bytearray)):
@@ -1546,7 +1594,7 @@ async def chat_completions(
                             user_id=current_user.id,
                             method="POST",
                             path="/v1/chat/completions",
-                            json_data=request.model_dump(),
+                            json_data=request_data,
                             extra_headers=extra_headers if extra_headers else None,
                         ):
                             tracker.feed(chunk)
@@ -1586,7 +1634,8 @@ async def chat_completions(
         if use_gemini_cli:
             result = await gemini_cli_service.openai_chat_completions(
                 user_id=current_user.id,
-                request_data=request.model_dump(),
+                request_data=request_data,
+                strategy=resolve_balance_strategy(current_user),
             )
             duration_ms = int((time.monotonic() - start_time) * 1000)
             in_tok, out_tok, total_tok = extract_openai_usage(result)
@@ -1610,7 +1659,7 @@ async def chat_completions(
         if use_kiro:
             openai_stream = kiro_service.chat_completions_stream(
                 user_id=current_user.id,
-                request_data=request.model_dump(),
+                request_data=request_data,
                 api_key_id=api_key_id
             )
         else:
@@ -1618,7 +1667,7 @@ async def chat_completions(
                 user_id=current_user.id,
                 method="POST",
                 path="/v1/chat/completions",
-                json_data=request.model_dump(),
+                json_data=request_data,
                 extra_headers=extra_headers if extra_headers else None,
             )
 
@@ -1695,7 +1744,7 @@ async def chat_completions(
             method=method,
             model_name=model_name,
             config_type=effective_config_type,
-            stream=bool(request.stream),
+            stream=stream,
             success=False,
             status_code=e.status_code,
             error_message=str(e.detail) if hasattr(e, "detail") else str(e),
@@ -1711,7 +1760,7 @@ async def chat_completions(
             method=method,
             model_name=model_name,
             config_type=effective_config_type,
-            stream=bool(request.stream),
+            stream=stream,
             success=False,
             status_code=e.status_code,
             error_message=e.extracted_message,
@@ -1751,7 +1800,7 @@ async def chat_completions(
             method=method,
             model_name=model_name,
             config_type=effective_config_type,
-            stream=bool(request.stream),
+            stream=stream,
             success=False,
             status_code=e.response.status_code,
             error_message=error_message,
@@ -1771,7 +1820,7 @@ async def chat_completions(
             method=method,
             model_name=model_name,
             config_type=effective_config_type,
-            stream=bool(request.stream),
+            stream=stream,
             success=False,
             status_code=status.HTTP_400_BAD_REQUEST,
             error_message=str(e),
@@ -1787,7 +1836,7 @@ async def chat_completions(
             method=method,
             model_name=model_name,
             config_type=effective_config_type,
-            stream=bool(request.stream),
+            stream=stream,
             success=False,
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             error_message=str(e),
@@ -8,10 +8,48 @@ from app.cache.redis_client import (
     init_redis,
     close_redis,
 )
+from app.cache.auth_cache import (
+    AuthCache,
+    get_auth_cache,
+    init_auth_cache,
+    close_auth_cache,
+)
+from app.cache.content_cache import (
+    ContentCache,
+    get_content_cache,
+)
+from app.cache.kiro_history_cache import (
+    KiroHistoryCache,
+    get_kiro_history_cache,
+)
+from app.cache.codex_account_pool import (
+    CodexAccountPool,
+    get_codex_account_pool,
+    init_codex_account_pool,
+    close_codex_account_pool,
+)
+from app.cache.token_refresh_lock import (
+    TokenRefreshCoordinator,
+    get_token_refresh_coordinator,
+)
 
 __all__ = [
     "RedisClient",
     "get_redis_client",
     "init_redis",
     "close_redis",
+    "AuthCache",
+    "get_auth_cache",
+    "init_auth_cache",
+    "close_auth_cache",
+    "ContentCache",
+    "get_content_cache",
+    "KiroHistoryCache",
+    "get_kiro_history_cache",
+    "CodexAccountPool",
+    "get_codex_account_pool",
+    "init_codex_account_pool",
+    "close_codex_account_pool",
+    "TokenRefreshCoordinator",
+    "get_token_refresh_coordinator",
 ]
\ No newline at end of file
@@ -0,0 +1,337 @@
+"""
+认证缓存
+API key / JWT 用户认证结果的两级缓存：
+
+- L1：进程内 TTL + LRU 缓存，已见过的凭证命中时不产生任何网络往返
+- L2：Redis，多 worker 共享，L1 未命中时回源
+
+API key 被禁用、删除、修改类型，或用户状态变化时，通过 Redis pub/sub
+广播失效消息，各 worker 同步清理自己的 L1。
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from app.cache.redis_client import RedisClient, get_redis_client
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Redis 键前缀（与历史实现保持一致）
+API_KEY_AUTH_PREFIX = "api_key_auth:"
+JWT_USER_PREFIX = "jwt_user:"
+
+# 失效广播频道
+INVALIDATION_CHANNEL = "auth_cache:invalidate"
+
+# API key last_used 的本地写入节流（秒）
+LAST_USED_THROTTLE_SECONDS = 60
+
+
+class TTLCache:
+    """
+    进程内 TTL + LRU 缓存
+
+    只在事件循环线程内使用，不加锁。
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max(1, int(max_size))
+        self.ttl = float(ttl)
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else min(self.ttl, float(ttl))
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> bool:
+        return self._data.pop(key, None) is not None
+
+    def pop_where(self, predicate: Callable[[Any], bool]) -> int:
+        """删除 value 满足条件的所有条目，返回删除数量"""
+        keys = [k for k, (_, v) in self._data.items() if predicate(v)]
+        for k in keys:
+            del self._data[k]
+        return len(keys)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class AuthCache:
+    """
+    认证结果两级缓存
+
+    缓存值为可 JSON 序列化的 dict（与 Redis 中存储的结构一致），
+    User 对象的重建由调用方负责。
+    """
+
+    def __init__(
+        self,
+        redis: Optional[RedisClient] = None,
+        *,
+        max_size: int = 10000,
+        ttl: float = 30.0,
+    ):
+        self._redis = redis
+        self._api_keys = TTLCache(max_size, ttl)
+        self._users = TTLCache(max_size, ttl)
+        self._last_used = TTLCache(max_size, LAST_USED_THROTTLE_SECONDS)
+        self._listener: Optional[asyncio.Task] = None
+
+        self.l1_hits = 0
+        self.l2_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def redis(self) -> RedisClient:
+        return self._redis if self._redis is not None else get_redis_client()
+
+    # ==================== 读写 ====================
+
+    async def _get(self, l1: TTLCache, key: Hashable, redis_key: str) -> Optional[Dict[str, Any]]:
+        value = l1.get(key)
+        if value is not None:
+            self.l1_hits += 1
+            return value
+
+        try:
+            value = await self.redis.get_json(redis_key)
+        except Exception as e:
+            logger.warning(f"Redis 缓存读取失败: {e}")
+            value = None
+
+        if value:
+            self.l2_hits += 1
+            l1.set(key, value)
+            return value
+
+        self.misses += 1
+        return None
+
+    async def _set(
+        self,
+        l1: TTLCache,
+        key: Hashable,
+        redis_key: str,
+        value: Dict[str, Any],
+        expire: int,
+    ) -> None:
+        l1.set(key, value, ttl=expire)
+        try:
+            await self.redis.set_json(redis_key, value, expire=expire)
+        except Exception as e:
+            logger.warning(f"Redis 缓存写入失败: {e}")
+
+    async def get_api_key(self, api_key: str) -> Optional[Dict[str, Any]]:
+        """获取 API key 认证结果"""
+        return await self._get(self._api_keys, api_key, f"{API_KEY_AUTH_PREFIX}{api_key}")
+
+    async def set_api_key(self, api_key: str, data: Dict[str, Any], expire: int) -> None:
+        """缓存 API key 认证结果"""
+        await self._set(self._api_keys, api_key, f"{API_KEY_AUTH_PREFIX}{api_key}", data, expire)
+
+    async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """获取 JWT 用户信息"""
+        return await self._get(self._users, int(user_id), f"{JWT_USER_PREFIX}{user_id}")
+
+    async def set_user(self, user_id: int, data: Dict[str, Any], expire: int) -> None:
+        """缓存 JWT 用户信息"""
+        await self._set(self._users, int(user_id), f"{JWT_USER_PREFIX}{user_id}", data, expire)
+
+    def should_touch_last_used(self, api_key: str) -> bool:
+        """
+        本地判断是否需要更新 API key 的 last_used
+
+        每个 worker 在节流窗口内只放行一次，避免每个请求都访问 Redis 做限流判断。
+        """
+        if self._last_used.get(api_key) is not None:
+            return False
+        self._last_used.set(api_key, True)
+        return True
+
+    # ==================== 失效 ====================
+
+    def _drop_api_keys(self, api_keys: Iterable[str]) -> None:
+        for api_key in api_keys:
+            self._api_keys.pop(api_key)
+            self._last_used.pop(api_key)
+
+    def _drop_user(self, user_id: int) -> None:
+        self._users.pop(user_id)
+        self._api_keys.pop_where(lambda data: data.get("id") == user_id)
+
+    async def _publish(self, message: Dict[str, Any]) -> None:
+        try:
+            await self.redis.publish(INVALIDATION_CHANNEL, json.dumps(message))
+        except Exception as e:
+            logger.warning(f"认证缓存失效广播失败: {e}")
+
+    async def invalidate_api_key(self, *api_keys: str) -> None:
+        """使 API key 认证缓存失效（本地、Redis 及其他 worker）"""
+        keys = [k for k in api_keys if k]
+        if not keys:
+            return
+        self.invalidations += 1
+        self._drop_api_keys(keys)
+        for api_key in keys:
+            try:
+                await self.redis.delete(f"{API_KEY_AUTH_PREFIX}{api_key}")
+            except Exception as e:
+                logger.warning(f"Redis 缓存删除失败: {e}")
+        await self._publish({"type": "api_key", "keys": keys})
+
+    async def invalidate_user(self, user_id: int, api_keys: Iterable[str] = ()) -> None:
+        """
+        使用户相关的认证缓存失效
+
+        Args:
+            user_id: 用户 ID
+            api_keys: 该用户的 API key 列表（用于清理 Redis 中的 API key 认证缓存）
+        """
+        user_id = int(user_id)
+        keys = [k for k in api_keys if k]
+        self.invalidations += 1
+        self._drop_user(user_id)
+        self._drop_api_keys(keys)
+        for redis_key in [f"{JWT_USER_PREFIX}{user_id}"] + [f"{API_KEY_AUTH_PREFIX}{k}" for k in keys]:
+            try:
+                await self.redis.delete(redis_key)
+            except Exception as e:
+                logger.warning(f"Redis 缓存删除失败: {e}")
+        await self._publish({"type": "user", "user_id": user_id, "keys": keys})
+
+    def apply_invalidation(self, raw: Any) -> None:
+        """处理来自 pub/sub 的失效消息"""
+        try:
+            message = json.loads(raw) if isinstance(raw, (str, bytes)) else raw
+        except (TypeError, ValueError):
+            return
+        if not isinstance(message, dict):
+            return
+        keys = message.get("keys") or []
+        if message.get("type") == "user" and message.get("user_id") is not None:
+            self._drop_user(int(message["user_id"]))
+        self._drop_api_keys(keys)
+
+    def clear_local(self) -> None:
+        """清空本地 L1"""
+        self._api_keys.clear()
+        self._users.clear()
+
+    # ==================== 订阅 ====================
+
+    async def _listen(self) -> None:
+        backoff = 1.0
+        while True:
+            pubsub = None
+            try:
+                pubsub = await self.redis.pubsub()
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                # 订阅中断期间可能错过失效消息，重新订阅后清空 L1
+                self.clear_local()
+                backoff = 1.0
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message and message.get("type") == "message":
+                        self.apply_invalidation(message.get("data"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"认证缓存失效订阅中断，{backoff:.0f}s 后重试: {e}")
+                self.clear_local()
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.reset()
+                    except Exception:
+                        pass
+
+    def start(self) -> None:
+        """启动失效订阅任务"""
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        """停止失效订阅任务"""
+        task, self._listener = self._listener, None
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存命中统计"""
+        lookups = self.l1_hits + self.l2_hits + self.misses
+        return {
+            "lookups": lookups,
+            "l1_hits": self.l1_hits,
+            "l2_hits": self.l2_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.l1_hits + self.l2_hits) / lookups, 4) if lookups else 0.0,
+            "l1_hit_rate": round(self.l1_hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "l1_size": len(self._api_keys) + len(self._users),
+            "subscribed": self._listener is not None and not self._listener.done(),
+        }
+
+
+# 全局认证缓存实例
+_auth_cache: Optional[AuthCache] = None
+
+
+def get_auth_cache() -> AuthCache:
+    """
+    获取认证缓存实例
+    使用单例模式
+
+    Returns:
+        AuthCache 实例
+    """
+    global _auth_cache
+    if _auth_cache is None:
+        settings = get_settings()
+        _auth_cache = AuthCache(
+            max_size=settings.auth_cache_l1_size,
+            ttl=settings.auth_cache_l1_ttl_seconds,
+        )
+    return _auth_cache
+
+
+async def init_auth_cache() -> None:
+    """初始化认证缓存并启动失效订阅"""
+    get_auth_cache().start()
+
+
+async def close_auth_cache() -> None:
+    """停止失效订阅并释放认证缓存"""
+    global _auth_cache
+    if _auth_cache is not None:
+        await _auth_cache.stop()
+        _auth_cache = None
@@ -0,0 +1,425 @@
+"""
+Codex 账号池（进程内）
+
+选号原本每次（以及每次 429/401/403 换号重试）都要从数据库加载该用户全部启用账号再逐个判断冻结状态。
+这里按用户在内存中维护账号的选号状态（启用状态、5h/周限额百分比与重置时间、在途请求数），
+选号只读内存：
+- 可用账号按 id 升序保存（fill-first 取第一个未排除的即可）
+- 冻结账号按解冻时间放入小顶堆，到期后自动回到可用列表
+
+冻结、限额、刷新、管理端修改等事件由 CodexService 调用 update/remove 更新本地状态，
+并通过 Redis pub/sub 广播账号状态，其他 worker 直接应用，不再回查数据库。
+每个用户的池超过 POOL_TTL_SECONDS 会从数据库重新加载一次，兜底修正漏掉的广播或库外修改。
+过期（或重新订阅后被作废）的池不会立即删除，重新加载时沿用其中的在途计数：
+长连接流在重新加载之后才结束，release 仍能扣减到正确的计数上。
+
+只在事件循环线程内使用，不加锁。
+"""
+import asyncio
+import bisect
+import heapq
+import json
+import logging
+import math
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.cache.redis_client import RedisClient, get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# 账号状态广播频道
+SYNC_CHANNEL = "codex_account_pool:sync"
+
+# 用户账号池的最长缓存时间（秒），到期后从数据库重新加载
+POOL_TTL_SECONDS = 60.0
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[float]:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+@dataclass
+class CodexAccountState:
+    """单个账号的选号状态（与 CodexAccount.effective_status 的判断口径一致）"""
+
+    id: int
+    user_id: int
+    status: int = 1
+    limit_5h_used_percent: Optional[int] = None
+    limit_5h_reset_at: Optional[float] = None  # UNIX 时间戳
+    limit_week_used_percent: Optional[int] = None
+    limit_week_reset_at: Optional[float] = None  # UNIX 时间戳
+    # 本 worker 内正在使用该账号的请求数（不跨 worker 同步）
+    in_flight: int = 0
+
+    @classmethod
+    def from_account(cls, account: Any) -> "CodexAccountState":
+        """从 CodexAccount ORM 实例（或包含同名列的查询结果行）构建"""
+        return cls(
+            id=int(account.id),
+            user_id=int(account.user_id),
+            status=int(account.status or 0),
+            limit_5h_used_percent=account.limit_5h_used_percent,
+            limit_5h_reset_at=_timestamp(account.limit_5h_reset_at),
+            limit_week_used_percent=account.limit_week_used_percent,
+            limit_week_reset_at=_timestamp(account.limit_week_reset_at),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """广播用的状态（不含本地在途计数）"""
+        data = asdict(self)
+        data.pop("in_flight")
+        return data
+
+    @property
+    def available_at(self) -> float:
+        """
+        解冻时间戳：0 表示未冻结；inf 表示打满但缺少重置时间（需要管理端或同步事件解冻）
+
+        任一限额桶打满（>=100）时冻结到该桶的重置时间，两个桶都打满时取较晚者。
+        """
+        at = 0.0
+        for percent, reset_at in (
+            (self.limit_week_used_percent, self.limit_week_reset_at),
+            (self.limit_5h_used_percent, self.limit_5h_reset_at),
+        ):
+            if percent is not None and int(percent) >= 100:
+                at = max(at, math.inf if reset_at is None else reset_at)
+        return at
+
+    def is_available(self, now: float) -> bool:
+        return self.status == 1 and self.available_at <= now
+
+    def remaining_ratio(self, now: float) -> float:
+        """剩余限额比例（0~1，取 5h / 周两个桶中较少者；重置时间已过的桶视为已恢复）"""
+        ratio = 1.0
+        for percent, reset_at in (
+            (self.limit_5h_used_percent, self.limit_5h_reset_at),
+            (self.limit_week_used_percent, self.limit_week_reset_at),
+        ):
+            if percent is None or (reset_at is not None and reset_at <= now):
+                continue
+            ratio = min(ratio, max(0.0, 1.0 - int(percent) / 100.0))
+        return ratio
+
+
+class UserAccountPool:
+    """单个用户的账号池"""
+
+    def __init__(self, states: Iterable[CodexAccountState], *, loaded_at: float):
+        self.loaded_at = loaded_at
+        self.accounts: Dict[int, CodexAccountState] = {}
+        # 可用账号 id（升序）
+        self._available: List[int] = []
+        # (解冻时间戳, 账号 id) 小顶堆；过期条目在出堆时按当前状态校验后丢弃
+        self._frozen: List[Tuple[float, int]] = []
+        for state in states:
+            self.upsert(state)
+
+    def __len__(self) -> int:
+        return len(self.accounts)
+
+    def _discard_available(self, account_id: int) -> None:
+        i = bisect.bisect_left(self._available, account_id)
+        if i < len(self._available) and self._available[i] == account_id:
+            del self._available[i]
+
+    def _insert_available(self, account_id: int) -> None:
+        i = bisect.bisect_left(self._available, account_id)
+        if i == len(self._available) or self._available[i] != account_id:
+            self._available.insert(i, account_id)
+
+    def upsert(self, state: CodexAccountState, now: Optional[float] = None) -> None:
+        previous = self.accounts.get(state.id)
+        if previous is not None:
+            state.in_flight = previous.in_flight
+            self._discard_available(state.id)
+        self.accounts[state.id] = state
+
+        if state.status != 1:
+            return
+        at = state.available_at
+        if at <= (time.time() if now is None else now):
+            self._insert_available(state.id)
+        elif at != math.inf:
+            heapq.heappush(self._frozen, (at, state.id))
+
+    def remove(self, account_id: int) -> None:
+        if self.accounts.pop(account_id, None) is not None:
+            self._discard_available(account_id)
+
+    def _thaw(self, now: float) -> None:
+        frozen = self._frozen
+        while frozen and frozen[0][0] <= now:
+            at, account_id = heapq.heappop(frozen)
+            state = self.accounts.get(account_id)
+            if state is not None and state.status == 1 and state.available_at == at:
+                self._insert_available(account_id)
+
+    def select(self, exclude_ids: Set[int] = frozenset(), now: Optional[float] = None) -> Optional[CodexAccountState]:
+        """fill-first：返回 id 最小的可用账号（跳过 exclude_ids）"""
+        self._thaw(time.time() if now is None else now)
+        for account_id in self._available:
+            if account_id not in exclude_ids:
+                return self.accounts[account_id]
+        return None
+
+    def candidates(self, exclude_ids: Set[int] = frozenset(), now: Optional[float] = None) -> List[CodexAccountState]:
+        """全部可用账号（按 id 升序，跳过 exclude_ids），供负载均衡策略选择"""
+        self._thaw(time.time() if now is None else now)
+        return [self.accounts[i] for i in self._available if i not in exclude_ids]
+
+    def has_enabled(self) -> bool:
+        return any(state.status == 1 for state in self.accounts.values())
+
+    def earliest_unfreeze(self, now: Optional[float] = None) -> Tuple[Optional[float], bool]:
+        """
+        启用但冻结的账号中最早的解冻时间
+
+        Returns:
+            (最早解冻时间戳或 None, 是否存在缺少重置时间的冻结账号)
+        """
+        now = time.time() if now is None else now
+        earliest: Optional[float] = None
+        has_unknown_reset = False
+        for state in self.accounts.values():
+            if state.status != 1:
+                continue
+            at = state.available_at
+            if at == math.inf:
+                has_unknown_reset = True
+            elif at > now and (earliest is None or at < earliest):
+                earliest = at
+        return earliest, has_unknown_reset
+
+    def available_count(self, now: Optional[float] = None) -> int:
+        self._thaw(time.time() if now is None else now)
+        return len(self._available)
+
+
+class CodexAccountPool:
+    """按用户缓存的 Codex 账号池，账号状态变化通过 Redis pub/sub 在 worker 间同步"""
+
+    def __init__(self, redis: Optional[RedisClient] = None, *, ttl: float = POOL_TTL_SECONDS):
+        self._redis = redis
+        self.ttl = float(ttl)
+        self._users: Dict[int, UserAccountPool] = {}
+        self._listener: Optional[asyncio.Task] = None
+
+        self.selections = 0
+        self.loads = 0
+        self.published = 0
+        self.applied = 0
+
+    @property
+    def redis(self) -> RedisClient:
+        return self._redis if self._redis is not None else get_redis_client()
+
+    # ==================== 读取 ====================
+
+    def get(self, user_id: int) -> Optional[UserAccountPool]:
+        """
+        返回已加载且未过期的用户账号池；返回 None 时调用方应从数据库加载后调用 load()
+
+        过期的池保留到 load() 替换为止（在途计数由新池继承）。
+        """
+        pool = self._users.get(int(user_id))
+        if pool is None or time.monotonic() - pool.loaded_at > self.ttl:
+            return None
+        return pool
+
+    def load(self, user_id: int, accounts: Iterable[Any]) -> UserAccountPool:
+        """用数据库中的账号（ORM 实例或查询结果行）建立用户账号池"""
+        self.loads += 1
+        previous = self._users.get(int(user_id))
+        pool = UserAccountPool(
+            (CodexAccountState.from_account(account) for account in accounts),
+            loaded_at=time.monotonic(),
+        )
+        if previous is not None:
+            for account_id, state in pool.accounts.items():
+                old = previous.accounts.get(account_id)
+                if old is not None:
+                    state.in_flight = old.in_flight
+        self._users[int(user_id)] = pool
+        return pool
+
+    def select(self, user_id: int, exclude_ids: Set[int] = frozenset()) -> Optional[CodexAccountState]:
+        """fill-first 选号"""
+        pool = self._users.get(int(user_id))
+        if pool is None:
+            return None
+        self.selections += 1
+        return pool.select(exclude_ids)
+
+    def candidates(self, user_id: int, exclude_ids: Set[int] = frozenset()) -> List[CodexAccountState]:
+        """全部可用账号（供 fill-first 以外的负载均衡策略选择）"""
+        pool = self._users.get(int(user_id))
+        if pool is None:
+            return []
+        self.selections += 1
+        return pool.candidates(exclude_ids)
+
+    # ==================== 在途计数 ====================
+
+    def acquire(self, user_id: int, account_id: int) -> None:
+        pool = self._users.get(int(user_id))
+        state = pool.accounts.get(int(account_id)) if pool is not None else None
+        if state is not None:
+            state.in_flight += 1
+
+    def release(self, user_id: int, account_id: int) -> None:
+        pool = self._users.get(int(user_id))
+        state = pool.accounts.get(int(account_id)) if pool is not None else None
+        if state is not None and state.in_flight > 0:
+            state.in_flight -= 1
+
+    # ==================== 事件 ====================
+
+    def _apply_state(self, state: CodexAccountState) -> bool:
+        """更新本地状态，返回状态是否变化（本地未加载该用户时视为变化）"""
+        pool = self._users.get(state.user_id)
+        if pool is None:
+            return True
+        previous = pool.accounts.get(state.id)
+        if previous is not None and previous.to_dict() == state.to_dict():
+            return False
+        pool.upsert(state)
+        return True
+
+    def _apply_remove(self, user_id: int, account_id: int) -> None:
+        pool = self._users.get(int(user_id))
+        if pool is not None:
+            pool.remove(int(account_id))
+
+    async def _publish(self, message: Dict[str, Any]) -> None:
+        self.published += 1
+        try:
+            await self.redis.publish(SYNC_CHANNEL, json.dumps(message))
+        except Exception as e:
+            logger.warning(f"Codex 账号池同步广播失败: {e}")
+
+    async def update(self, account: Any) -> None:
+        """账号状态已落库：更新本地账号池，状态有变化时广播给其他 worker"""
+        state = CodexAccountState.from_account(account)
+        if self._apply_state(state):
+            await self._publish({"type": "account", "account": state.to_dict()})
+
+    async def remove(self, user_id: int, account_id: int) -> None:
+        """账号已删除：从本地与其他 worker 的账号池中移除"""
+        self._apply_remove(user_id, account_id)
+        await self._publish({"type": "remove", "user_id": int(user_id), "account_id": int(account_id)})
+
+    def apply_message(self, raw: Any) -> None:
+        """处理来自 pub/sub 的账号状态消息"""
+        try:
+            message = json.loads(raw) if isinstance(raw, (str, bytes)) else raw
+        except (TypeError, ValueError):
+            return
+        if not isinstance(message, dict):
+            return
+        try:
+            if message.get("type") == "account" and isinstance(message.get("account"), dict):
+                self._apply_state(CodexAccountState(**message["account"]))
+            elif message.get("type") == "remove":
+                self._apply_remove(int(message["user_id"]), int(message["account_id"]))
+            else:
+                return
+        except (KeyError, TypeError, ValueError):
+            return
+        self.applied += 1
+
+    def clear_local(self) -> None:
+        """作废本地账号池（下次选号时从数据库重新加载，在途计数保留）"""
+        for pool in self._users.values():
+            pool.loaded_at = -math.inf
+
+    # ==================== 订阅 ====================
+
+    async def _listen(self) -> None:
+        backoff = 1.0
+        while True:
+            pubsub = None
+            try:
+                pubsub = await self.redis.pubsub()
+                await pubsub.subscribe(SYNC_CHANNEL)
+                # 订阅中断期间可能错过状态消息，重新订阅后清空本地账号池
+                self.clear_local()
+                backoff = 1.0
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message and message.get("type") == "message":
+                        self.apply_message(message.get("data"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Codex 账号池同步订阅中断，{backoff:.0f}s 后重试: {e}")
+                self.clear_local()
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.reset()
+                    except Exception:
+                        pass
+
+    def start(self) -> None:
+        """启动状态同步订阅任务"""
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        """停止状态同步订阅任务"""
+        task, self._listener = self._listener, None
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        """账号池统计"""
+        return {
+            "users": len(self._users),
+            "accounts": sum(len(pool) for pool in self._users.values()),
+            "selections": self.selections,
+            "loads": self.loads,
+            "published": self.published,
+            "applied": self.applied,
+            "subscribed": self._listener is not None and not self._listener.done(),
+        }
+
+
+# 全局 Codex 账号池实例
+_codex_account_pool: Optional[CodexAccountPool] = None
+
+
+def get_codex_account_pool() -> CodexAccountPool:
+    """获取进程内的 Codex 账号池单例"""
+    global _codex_account_pool
+    if _codex_account_pool is None:
+        _codex_account_pool = CodexAccountPool()
+    return _codex_account_pool
+
+
+async def init_codex_account_pool() -> None:
+    """启动 Codex 账号池的状态同步订阅"""
+    get_codex_account_pool().start()
+
+
+async def close_codex_account_pool() -> None:
+    """停止状态同步订阅并释放账号池"""
+    global _codex_account_pool
+    if _codex_account_pool is not None:
+        await _codex_account_pool.stop()
+        _codex_account_pool = None
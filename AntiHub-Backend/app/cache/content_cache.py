@@ -0,0 +1,114 @@
+"""
+内容寻址的计算结果缓存
+
+Agent 客户端（Claude Code 等）每一轮请求都携带完全相同的 system 与 tools，
+逐请求重新计算是纯重复劳动。这里以规范化 JSON（pydantic-core 序列化，
+Pydantic 模型与普通 dict/list 都适用）的 SHA-256 摘要为键缓存计算结果，
+目前用于 system 与 tools 的 token 预估值。
+
+计算键本身要序列化并哈希整个内容（约 2.5us/KB），只有计算代价明显高于此的结果才值得缓存；
+tools 转换为 OpenAI / Gemini / Kiro 格式只是重组 dict，比算键更便宜，不走缓存。
+
+有界 LRU，按命名空间统计命中率（/health 中展示）。
+缓存值在请求之间共享：调用方只能读取，不得原地修改。
+
+只在事件循环线程内使用，不加锁。
+"""
+import hashlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
+
+from pydantic_core import to_json
+
+T = TypeVar("T")
+
+DEFAULT_MAX_ENTRIES = 1024
+
+
+def content_key(content: Any) -> Optional[bytes]:
+    """内容摘要；无法序列化（如孤立代理字符）时返回 None，调用方应直接计算不缓存"""
+    try:
+        data = to_json(content)
+    except Exception:
+        return None
+    return hashlib.sha256(data).digest()
+
+
+class ContentCache:
+    """按内容摘要寻址的有界 LRU"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max(1, int(max_entries))
+        self._data: "OrderedDict[Tuple[str, bytes], Any]" = OrderedDict()
+        self._hits: Dict[str, int] = {}
+        self._misses: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get_or_compute(self, namespace: str, content: Any, compute: Callable[[], T]) -> T:
+        """
+        返回 content 在 namespace 下的缓存结果，未命中时调用 compute() 计算并缓存
+
+        Args:
+            namespace: 转换类型（同一内容在不同转换下结果不同）
+            content: 决定结果的全部输入
+            compute: 无参计算函数
+        """
+        key = content_key(content)
+        if key is None:
+            self._misses[namespace] = self._misses.get(namespace, 0) + 1
+            return compute()
+
+        entry_key = (namespace, key)
+        data = self._data
+        if entry_key in data:
+            data.move_to_end(entry_key)
+            self._hits[namespace] = self._hits.get(namespace, 0) + 1
+            return data[entry_key]
+
+        value = compute()
+        self._misses[namespace] = self._misses.get(namespace, 0) + 1
+        data[entry_key] = value
+        while len(data) > self.max_entries:
+            data.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._hits.clear()
+        self._misses.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存命中统计（总计 + 按命名空间）"""
+        namespaces = {}
+        for name in sorted(set(self._hits) | set(self._misses)):
+            hits = self._hits.get(name, 0)
+            lookups = hits + self._misses.get(name, 0)
+            namespaces[name] = {
+                "lookups": lookups,
+                "hits": hits,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            }
+        hits = sum(self._hits.values())
+        lookups = hits + sum(self._misses.values())
+        return {
+            "lookups": lookups,
+            "hits": hits,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "namespaces": namespaces,
+        }
+
+
+# 全局内容缓存实例
+_content_cache: Optional[ContentCache] = None
+
+
+def get_content_cache() -> ContentCache:
+    """获取进程内的内容寻址缓存单例"""
+    global _content_cache
+    if _content_cache is None:
+        _content_cache = ContentCache()
+    return _content_cache
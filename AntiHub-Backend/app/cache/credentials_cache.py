@@ -0,0 +1,67 @@
+"""
+解密后的账号凭证缓存（进程内）
+
+Codex / GeminiCLI 每次请求（以及每次换号重试）都要解密账号凭证（Fernet：HMAC 校验 + AES 解密）再 json.loads。
+这里以密文本身为键缓存解密结果：token 刷新后密文随之变化，旧条目自然不再命中，不需要失效通知。
+TTL 较短，解密后的明文只在内存中停留有限时间；后台 token 预刷新任务刷新后会顺带预热新凭证。
+
+返回的是副本，调用方可以原地修改。只在事件循环线程内使用，不加锁。
+"""
+from typing import Any, Callable, Dict, Optional
+
+from app.cache.auth_cache import TTLCache
+
+# 缓存条目上限（账号数）
+CREDENTIALS_CACHE_SIZE = 4096
+# 解密结果在内存中的最长停留时间（秒）
+CREDENTIALS_CACHE_TTL_SECONDS = 60.0
+
+
+class CredentialsCache:
+    """密文 -> 解密后的凭证 dict（TTL + LRU）"""
+
+    def __init__(self, max_size: int = CREDENTIALS_CACHE_SIZE, ttl: float = CREDENTIALS_CACHE_TTL_SECONDS):
+        self._cache = TTLCache(max_size, ttl)
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, ciphertext: Optional[str], decrypt: Callable[[str], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        返回密文对应的凭证（副本），未命中时调用 decrypt(ciphertext) 并缓存
+
+        decrypt 抛出异常时不缓存，异常原样抛出。
+        """
+        if not ciphertext:
+            return decrypt(ciphertext)
+        cached = self._cache.get(ciphertext)
+        if cached is not None:
+            self.hits += 1
+            return dict(cached)
+        self.misses += 1
+        value = decrypt(ciphertext)
+        self._cache.set(ciphertext, dict(value))
+        return value
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# 全局凭证缓存实例
+_credentials_cache: Optional[CredentialsCache] = None
+
+
+def get_credentials_cache() -> CredentialsCache:
+    """获取进程内的凭证缓存单例"""
+    global _credentials_cache
+    if _credentials_cache is None:
+        _credentials_cache = CredentialsCache()
+    return _credentials_cache
@@ -0,0 +1,91 @@
+"""
+Kiro 会话 history 转换缓存
+
+Kiro 通道每一轮都要把完整的 messages 转换为 conversationState.history，
+而同一会话的第 N+1 轮与第 N 轮共享全部前缀。这里按会话 ID（metadata.user_id 中的 session_xxx）
+保存上一轮已转换的 history 前缀，由 KiroAnthropicConverter 校验前缀一致后只转换新增的尾部。
+
+缓存值的结构由转换器决定，这里只负责有界 LRU 与命中统计（/health 中展示）。
+
+只在事件循环线程内使用，不加锁。
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+DEFAULT_MAX_SESSIONS = 128
+
+
+class KiroHistoryCache:
+    """按会话 ID 保存已转换 history 前缀的有界 LRU"""
+
+    def __init__(self, max_sessions: int = DEFAULT_MAX_SESSIONS):
+        self.max_sessions = max(1, int(max_sessions))
+        self._data: "OrderedDict[str, Any]" = OrderedDict()
+        self.lookups = 0
+        self.hits = 0
+        self.reused_messages = 0
+        self.converted_messages = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, session_id: str) -> Optional[Any]:
+        self.lookups += 1
+        state = self._data.get(session_id)
+        if state is not None:
+            self._data.move_to_end(session_id)
+        return state
+
+    def put(self, session_id: str, state: Any, *, reused: int, converted: int) -> None:
+        """
+        保存会话的最新 history 状态
+
+        Args:
+            session_id: 会话 ID
+            state: 转换器的 history 状态
+            reused: 本轮复用的已转换消息数（>0 记为命中）
+            converted: 本轮新转换的消息数
+        """
+        if reused > 0:
+            self.hits += 1
+        self.reused_messages += reused
+        self.converted_messages += converted
+
+        data = self._data
+        data[session_id] = state
+        data.move_to_end(session_id)
+        while len(data) > self.max_sessions:
+            data.popitem(last=False)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.lookups = 0
+        self.hits = 0
+        self.reused_messages = 0
+        self.converted_messages = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """命中统计：会话级命中率 + 消息级复用率"""
+        total_messages = self.reused_messages + self.converted_messages
+        return {
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            "reused_messages": self.reused_messages,
+            "converted_messages": self.converted_messages,
+            "reuse_rate": round(self.reused_messages / total_messages, 4) if total_messages else 0.0,
+            "sessions": len(self._data),
+            "max_sessions": self.max_sessions,
+        }
+
+
+# 全局 Kiro history 缓存实例
+_kiro_history_cache: Optional[KiroHistoryCache] = None
+
+
+def get_kiro_history_cache() -> KiroHistoryCache:
+    """获取进程内的 Kiro history 转换缓存单例"""
+    global _kiro_history_cache
+    if _kiro_history_cache is None:
+        _kiro_history_cache = KiroHistoryCache()
+    return _kiro_history_cache
@@ -6,6 +6,7 @@ from typing import Optional, Any
 import json
 from redis import asyncio as aioredis
 from redis.asyncio import Redis
+from redis.asyncio.client import PubSub
 
 from app.core.config import get_settings
 
@@ -173,6 +174,34 @@ class RedisClient:
         json_value = json.dumps(value, ensure_ascii=False)
         return await self.set(key, json_value, expire)
     
+    # ==================== 发布订阅 ====================
+    
+    async def publish(self, channel: str, message: str) -> int:
+        """
+        向频道发布消息
+        
+        Args:
+            channel: 频道名
+            message: 消息内容
+            
+        Returns:
+            收到消息的订阅者数量
+        """
+        if self._client is None:
+            await self.connect()
+        return await self._client.publish(channel, message)
+    
+    async def pubsub(self) -> PubSub:
+        """
+        创建发布订阅对象（独占一个连接，使用完毕需 reset）
+        
+        Returns:
+            PubSub 实例
+        """
+        if self._client is None:
+            await self.connect()
+        return self._client.pubsub()
+    
     # ==================== 会话管理功能 ====================
     
     async def create_session(
@@ -451,6 +480,53 @@ class RedisClient:
         key = f"oauth_state:{state}"
         result = await self.delete(key)
         return result > 0
+    
+    # ==================== 分布式锁 ====================
+    
+    # 锁空闲时获取锁并返回新的锁令牌（单调递增），锁被占用返回 0
+    _ACQUIRE_LOCK_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 1 then
+    return 0
+end
+local fence = redis.call('incr', KEYS[2])
+redis.call('set', KEYS[1], fence, 'PX', ARGV[1])
+return fence
+"""
+    
+    # 仅当锁仍为给定锁令牌持有时删除
+    _RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+    
+    async def acquire_lock(self, name: str, ttl_ms: int) -> Optional[int]:
+        """
+        尝试获取锁（不阻塞）
+        
+        Args:
+            name: 锁的键
+            ttl_ms: 锁的过期时间(毫秒)
+            
+        Returns:
+            获取成功返回本次的锁令牌（同一把锁单调递增），锁被占用返回 None
+        """
+        if self._client is None:
+            await self.connect()
+        fence = await self._client.eval(self._ACQUIRE_LOCK_SCRIPT, 2, name, f"{name}:fence", ttl_ms)
+        return int(fence) or None
+    
+    async def release_lock(self, name: str, fence: int) -> bool:
+        """
+        释放锁（锁已过期或已被他人持有时不做任何事）
+        
+        Returns:
+            本次确实释放了锁返回 True
+        """
+        if self._client is None:
+            await self.connect()
+        return bool(await self._client.eval(self._RELEASE_LOCK_SCRIPT, 1, name, str(fence)))
 
 
 # 全局 Redis 客户端实例
@@ -0,0 +1,179 @@
+"""
+OAuth token 刷新的单飞（single-flight）协调
+
+access_token 临近过期（或上游返回 401）时，同一账号的并发请求原本会各自调用刷新接口、
+重新加密凭证并提交。刷新接口会轮换 refresh_token，并发刷新还可能让彼此拿到的 refresh_token 失效。
+这里对同一账号（key）的刷新做两级合并：
+- 进程内：按 key 保存正在进行的刷新（asyncio.Future），后来的请求直接等待并复用同一结果
+- 跨 worker：Redis 锁（SET NX PX），等到锁的 worker 由刷新函数先回查数据库，
+  发现凭证已被其他 worker 刷新就直接使用，不再请求上游
+
+锁只用来减少重复刷新，不保证互斥（锁可能在刷新途中过期）。正确性由写库保证：
+刷新函数以刷新前的凭证密文为条件更新（compare-and-set，见各账号仓储的 update_credentials_if_unchanged），
+凭证已被他人改写时不覆盖，改用库中的结果；库中凭证未变则照常保存本次轮换。
+
+Redis 不可用时退化为仅进程内合并。只在事件循环线程内使用，不加锁。
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional, TypeVar
+
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.cache.redis_client import RedisClient, get_redis_client
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+LOCK_KEY_PREFIX = "token_refresh:lock:"
+
+# 锁的过期时间：覆盖一次刷新请求（上游超时 30 秒）+ 写库
+LOCK_TTL_SECONDS = 45.0
+# 等锁的最长时间；超时后不持锁直接刷新（此时锁一般已过期）
+LOCK_WAIT_SECONDS = 45.0
+# 等锁时的轮询间隔
+LOCK_POLL_SECONDS = 0.05
+
+
+class _LeaderCancelled(Exception):
+    """执行刷新的请求被取消：等待者需要重新发起（由其中一个接手）"""
+
+
+class RefreshLease:
+    """一次刷新持有的 Redis 锁；fence 为 None 表示未持锁（Redis 不可用或等锁超时）"""
+
+    def __init__(self, lock_key: str, fence: Optional[int]):
+        self.lock_key = lock_key
+        self.fence = fence
+
+
+class TokenRefreshCoordinator:
+    """
+    按 key 合并并发刷新
+
+    用法：result = await coordinator.run("codex:12", lambda lease: refresh(lease))
+    refresh 在持锁期间执行一次，同一 key 的并发调用方都拿到它的返回值（或异常）。
+    """
+
+    def __init__(
+        self,
+        redis: Optional[RedisClient] = None,
+        *,
+        lock_ttl: float = LOCK_TTL_SECONDS,
+        lock_wait: float = LOCK_WAIT_SECONDS,
+        poll_interval: float = LOCK_POLL_SECONDS,
+    ):
+        self._redis = redis
+        self.lock_ttl = float(lock_ttl)
+        self.lock_wait = float(lock_wait)
+        self.poll_interval = float(poll_interval)
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+        self.refreshes = 0
+        self.joined = 0
+        self.lock_waits = 0
+        self.lock_lost = 0
+
+    @property
+    def redis(self) -> RedisClient:
+        if self._redis is None:
+            self._redis = get_redis_client()
+        return self._redis
+
+    async def run(self, key: str, refresh: Callable[[RefreshLease], Awaitable[T]]) -> T:
+        while True:
+            future = self._inflight.get(key)
+            if future is None:
+                break
+            self.joined += 1
+            try:
+                return await asyncio.shield(future)
+            except _LeaderCancelled:
+                continue
+
+        future = asyncio.get_running_loop().create_future()
+        # 没有等待者时也标记异常已读取，避免 "exception was never retrieved" 日志
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            result = await self._run_locked(key, refresh)
+        except asyncio.CancelledError:
+            future.set_exception(_LeaderCancelled())
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    async def _run_locked(self, key: str, refresh: Callable[[RefreshLease], Awaitable[T]]) -> T:
+        lock_key = f"{LOCK_KEY_PREFIX}{key}"
+        ttl_ms = int(self.lock_ttl * 1000)
+        deadline = time.monotonic() + self.lock_wait
+        fence: Optional[int] = None
+        waited = False
+        while True:
+            try:
+                fence = await self.redis.acquire_lock(lock_key, ttl_ms)
+            except Exception as e:
+                logger.warning("token refresh lock unavailable, refreshing without it: key=%s error=%s", key, e)
+                break
+            if fence is not None:
+                break
+            if time.monotonic() >= deadline:
+                logger.warning("token refresh lock wait timed out, refreshing without it: key=%s", key)
+                break
+            if not waited:
+                waited = True
+                self.lock_waits += 1
+            await asyncio.sleep(self.poll_interval)
+
+        self.refreshes += 1
+        lease = RefreshLease(lock_key, fence)
+        try:
+            return await refresh(lease)
+        finally:
+            if fence is not None:
+                try:
+                    released = await self.redis.release_lock(lock_key, fence)
+                    if not released:
+                        self.lock_lost += 1
+                except Exception as e:
+                    logger.warning("token refresh lock release failed: key=%s error=%s", key, e)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "inflight": len(self._inflight),
+            "refreshes": self.refreshes,
+            "joined": self.joined,
+            "lock_waits": self.lock_waits,
+            "lock_lost": self.lock_lost,
+        }
+
+
+def apply_refreshed_columns(instance: Any, values: Mapping[str, Any]) -> None:
+    """
+    把刷新结果写到（其他会话加载的）ORM 实例上
+
+    这些值已由刷新方提交到数据库，这里按“已提交”设置，不会让实例变脏、在下次提交时重复写库。
+    """
+    for name, value in values.items():
+        set_committed_value(instance, name, value)
+
+
+# 全局刷新协调器实例
+_token_refresh_coordinator: Optional[TokenRefreshCoordinator] = None
+
+
+def get_token_refresh_coordinator() -> TokenRefreshCoordinator:
+    """获取进程内的 token 刷新协调器单例"""
+    global _token_refresh_coordinator
+    if _token_refresh_coordinator is None:
+        _token_refresh_coordinator = TokenRefreshCoordinator()
+    return _token_refresh_coordinator
@@ -0,0 +1,379 @@
+"""
+上游熔断器（进程内）
+
+上游账号或自定义 base_url 开始超时/出错时，请求原本仍会先打到它，在 300~1200 秒的超时里
+占着连接和数据库会话慢慢失败。这里按 (config_type, 账号 id 或 base_url) 维护熔断状态：
+
+- closed   ：正常放行；统计最近 window 秒内的调用，调用数不少于 min_calls 且
+             失败率 >= failure_rate 或慢调用率 >= slow_call_rate 时熔断
+- open     ：直接拒绝，选号时跳过该账号 / 上游；冷却 open_seconds 秒后进入 half-open，
+             连续熔断时冷却时间翻倍（不超过 max_open_seconds）
+- half-open：只放行一个探测请求，成功则恢复 closed，失败或过慢则重新 open；
+             探测请求超过 probe_timeout 秒仍无结果时允许再放行一个
+
+失败只计网络层错误（连接失败、超时等 httpx.TransportError，本地连接池满的 PoolTimeout 除外）与 5xx；
+4xx / 429 由各渠道自己的冻结、限额逻辑处理，不计入。慢调用按首字节（收到响应头）计时，只对流式请求有意义，
+非流式请求记录状态时传 timed=False。多个用户共享的上游（如 plug-in API 的 base_url）以
+transport_only=True 放行：只计网络层错误，避免个别用户的 5xx / 慢请求把所有用户挡在外面。
+
+状态只保存在当前 worker 内，不跨 worker 同步。只在事件循环线程内使用，不加锁。
+closed 且窗口内已无调用的键每隔 window 秒清理一次，键的数量不会随历史上出现过的账号 / base_url 无限增长。
+"""
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+import httpx
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+CircuitKey = Tuple[str, str]
+
+
+def circuit_key(config_type: str, target: Any) -> CircuitKey:
+    """熔断键：(config_type, 账号 id 或 base_url)；base_url 去掉末尾的 /"""
+    return (config_type, str(target).rstrip("/"))
+
+
+class _Circuit:
+    __slots__ = ("state", "calls", "failures", "slow", "open_until", "trips", "probe_started")
+
+    def __init__(self) -> None:
+        self.state = CLOSED
+        # (时间, 是否失败, 是否慢调用)
+        self.calls: Deque[Tuple[float, bool, bool]] = deque()
+        self.failures = 0
+        self.slow = 0
+        self.open_until = 0.0
+        # 连续熔断次数（决定冷却时间），恢复 closed 后清零
+        self.trips = 0
+        self.probe_started: Optional[float] = None
+
+
+class CircuitPermit:
+    """
+    一次放行的调用；调用方在收到响应头 / 出错时记录结果，结束时 finish()
+
+    也可作为上下文管理器：with permit: ...，退出时自动记录异常并 finish()。
+    没有记录任何结果（例如请求被取消）时不计入统计，只释放半开探测名额。
+    """
+
+    def __init__(self, breaker: "CircuitBreaker", key: CircuitKey, *, probe: bool, transport_only: bool = False):
+        self._breaker = breaker
+        self.key = key
+        self.probe = probe
+        self.transport_only = transport_only
+        self._started = breaker.clock()
+        self._ok: Optional[bool] = None
+        self._latency: Optional[float] = None
+        self._done = False
+
+    def observe_status(self, status_code: int, *, timed: bool = True) -> None:
+        """
+        收到响应头时调用：5xx 计为失败
+
+        Args:
+            timed: 本次耗时能否代表上游响应速度（流式请求的首字节为 True；非流式整包响应为 False）
+        """
+        if self._ok is not None:
+            return
+        if self.transport_only:
+            # 收到响应即说明上游可达
+            self._ok = True
+            return
+        self._ok = status_code < 500
+        if timed:
+            self._latency = self._breaker.clock() - self._started
+
+    def observe_exception(self, exc: BaseException) -> None:
+        """
+        网络层错误（含读超时、流中途断开）计为失败；其他异常不影响结果
+
+        本地连接池满（httpx.PoolTimeout）没有发出请求，不说明上游状况，按未观测处理。
+        """
+        if isinstance(exc, httpx.TransportError) and not isinstance(exc, httpx.PoolTimeout):
+            self._ok = False
+
+    def finish(self) -> None:
+        if self._done:
+            return
+        self._done = True
+        self._breaker._record(self.key, probe=self.probe, ok=self._ok, latency=self._latency)
+
+    def __enter__(self) -> "CircuitPermit":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if exc is not None:
+            self.observe_exception(exc)
+        self.finish()
+        return False
+
+
+class CircuitPermitGroup:
+    """同一次调用同时占用的多个 CircuitPermit（如共享上游 + 用户），结果记录到每一个"""
+
+    def __init__(self, *permits: CircuitPermit):
+        self.permits = permits
+
+    def observe_status(self, status_code: int, *, timed: bool = True) -> None:
+        for permit in self.permits:
+            permit.observe_status(status_code, timed=timed)
+
+    def observe_exception(self, exc: BaseException) -> None:
+        for permit in self.permits:
+            permit.observe_exception(exc)
+
+    def finish(self) -> None:
+        for permit in self.permits:
+            permit.finish()
+
+    def __enter__(self) -> "CircuitPermitGroup":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if exc is not None:
+            self.observe_exception(exc)
+        self.finish()
+        return False
+
+
+class CircuitBreaker:
+    """
+    按键维护的熔断器集合
+
+    Args:
+        enabled: 关闭时一律放行、不做统计
+        window: 统计窗口（秒）
+        min_calls: 窗口内至少多少次调用才判断是否熔断
+        failure_rate: 失败率阈值
+        slow_call_seconds: 首字节耗时不低于该值视为慢调用
+        slow_call_rate: 慢调用率阈值
+        open_seconds: 首次熔断的冷却时间（秒）
+        max_open_seconds: 连续熔断时冷却时间的上限（秒）
+        probe_timeout: 半开探测请求的最长占用时间（秒）
+    """
+
+    def __init__(
+        self,
+        *,
+        enabled: bool = True,
+        window: float = 60.0,
+        min_calls: int = 5,
+        failure_rate: float = 0.5,
+        slow_call_seconds: float = 30.0,
+        slow_call_rate: float = 0.8,
+        open_seconds: float = 30.0,
+        max_open_seconds: float = 600.0,
+        probe_timeout: float = 120.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.enabled = bool(enabled)
+        self.window = max(1.0, float(window))
+        self.min_calls = max(1, int(min_calls))
+        self.failure_rate = float(failure_rate)
+        self.slow_call_seconds = float(slow_call_seconds)
+        self.slow_call_rate = float(slow_call_rate)
+        self.open_seconds = max(0.0, float(open_seconds))
+        self.max_open_seconds = max(self.open_seconds, float(max_open_seconds))
+        self.probe_timeout = max(1.0, float(probe_timeout))
+        self.clock = clock
+        self._circuits: Dict[CircuitKey, _Circuit] = {}
+        # 非 closed 的键
+        self._tripped: Set[CircuitKey] = set()
+        self._next_sweep = clock() + self.window
+
+        self.opened = 0
+        self.recovered = 0
+        self.rejected = 0
+
+    def state(self, key: CircuitKey) -> str:
+        circuit = self._circuits.get(key)
+        return circuit.state if circuit is not None else CLOSED
+
+    def has_tripped(self, config_type: str) -> bool:
+        """该渠道是否有非 closed 的熔断器（没有时调用方可跳过逐个检查）"""
+        return any(key[0] == config_type for key in self._tripped)
+
+    def _probe_busy(self, circuit: _Circuit, now: float) -> bool:
+        return circuit.probe_started is not None and now - circuit.probe_started < self.probe_timeout
+
+    def is_open(self, key: CircuitKey) -> bool:
+        """请求此刻是否会被拒绝（只查询，不占用半开探测名额）"""
+        if not self.enabled:
+            return False
+        circuit = self._circuits.get(key)
+        if circuit is None or circuit.state == CLOSED:
+            return False
+        now = self.clock()
+        if circuit.state == OPEN:
+            return now < circuit.open_until
+        return self._probe_busy(circuit, now)
+
+    def retry_after(self, key: CircuitKey) -> float:
+        """熔断中的键距离可以探测还有多少秒"""
+        circuit = self._circuits.get(key)
+        if circuit is None or circuit.state != OPEN:
+            return 0.0
+        return max(0.0, circuit.open_until - self.clock())
+
+    def try_acquire(self, key: CircuitKey, *, transport_only: bool = False) -> Optional[CircuitPermit]:
+        """
+        放行返回 CircuitPermit，熔断中（或半开探测名额已被占用）返回 None
+
+        Args:
+            transport_only: 只把网络层错误计为失败（状态码与耗时不计入），用于多个用户共享的上游
+        """
+        if not self.enabled:
+            return CircuitPermit(self, key, probe=False, transport_only=transport_only)
+        circuit = self._circuits.get(key)
+        if circuit is None or circuit.state == CLOSED:
+            return CircuitPermit(self, key, probe=False, transport_only=transport_only)
+
+        now = self.clock()
+        if circuit.state == OPEN:
+            if now < circuit.open_until:
+                self.rejected += 1
+                return None
+            circuit.state = HALF_OPEN
+            circuit.probe_started = None
+        if self._probe_busy(circuit, now):
+            self.rejected += 1
+            return None
+        circuit.probe_started = now
+        return CircuitPermit(self, key, probe=True, transport_only=transport_only)
+
+    def _trim(self, circuit: _Circuit, now: float) -> None:
+        calls = circuit.calls
+        cutoff = now - self.window
+        while calls and calls[0][0] <= cutoff:
+            _, failed, slow = calls.popleft()
+            circuit.failures -= failed
+            circuit.slow -= slow
+
+    def _sweep(self, now: float) -> None:
+        """清理 closed 且窗口内已无调用的键"""
+        self._next_sweep = now + self.window
+        idle: List[CircuitKey] = []
+        for key, circuit in self._circuits.items():
+            if circuit.state != CLOSED:
+                continue
+            self._trim(circuit, now)
+            if not circuit.calls:
+                idle.append(key)
+        for key in idle:
+            del self._circuits[key]
+
+    def _reset_window(self, circuit: _Circuit) -> None:
+        circuit.calls.clear()
+        circuit.failures = 0
+        circuit.slow = 0
+
+    def _trip(self, key: CircuitKey, circuit: _Circuit, now: float) -> None:
+        circuit.trips += 1
+        cool_down = min(self.max_open_seconds, self.open_seconds * (2 ** (circuit.trips - 1)))
+        circuit.state = OPEN
+        circuit.open_until = now + cool_down
+        circuit.probe_started = None
+        self._reset_window(circuit)
+        self._tripped.add(key)
+        self.opened += 1
+        logger.warning("circuit opened: key=%s:%s cool_down=%.0fs trips=%s", key[0], key[1], cool_down, circuit.trips)
+
+    def _record(self, key: CircuitKey, *, probe: bool, ok: Optional[bool], latency: Optional[float]) -> None:
+        if not self.enabled:
+            return
+        circuit = self._circuits.get(key)
+        slow = latency is not None and latency >= self.slow_call_seconds
+        now = self.clock()
+        if now >= self._next_sweep:
+            self._sweep(now)
+            circuit = self._circuits.get(key)
+
+        if probe:
+            if circuit is None or circuit.state != HALF_OPEN:
+                return
+            if ok is None:
+                # 探测没有结论（如客户端断开）：释放名额，由下一个请求探测
+                circuit.probe_started = None
+            elif ok and not slow:
+                circuit.state = CLOSED
+                circuit.trips = 0
+                circuit.probe_started = None
+                self._reset_window(circuit)
+                self._tripped.discard(key)
+                self.recovered += 1
+                logger.info("circuit closed: key=%s:%s", key[0], key[1])
+            else:
+                self._trip(key, circuit, now)
+            return
+
+        if ok is None:
+            return
+        if circuit is None:
+            circuit = self._circuits[key] = _Circuit()
+        if circuit.state != CLOSED:
+            # 熔断前放行、熔断后才结束的请求：不再影响状态
+            return
+        failed = not ok
+        circuit.calls.append((now, failed, slow))
+        circuit.failures += failed
+        circuit.slow += slow
+        self._trim(circuit, now)
+        total = len(circuit.calls)
+        if total < self.min_calls:
+            return
+        if circuit.failures / total >= self.failure_rate or circuit.slow / total >= self.slow_call_rate:
+            self._trip(key, circuit, now)
+
+    def stats(self) -> Dict[str, Any]:
+        now = self.clock()
+        tripped: List[Dict[str, Any]] = []
+        for key in sorted(self._tripped):
+            circuit = self._circuits[key]
+            tripped.append(
+                {
+                    "key": f"{key[0]}:{key[1]}",
+                    "state": circuit.state,
+                    "retry_after": round(max(0.0, circuit.open_until - now), 1) if circuit.state == OPEN else 0.0,
+                    "trips": circuit.trips,
+                }
+            )
+        return {
+            "enabled": self.enabled,
+            "circuits": len(self._circuits),
+            "opened": self.opened,
+            "recovered": self.recovered,
+            "rejected": self.rejected,
+            "tripped": tripped,
+        }
+
+
+# 全局熔断器实例
+_circuit_breaker: Optional[CircuitBreaker] = None
+
+
+def get_circuit_breaker() -> CircuitBreaker:
+    """获取进程内的熔断器单例"""
+    global _circuit_breaker
+    if _circuit_breaker is None:
+        settings = get_settings()
+        _circuit_breaker = CircuitBreaker(
+            enabled=settings.circuit_breaker_enabled,
+            window=settings.circuit_breaker_window_seconds,
+            min_calls=settings.circuit_breaker_min_calls,
+            failure_rate=settings.circuit_breaker_failure_rate,
+            slow_call_seconds=settings.circuit_breaker_slow_call_seconds,
+            slow_call_rate=settings.circuit_breaker_slow_call_rate,
+            open_seconds=settings.circuit_breaker_open_seconds,
+            max_open_seconds=settings.circuit_breaker_max_open_seconds,
+            probe_timeout=settings.circuit_breaker_probe_timeout_seconds,
+        )
+    return _circuit_breaker
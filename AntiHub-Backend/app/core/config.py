@@ -2,7 +2,7 @@
 配置管理模块
 使用 pydantic-settings 从环境变量加载配置
 """
-from typing import Optional
+from typing import Any, Dict, Optional
 from pydantic import Field, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -64,6 +64,141 @@ class Settings(BaseSettings):
         description="非流式音频文件保留数量（启动自动清理）",
     )
 
+    # 上游 HTTP 连接池配置
+    upstream_http_limits: Dict[str, Dict[str, Any]] = Field(
+        default_factory=dict,
+        description=(
+            "按上游覆盖连接池参数（JSON），例如 "
+            '{"codex": {"max_connections": 800, "keepalive_expiry": 90}}；'
+            "默认上限 plugin/codex 500、cloudcode 300、custom 200 个连接，"
+            "连接池满时最多等待 pool_timeout（默认 10 秒）后返回 503"
+        ),
+    )
+    proxy_client_cache_size: int = Field(
+        default=64,
+        description="自定义账号出站代理 client 缓存容量（按 proxy_url + 上游 host）",
+    )
+    proxy_client_idle_ttl_seconds: float = Field(
+        default=300.0,
+        description="出站代理 client 空闲多久后关闭（秒）",
+    )
+
+    # 认证缓存配置（进程内 L1，位于 Redis 之前）
+    auth_cache_l1_size: int = Field(
+        default=10000,
+        description="进程内认证缓存（API key / JWT 用户）最大条目数",
+    )
+    auth_cache_l1_ttl_seconds: float = Field(
+        default=30.0,
+        description="进程内认证缓存 TTL（秒）；失效消息经 Redis pub/sub 广播，TTL 仅兜底",
+    )
+
+    # usage_log 批量写入配置
+    usage_log_batch_size: int = Field(
+        default=200,
+        description="usage_log 单批写入的最大行数",
+    )
+    usage_log_flush_interval_seconds: float = Field(
+        default=1.0,
+        description="usage_log 攒批最长等待时间（秒）",
+    )
+    usage_log_queue_size: int = Field(
+        default=10000,
+        description="usage_log 内存队列容量（超出后请求最多等待 usage_log_enqueue_timeout_seconds，再丢弃）",
+    )
+    usage_log_enqueue_timeout_seconds: float = Field(
+        default=0.5,
+        description="usage_log 队列满时请求侧最长等待时间（秒）",
+    )
+    usage_log_retention_months: int = Field(
+        default=6,
+        description="usage_logs 按月分区保留的月数（含当月），<=0 表示不按时间删除",
+    )
+    usage_log_partitions_ahead_months: int = Field(
+        default=2,
+        description="usage_logs 预建未来分区的月数（至少 1，小于 1 时按 1 处理）",
+    )
+    usage_log_retention_interval_seconds: float = Field(
+        default=600.0,
+        description="usage_logs 保留任务（预建/删除分区、每渠道条数上限）执行间隔（秒）",
+    )
+
+    # OAuth token 后台预刷新（Codex / GeminiCLI）
+    token_refresher_enabled: bool = Field(
+        default=True,
+        description="是否启动 token 后台预刷新任务",
+    )
+    token_refresher_interval_seconds: float = Field(
+        default=60.0,
+        description="token 预刷新扫描间隔（秒）",
+    )
+    token_refresher_horizon_seconds: float = Field(
+        default=600.0,
+        description="提前刷新将在多少秒内过期的 token；应大于扫描间隔 + 抖动 + 60（请求路径的同步刷新窗口）",
+    )
+    token_refresher_concurrency: int = Field(
+        default=4,
+        description="token 预刷新同时进行的刷新数上限",
+    )
+    token_refresher_jitter_seconds: float = Field(
+        default=5.0,
+        description="每个账号刷新前的最大随机等待（秒），避免同批到期的账号同时请求 OAuth 端点",
+    )
+
+    # 上游熔断配置（按账号 / 上游 base_url，见 app.core.circuit_breaker）
+    circuit_breaker_enabled: bool = Field(
+        default=True,
+        description="是否启用上游熔断（Codex / GeminiCLI 按账号，自定义账号按 base_url，plug-in API 推理请求按用户 + base_url）",
+    )
+    circuit_breaker_window_seconds: float = Field(
+        default=60.0,
+        description="熔断统计窗口（秒）",
+    )
+    circuit_breaker_min_calls: int = Field(
+        default=5,
+        description="窗口内至少多少次调用才判断是否熔断",
+    )
+    circuit_breaker_failure_rate: float = Field(
+        default=0.5,
+        description="失败率阈值（网络错误与 5xx 计为失败）",
+    )
+    circuit_breaker_slow_call_seconds: float = Field(
+        default=30.0,
+        description="流式请求首字节耗时不低于该值（秒）视为慢调用",
+    )
+    circuit_breaker_slow_call_rate: float = Field(
+        default=0.8,
+        description="慢调用率阈值",
+    )
+    circuit_breaker_open_seconds: float = Field(
+        default=30.0,
+        description="首次熔断的冷却时间（秒），之后进入半开状态放行一个探测请求",
+    )
+    circuit_breaker_max_open_seconds: float = Field(
+        default=600.0,
+        description="连续熔断时冷却时间翻倍的上限（秒）",
+    )
+    circuit_breaker_probe_timeout_seconds: float = Field(
+        default=120.0,
+        description="半开探测请求的最长占用时间（秒），超时仍无结果时允许再放行一个探测",
+    )
+
+    # Claude Code 兼容端点（/cc/v1/messages）流式配置
+    cc_stream_mode: str = Field(
+        default="estimate",
+        description="/cc/v1 流式模式：estimate=预估 input_tokens 写入 message_start 并立即流式输出；buffer=缓冲到拿到真实 usage 再输出",
+    )
+    cc_token_calibration_enabled: bool = Field(
+        default=True,
+        description="estimate 模式下是否按模型用真实 usage 校准 input_tokens 预估值",
+    )
+
+    # 请求体解析
+    raw_body_fast_path_enabled: bool = Field(
+        default=False,
+        description="/v1/chat/completions 跳过 Pydantic 模型构建：只校验顶层字段，直接把解析出的 JSON 交给下游",
+    )
+
     # 管理员账号配置（可选，用于首次初始化）
     # ZAI Image 配置
     zai_image_base_url: str = Field(
@@ -103,6 +238,16 @@ class Settings(BaseSettings):
             raise ValueError(f"log_level must be one of {allowed_levels}")
         return v_upper
     
+    @field_validator("cc_stream_mode")
+    @classmethod
+    def validate_cc_stream_mode(cls, v: str) -> str:
+        """验证 /cc/v1 流式模式"""
+        allowed_modes = ["estimate", "buffer"]
+        v_lower = v.lower()
+        if v_lower not in allowed_modes:
+            raise ValueError(f"cc_stream_mode must be one of {allowed_modes}")
+        return v_lower
+    
     @field_validator("jwt_expire_hours")
     @classmethod
     def validate_jwt_expire_hours(cls, v: int) -> int:
@@ -0,0 +1,408 @@
+"""
+上游 HTTP 客户端注册表
+按上游（plugin / codex / cloudcode / google_oauth / zai ...）维护进程级共享的 httpx.AsyncClient
+
+优化说明：
+1. 每个上游一个长连接池，复用 TCP/TLS 连接与 keep-alive，避免每个请求重新握手
+2. 连接池上限、keep-alive 参数与等待空闲连接的超时可通过配置 UPSTREAM_HTTP_LIMITS 按上游单独调整
+   （默认上限见 DEFAULT_UPSTREAM_SPECS：plugin / codex 500，cloudcode 300，custom 200）
+3. 在 app.main.lifespan 中创建，关闭应用时统一释放
+4. 自定义账号的出站代理：按 (proxy_url, 上游 host) 缓存长连接 client（LRU + 空闲淘汰），
+   复用已建立的 CONNECT 隧道 / SOCKS 连接，见 ProxyClientCache
+
+使用约定：
+- 通过 get_http_client(name) 借用客户端，直接调用 request/stream/send
+- 不要对借用的客户端使用 `async with` 或调用 aclose()，生命周期由注册表管理
+- 超时请按请求传入 timeout=request_timeout(name, read, connect=...)，客户端默认超时仅作兜底；
+  直接传 timeout=1200.0 会让连接池满时的排队等待也长达 1200 秒
+- 连接池满（httpx.PoolTimeout）表示本进程并发超过上限，不是上游故障：返回 503
+  （UPSTREAM_POOL_EXHAUSTED_MESSAGE），也不计入熔断
+"""
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field, replace
+from typing import AsyncIterator, Dict, Optional, Tuple
+from urllib.parse import urlparse
+import logging
+import time
+
+import httpx
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+# 上游名称
+UPSTREAM_PLUGIN = "plugin"
+UPSTREAM_CODEX = "codex"
+UPSTREAM_CLOUDCODE = "cloudcode"
+UPSTREAM_GOOGLE_OAUTH = "google_oauth"
+UPSTREAM_ZAI = "zai"
+UPSTREAM_CUSTOM = "custom"
+UPSTREAM_DEFAULT = "default"
+
+
+@dataclass(frozen=True)
+class UpstreamPoolSpec:
+    """单个上游连接池配置"""
+
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    connect_timeout: float = 30.0
+    read_timeout: Optional[float] = 300.0
+    # 连接池满时等待空闲连接的最长时间（秒），超时抛 httpx.PoolTimeout
+    pool_timeout: float = 10.0
+    follow_redirects: bool = False
+
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(self.read_timeout, connect=self.connect_timeout, pool=self.pool_timeout)
+
+
+# 默认配置：流式推理上游（plugin/codex/cloudcode）需要较大的池与较长的读超时
+DEFAULT_UPSTREAM_SPECS: Dict[str, UpstreamPoolSpec] = {
+    UPSTREAM_PLUGIN: UpstreamPoolSpec(
+        max_connections=500,
+        max_keepalive_connections=100,
+        keepalive_expiry=60.0,
+        connect_timeout=60.0,
+        read_timeout=1200.0,
+    ),
+    UPSTREAM_CODEX: UpstreamPoolSpec(
+        max_connections=500,
+        max_keepalive_connections=100,
+        keepalive_expiry=60.0,
+        connect_timeout=10.0,
+        read_timeout=None,
+        follow_redirects=True,
+    ),
+    UPSTREAM_CLOUDCODE: UpstreamPoolSpec(
+        max_connections=300,
+        max_keepalive_connections=60,
+        keepalive_expiry=60.0,
+        connect_timeout=60.0,
+        read_timeout=1200.0,
+    ),
+    UPSTREAM_GOOGLE_OAUTH: UpstreamPoolSpec(
+        max_connections=50,
+        max_keepalive_connections=10,
+        keepalive_expiry=30.0,
+        connect_timeout=30.0,
+        read_timeout=60.0,
+    ),
+    UPSTREAM_ZAI: UpstreamPoolSpec(
+        max_connections=100,
+        max_keepalive_connections=20,
+        keepalive_expiry=30.0,
+        connect_timeout=30.0,
+        read_timeout=120.0,
+    ),
+    # 自定义账号（用户配置的 base_url）；带代理时每个 (proxy, host) 单独一个池
+    UPSTREAM_CUSTOM: UpstreamPoolSpec(
+        max_connections=200,
+        max_keepalive_connections=40,
+        keepalive_expiry=60.0,
+        connect_timeout=30.0,
+        read_timeout=300.0,
+    ),
+    UPSTREAM_DEFAULT: UpstreamPoolSpec(),
+}
+
+
+# 连接池满（httpx.PoolTimeout）时返回给客户端的提示（HTTP 503）
+UPSTREAM_POOL_EXHAUSTED_MESSAGE = "上游连接池已满，请稍后重试"
+
+
+def _get_codex_proxies() -> Optional[Dict[str, str]]:
+    # 延迟导入，避免 core -> services 的循环依赖
+    from app.services.codex_service import _get_httpx_proxies
+
+    return _get_httpx_proxies()
+
+
+class HTTPClientRegistry:
+    """
+    上游 HTTP 客户端注册表
+    每个上游名称对应一个共享的 httpx.AsyncClient，首次借用时按需创建
+    """
+
+    def __init__(self):
+        """初始化注册表"""
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._specs: Dict[str, UpstreamPoolSpec] = self._load_specs()
+
+    @staticmethod
+    def _load_specs() -> Dict[str, UpstreamPoolSpec]:
+        """合并默认配置与 UPSTREAM_HTTP_LIMITS 覆盖项"""
+        specs = dict(DEFAULT_UPSTREAM_SPECS)
+        overrides = get_settings().upstream_http_limits or {}
+        for name, fields in overrides.items():
+            if not isinstance(fields, dict):
+                continue
+            base = specs.get(name, specs[UPSTREAM_DEFAULT])
+            known = {k: v for k, v in fields.items() if k in UpstreamPoolSpec.__dataclass_fields__}
+            try:
+                specs[name] = replace(base, **known)
+            except TypeError as e:
+                logger.warning("忽略无效的上游连接池配置: upstream=%s error=%s", name, e)
+        return specs
+
+    def get_spec(self, name: str) -> UpstreamPoolSpec:
+        """获取上游连接池配置（未知上游使用 default）"""
+        return self._specs.get(name) or self._specs[UPSTREAM_DEFAULT]
+
+    def _build_client(self, name: str) -> httpx.AsyncClient:
+        spec = self.get_spec(name)
+        proxies = _get_codex_proxies() if name == UPSTREAM_CODEX else None
+        logger.info(
+            "创建上游 HTTP 连接池: upstream=%s max_connections=%s max_keepalive=%s keepalive_expiry=%ss",
+            name,
+            spec.max_connections,
+            spec.max_keepalive_connections,
+            spec.keepalive_expiry,
+        )
+        return httpx.AsyncClient(
+            timeout=spec.timeout(),
+            limits=spec.limits(),
+            follow_redirects=spec.follow_redirects,
+            proxies=proxies,
+        )
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        """
+        借用指定上游的共享客户端
+
+        Args:
+            name: 上游名称（见 UPSTREAM_* 常量）
+
+        Returns:
+            共享的 httpx.AsyncClient
+        """
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._build_client(name)
+            self._clients[name] = client
+        return client
+
+    def warm_up(self, *names: str) -> None:
+        """预先创建指定上游的客户端"""
+        for name in names or tuple(self._specs.keys()):
+            try:
+                self.get(name)
+            except Exception as e:
+                # 例如 codex 配置了 SOCKS 代理但缺少依赖：推迟到实际请求时再报错
+                logger.warning("预创建上游 HTTP 连接池失败: upstream=%s error=%s", name, e)
+
+    async def close(self) -> None:
+        """关闭所有客户端"""
+        clients = list(self._clients.items())
+        self._clients.clear()
+        for name, client in clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning("关闭上游 HTTP 连接池失败: upstream=%s error=%s", name, e)
+
+
+@dataclass
+class _ProxyClientEntry:
+    client: httpx.AsyncClient
+    last_used: float = field(default_factory=time.monotonic)
+    in_use: int = 0
+    evicted: bool = False
+
+
+ProxyClientKey = Tuple[str, str]
+
+
+class ProxyClientCache:
+    """
+    出站代理 client 缓存
+
+    - 键：(proxy_url, 上游 host)，每个键持有一个带代理 transport 的长连接 client
+    - 容量上限（LRU）与空闲超时淘汰，淘汰的 client 会被关闭
+    - 借用期间（lease）的 client 不会被关闭：淘汰只做标记，最后一个借用者归还时再关闭
+    """
+
+    def __init__(self, *, max_size: int, idle_ttl: float, spec: UpstreamPoolSpec):
+        self.max_size = max(1, int(max_size))
+        self.idle_ttl = float(idle_ttl)
+        self.spec = spec
+        self._entries: "OrderedDict[ProxyClientKey, _ProxyClientEntry]" = OrderedDict()
+        self.created = 0
+        self.evicted = 0
+
+    @staticmethod
+    def make_key(proxy_url: str, base_url: str) -> ProxyClientKey:
+        try:
+            parsed = urlparse(base_url or "")
+            host = (parsed.netloc or parsed.path or "").lower()
+        except Exception:
+            host = ""
+        return proxy_url.strip(), host
+
+    def _build_client(self, proxy_url: str) -> httpx.AsyncClient:
+        # httpx==0.25.*：AsyncHTTPTransport 不会把 str 转成 Proxy，需显式构造
+        transport = httpx.AsyncHTTPTransport(proxy=httpx.Proxy(proxy_url), limits=self.spec.limits())
+        return httpx.AsyncClient(
+            transport=transport,
+            timeout=self.spec.timeout(),
+            follow_redirects=self.spec.follow_redirects,
+        )
+
+    async def _close_entry(self, entry: _ProxyClientEntry) -> None:
+        try:
+            await entry.client.aclose()
+        except Exception as e:
+            logger.warning("关闭代理 client 失败: %s", e)
+
+    async def _evict(self, key: ProxyClientKey) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        entry.evicted = True
+        self.evicted += 1
+        if entry.in_use <= 0:
+            await self._close_entry(entry)
+
+    async def sweep(self) -> None:
+        """淘汰空闲超时与超出容量的条目"""
+        now = time.monotonic()
+        for key, entry in list(self._entries.items()):
+            if entry.in_use <= 0 and now - entry.last_used > self.idle_ttl:
+                await self._evict(key)
+        while len(self._entries) > self.max_size:
+            oldest = next(iter(self._entries))
+            await self._evict(oldest)
+
+    @asynccontextmanager
+    async def lease(self, proxy_url: str, base_url: str) -> AsyncIterator[httpx.AsyncClient]:
+        """
+        借用 (proxy_url, base_url host) 对应的长连接 client
+
+        注意：流式响应需要在 lease 作用域内读完（或关闭）
+        """
+        key = self.make_key(proxy_url, base_url)
+        entry = self._entries.get(key)
+        if entry is None or entry.client.is_closed:
+            entry = _ProxyClientEntry(client=self._build_client(key[0]))
+            self._entries[key] = entry
+            self.created += 1
+        self._entries.move_to_end(key)
+        entry.in_use += 1
+        entry.last_used = time.monotonic()
+        await self.sweep()
+        try:
+            yield entry.client
+        finally:
+            entry.in_use -= 1
+            entry.last_used = time.monotonic()
+            if entry.evicted and entry.in_use <= 0:
+                await self._close_entry(entry)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def close(self) -> None:
+        """关闭所有缓存的 client"""
+        entries = list(self._entries.values())
+        self._entries.clear()
+        for entry in entries:
+            await self._close_entry(entry)
+
+
+# 全局注册表实例
+_registry: Optional[HTTPClientRegistry] = None
+_proxy_client_cache: Optional[ProxyClientCache] = None
+
+
+def get_http_client_registry() -> HTTPClientRegistry:
+    """
+    获取上游 HTTP 客户端注册表
+    使用单例模式
+    """
+    global _registry
+    if _registry is None:
+        _registry = HTTPClientRegistry()
+    return _registry
+
+
+def get_http_client(name: str = UPSTREAM_DEFAULT) -> httpx.AsyncClient:
+    """借用指定上游的共享 httpx.AsyncClient"""
+    return get_http_client_registry().get(name)
+
+
+def request_timeout(name: str, read: Optional[float], *, connect: Optional[float] = None) -> httpx.Timeout:
+    """
+    按请求的超时：读 / 写超时为 read，等待空闲连接的时间取上游配置的 pool_timeout
+
+    Args:
+        name: 上游名称（见 UPSTREAM_* 常量）
+        read: 读 / 写超时（秒），None 表示不限
+        connect: 建连超时（秒），默认同 read
+    """
+    # 注册表在应用启动时创建；未创建时（如单独使用服务类）按默认配置
+    if _registry is not None:
+        spec = _registry.get_spec(name)
+    else:
+        spec = DEFAULT_UPSTREAM_SPECS.get(name) or DEFAULT_UPSTREAM_SPECS[UPSTREAM_DEFAULT]
+    return httpx.Timeout(read, connect=read if connect is None else connect, pool=spec.pool_timeout)
+
+
+def get_proxy_client_cache() -> ProxyClientCache:
+    """
+    获取出站代理 client 缓存
+    使用单例模式
+    """
+    global _proxy_client_cache
+    if _proxy_client_cache is None:
+        settings = get_settings()
+        _proxy_client_cache = ProxyClientCache(
+            max_size=settings.proxy_client_cache_size,
+            idle_ttl=settings.proxy_client_idle_ttl_seconds,
+            spec=get_http_client_registry().get_spec(UPSTREAM_CUSTOM),
+        )
+    return _proxy_client_cache
+
+
+@asynccontextmanager
+async def lease_upstream_client(
+    base_url: str,
+    proxy_url: Optional[str] = None,
+) -> AsyncIterator[httpx.AsyncClient]:
+    """
+    借用访问自定义上游的 client
+
+    - 配置了代理：从 ProxyClientCache 借用 (proxy_url, host) 对应的长连接 client
+    - 未配置代理：使用共享的 custom 连接池
+    """
+    proxy = (proxy_url or "").strip()
+    if not proxy:
+        yield get_http_client(UPSTREAM_CUSTOM)
+        return
+    async with get_proxy_client_cache().lease(proxy, base_url) as client:
+        yield client
+
+
+async def init_http_clients() -> None:
+    """初始化上游 HTTP 客户端（应在应用启动时调用）"""
+    get_http_client_registry().warm_up()
+
+
+async def close_http_clients() -> None:
+    """关闭上游 HTTP 客户端（应在应用关闭时调用）"""
+    global _registry, _proxy_client_cache
+    if _proxy_client_cache is not None:
+        await _proxy_client_cache.close()
+        _proxy_client_cache = None
+    if _registry is not None:
+        await _registry.close()
+        _registry = None
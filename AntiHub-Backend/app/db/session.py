@@ -6,9 +6,13 @@
 1. 调整连接池参数以提高并发处理能力
 2. 缩短 pool_timeout 以快速发现问题
 3. 缩短 pool_recycle 以避免使用过期连接
+4. 请求级会话在响应开始发送时释放连接（见 DBSessionReleaseMiddleware），
+   长时间的流式响应不再占用连接池
 """
-from typing import AsyncGenerator
+from typing import AsyncGenerator, List
 import logging
+from fastapi import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from sqlalchemy.ext.asyncio import (
     AsyncSession,
     AsyncEngine,
@@ -21,6 +25,9 @@ from app.core.config import get_settings
 
 logger = logging.getLogger(__name__)
 
+# 请求 scope 中登记待释放会话的键
+REQUEST_SESSIONS_SCOPE_KEY = "antihub.db_sessions"
+
 # 全局引擎实例
 _engine: AsyncEngine | None = None
 _async_session_maker: async_sessionmaker[AsyncSession] | None = None
@@ -92,14 +99,17 @@ def get_session_maker() -> async_sessionmaker[AsyncSession]:
     return _async_session_maker
 
 
-async def get_db() -> AsyncGenerator[AsyncSession, None]:
+async def get_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
     """
     获取数据库会话
     用于依赖注入
     
     重要说明：
-    - 使用 async with 上下文管理器自动处理连接的获取和释放
-    - 请求成功时自动 commit
+    - AsyncSession 是惰性的：创建时不占用连接，首次执行 SQL 时才从连接池取连接
+      （例如 API key 认证命中缓存、未执行任何 SQL 的请求不会占用连接）
+    - 会话登记在请求 scope 中，响应开始发送时由 DBSessionReleaseMiddleware 提交并归还连接，
+      因此 StreamingResponse 的整个流式过程不再占用连接
+    - 流式过程中如再次使用会话，会重新短暂取用连接，流结束后由这里统一提交
     - 发生异常时自动 rollback
     - 上下文退出时自动关闭 session 并归还连接到连接池
     
@@ -111,16 +121,62 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
     """
     session_maker = get_session_maker()
     async with session_maker() as session:
+        sessions: List[AsyncSession] = request.scope.setdefault(REQUEST_SESSIONS_SCOPE_KEY, [])
+        sessions.append(session)
         try:
             yield session
             await session.commit()
         except Exception:
             await session.rollback()
             raise
+        finally:
+            if session in sessions:
+                sessions.remove(session)
         # 注意：不需要显式调用 session.close()
         # async with 上下文管理器会自动处理连接的释放
 
 
+async def release_session(session: AsyncSession) -> None:
+    """
+    提交会话当前事务并归还连接（会话仍可继续使用）
+    
+    未执行过 SQL 的会话没有事务，直接跳过；提交失败时回滚，保证连接被归还。
+    """
+    if not session.in_transaction():
+        return
+    try:
+        await session.commit()
+    except Exception as e:
+        logger.warning(f"响应开始前提交数据库会话失败，已回滚: {type(e).__name__}: {str(e)}")
+        await session.rollback()
+
+
+class DBSessionReleaseMiddleware:
+    """
+    在响应开始发送（http.response.start）时释放请求级数据库会话占用的连接
+    
+    FastAPI 中 yield 依赖的清理在响应完全发送后才执行，
+    对于持续数分钟的 SSE 流，get_db 的连接会一直被占用；
+    该中间件在路由返回、响应体开始发送之前提交会话，使连接立即回到连接池。
+    """
+    
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                for session in list(scope.get(REQUEST_SESSIONS_SCOPE_KEY) or ()):
+                    await release_session(session)
+            await send(message)
+        
+        await self.app(scope, receive, send_wrapper)
+
+
 async def init_db() -> None:
     """
     初始化数据库连接
@@ -12,12 +12,24 @@ from fastapi import FastAPI, Request, status
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
+import httpx
 from sqlalchemy.exc import SQLAlchemyError
 
 from app.core.config import get_settings
 from app.core.exceptions import BaseAPIException
-from app.db.session import init_db, close_db
-from app.cache import init_redis, close_redis
+from app.db.session import init_db, close_db, DBSessionReleaseMiddleware
+from app.cache import (
+    init_redis,
+    close_redis,
+    init_auth_cache,
+    close_auth_cache,
+    init_codex_account_pool,
+    close_codex_account_pool,
+)
+from app.core.http_client import UPSTREAM_POOL_EXHAUSTED_MESSAGE, init_http_clients, close_http_clients
+from app.services.usage_log_service import init_usage_log_writer, close_usage_log_writer
+from app.services.usage_log_retention import init_usage_log_retention, close_usage_log_retention
+from app.services.token_refresher import init_token_refresher, close_token_refresher
 from app.api.routes import (
     auth_router,
     health_router,
@@ -89,6 +101,31 @@ async def lifespan(app: FastAPI):
         logger.error(f"✗ Redis 连接失败: {str(e)}")
         raise
 
+    # 启动认证缓存失效订阅（Redis pub/sub）
+    await init_auth_cache()
+    logger.info("✓ 认证缓存失效订阅已启动")
+
+    # 启动 Codex 账号池状态同步订阅（Redis pub/sub）
+    await init_codex_account_pool()
+    logger.info("✓ Codex 账号池同步订阅已启动")
+
+    # 初始化上游 HTTP 连接池
+    await init_http_clients()
+    logger.info("✓ 上游 HTTP 连接池已创建")
+
+    # 启动用量日志后台批量写入
+    await init_usage_log_writer()
+    logger.info("✓ 用量日志批量写入已启动")
+
+    # 启动用量日志保留任务（分区维护 + 每渠道条数上限）
+    await init_usage_log_retention()
+    logger.info("✓ 用量日志保留任务已启动")
+
+    # 启动 OAuth token 后台预刷新（Codex / GeminiCLI）
+    await init_token_refresher()
+    if settings.token_refresher_enabled:
+        logger.info("✓ token 预刷新任务已启动")
+
     # 启动时自动初始化管理员账号（可选）
     try:
         from app.db.session import get_session_maker
@@ -121,6 +158,44 @@ async def lifespan(app: FastAPI):
     # 关闭事件
     logger.info("正在关闭应用...")
     
+    # 停止 token 预刷新任务（需在关闭 HTTP 连接池与数据库之前）
+    try:
+        await close_token_refresher()
+    except Exception as e:
+        logger.error(f"✗ 停止 token 预刷新任务失败: {str(e)}")
+
+    # 停止用量日志保留任务
+    try:
+        await close_usage_log_retention()
+    except Exception as e:
+        logger.error(f"✗ 停止用量日志保留任务失败: {str(e)}")
+
+    # 停止用量日志写入（写完队列中剩余日志，需在关闭数据库之前）
+    try:
+        await close_usage_log_writer()
+        logger.info("✓ 用量日志队列已写完")
+    except Exception as e:
+        logger.error(f"✗ 停止用量日志写入失败: {str(e)}")
+
+    # 关闭上游 HTTP 连接池
+    try:
+        await close_http_clients()
+        logger.info("✓ 上游 HTTP 连接池已关闭")
+    except Exception as e:
+        logger.error(f"✗ 关闭上游 HTTP 连接池失败: {str(e)}")
+
+    # 停止认证缓存失效订阅
+    try:
+        await close_auth_cache()
+    except Exception as e:
+        logger.error(f"✗ 停止认证缓存失效订阅失败: {str(e)}")
+
+    # 停止 Codex 账号池状态同步订阅
+    try:
+        await close_codex_account_pool()
+    except Exception as e:
+        logger.error(f"✗ 停止 Codex 账号池同步订阅失败: {str(e)}")
+
     # 关闭数据库连接
     try:
         await close_db()
@@ -175,6 +250,9 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
     
+    # 响应开始发送时归还请求级数据库连接（流式响应不再占用连接池）
+    app.add_middleware(DBSessionReleaseMiddleware)
+    
     # ==================== 注册路由 ====================
     
     app.include_router(auth_router, prefix="/api")
@@ -308,6 +386,24 @@ def create_app() -> FastAPI:
             }
         )
     
+    @app.exception_handler(httpx.PoolTimeout)
+    async def upstream_pool_exhausted_handler(request: Request, exc: httpx.PoolTimeout):
+        """处理上游连接池已满（本进程并发超过连接池上限，不是上游故障）"""
+        logger.warning(f"上游连接池已满: path={request.url.path}")
+        
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={
+                "error_code": "UPSTREAM_POOL_EXHAUSTED",
+                "message": UPSTREAM_POOL_EXHAUSTED_MESSAGE,
+                "details": {}
+            },
+            headers={
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Credentials": "true",
+            }
+        )
+    
     @app.exception_handler(Exception)
     async def general_exception_handler(request: Request, exc: Exception):
         """处理通用异常"""
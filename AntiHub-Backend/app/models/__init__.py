@@ -7,6 +7,7 @@ from app.models.oauth_token import OAuthToken
 from app.models.plugin_api_key import PluginAPIKey
 from app.models.api_key import APIKey
 from app.models.usage_log import UsageLog
+from app.models.usage_rollup import UsageRollupHourly
 from app.models.codex_account import CodexAccount
 from app.models.codex_fallback_config import CodexFallbackConfig
 from app.models.gemini_cli_account import GeminiCLIAccount
@@ -20,6 +21,7 @@ __all__ = [
     "PluginAPIKey",
     "APIKey",
     "UsageLog",
+    "UsageRollupHourly",
     "CodexAccount",
     "CodexFallbackConfig",
     "GeminiCLIAccount",
@@ -26,6 +26,7 @@ class APIKey(Base):
     last_used_at = Column(DateTime(timezone=True), nullable=True)
     expires_at = Column(DateTime(timezone=True), nullable=True)  # 过期时间，可选
     allowed_account_ids = Column(JSONB, nullable=True)  # 允许使用的账号ID列表；NULL=全部，[]=无，[1,2,3]=指定
+    balance_strategy = Column(String(32), nullable=True)  # 多账号负载均衡策略；NULL=跟随用户设置
     
     # 关系
     user = relationship("User", back_populates="api_keys")
@@ -2,7 +2,7 @@
 使用记录模型
 记录用户的API调用，用于统计
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Boolean
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -10,11 +10,21 @@ from app.db.base import Base
 
 
 class UsageLog(Base):
-    """使用记录表"""
+    """
+    使用记录表
+    
+    按 created_at 月度范围分区（usage_logs_pYYYYMM + usage_logs_default），
+    分区的预建与过期删除由 UsageLogRetentionJob 负责；分区表主键必须包含分区键。
+    """
     
     __tablename__ = "usage_logs"
+    __table_args__ = (
+        Index("ix_usage_logs_user_config_created", "user_id", "config_type", "created_at"),
+        Index("ix_usage_logs_user_created_id", "user_id", "created_at", "id"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     api_key_id = Column(Integer, ForeignKey("api_keys.id", ondelete="SET NULL"), nullable=True)
     
@@ -46,7 +56,7 @@ class UsageLog(Base):
     duration_ms = Column(Integer, default=0, nullable=False)
 
     # 时间戳
-    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True, primary_key=True)
     
     # 关系
     user = relationship("User", backref="usage_logs")
@@ -0,0 +1,52 @@
+"""
+用量小时汇总模型
+由 usage_log 批量写入器在同一事务内增量维护，统计接口直接查询汇总表
+"""
+from datetime import datetime, timezone
+
+from sqlalchemy import BigInteger, Column, DateTime, Float, ForeignKey, Integer, String
+
+from app.db.base import Base
+
+# 维度列不允许 NULL（NULL 无法参与 ON CONFLICT 的唯一键匹配），以哨兵值代替
+NO_API_KEY_ID = 0
+NO_DIMENSION = ""
+
+
+def hour_bucket(value: datetime) -> datetime:
+    """把时间截断到 UTC 整点（小时汇总桶）"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+class UsageRollupHourly(Base):
+    """
+    用量小时汇总表
+
+    主键即汇总维度：(user_id, hour, api_key_id, config_type, model_name, endpoint)；
+    api_key_id 为 0 / config_type、model_name 为空串表示原始记录中该字段为空。
+    """
+
+    __tablename__ = "usage_rollups_hourly"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    hour = Column(DateTime(timezone=True), primary_key=True)  # 小时桶（UTC 整点）
+    api_key_id = Column(Integer, primary_key=True, default=NO_API_KEY_ID)
+    config_type = Column(String(20), primary_key=True, default=NO_DIMENSION)
+    model_name = Column(String(100), primary_key=True, default=NO_DIMENSION)
+    endpoint = Column(String(255), primary_key=True)
+
+    # 计数
+    request_count = Column(BigInteger, default=0, nullable=False)
+    success_count = Column(BigInteger, default=0, nullable=False)
+
+    # Token / 配额 / 耗时累计
+    input_tokens = Column(BigInteger, default=0, nullable=False)
+    output_tokens = Column(BigInteger, default=0, nullable=False)
+    total_tokens = Column(BigInteger, default=0, nullable=False)
+    quota_consumed = Column(Float, default=0.0, nullable=False)
+    duration_ms_sum = Column(BigInteger, default=0, nullable=False)
+
+    def __repr__(self):
+        return f"<UsageRollupHourly(user_id={self.user_id}, hour={self.hour}, endpoint={self.endpoint})>"
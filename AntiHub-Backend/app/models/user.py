@@ -94,6 +94,13 @@ class User(Base):
         comment="是否加入beta计划"
     )
     
+    # 多账号负载均衡策略（fill-first / round-robin / least-in-flight / weighted-quota；NULL=fill-first）
+    balance_strategy: Mapped[Optional[str]] = mapped_column(
+        String(32),
+        nullable=True,
+        comment="多账号负载均衡策略"
+    )
+    
     # 时间戳
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
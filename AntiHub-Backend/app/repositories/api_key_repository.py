@@ -22,6 +22,7 @@ class APIKeyRepository:
         name: Optional[str] = None,
         config_type: str = "antigravity",
         allowed_account_ids: Optional[List[int]] = None,
+        balance_strategy: Optional[str] = None,
     ) -> APIKey:
         """
         创建新的API密钥
@@ -31,6 +32,7 @@ class APIKeyRepository:
             name: 密钥名称
             config_type: 配置类型（antigravity 或 kiro）
             allowed_account_ids: 允许使用的账号ID列表；None=全部账号
+            balance_strategy: 多账号负载均衡策略；None=跟随用户设置
 
         Returns:
             创建的API密钥对象
@@ -41,6 +43,7 @@ class APIKeyRepository:
             name=name,
             config_type=config_type,
             allowed_account_ids=allowed_account_ids,
+            balance_strategy=balance_strategy,
         )
         self.db.add(api_key)
         await self.db.flush()
@@ -188,3 +191,28 @@ class APIKeyRepository:
             await self.db.refresh(api_key)
             return api_key
         return None
+
+    async def update_balance_strategy(
+        self,
+        key_id: int,
+        user_id: int,
+        balance_strategy: Optional[str],
+    ) -> Optional[APIKey]:
+        """
+        更新密钥的多账号负载均衡策略
+
+        Args:
+            key_id: 密钥ID
+            user_id: 用户ID（用于验证权限）
+            balance_strategy: 策略名；None=跟随用户设置
+
+        Returns:
+            更新后的API密钥对象
+        """
+        api_key = await self.get_by_id(key_id)
+        if api_key and api_key.user_id == user_id:
+            api_key.balance_strategy = balance_strategy
+            await self.db.flush()
+            await self.db.refresh(api_key)
+            return api_key
+        return None
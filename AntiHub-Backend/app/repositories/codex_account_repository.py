@@ -8,7 +8,7 @@ Codex 账号数据仓储
 from __future__ import annotations
 
 from datetime import datetime
-from typing import Optional, Sequence
+from typing import Any, Optional, Sequence
 
 from sqlalchemy import select, update, delete
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -41,6 +41,27 @@ class CodexAccountRepository:
         )
         return result.scalars().all()
 
+    async def list_pool_states_by_user_id(self, user_id: int) -> Sequence[Any]:
+        """
+        返回账号池需要的选号状态列（不加载凭证等大字段，包含禁用账号）。
+
+        每行可按属性访问：id / user_id / status / limit_5h_* / limit_week_*。
+        """
+        result = await self.db.execute(
+            select(
+                CodexAccount.id,
+                CodexAccount.user_id,
+                CodexAccount.status,
+                CodexAccount.limit_5h_used_percent,
+                CodexAccount.limit_5h_reset_at,
+                CodexAccount.limit_week_used_percent,
+                CodexAccount.limit_week_reset_at,
+            )
+            .where(CodexAccount.user_id == user_id)
+            .order_by(CodexAccount.id.asc())
+        )
+        return result.all()
+
     async def get_by_id(self, account_id: int) -> Optional[CodexAccount]:
         result = await self.db.execute(select(CodexAccount).where(CodexAccount.id == account_id))
         return result.scalar_one_or_none()
@@ -51,6 +72,77 @@ class CodexAccountRepository:
         )
         return result.scalar_one_or_none()
 
+    async def list_expiring_tokens(
+        self,
+        before: datetime,
+        *,
+        not_before: Optional[datetime] = None,
+        limit: int = 500,
+    ) -> Sequence[Any]:
+        """
+        启用账号中 token_expires_at 早于 before 的账号（后台预刷新用），按过期时间升序
+
+        not_before 不为空时跳过早于它就已过期的账号（过期太久的多半已失效）。
+        每行可按属性访问：id / user_id / token_expires_at。
+        """
+        conditions = [
+            CodexAccount.status == 1,
+            CodexAccount.token_expires_at.is_not(None),
+            CodexAccount.token_expires_at <= before,
+        ]
+        if not_before is not None:
+            conditions.append(CodexAccount.token_expires_at >= not_before)
+        result = await self.db.execute(
+            select(CodexAccount.id, CodexAccount.user_id, CodexAccount.token_expires_at)
+            .where(*conditions)
+            .order_by(CodexAccount.token_expires_at.asc())
+            .limit(limit)
+        )
+        return result.all()
+
+    async def get_token_state(self, account_id: int, user_id: int) -> Optional[Any]:
+        """
+        只查凭证相关列（用于 token 刷新前的复核）
+
+        查询列而不是实体，不经过会话的 identity map，拿到的是库中的最新值。
+        """
+        result = await self.db.execute(
+            select(
+                CodexAccount.credentials,
+                CodexAccount.email,
+                CodexAccount.openai_account_id,
+                CodexAccount.chatgpt_plan_type,
+                CodexAccount.token_expires_at,
+                CodexAccount.last_refresh_at,
+            ).where(CodexAccount.id == account_id, CodexAccount.user_id == user_id)
+        )
+        return result.first()
+
+    async def update_credentials_if_unchanged(
+        self,
+        account_id: int,
+        user_id: int,
+        expected_credentials: str,
+        **values: Any,
+    ) -> bool:
+        """
+        凭证仍为 expected_credentials 时才写入 values（token 刷新的 compare-and-set）
+
+        Returns:
+            写入成功返回 True；凭证已被其他刷新改写（或账号不存在）返回 False
+        """
+        result = await self.db.execute(
+            update(CodexAccount)
+            .where(
+                CodexAccount.id == account_id,
+                CodexAccount.user_id == user_id,
+                CodexAccount.credentials == expected_credentials,
+            )
+            .values(**values)
+        )
+        await self.db.flush()
+        return result.rowcount == 1
+
     async def get_by_user_id_and_email(self, user_id: int, email: str) -> Optional[CodexAccount]:
         result = await self.db.execute(
             select(CodexAccount).where(CodexAccount.user_id == user_id, CodexAccount.email == email)
@@ -8,7 +8,7 @@ GeminiCLI 账号数据仓储
 from __future__ import annotations
 
 from datetime import datetime, timezone
-from typing import Optional, Sequence
+from typing import Any, Optional, Sequence
 
 from sqlalchemy import select, update, delete
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -50,6 +50,77 @@ class GeminiCLIAccountRepository:
         )
         return result.scalar_one_or_none()
 
+    async def list_expiring_tokens(
+        self,
+        before: datetime,
+        *,
+        not_before: Optional[datetime] = None,
+        limit: int = 500,
+    ) -> Sequence[Any]:
+        """
+        启用账号中 token_expires_at 早于 before 的账号（后台预刷新用），按过期时间升序
+
+        not_before 不为空时跳过早于它就已过期的账号（过期太久的多半已失效）。
+        每行可按属性访问：id / user_id / token_expires_at。
+        """
+        conditions = [
+            GeminiCLIAccount.status == 1,
+            GeminiCLIAccount.token_expires_at.is_not(None),
+            GeminiCLIAccount.token_expires_at <= before,
+        ]
+        if not_before is not None:
+            conditions.append(GeminiCLIAccount.token_expires_at >= not_before)
+        result = await self.db.execute(
+            select(GeminiCLIAccount.id, GeminiCLIAccount.user_id, GeminiCLIAccount.token_expires_at)
+            .where(*conditions)
+            .order_by(GeminiCLIAccount.token_expires_at.asc())
+            .limit(limit)
+        )
+        return result.all()
+
+    async def get_token_state(self, account_id: int, user_id: int) -> Optional[Any]:
+        """
+        只查凭证相关列（用于 token 刷新前的复核）
+
+        查询列而不是实体，不经过会话的 identity map，拿到的是库中的最新值。
+        """
+        result = await self.db.execute(
+            select(
+                GeminiCLIAccount.credentials,
+                GeminiCLIAccount.token_expires_at,
+                GeminiCLIAccount.last_refresh_at,
+            ).where(
+                GeminiCLIAccount.id == account_id,
+                GeminiCLIAccount.user_id == user_id,
+            )
+        )
+        return result.first()
+
+    async def update_credentials_if_unchanged(
+        self,
+        account_id: int,
+        user_id: int,
+        expected_credentials: str,
+        **values: Any,
+    ) -> bool:
+        """
+        凭证仍为 expected_credentials 时才写入 values（token 刷新的 compare-and-set）
+
+        Returns:
+            写入成功返回 True；凭证已被其他刷新改写（或账号不存在）返回 False
+        """
+        result = await self.db.execute(
+            update(GeminiCLIAccount)
+            .where(
+                GeminiCLIAccount.id == account_id,
+                GeminiCLIAccount.user_id == user_id,
+                GeminiCLIAccount.credentials == expected_credentials,
+            )
+            .values(**values)
+        )
+        await self.db.flush()
+        return result.rowcount == 1
+
     async def get_by_user_id_and_email(self, user_id: int, email: str) -> Optional[GeminiCLIAccount]:
         result = await self.db.execute(
             select(GeminiCLIAccount).where(
@@ -5,13 +5,55 @@ UsageLog Repository
 
 from __future__ import annotations
 
+import base64
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
 
-from sqlalchemy import case, func, select, text
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.engine import Row
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.usage_log import UsageLog
+from app.models.usage_rollup import UsageRollupHourly, hour_bucket
+
+
+# 导出时逐列读取（不构造 ORM 实体，避免 identity map 开销）
+EXPORT_COLUMNS = (
+    UsageLog.id,
+    UsageLog.endpoint,
+    UsageLog.method,
+    UsageLog.model_name,
+    UsageLog.config_type,
+    UsageLog.stream,
+    UsageLog.success,
+    UsageLog.status_code,
+    UsageLog.error_message,
+    UsageLog.quota_consumed,
+    UsageLog.input_tokens,
+    UsageLog.output_tokens,
+    UsageLog.total_tokens,
+    UsageLog.duration_ms,
+    UsageLog.tts_voice_id,
+    UsageLog.tts_account_id,
+    UsageLog.created_at,
+)
+
+
+def encode_cursor(created_at: datetime, log_id: int) -> str:
+    """把 (created_at, id) 编码为不透明游标"""
+    raw = f"{created_at.isoformat()}|{log_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """解析游标；格式非法时抛出 ValueError"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8")
+        created_at_str, log_id_str = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at_str), int(log_id_str)
+    except Exception as e:
+        raise ValueError("cursor 无效") from e
 
 
 class UsageLogRepository:
@@ -78,10 +120,12 @@ class UsageLogRepository:
         result = await self.db.execute(stmt)
         return list(result.scalars().all())
 
-    async def count_logs(
+    async def list_logs_after(
         self,
         *,
         user_id: int,
+        cursor: Optional[str] = None,
+        limit: int = 50,
         api_key_id: Optional[int] = None,
         start_at: Optional[datetime] = None,
         end_at: Optional[datetime] = None,
@@ -89,8 +133,16 @@ class UsageLogRepository:
         success: Optional[bool] = None,
         model_name: Optional[str] = None,
         endpoint: Optional[str] = None,
-    ) -> int:
-        stmt = select(func.count(UsageLog.id))
+    ) -> Tuple[List[UsageLog], Optional[str]]:
+        """
+        游标分页（按 created_at DESC, id DESC 的 keyset 分页）
+
+        与 offset 分页不同，翻页代价与页深无关，也不需要额外的 count 查询。
+
+        Returns:
+            (本页日志, 下一页游标；没有更多数据时为 None)
+        """
+        stmt = select(UsageLog)
         stmt = self._apply_filters(
             stmt,
             user_id=user_id,
@@ -102,171 +154,210 @@ class UsageLogRepository:
             model_name=model_name,
             endpoint=endpoint,
         )
+        if cursor:
+            cursor_created_at, cursor_id = decode_cursor(cursor)
+            stmt = stmt.where(
+                tuple_(UsageLog.created_at, UsageLog.id) < tuple_(cursor_created_at, cursor_id)
+            )
+        # 多取一条判断是否还有下一页
+        stmt = stmt.order_by(UsageLog.created_at.desc(), UsageLog.id.desc()).limit(limit + 1)
         result = await self.db.execute(stmt)
-        return int(result.scalar() or 0)
+        logs = list(result.scalars().all())
 
-    async def get_stats(
+        next_cursor = None
+        if len(logs) > limit:
+            logs = logs[:limit]
+            last = logs[-1]
+            next_cursor = encode_cursor(last.created_at, last.id)
+        return logs, next_cursor
+
+    async def stream_logs(
         self,
         *,
         user_id: int,
+        batch_size: int = 1000,
         api_key_id: Optional[int] = None,
         start_at: Optional[datetime] = None,
         end_at: Optional[datetime] = None,
         config_type: Optional[str] = None,
+        success: Optional[bool] = None,
+        model_name: Optional[str] = None,
         endpoint: Optional[str] = None,
-    ) -> Dict[str, Any]:
-        base_stmt = select(
-            func.count(UsageLog.id).label("total_requests"),
-            func.coalesce(
-                func.sum(case((UsageLog.success.is_(True), 1), else_=0)), 0
-            ).label("success_requests"),
-            func.coalesce(
-                func.sum(case((UsageLog.success.is_(False), 1), else_=0)), 0
-            ).label("failed_requests"),
-            func.coalesce(func.sum(UsageLog.input_tokens), 0).label("input_tokens"),
-            func.coalesce(func.sum(UsageLog.output_tokens), 0).label("output_tokens"),
-            func.coalesce(func.sum(UsageLog.total_tokens), 0).label("total_tokens"),
-            func.coalesce(func.sum(UsageLog.quota_consumed), 0).label("total_quota_consumed"),
-            func.coalesce(func.avg(UsageLog.duration_ms), 0).label("avg_duration_ms"),
-        )
-        base_stmt = self._apply_filters(
-            base_stmt,
+    ) -> AsyncIterator[Sequence[Row]]:
+        """
+        以服务端游标（stream_results）分批读取日志，用于导出
+
+        每次只在内存中保留 batch_size 行；行对象可按属性访问 EXPORT_COLUMNS 中的列。
+        """
+        stmt = select(*EXPORT_COLUMNS)
+        stmt = self._apply_filters(
+            stmt,
             user_id=user_id,
             api_key_id=api_key_id,
             start_at=start_at,
             end_at=end_at,
             config_type=config_type,
+            success=success,
+            model_name=model_name,
             endpoint=endpoint,
         )
-        base_result = await self.db.execute(base_stmt)
-        row = base_result.one()
+        stmt = stmt.order_by(UsageLog.created_at.desc(), UsageLog.id.desc())
+        result = await self.db.stream(stmt.execution_options(yield_per=batch_size))
+        try:
+            async for rows in result.partitions(batch_size):
+                yield rows
+        finally:
+            await result.close()
 
-        # 按 config_type 聚合
-        by_config_stmt = select(
-            UsageLog.config_type,
-            func.count(UsageLog.id).label("total_requests"),
-            func.coalesce(
-                func.sum(case((UsageLog.success.is_(True), 1), else_=0)), 0
-            ).label("success_requests"),
-            func.coalesce(
-                func.sum(case((UsageLog.success.is_(False), 1), else_=0)), 0
-            ).label("failed_requests"),
-            func.coalesce(func.sum(UsageLog.total_tokens), 0).label("total_tokens"),
-            func.coalesce(func.sum(UsageLog.quota_consumed), 0).label("total_quota_consumed"),
-        )
-        by_config_stmt = self._apply_filters(
-            by_config_stmt,
+    async def count_logs(
+        self,
+        *,
+        user_id: int,
+        api_key_id: Optional[int] = None,
+        start_at: Optional[datetime] = None,
+        end_at: Optional[datetime] = None,
+        config_type: Optional[str] = None,
+        success: Optional[bool] = None,
+        model_name: Optional[str] = None,
+        endpoint: Optional[str] = None,
+    ) -> int:
+        stmt = select(func.count(UsageLog.id))
+        stmt = self._apply_filters(
+            stmt,
             user_id=user_id,
             api_key_id=api_key_id,
             start_at=start_at,
             end_at=end_at,
             config_type=config_type,
+            success=success,
+            model_name=model_name,
             endpoint=endpoint,
-        ).group_by(UsageLog.config_type)
-        by_config_rows = (await self.db.execute(by_config_stmt)).all()
+        )
+        result = await self.db.execute(stmt)
+        return int(result.scalar() or 0)
 
-        by_config: Dict[str, Any] = {}
-        for r in by_config_rows:
-            key = r.config_type or "unknown"
-            total_reqs = int(r.total_requests or 0)
-            success_reqs = int(r.success_requests or 0)
-            by_config[key] = {
-                "total_requests": total_reqs,
-                "success_requests": success_reqs,
-                "failed_requests": int(r.failed_requests or 0),
-                "success_rate": round((success_reqs / total_reqs * 100), 1) if total_reqs > 0 else 0.0,
-                "total_tokens": int(r.total_tokens or 0),
-                "total_quota_consumed": float(r.total_quota_consumed or 0.0),
-            }
+    def _apply_rollup_filters(
+        self,
+        stmt,
+        *,
+        user_id: int,
+        api_key_id: Optional[int] = None,
+        start_at: Optional[datetime] = None,
+        end_at: Optional[datetime] = None,
+        config_type: Optional[str] = None,
+        endpoint: Optional[str] = None,
+    ):
+        """
+        小时汇总表的过滤条件
 
-        # 按 model 聚合（只返回 top 50，避免返回过大）
-        by_model_stmt = select(
-            UsageLog.model_name,
-            func.count(UsageLog.id).label("total_requests"),
-            func.coalesce(
-                func.sum(case((UsageLog.success.is_(True), 1), else_=0)), 0
-            ).label("success_requests"),
-            func.coalesce(
-                func.sum(case((UsageLog.success.is_(False), 1), else_=0)), 0
-            ).label("failed_requests"),
-            func.coalesce(func.sum(UsageLog.total_tokens), 0).label("total_tokens"),
-            func.coalesce(func.sum(UsageLog.quota_consumed), 0).label("total_quota_consumed"),
+        时间范围按小时桶粒度匹配：包含 start_at 所在小时到 end_at 所在小时的全部记录。
+        """
+        stmt = stmt.where(UsageRollupHourly.user_id == user_id)
+        if api_key_id is not None:
+            stmt = stmt.where(UsageRollupHourly.api_key_id == api_key_id)
+        if start_at is not None:
+            stmt = stmt.where(UsageRollupHourly.hour >= hour_bucket(start_at))
+        if end_at is not None:
+            stmt = stmt.where(UsageRollupHourly.hour <= end_at)
+        if config_type:
+            stmt = stmt.where(UsageRollupHourly.config_type == config_type)
+        if endpoint:
+            stmt = stmt.where(UsageRollupHourly.endpoint == endpoint)
+        return stmt
+
+    @staticmethod
+    def _rollup_sums():
+        return (
+            func.coalesce(func.sum(UsageRollupHourly.request_count), 0).label("total_requests"),
+            func.coalesce(func.sum(UsageRollupHourly.success_count), 0).label("success_requests"),
+            func.coalesce(func.sum(UsageRollupHourly.input_tokens), 0).label("input_tokens"),
+            func.coalesce(func.sum(UsageRollupHourly.output_tokens), 0).label("output_tokens"),
+            func.coalesce(func.sum(UsageRollupHourly.total_tokens), 0).label("total_tokens"),
+            func.coalesce(func.sum(UsageRollupHourly.quota_consumed), 0).label("total_quota_consumed"),
+            func.coalesce(func.sum(UsageRollupHourly.duration_ms_sum), 0).label("duration_ms_sum"),
         )
-        by_model_stmt = self._apply_filters(
-            by_model_stmt,
+
+    @staticmethod
+    def _summarize(r, *, with_tokens: bool) -> Dict[str, Any]:
+        total_reqs = int(r.total_requests or 0)
+        success_reqs = int(r.success_requests or 0)
+        item: Dict[str, Any] = {
+            "total_requests": total_reqs,
+            "success_requests": success_reqs,
+            "failed_requests": total_reqs - success_reqs,
+            "success_rate": round((success_reqs / total_reqs * 100), 1) if total_reqs > 0 else 0.0,
+        }
+        if with_tokens:
+            item["input_tokens"] = int(r.input_tokens or 0)
+            item["output_tokens"] = int(r.output_tokens or 0)
+        item["total_tokens"] = int(r.total_tokens or 0)
+        item["total_quota_consumed"] = float(r.total_quota_consumed or 0.0)
+        if with_tokens:
+            item["avg_duration_ms"] = (
+                float(r.duration_ms_sum or 0) / total_reqs if total_reqs > 0 else 0.0
+            )
+        return item
+
+    async def get_stats(
+        self,
+        *,
+        user_id: int,
+        api_key_id: Optional[int] = None,
+        start_at: Optional[datetime] = None,
+        end_at: Optional[datetime] = None,
+        config_type: Optional[str] = None,
+        endpoint: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        聚合统计（查询 usage_rollups_hourly，代价与小时桶数量成正比，而非日志行数）
+
+        汇总覆盖保留窗口内的全部请求，不受明细每渠道条数上限的影响；调用方用
+        app.services.usage_log_retention.clamp_stats_start 把 start_at 限定在保留窗口内。
+        recent_requests 仍取自 usage_logs（按索引取最近 10 条）。
+        """
+        filters = dict(
             user_id=user_id,
             api_key_id=api_key_id,
             start_at=start_at,
             end_at=end_at,
             config_type=config_type,
             endpoint=endpoint,
-        ).group_by(UsageLog.model_name)
+        )
+        sums = self._rollup_sums()
+
+        base_stmt = self._apply_rollup_filters(select(*sums), **filters)
+        row = (await self.db.execute(base_stmt)).one()
+
+        # 按 config_type 聚合
+        by_config_stmt = self._apply_rollup_filters(
+            select(UsageRollupHourly.config_type, *sums), **filters
+        ).group_by(UsageRollupHourly.config_type)
+        by_config: Dict[str, Any] = {}
+        for r in (await self.db.execute(by_config_stmt)).all():
+            by_config[r.config_type or "unknown"] = self._summarize(r, with_tokens=False)
+
+        # 按 model 聚合（只返回 top 50，避免返回过大）
+        by_model_stmt = self._apply_rollup_filters(
+            select(UsageRollupHourly.model_name, *sums), **filters
+        ).group_by(UsageRollupHourly.model_name)
         by_model_stmt = by_model_stmt.order_by(
-            func.sum(UsageLog.total_tokens).desc(),
-            func.sum(UsageLog.quota_consumed).desc(),
+            func.sum(UsageRollupHourly.total_tokens).desc(),
+            func.sum(UsageRollupHourly.quota_consumed).desc(),
         ).limit(50)
-        by_model_rows = (await self.db.execute(by_model_stmt)).all()
-
         by_model: Dict[str, Any] = {}
-        for r in by_model_rows:
-            key = r.model_name or "unknown"
-            total_reqs = int(r.total_requests or 0)
-            success_reqs = int(r.success_requests or 0)
-            by_model[key] = {
-                "total_requests": total_reqs,
-                "success_requests": success_reqs,
-                "failed_requests": int(r.failed_requests or 0),
-                "success_rate": round((success_reqs / total_reqs * 100), 1) if total_reqs > 0 else 0.0,
-                "total_tokens": int(r.total_tokens or 0),
-                "total_quota_consumed": float(r.total_quota_consumed or 0.0),
-            }
+        for r in (await self.db.execute(by_model_stmt)).all():
+            by_model[r.model_name or "unknown"] = self._summarize(r, with_tokens=False)
 
         # 按 endpoint 聚合（返回 top 100，按请求数降序）
-        by_endpoint_stmt = select(
-            UsageLog.endpoint,
-            func.count(UsageLog.id).label("total_requests"),
-            func.coalesce(
-                func.sum(case((UsageLog.success.is_(True), 1), else_=0)), 0
-            ).label("success_requests"),
-            func.coalesce(
-                func.sum(case((UsageLog.success.is_(False), 1), else_=0)), 0
-            ).label("failed_requests"),
-            func.coalesce(func.sum(UsageLog.input_tokens), 0).label("input_tokens"),
-            func.coalesce(func.sum(UsageLog.output_tokens), 0).label("output_tokens"),
-            func.coalesce(func.sum(UsageLog.total_tokens), 0).label("total_tokens"),
-            func.coalesce(func.sum(UsageLog.quota_consumed), 0).label("total_quota_consumed"),
-            func.coalesce(func.avg(UsageLog.duration_ms), 0).label("avg_duration_ms"),
-        )
-        by_endpoint_stmt = self._apply_filters(
-            by_endpoint_stmt,
-            user_id=user_id,
-            api_key_id=api_key_id,
-            start_at=start_at,
-            end_at=end_at,
-            config_type=config_type,
-            endpoint=endpoint,
-        ).group_by(UsageLog.endpoint)
+        by_endpoint_stmt = self._apply_rollup_filters(
+            select(UsageRollupHourly.endpoint, *sums), **filters
+        ).group_by(UsageRollupHourly.endpoint)
         by_endpoint_stmt = by_endpoint_stmt.order_by(
-            func.count(UsageLog.id).desc()
+            func.sum(UsageRollupHourly.request_count).desc()
         ).limit(100)
-        by_endpoint_rows = (await self.db.execute(by_endpoint_stmt)).all()
-
         by_endpoint: Dict[str, Any] = {}
-        for r in by_endpoint_rows:
-            key = r.endpoint or "unknown"
-            total_reqs = int(r.total_requests or 0)
-            success_reqs = int(r.success_requests or 0)
-            by_endpoint[key] = {
-                "total_requests": total_reqs,
-                "success_requests": success_reqs,
-                "failed_requests": int(r.failed_requests or 0),
-                "success_rate": round((success_reqs / total_reqs * 100), 1) if total_reqs > 0 else 0.0,
-                "input_tokens": int(r.input_tokens or 0),
-                "output_tokens": int(r.output_tokens or 0),
-                "total_tokens": int(r.total_tokens or 0),
-                "total_quota_consumed": float(r.total_quota_consumed or 0.0),
-                "avg_duration_ms": float(r.avg_duration_ms or 0),
-            }
+        for r in (await self.db.execute(by_endpoint_stmt)).all():
+            by_endpoint[r.endpoint or "unknown"] = self._summarize(r, with_tokens=True)
 
         # 获取最近的请求记录（最多10条）
         recent_stmt = select(UsageLog)
@@ -303,21 +394,8 @@ class UsageLogRepository:
             for log in recent_logs
         ]
 
-        # 计算总体成功率
-        total_reqs = int(row.total_requests or 0)
-        success_reqs = int(row.success_requests or 0)
-        success_rate = round((success_reqs / total_reqs * 100), 1) if total_reqs > 0 else 0.0
-
         return {
-            "total_requests": total_reqs,
-            "success_requests": success_reqs,
-            "failed_requests": int(row.failed_requests or 0),
-            "success_rate": success_rate,
-            "input_tokens": int(row.input_tokens or 0),
-            "output_tokens": int(row.output_tokens or 0),
-            "total_tokens": int(row.total_tokens or 0),
-            "total_quota_consumed": float(row.total_quota_consumed or 0.0),
-            "avg_duration_ms": float(row.avg_duration_ms or 0),
+            **self._summarize(row, with_tokens=True),
             "by_config_type": by_config,
             "by_model": by_model,
             "by_endpoint": by_endpoint,
@@ -333,15 +411,14 @@ class UsageLogRepository:
         end_at: Optional[datetime] = None,
         config_type: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
-        """按小时 + 模型分桶聚合，用于 API Key 详情页图表"""
-        hour_bucket = func.date_trunc(text("'hour'"), UsageLog.created_at).label("hour")
+        """按小时 + 模型分桶聚合，用于 API Key 详情页图表（查询小时汇总表）"""
         stmt = select(
-            hour_bucket,
-            UsageLog.model_name,
-            func.count(UsageLog.id).label("request_count"),
-            func.coalesce(func.sum(UsageLog.quota_consumed), 0).label("quota_consumed"),
+            UsageRollupHourly.hour,
+            UsageRollupHourly.model_name,
+            func.sum(UsageRollupHourly.request_count).label("request_count"),
+            func.coalesce(func.sum(UsageRollupHourly.quota_consumed), 0).label("quota_consumed"),
         )
-        stmt = self._apply_filters(
+        stmt = self._apply_rollup_filters(
             stmt,
             user_id=user_id,
             api_key_id=api_key_id,
@@ -349,7 +426,9 @@ class UsageLogRepository:
             end_at=end_at,
             config_type=config_type,
         )
-        stmt = stmt.group_by(hour_bucket, UsageLog.model_name).order_by(hour_bucket)
+        stmt = stmt.group_by(UsageRollupHourly.hour, UsageRollupHourly.model_name).order_by(
+            UsageRollupHourly.hour
+        )
         result = await self.db.execute(stmt)
         rows = result.all()
         return [
@@ -162,7 +162,8 @@ class UserRepository:
         # 更新允许的字段
         allowed_fields = {
             'username', 'password_hash', 'oauth_id', 'avatar_url',
-            'trust_level', 'is_active', 'is_silenced', 'last_login_at', 'beta'
+            'trust_level', 'is_active', 'is_silenced', 'last_login_at', 'beta',
+            'balance_strategy'
         }
         
         for field, value in kwargs.items():
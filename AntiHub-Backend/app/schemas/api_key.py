@@ -17,6 +17,18 @@ APIKeyConfigType = Literal[
     "custom",
 ]
 
+# 多账号负载均衡策略（见 app.services.account_balancer）
+BalanceStrategy = Literal[
+    "fill-first",
+    "round-robin",
+    "least-in-flight",
+    "weighted-quota",
+]
+
+_BALANCE_STRATEGY_DESCRIPTION = (
+    "多账号负载均衡策略：fill-first / round-robin / least-in-flight / weighted-quota；NULL=跟随用户设置"
+)
+
 
 class APIKeyCreate(BaseModel):
     """创建API密钥请求"""
@@ -29,6 +41,7 @@ class APIKeyCreate(BaseModel):
         None,
         description="允许使用的账号ID列表；NULL=全部账号，[]=无账号，[1,2,3]=指定账号",
     )
+    balance_strategy: Optional[BalanceStrategy] = Field(None, description=_BALANCE_STRATEGY_DESCRIPTION)
 
 
 class APIKeyResponse(BaseModel):
@@ -49,6 +62,7 @@ class APIKeyResponse(BaseModel):
         None,
         description="允许使用的账号ID列表；NULL=全部账号",
     )
+    balance_strategy: Optional[BalanceStrategy] = Field(None, description=_BALANCE_STRATEGY_DESCRIPTION)
 
     model_config = {"from_attributes": True}
 
@@ -75,6 +89,7 @@ class APIKeyListResponse(BaseModel):
         None,
         description="允许使用的账号数量；NULL=全部账号",
     )
+    balance_strategy: Optional[BalanceStrategy] = Field(None, description=_BALANCE_STRATEGY_DESCRIPTION)
 
     model_config = {"from_attributes": True}
 
@@ -100,6 +115,11 @@ class APIKeyUpdateAccounts(BaseModel):
     )
 
 
+class APIKeyUpdateBalanceStrategy(BaseModel):
+    """更新API密钥的负载均衡策略"""
+    balance_strategy: Optional[BalanceStrategy] = Field(None, description=_BALANCE_STRATEGY_DESCRIPTION)
+
+
 class AccountSummary(BaseModel):
     """账号摘要（用于账号选择列表）"""
     account_id: int = Field(..., description="账号ID")
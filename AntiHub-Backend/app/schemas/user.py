@@ -6,6 +6,8 @@ from typing import Optional
 from datetime import datetime
 from pydantic import BaseModel, Field, ConfigDict
 
+from app.schemas.api_key import BalanceStrategy
+
 
 # ==================== 用户基础 Schema ====================
 
@@ -116,6 +118,7 @@ class UserResponse(BaseModel):
     is_active: bool = Field(..., description="账号是否激活")
     is_silenced: bool = Field(..., description="是否被禁言")
     beta: int = Field(default=0, description="是否加入beta计划")
+    balance_strategy: Optional[str] = Field(None, description="多账号负载均衡策略；NULL=fill-first")
     created_at: datetime = Field(..., description="创建时间")
     last_login_at: Optional[datetime] = Field(None, description="最后登录时间")
     
@@ -174,4 +177,22 @@ class JoinBetaResponse(BaseModel):
     message: str = Field(..., description="响应消息")
     beta: int = Field(..., description="当前beta状态")
     
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+
+# ==================== 负载均衡策略 Schema ====================
+
+class BalanceStrategyUpdate(BaseModel):
+    """设置多账号负载均衡策略"""
+    
+    balance_strategy: Optional[BalanceStrategy] = Field(
+        None,
+        description="fill-first / round-robin / least-in-flight / weighted-quota；NULL=恢复默认（fill-first）"
+    )
+
+
+class BalanceStrategyResponse(BaseModel):
+    """多账号负载均衡策略响应"""
+    
+    success: bool = Field(..., description="是否成功")
+    balance_strategy: Optional[str] = Field(None, description="当前策略；NULL=fill-first")
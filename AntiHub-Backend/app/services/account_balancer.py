@@ -0,0 +1,145 @@
+"""
+多账号负载均衡策略
+
+同一渠道下有多个可用账号时，由策略决定本次请求使用哪个账号：
+- fill-first      ：按 id 升序使用第一个可用账号（默认；满了/冻结/禁用才换下一个）
+- round-robin     ：按用户轮询可用账号
+- least-in-flight ：选在途请求最少的账号（并列时轮询）
+- weighted-quota  ：按剩余限额加权随机（剩余越多越容易被选中）
+
+策略可按用户设置（users.balance_strategy），API key 上的 balance_strategy 优先；都未设置时为 fill-first。
+
+在途数 / 剩余限额由调用方提供：Codex 取自内存账号池；其他渠道没有这两项数据，
+least-in-flight 退化为轮询，weighted-quota 退化为均匀随机。
+
+轮询游标只保存在进程内（不跨 worker 同步）。只在事件循环线程内使用，不加锁。
+"""
+import random
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Hashable, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+
+FILL_FIRST = "fill-first"
+ROUND_ROBIN = "round-robin"
+LEAST_IN_FLIGHT = "least-in-flight"
+WEIGHTED_QUOTA = "weighted-quota"
+
+BALANCE_STRATEGIES = (FILL_FIRST, ROUND_ROBIN, LEAST_IN_FLIGHT, WEIGHTED_QUOTA)
+DEFAULT_BALANCE_STRATEGY = FILL_FIRST
+
+# weighted-quota 的最小权重：接近用完的账号仍分到少量请求（限额数据可能滞后）
+MIN_QUOTA_WEIGHT = 0.01
+
+
+def _no_in_flight(_candidate: Any) -> int:
+    return 0
+
+
+def _full_quota(_candidate: Any) -> float:
+    return 1.0
+
+
+class BalanceStrategy(ABC):
+    """选号策略：从候选账号（均可用，按 id 升序）中选出一个"""
+
+    name = ""
+
+    @abstractmethod
+    def choose(
+        self,
+        key: Hashable,
+        candidates: Sequence[T],
+        *,
+        in_flight: Callable[[T], int],
+        remaining: Callable[[T], float],
+    ) -> T:
+        raise NotImplementedError
+
+
+class FillFirstStrategy(BalanceStrategy):
+    name = FILL_FIRST
+
+    def choose(self, key, candidates, *, in_flight, remaining):
+        return candidates[0]
+
+
+class RoundRobinStrategy(BalanceStrategy):
+    name = ROUND_ROBIN
+
+    def __init__(self) -> None:
+        # key（渠道 + 用户）-> 已选次数
+        self._cursors: Dict[Hashable, int] = {}
+
+    def _next(self, key: Hashable) -> int:
+        n = self._cursors.get(key, 0)
+        self._cursors[key] = n + 1
+        return n
+
+    def choose(self, key, candidates, *, in_flight, remaining):
+        return candidates[self._next(key) % len(candidates)]
+
+
+class LeastInFlightStrategy(RoundRobinStrategy):
+    name = LEAST_IN_FLIGHT
+
+    def choose(self, key, candidates, *, in_flight, remaining):
+        counts = [in_flight(c) for c in candidates]
+        lowest = min(counts)
+        ties = [c for c, n in zip(candidates, counts) if n == lowest]
+        return ties[self._next(key) % len(ties)]
+
+
+class WeightedQuotaStrategy(BalanceStrategy):
+    name = WEIGHTED_QUOTA
+
+    def __init__(self, rng: Optional[random.Random] = None) -> None:
+        self._random = rng or random.Random()
+
+    def choose(self, key, candidates, *, in_flight, remaining):
+        weights = [max(MIN_QUOTA_WEIGHT, min(1.0, float(remaining(c)))) for c in candidates]
+        return self._random.choices(candidates, weights)[0]
+
+
+_STRATEGIES: Dict[str, BalanceStrategy] = {
+    s.name: s
+    for s in (FillFirstStrategy(), RoundRobinStrategy(), LeastInFlightStrategy(), WeightedQuotaStrategy())
+}
+
+
+def get_balance_strategy(name: Optional[str]) -> BalanceStrategy:
+    """按名称取策略实例；未知名称或 None 返回 fill-first"""
+    return _STRATEGIES.get(name or "", _STRATEGIES[DEFAULT_BALANCE_STRATEGY])
+
+
+def choose_account(
+    strategy: Optional[str],
+    key: Hashable,
+    candidates: Sequence[T],
+    *,
+    in_flight: Callable[[T], int] = _no_in_flight,
+    remaining: Callable[[T], float] = _full_quota,
+) -> Optional[T]:
+    """
+    按策略从候选账号中选一个
+
+    Args:
+        strategy: 策略名（BALANCE_STRATEGIES 之一；None / 未知 = fill-first）
+        key: 轮询游标的分组键，一般为 (渠道, user_id)
+        candidates: 可用账号（按 id 升序）
+        in_flight: 账号 -> 在途请求数
+        remaining: 账号 -> 剩余限额比例（0~1）
+    """
+    if not candidates:
+        return None
+    if len(candidates) == 1:
+        return candidates[0]
+    return get_balance_strategy(strategy).choose(key, candidates, in_flight=in_flight, remaining=remaining)
+
+
+def resolve_balance_strategy(user: Any) -> str:
+    """本次请求使用的策略：API key 上的设置优先，其次用户设置，默认 fill-first"""
+    for value in (getattr(user, "_balance_strategy", None), getattr(user, "balance_strategy", None)):
+        if value in _STRATEGIES:
+            return value
+    return DEFAULT_BALANCE_STRATEGY
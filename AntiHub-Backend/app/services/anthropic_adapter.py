@@ -2,9 +2,9 @@
 Anthropic格式转换器服务
 将Anthropic Messages API格式转换为OpenAI格式，并将OpenAI响应转换回Anthropic格式
 """
-from typing import Optional, Dict, Any, List, Union, AsyncGenerator, Tuple
+from typing import Optional, Dict, Any, List, Union, AsyncGenerator, Tuple, Callable
 import ast
-import asyncio
+import functools
 import json
 import uuid
 import time
@@ -21,10 +21,252 @@ from app.schemas.anthropic import (
     AnthropicErrorResponse,
     AnthropicErrorDetail,
 )
+from app.utils import jsonx
+from app.utils.keepalive import with_keepalive
+from app.utils.sse import SSELineBuffer, SSETemplate, parse_data_line, template_slot
 from app.utils.thinking_parser import KiroThinkingTagParser, SegmentType, TextSegment
 
 logger = logging.getLogger(__name__)
 
+# Claude Code 缓冲模式的保活哨兵（with_keepalive 产出它时输出 `: ping`）
+_CC_PING = object()
+
+
+@functools.lru_cache(maxsize=256)
+def _content_block_delta_template(delta_type: str, field: str, index: int) -> SSETemplate:
+    """
+    content_block_delta（text_delta / thinking_delta）事件模板，按内容块序号缓存
+
+    每个 token 只需对文本片段做 JSON 编码，不再逐次构造 dict 与整体序列化。
+    """
+    return SSETemplate(
+        {"type": "content_block_delta", "index": index, "delta": {"type": delta_type, field: template_slot(0)}},
+        event="content_block_delta",
+    )
+
+
+class _OpenAIStreamAccumulator:
+    """
+    OpenAI ChatCompletions 流的增量聚合器（collect_openai_stream_to_response 使用）
+
+    逐个 chunk 更新文本 / 思考 / 工具调用 / usage 状态，不保留原始 SSE 字节；
+    文本片段以列表累积，最终一次 join，整体内存与输出内容大小同阶。
+    """
+
+    __slots__ = (
+        "text_parts",
+        "reasoning_parts",
+        "thinking_signature",
+        "input_tokens",
+        "output_tokens",
+        "finish_reason",
+        "model",
+        "response_id",
+        "tool_calls",
+        "_tool_call_ids",
+        "_thinking_parser",
+    )
+
+    def __init__(self, thinking_enabled: bool = False):
+        self.text_parts: List[str] = []
+        self.reasoning_parts: List[str] = []
+        self.thinking_signature = ""
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.finish_reason: Optional[str] = None
+        self.model = ""
+        self.response_id = ""
+        self.tool_calls: Dict[int, Dict[str, Any]] = {}  # {index: {id, name, arguments: [片段]}}
+        self._tool_call_ids: Dict[str, int] = {}  # 工具调用 id -> index
+        # Thinking parser（用于解析原始<thinking>标签）
+        self._thinking_parser: Optional[KiroThinkingTagParser] = None
+        if thinking_enabled:
+            self._thinking_parser = KiroThinkingTagParser()
+            logger.debug("Thinking parser enabled for non-stream response")
+
+    def _update_usage(self, usage_data: Dict[str, Any]) -> None:
+        self.input_tokens = usage_data.get('prompt_tokens', self.input_tokens)
+        self.output_tokens = usage_data.get('completion_tokens', self.output_tokens)
+
+    def _add_segments(self, segments: List[TextSegment]) -> None:
+        for segment in segments:
+            if segment.type == SegmentType.THINKING:
+                self.reasoning_parts.append(segment.content)
+            elif segment.type == SegmentType.TEXT:
+                self.text_parts.append(segment.content)
+
+    @staticmethod
+    def _extract_signature(extra_content: Dict[str, Any]) -> str:
+        google_extra = extra_content.get('google', {})
+        if google_extra and 'thought_signature' in google_extra:
+            return google_extra['thought_signature']
+        return extra_content.get('thought_signature', "")
+
+    def feed_full_json(self, data: Dict[str, Any]) -> None:
+        """上游直接返回了一个不带 data: 前缀的 JSON（单个 chunk 或非流式响应）"""
+        if 'choices' not in data:
+            return
+        choice = data.get('choices', [{}])[0]
+        message = choice.get('message', {})
+        delta = choice.get('delta', {})
+
+        self.response_id = data.get('id', self.response_id)
+        self.model = data.get('model', self.model)
+        if 'usage' in data:
+            self._update_usage(data['usage'])
+
+        # 提取内容（从message或delta）
+        content = message.get('content') or delta.get('content')
+        if content:
+            self.text_parts = [content]
+        self.finish_reason = choice.get('finish_reason', self.finish_reason)
+
+    def feed_chunk(self, data: Dict[str, Any]) -> None:
+        """处理一个 chat.completion.chunk"""
+        # 提取基本信息
+        if 'id' in data and not self.response_id:
+            self.response_id = data['id']
+        if 'model' in data and not self.model:
+            self.model = data['model']
+
+        # 提取usage信息（可能在任何chunk中，包括最后一个只有usage的chunk）
+        if 'usage' in data:
+            self._update_usage(data['usage'])
+        # 也检查x_groq格式的usage（某些上游服务使用）
+        if 'x_groq' in data and 'usage' in data['x_groq']:
+            self._update_usage(data['x_groq']['usage'])
+
+        choices = data.get('choices', [])
+        if not choices:
+            return
+        choice = choices[0]
+        delta = choice.get('delta', {})
+
+        if choice.get('finish_reason'):
+            self.finish_reason = choice['finish_reason']
+
+        # 处理reasoning_content（思考过程）
+        reasoning_delta = (
+            delta.get('reasoning_content') or
+            delta.get('reasoning') or
+            delta.get('thinking_content')
+        )
+        if reasoning_delta:
+            self.reasoning_parts.append(reasoning_delta)
+
+        tool_call_deltas = delta.get('tool_calls') or []
+
+        # 提取思考签名（工具调用级别优先，其次 delta 级别）
+        for tc in tool_call_deltas:
+            extra_content = tc.get('extra_content', {})
+            if extra_content:
+                signature = self._extract_signature(extra_content)
+                if signature:
+                    self.thinking_signature = signature
+        if not self.thinking_signature:
+            extra_content = delta.get('extra_content', {})
+            if extra_content:
+                self.thinking_signature = self._extract_signature(extra_content)
+            if not self.thinking_signature and 'signature' in delta:
+                self.thinking_signature = delta['signature']
+
+        # 处理文本内容
+        content_delta = delta.get('content')
+        if content_delta:
+            if self._thinking_parser:
+                self._add_segments(self._thinking_parser.push_and_parse(content_delta))
+            else:
+                self.text_parts.append(content_delta)
+
+        # 处理工具调用
+        for tc in tool_call_deltas:
+            tc_index = tc.get('index', 0)
+            tc_id = tc.get('id', '')
+
+            # 优先按 id 归并；新 id 分配新的 index（部分上游的 index 不可靠）
+            if tc_id:
+                tc_index = self._tool_call_ids.get(tc_id, len(self.tool_calls))
+
+            entry = self.tool_calls.get(tc_index)
+            if entry is None:
+                entry = self.tool_calls[tc_index] = {'id': tc_id, 'name': '', 'arguments': []}
+            if tc_id:
+                entry['id'] = tc_id
+                self._tool_call_ids[tc_id] = tc_index
+
+            func = tc.get('function')
+            if func:
+                if 'name' in func:
+                    entry['name'] = func['name']
+                if 'arguments' in func:
+                    entry['arguments'].append(func['arguments'])
+
+    def feed_sse_lines(self, lines: List[str]) -> None:
+        """处理一批 SSE 行：只关心 data: 行，[DONE] 与无法解析的行直接跳过"""
+        for line in lines:
+            data_str = parse_data_line(line.strip())
+            if not data_str or data_str == '[DONE]':
+                continue
+            try:
+                data = jsonx.loads(data_str)
+            except jsonx.JSONDecodeError:
+                continue
+            if isinstance(data, dict):
+                self.feed_chunk(data)
+
+    def build_response(self) -> Dict[str, Any]:
+        """流结束：组装完整的 chat.completion 响应"""
+        # 如果启用了thinking parser，刷新缓冲区
+        if self._thinking_parser:
+            self._add_segments(self._thinking_parser.flush())
+
+        accumulated_text = "".join(self.text_parts)
+        accumulated_reasoning = "".join(self.reasoning_parts)
+
+        message: Dict[str, Any] = {
+            "role": "assistant",
+            "content": accumulated_text if accumulated_text else None
+        }
+        if accumulated_reasoning:
+            message["reasoning_content"] = accumulated_reasoning
+        if self.thinking_signature:
+            message["signature"] = self.thinking_signature
+        if self.tool_calls:
+            message["tool_calls"] = [
+                {
+                    "id": tc['id'] or f"call_{uuid.uuid4().hex[:24]}",
+                    "type": "function",
+                    "function": {
+                        "name": tc['name'],
+                        "arguments": "".join(tc['arguments'])
+                    }
+                }
+                for _, tc in sorted(self.tool_calls.items())
+            ]
+
+        finish_reason = self.finish_reason
+        if not finish_reason:
+            finish_reason = "tool_calls" if self.tool_calls else "stop"
+
+        return {
+            "id": self.response_id or f"chatcmpl-{uuid.uuid4().hex[:24]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": self.model,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": message,
+                    "finish_reason": finish_reason
+                }
+            ],
+            "usage": {
+                "prompt_tokens": self.input_tokens,
+                "completion_tokens": self.output_tokens,
+                "total_tokens": self.input_tokens + self.output_tokens
+            }
+        }
+
 
 class AnthropicAdapter:
     """
@@ -804,7 +1046,8 @@ class AnthropicAdapter:
         openai_stream: AsyncGenerator[bytes, None],
         model: str,
         request_id: str,
-        thinking_enabled: bool = False
+        thinking_enabled: bool = False,
+        input_tokens_hint: int = 0,
     ) -> AsyncGenerator[str, None]:
         """
         将OpenAI流式响应转换为Anthropic流式响应格式
@@ -814,6 +1057,7 @@ class AnthropicAdapter:
             model: 模型名称
             request_id: 请求ID
             thinking_enabled: 是否启用thinking解析（用于解析原始<thinking>标签）
+            input_tokens_hint: 写入 message_start.usage.input_tokens 的预估值（真实值仍在 message_delta 中给出）
 
         Yields:
             Anthropic格式的SSE事件
@@ -834,12 +1078,12 @@ class AnthropicAdapter:
                 "stop_reason": None,
                 "stop_sequence": None,
                 "usage": {
-                    "input_tokens": 0,
+                    "input_tokens": input_tokens_hint,
                     "output_tokens": 0
                 }
             }
         }
-        yield f"event: message_start\ndata: {json.dumps(message_start, ensure_ascii=False)}\n\n"
+        yield f"event: message_start\ndata: {jsonx.dumps_str(message_start)}\n\n"
 
         # 跟踪状态
         accumulated_text = ""
@@ -867,19 +1111,11 @@ class AnthropicAdapter:
             thinking_parser = KiroThinkingTagParser()
             logger.debug("Thinking parser enabled for stream")
 
-        buffer = ""
+        sse_lines = SSELineBuffer()
         
         async for chunk in openai_stream:
-            # 解码chunk
-            if isinstance(chunk, bytes):
-                chunk_str = chunk.decode('utf-8')
-                buffer += chunk_str
-            else:
-                chunk_str = chunk
-                buffer += chunk
-            # 处理SSE格式的数据
-            while '\n' in buffer:
-                line, buffer = buffer.split('\n', 1)
+            # 增量切行：整行解码，多字节字符被 chunk 边界拆开也不会解码失败
+            for line in sse_lines.feed(chunk):
                 line = line.strip()
                 
                 if not line:
@@ -892,8 +1128,8 @@ class AnthropicAdapter:
                         continue
                     
                     try:
-                        data = json.loads(data_str)
-                    except json.JSONDecodeError as e:
+                        data = jsonx.loads(data_str)
+                    except jsonx.JSONDecodeError as e:
                         continue
                     
                     # 提取usage信息
@@ -930,18 +1166,10 @@ class AnthropicAdapter:
                                     "thinking": ""
                                 }
                             }
-                            yield f"event: content_block_start\ndata: {json.dumps(thinking_block_start, ensure_ascii=False)}\n\n"
+                            yield f"event: content_block_start\ndata: {jsonx.dumps_str(thinking_block_start)}\n\n"
                         
                         # 发送thinking内容增量
-                        thinking_delta_event = {
-                            "type": "content_block_delta",
-                            "index": current_block_index,
-                            "delta": {
-                                "type": "thinking_delta",
-                                "thinking": reasoning_delta
-                            }
-                        }
-                        yield f"event: content_block_delta\ndata: {json.dumps(thinking_delta_event, ensure_ascii=False)}\n\n"
+                        yield _content_block_delta_template("thinking_delta", "thinking", current_block_index).render_str(reasoning_delta)
                     
                     # 提取思考签名（thought_signature）
                     # 支持多种上游格式：
@@ -998,18 +1226,10 @@ class AnthropicAdapter:
                                                 "thinking": ""
                                             }
                                         }
-                                        yield f"event: content_block_start\ndata: {json.dumps(thinking_block_start, ensure_ascii=False)}\n\n"
+                                        yield f"event: content_block_start\ndata: {jsonx.dumps_str(thinking_block_start)}\n\n"
 
                                     # 发送thinking_delta
-                                    thinking_delta_event = {
-                                        "type": "content_block_delta",
-                                        "index": current_block_index,
-                                        "delta": {
-                                            "type": "thinking_delta",
-                                            "thinking": segment.content
-                                        }
-                                    }
-                                    yield f"event: content_block_delta\ndata: {json.dumps(thinking_delta_event, ensure_ascii=False)}\n\n"
+                                    yield _content_block_delta_template("thinking_delta", "thinking", current_block_index).render_str(segment.content)
 
                                 elif segment.type == SegmentType.TEXT:
                                     # 普通文本内容
@@ -1028,14 +1248,14 @@ class AnthropicAdapter:
                                                     "signature": thinking_signature
                                                 }
                                             }
-                                            yield f"event: content_block_delta\ndata: {json.dumps(signature_delta_event, ensure_ascii=False)}\n\n"
+                                            yield f"event: content_block_delta\ndata: {jsonx.dumps_str(signature_delta_event)}\n\n"
 
                                         # 发送thinking块的content_block_stop
                                         thinking_block_stop = {
                                             "type": "content_block_stop",
                                             "index": current_block_index
                                         }
-                                        yield f"event: content_block_stop\ndata: {json.dumps(thinking_block_stop, ensure_ascii=False)}\n\n"
+                                        yield f"event: content_block_stop\ndata: {jsonx.dumps_str(thinking_block_stop)}\n\n"
                                         # 增加block索引
                                         current_block_index += 1
 
@@ -1050,20 +1270,12 @@ class AnthropicAdapter:
                                                 "text": ""
                                             }
                                         }
-                                        yield f"event: content_block_start\ndata: {json.dumps(text_block_start, ensure_ascii=False)}\n\n"
+                                        yield f"event: content_block_start\ndata: {jsonx.dumps_str(text_block_start)}\n\n"
 
                                     accumulated_text += segment.content
 
                                     # 发送content_block_delta事件
-                                    content_delta = {
-                                        "type": "content_block_delta",
-                                        "index": current_block_index,
-                                        "delta": {
-                                            "type": "text_delta",
-                                            "text": segment.content
-                                        }
-                                    }
-                                    yield f"event: content_block_delta\ndata: {json.dumps(content_delta, ensure_ascii=False)}\n\n"
+                                    yield _content_block_delta_template("text_delta", "text", current_block_index).render_str(segment.content)
                         else:
                             # 没有启用thinking parser，直接处理为文本
                             # 如果之前有thinking内容且thinking块还没结束，先结束thinking块
@@ -1080,14 +1292,14 @@ class AnthropicAdapter:
                                             "signature": thinking_signature
                                         }
                                     }
-                                    yield f"event: content_block_delta\ndata: {json.dumps(signature_delta_event, ensure_ascii=False)}\n\n"
+                                    yield f"event: content_block_delta\ndata: {jsonx.dumps_str(signature_delta_event)}\n\n"
 
                                 # 发送thinking块的content_block_stop
                                 thinking_block_stop = {
                                     "type": "content_block_stop",
                                     "index": current_block_index
                                 }
-                                yield f"event: content_block_stop\ndata: {json.dumps(thinking_block_stop, ensure_ascii=False)}\n\n"
+                                yield f"event: content_block_stop\ndata: {jsonx.dumps_str(thinking_block_stop)}\n\n"
                                 # 增加block索引
                                 current_block_index += 1
 
@@ -1102,20 +1314,12 @@ class AnthropicAdapter:
                                         "text": ""
                                     }
                                 }
-                                yield f"event: content_block_start\ndata: {json.dumps(text_block_start, ensure_ascii=False)}\n\n"
+                                yield f"event: content_block_start\ndata: {jsonx.dumps_str(text_block_start)}\n\n"
 
                             accumulated_text += text_delta
 
                             # 发送content_block_delta事件
-                            content_delta = {
-                                "type": "content_block_delta",
-                                "index": current_block_index,
-                                "delta": {
-                                    "type": "text_delta",
-                                    "text": text_delta
-                                }
-                            }
-                            yield f"event: content_block_delta\ndata: {json.dumps(content_delta, ensure_ascii=False)}\n\n"
+                            yield _content_block_delta_template("text_delta", "text", current_block_index).render_str(text_delta)
                     
                     # 处理工具调用
                     if 'tool_calls' in delta:
@@ -1133,13 +1337,13 @@ class AnthropicAdapter:
                                         "signature": thinking_signature
                                     }
                                 }
-                                yield f"event: content_block_delta\ndata: {json.dumps(signature_delta_event, ensure_ascii=False)}\n\n"
+                                yield f"event: content_block_delta\ndata: {jsonx.dumps_str(signature_delta_event)}\n\n"
                             
                             thinking_block_stop = {
                                 "type": "content_block_stop",
                                 "index": current_block_index
                             }
-                            yield f"event: content_block_stop\ndata: {json.dumps(thinking_block_stop, ensure_ascii=False)}\n\n"
+                            yield f"event: content_block_stop\ndata: {jsonx.dumps_str(thinking_block_stop)}\n\n"
                             current_block_index += 1
                         
                         for tc in delta['tool_calls']:
@@ -1202,19 +1406,11 @@ class AnthropicAdapter:
                                 "thinking": ""
                             }
                         }
-                        yield f"event: content_block_start\ndata: {json.dumps(thinking_block_start, ensure_ascii=False)}\n\n"
+                        yield f"event: content_block_start\ndata: {jsonx.dumps_str(thinking_block_start)}\n\n"
                         thinking_block_started = True
 
                     # 发送thinking_delta
-                    thinking_delta_event = {
-                        "type": "content_block_delta",
-                        "index": current_block_index,
-                        "delta": {
-                            "type": "thinking_delta",
-                            "thinking": segment.content
-                        }
-                    }
-                    yield f"event: content_block_delta\ndata: {json.dumps(thinking_delta_event, ensure_ascii=False)}\n\n"
+                    yield _content_block_delta_template("thinking_delta", "thinking", current_block_index).render_str(segment.content)
 
                 elif segment.type == SegmentType.TEXT:
                     # 普通文本内容
@@ -1233,14 +1429,14 @@ class AnthropicAdapter:
                                     "signature": thinking_signature
                                 }
                             }
-                            yield f"event: content_block_delta\ndata: {json.dumps(signature_delta_event, ensure_ascii=False)}\n\n"
+                            yield f"event: content_block_delta\ndata: {jsonx.dumps_str(signature_delta_event)}\n\n"
 
                         # 发送thinking块的content_block_stop
                         thinking_block_stop = {
                             "type": "content_block_stop",
                             "index": current_block_index
                         }
-                        yield f"event: content_block_stop\ndata: {json.dumps(thinking_block_stop, ensure_ascii=False)}\n\n"
+                        yield f"event: content_block_stop\ndata: {jsonx.dumps_str(thinking_block_stop)}\n\n"
                         current_block_index += 1
 
                     # 如果text块还没开始，先发送content_block_start
@@ -1254,20 +1450,12 @@ class AnthropicAdapter:
                                 "text": ""
                             }
                         }
-                        yield f"event: content_block_start\ndata: {json.dumps(text_block_start, ensure_ascii=False)}\n\n"
+                        yield f"event: content_block_start\ndata: {jsonx.dumps_str(text_block_start)}\n\n"
 
                     accumulated_text += segment.content
 
                     # 发送content_block_delta事件
-                    content_delta = {
-                        "type": "content_block_delta",
-                        "index": current_block_index,
-                        "delta": {
-                            "type": "text_delta",
-                            "text": segment.content
-                        }
-                    }
-                    yield f"event: content_block_delta\ndata: {json.dumps(content_delta, ensure_ascii=False)}\n\n"
+                    yield _content_block_delta_template("text_delta", "text", current_block_index).render_str(segment.content)
 
         # 如果thinking块开始了但还没结束，先结束它
         if thinking_block_started and not thinking_block_stopped:
@@ -1283,13 +1471,13 @@ class AnthropicAdapter:
                         "signature": thinking_signature
                     }
                 }
-                yield f"event: content_block_delta\ndata: {json.dumps(signature_delta_event, ensure_ascii=False)}\n\n"
+                yield f"event: content_block_delta\ndata: {jsonx.dumps_str(signature_delta_event)}\n\n"
             
             thinking_block_stop = {
                 "type": "content_block_stop",
                 "index": current_block_index
             }
-            yield f"event: content_block_stop\ndata: {json.dumps(thinking_block_stop, ensure_ascii=False)}\n\n"
+            yield f"event: content_block_stop\ndata: {jsonx.dumps_str(thinking_block_stop)}\n\n"
             current_block_index += 1
         
         # 如果没有任何text块开始（只有thinking或什么都没有），需要发送一个空的text块
@@ -1303,14 +1491,14 @@ class AnthropicAdapter:
                     "text": ""
                 }
             }
-            yield f"event: content_block_start\ndata: {json.dumps(text_block_start, ensure_ascii=False)}\n\n"
+            yield f"event: content_block_start\ndata: {jsonx.dumps_str(text_block_start)}\n\n"
         
         # 发送text块的content_block_stop事件
         content_block_stop = {
             "type": "content_block_stop",
             "index": current_block_index
         }
-        yield f"event: content_block_stop\ndata: {json.dumps(content_block_stop, ensure_ascii=False)}\n\n"
+        yield f"event: content_block_stop\ndata: {jsonx.dumps_str(content_block_stop)}\n\n"
         
         
         # text 块结束后，后续 block 从下一个索引开始
@@ -1344,7 +1532,7 @@ class AnthropicAdapter:
                     "index": next_block_index,
                     "content_block": {"type": "text", "text": ""},
                 }
-                yield f"event: content_block_start\ndata: {json.dumps(text_block_start, ensure_ascii=False)}\n\n"
+                yield f"event: content_block_start\ndata: {jsonx.dumps_str(text_block_start)}\n\n"
 
                 warn_delta = {
                     "type": "content_block_delta",
@@ -1354,10 +1542,10 @@ class AnthropicAdapter:
                         "text": f"[tool_call_error] {tool_name} missing required args: {', '.join(missing)}",
                     },
                 }
-                yield f"event: content_block_delta\ndata: {json.dumps(warn_delta, ensure_ascii=False)}\n\n"
+                yield f"event: content_block_delta\ndata: {jsonx.dumps_str(warn_delta)}\n\n"
 
                 text_block_stop = {"type": "content_block_stop", "index": next_block_index}
-                yield f"event: content_block_stop\ndata: {json.dumps(text_block_stop, ensure_ascii=False)}\n\n"
+                yield f"event: content_block_stop\ndata: {jsonx.dumps_str(text_block_stop)}\n\n"
 
                 next_block_index += 1
                 continue
@@ -1373,7 +1561,7 @@ class AnthropicAdapter:
                     "input": {},
                 },
             }
-            yield f"event: content_block_start\ndata: {json.dumps(tool_block_start, ensure_ascii=False)}\n\n"
+            yield f"event: content_block_start\ndata: {jsonx.dumps_str(tool_block_start)}\n\n"
 
             # content_block_delta for tool_use input
             if input_data:
@@ -1385,11 +1573,11 @@ class AnthropicAdapter:
                         "partial_json": json.dumps(input_data, ensure_ascii=False),
                     },
                 }
-                yield f"event: content_block_delta\ndata: {json.dumps(tool_delta, ensure_ascii=False)}\n\n"
+                yield f"event: content_block_delta\ndata: {jsonx.dumps_str(tool_delta)}\n\n"
 
             # content_block_stop for tool_use
             tool_block_stop = {"type": "content_block_stop", "index": next_block_index}
-            yield f"event: content_block_stop\ndata: {json.dumps(tool_block_stop, ensure_ascii=False)}\n\n"
+            yield f"event: content_block_stop\ndata: {jsonx.dumps_str(tool_block_stop)}\n\n"
 
             emitted_tool_use = True
             next_block_index += 1
@@ -1419,13 +1607,29 @@ class AnthropicAdapter:
                 "output_tokens": output_tokens
             }
         }
-        yield f"event: message_delta\ndata: {json.dumps(message_delta, ensure_ascii=False)}\n\n"
+        yield f"event: message_delta\ndata: {jsonx.dumps_str(message_delta)}\n\n"
         
         # 发送message_stop事件
         message_stop = {
             "type": "message_stop"
         }
-        yield f"event: message_stop\ndata: {json.dumps(message_stop, ensure_ascii=False)}\n\n"
+        yield f"event: message_stop\ndata: {jsonx.dumps_str(message_stop)}\n\n"
+
+    @staticmethod
+    def _parse_message_delta_usage(event: str) -> Optional[Dict[str, Any]]:
+        """从 message_delta 事件文本中取出 usage；解析失败返回 None"""
+        try:
+            data_line = next(
+                (line for line in event.splitlines() if line.startswith("data: ")),
+                "",
+            )
+            if data_line:
+                usage = jsonx.loads(data_line[6:]).get("usage")
+                if isinstance(usage, dict):
+                    return usage
+        except Exception:
+            pass
+        return None
 
     @classmethod
     async def convert_openai_stream_to_anthropic_cc(
@@ -1435,21 +1639,39 @@ class AnthropicAdapter:
         request_id: str,
         thinking_enabled: bool = False,
         ping_interval_seconds: float = 25.0,
+        estimated_input_tokens: Optional[int] = None,
+        on_usage: Optional[Callable[[int, int], None]] = None,
     ) -> AsyncGenerator[str, None]:
         """
         Claude Code (2.1.9+) 兼容的 Anthropic SSE 转换。
 
         现象：Claude Code 新版不再从 `message_delta` 读取 `input_tokens`，而是从 `message_start` 中读取；
-        但上游（OpenAI 兼容流）通常在流末尾才返回 usage，因此必须“先缓冲、后输出”。
+        但上游（OpenAI 兼容流）通常在流末尾才返回 usage。
 
-        行为：
-        - 缓冲完整事件流，直到拿到 `usage`（来自 `message_delta.usage`）
-        - 将真实 tokens 写入 `message_start.message.usage` 后再输出所有事件
-        - 等待期间按 SSE 注释发送 `: ping` 保活（不影响事件顺序）
+        两种模式：
+        - estimated_input_tokens 不为 None（预估模式）：立即输出 message_start（input_tokens 为预估值），
+          其余事件实时透传，首字延迟与 /v1/messages 一致；真实 usage 仍在 message_delta 中给出
+        - estimated_input_tokens 为 None（缓冲模式）：缓冲完整事件流直到拿到 `message_delta.usage`，
+          将真实 tokens 写入 `message_start.message.usage` 后再输出所有事件，等待期间发送 `: ping` 保活
 
-        注意：该模式会牺牲流式实时输出，仅用于 Claude Code 兼容端点（/cc/v1）。
+        on_usage: 拿到真实 usage 时回调 (input_tokens, output_tokens)，用于校准预估值
         """
 
+        if estimated_input_tokens is not None:
+            async for event in cls.convert_openai_stream_to_anthropic(
+                openai_stream=openai_stream,
+                model=model,
+                request_id=request_id,
+                thinking_enabled=thinking_enabled,
+                input_tokens_hint=estimated_input_tokens,
+            ):
+                if on_usage is not None and event.startswith("event: message_delta"):
+                    usage = cls._parse_message_delta_usage(event)
+                    if usage:
+                        on_usage(usage.get("input_tokens", 0), usage.get("output_tokens", 0))
+                yield event
+            return
+
         base_gen = cls.convert_openai_stream_to_anthropic(
             openai_stream=openai_stream,
             model=model,
@@ -1461,54 +1683,31 @@ class AnthropicAdapter:
         input_tokens = 0
         output_tokens = 0
 
-        pending_task: Optional[asyncio.Task] = asyncio.create_task(base_gen.__anext__())
+        keepalive_events = with_keepalive(base_gen, interval=ping_interval_seconds, heartbeat=_CC_PING)
         try:
-            while True:
-                done, _ = await asyncio.wait({pending_task}, timeout=ping_interval_seconds)
-
-                if not done:
+            async for event in keepalive_events:
+                if event is _CC_PING:
                     yield ": ping\n\n"
                     continue
 
-                try:
-                    event = pending_task.result()
-                except StopAsyncIteration:
-                    break
-
-                pending_task = asyncio.create_task(base_gen.__anext__())
-
                 # 丢弃原始 message_start，最后用正确 usage 重新生成并作为首事件输出
                 if event.startswith("event: message_start"):
                     continue
 
                 # 从 message_delta 中抓取 usage（convert_openai_stream_to_anthropic 会把完整 usage 放在这里）
                 if event.startswith("event: message_delta"):
-                    try:
-                        data_line = next(
-                            (line for line in event.splitlines() if line.startswith("data: ")),
-                            "",
-                        )
-                        if data_line:
-                            payload = json.loads(data_line[6:])
-                            usage = payload.get("usage", {})
-                            input_tokens = usage.get("input_tokens", input_tokens)
-                            output_tokens = usage.get("output_tokens", output_tokens)
-                    except Exception:
-                        # usage 解析失败就保持为 0，不影响主流程
-                        pass
+                    # usage 解析失败就保持为 0，不影响主流程
+                    usage = cls._parse_message_delta_usage(event)
+                    if usage:
+                        input_tokens = usage.get("input_tokens", input_tokens)
+                        output_tokens = usage.get("output_tokens", output_tokens)
+                        if on_usage is not None:
+                            on_usage(input_tokens, output_tokens)
 
                 buffered_events.append(event)
         finally:
-            if pending_task and not pending_task.done():
-                pending_task.cancel()
-                try:
-                    await pending_task
-                except Exception:
-                    pass
-            try:
-                await base_gen.aclose()
-            except Exception:
-                pass
+            # 同时关闭 base_gen
+            await keepalive_events.aclose()
 
         message_start = {
             "type": "message_start",
@@ -1526,7 +1725,7 @@ class AnthropicAdapter:
                 },
             },
         }
-        yield f"event: message_start\ndata: {json.dumps(message_start, ensure_ascii=False)}\n\n"
+        yield f"event: message_start\ndata: {jsonx.dumps_str(message_start)}\n\n"
 
         for buffered_event in buffered_events:
             yield buffered_event
@@ -1549,278 +1748,47 @@ class AnthropicAdapter:
 
         Returns:
             OpenAI格式的完整响应字典
-        """
-        # 跟踪状态
-        accumulated_text = ""
-        accumulated_reasoning = ""
-        thinking_signature = ""
-        input_tokens = 0
-        output_tokens = 0
-        finish_reason = None
-        model = ""
-        response_id = ""
-        tool_calls = {}  # 跟踪工具调用 {index: {id, name, arguments}}
 
-        # Thinking parser（用于解析原始<thinking>标签）
-        thinking_parser: Optional[KiroThinkingTagParser] = None
-        if thinking_enabled:
-            thinking_parser = KiroThinkingTagParser()
-            logger.debug("Thinking parser enabled for non-stream response")
+        Note:
+            按 SSE 行增量聚合，不保留原始响应字节；仅当上游直接返回 JSON（首字节为 { 或 [）时才缓存原文再整体解析
+        """
+        accumulator = _OpenAIStreamAccumulator(thinking_enabled)
+        lines = SSELineBuffer()
+        raw_json: Optional[bytearray] = None
+        sniffed = False
 
-        buffer = ""
-        chunk_count = 0
-        
-        
         async for chunk in openai_stream:
-            chunk_count += 1
-            # 解码chunk
-            if isinstance(chunk, bytes):
-                chunk_str = chunk.decode('utf-8')
-                buffer += chunk_str
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            if not sniffed:
+                head = chunk.lstrip()
+                if not head:
+                    continue
+                sniffed = True
+                if head[:1] in (b"{", b"["):
+                    raw_json = bytearray()
+            if raw_json is not None:
+                raw_json += chunk
             else:
-                chunk_str = chunk
-                buffer += chunk
-        
-        # 流结束后，检查buffer中的内容
-        # 可能是SSE格式（data: {...}）或者直接的JSON响应
-        full_content = buffer.strip()
-        
-        # 首先尝试解析为完整的JSON响应（非流式响应）
-        if full_content and not full_content.startswith('data:'):
+                accumulator.feed_sse_lines(lines.feed(chunk))
+
+        if raw_json is not None:
+            # 可能是完整的JSON响应（非流式响应），或不带 data: 前缀的单个chunk
             try:
-                # 尝试直接解析为JSON
-                data = json.loads(full_content)
-                
+                data = jsonx.loads(raw_json)
+            except jsonx.JSONDecodeError:
+                data = None
+            if isinstance(data, dict):
                 # 这是一个完整的chat.completion响应，直接返回
                 if data.get('object') == 'chat.completion':
                     return data
-                
-                # 如果是流式chunk格式但没有data:前缀
-                if 'choices' in data:
-                    choice = data.get('choices', [{}])[0]
-                    message = choice.get('message', {})
-                    delta = choice.get('delta', {})
-                    
-                    # 提取基本信息
-                    response_id = data.get('id', response_id)
-                    model = data.get('model', model)
-                    
-                    # 提取usage
-                    if 'usage' in data:
-                        usage_data = data['usage']
-                        input_tokens = usage_data.get('prompt_tokens', input_tokens)
-                        output_tokens = usage_data.get('completion_tokens', output_tokens)
-                    
-                    # 提取内容（从message或delta）
-                    content = message.get('content') or delta.get('content')
-                    if content:
-                        accumulated_text = content
-                    
-                    # 提取finish_reason
-                    finish_reason = choice.get('finish_reason', finish_reason)
-                    
-            except json.JSONDecodeError:
-                pass
-        
-        # 处理SSE格式的数据
-        for line in full_content.split('\n'):
-            line = line.strip()
-            
-            if not line:
-                continue
-            
-            if line.startswith('data: '):
-                data_str = line[6:]
-                
-                if data_str == '[DONE]':
-                    continue
-                
-                try:
-                    data = json.loads(data_str)
-                except json.JSONDecodeError:
-                    continue
-                
-                # 提取基本信息
-                if 'id' in data and not response_id:
-                    response_id = data['id']
-                if 'model' in data and not model:
-                    model = data['model']
-                
-                # 提取usage信息（可能在任何chunk中，包括最后一个只有usage的chunk）
-                if 'usage' in data:
-                    usage_data = data['usage']
-                    input_tokens = usage_data.get('prompt_tokens', input_tokens)
-                    output_tokens = usage_data.get('completion_tokens', output_tokens)
-                
-                # 也检查x_groq格式的usage（某些上游服务使用）
-                if 'x_groq' in data and 'usage' in data['x_groq']:
-                    usage_data = data['x_groq']['usage']
-                    input_tokens = usage_data.get('prompt_tokens', input_tokens)
-                    output_tokens = usage_data.get('completion_tokens', output_tokens)
-                
-                choices = data.get('choices', [])
-                if not choices:
-                    continue
-                
-                choice = choices[0]
-                delta = choice.get('delta', {})
-                
-                # 检查finish_reason
-                if choice.get('finish_reason'):
-                    finish_reason = choice['finish_reason']
-                
-                # 处理reasoning_content（思考过程）
-                reasoning_delta = (
-                    delta.get('reasoning_content') or
-                    delta.get('reasoning') or
-                    delta.get('thinking_content')
-                )
-                if reasoning_delta:
-                    accumulated_reasoning += reasoning_delta
-                
-                # 提取思考签名
-                if 'tool_calls' in delta:
-                    for tc in delta['tool_calls']:
-                        extra_content = tc.get('extra_content', {})
-                        if extra_content:
-                            google_extra = extra_content.get('google', {})
-                            if google_extra and 'thought_signature' in google_extra:
-                                thinking_signature = google_extra['thought_signature']
-                            elif 'thought_signature' in extra_content:
-                                thinking_signature = extra_content['thought_signature']
-                
-                # 检查delta级别的签名
-                if not thinking_signature:
-                    extra_content = delta.get('extra_content', {})
-                    if extra_content:
-                        google_extra = extra_content.get('google', {})
-                        if google_extra and 'thought_signature' in google_extra:
-                            thinking_signature = google_extra['thought_signature']
-                        elif 'thought_signature' in extra_content:
-                            thinking_signature = extra_content['thought_signature']
-                    if not thinking_signature and 'signature' in delta:
-                        thinking_signature = delta['signature']
-                
-                # 处理文本内容
-                if 'content' in delta and delta['content']:
-                    content_delta = delta['content']
-
-                    # 如果启用了thinking parser，先解析
-                    if thinking_parser:
-                        segments = thinking_parser.push_and_parse(content_delta)
-                        for segment in segments:
-                            if segment.type == SegmentType.THINKING:
-                                # Thinking内容
-                                accumulated_reasoning += segment.content
-                            elif segment.type == SegmentType.TEXT:
-                                # 普通文本
-                                accumulated_text += segment.content
-                    else:
-                        # 没有启用thinking parser，直接添加
-                        accumulated_text += content_delta
-                
-                # 处理工具调用
-                if 'tool_calls' in delta:
-                    for tc in delta['tool_calls']:
-                        tc_index = tc.get('index', 0)
-                        tc_id = tc.get('id', '')
-                        
-                        # 首先尝试通过id查找已存在的工具调用
-                        found_index = None
-                        if tc_id:
-                            for idx, existing_tc in tool_calls.items():
-                                if existing_tc['id'] == tc_id:
-                                    found_index = idx
-                                    break
-                        
-                        if found_index is not None:
-                            tc_index = found_index
-                        elif tc_id and tc_id not in [t['id'] for t in tool_calls.values() if t['id']]:
-                            tc_index = len(tool_calls)
-                        
-                        if tc_index not in tool_calls:
-                            tool_calls[tc_index] = {
-                                'id': tc_id,
-                                'name': '',
-                                'arguments': ''
-                            }
-                        
-                        if 'id' in tc and tc['id']:
-                            tool_calls[tc_index]['id'] = tc['id']
-                        
-                        if 'function' in tc:
-                            func = tc['function']
-                            if 'name' in func:
-                                tool_calls[tc_index]['name'] = func['name']
-                            if 'arguments' in func:
-                                tool_calls[tc_index]['arguments'] += func['arguments']
-
-        # 如果启用了thinking parser，刷新缓冲区
-        if thinking_parser:
-            final_segments = thinking_parser.flush()
-            for segment in final_segments:
-                if segment.type == SegmentType.THINKING:
-                    # Thinking内容
-                    accumulated_reasoning += segment.content
-                elif segment.type == SegmentType.TEXT:
-                    # 普通文本
-                    accumulated_text += segment.content
-
-        # 构建完整的OpenAI响应
-        message = {
-            "role": "assistant",
-            "content": accumulated_text if accumulated_text else None
-        }
-        
-        # 添加reasoning_content
-        if accumulated_reasoning:
-            message["reasoning_content"] = accumulated_reasoning
-        
-        # 添加签名
-        if thinking_signature:
-            message["signature"] = thinking_signature
-        
-        # 添加工具调用
-        if tool_calls:
-            message["tool_calls"] = []
-            for idx in sorted(tool_calls.keys()):
-                tc = tool_calls[idx]
-                message["tool_calls"].append({
-                    "id": tc['id'] or f"call_{uuid.uuid4().hex[:24]}",
-                    "type": "function",
-                    "function": {
-                        "name": tc['name'],
-                        "arguments": tc['arguments']
-                    }
-                })
-        
-        # 确定finish_reason
-        if not finish_reason:
-            if tool_calls:
-                finish_reason = "tool_calls"
+                accumulator.feed_full_json(data)
             else:
-                finish_reason = "stop"
-        
-        response = {
-            "id": response_id or f"chatcmpl-{uuid.uuid4().hex[:24]}",
-            "object": "chat.completion",
-            "created": int(time.time()),
-            "model": model,
-            "choices": [
-                {
-                    "index": 0,
-                    "message": message,
-                    "finish_reason": finish_reason
-                }
-            ],
-            "usage": {
-                "prompt_tokens": input_tokens,
-                "completion_tokens": output_tokens,
-                "total_tokens": input_tokens + output_tokens
-            }
-        }
-        
-        return response
+                accumulator.feed_sse_lines(lines.feed(raw_json))
+            raw_json = None
+
+        accumulator.feed_sse_lines(lines.flush())
+        return accumulator.build_response()
     
     @classmethod
     def create_error_response(
@@ -31,6 +31,7 @@ from app.core.exceptions import (
 )
 from app.repositories.user_repository import UserRepository
 from app.cache.redis_client import RedisClient
+from app.cache.auth_cache import get_auth_cache
 from app.models.user import User
 from app.schemas.token import TokenPayload
 
@@ -40,6 +41,46 @@ logger = logging.getLogger(__name__)
 JWT_USER_CACHE_TTL = 30
 
 
+def user_to_cache(user: User, **extra: Any) -> Dict[str, Any]:
+    """
+    将 User 序列化为认证缓存结构
+
+    Args:
+        user: 用户对象
+        **extra: 额外字段（如 API key 的 _config_type / _api_key_id / _balance_strategy）
+    """
+    data = {
+        "id": user.id,
+        "username": user.username,
+        "is_active": user.is_active,
+        "beta": user.beta,
+        "balance_strategy": user.balance_strategy,
+        "trust_level": user.trust_level,
+        "is_silenced": user.is_silenced,
+        "created_at": user.created_at.isoformat() if user.created_at else None,
+        "avatar_url": user.avatar_url,
+        "last_login_at": user.last_login_at.isoformat() if user.last_login_at else None,
+    }
+    data.update(extra)
+    return data
+
+
+def user_from_cache(cached_data: Dict[str, Any]) -> User:
+    """从认证缓存结构重建 User 对象（不关联数据库会话）"""
+    return User(
+        id=cached_data["id"],
+        username=cached_data["username"],
+        is_active=cached_data["is_active"],
+        beta=cached_data.get("beta", 0),
+        balance_strategy=cached_data.get("balance_strategy"),
+        trust_level=cached_data.get("trust_level", 0),
+        is_silenced=cached_data.get("is_silenced", False),
+        created_at=datetime.fromisoformat(cached_data["created_at"]) if cached_data.get("created_at") else datetime.utcnow(),
+        avatar_url=cached_data.get("avatar_url"),
+        last_login_at=datetime.fromisoformat(cached_data["last_login_at"]) if cached_data.get("last_login_at") else None
+    )
+
+
 class AuthService:
     """认证服务类"""
     
@@ -285,7 +326,7 @@ class AuthService:
         """
         根据令牌获取当前用户
         
-        优化：添加短期 Redis 缓存减少数据库查询
+        优化：进程内 L1 + Redis 两级短期缓存减少数据库查询
         
         Args:
             token: JWT 令牌字符串
@@ -303,27 +344,12 @@ class AuthService:
             payload = await self.verify_token(token)
             user_id = int(payload.sub)
             
-            # 尝试从缓存获取用户信息
-            cache_key = f"jwt_user:{user_id}"
-            try:
-                cached_data = await self.redis.get_json(cache_key)
-                if cached_data:
-                    logger.debug(f"从缓存获取 JWT 用户信息: user_id={user_id}")
-                    # 从缓存恢复完整的User对象
-                    user = User(
-                        id=cached_data["id"],
-                        username=cached_data["username"],
-                        is_active=cached_data["is_active"],
-                        beta=cached_data.get("beta", 0),
-                        trust_level=cached_data.get("trust_level", 0),
-                        is_silenced=cached_data.get("is_silenced", False),
-                        created_at=datetime.fromisoformat(cached_data["created_at"]) if cached_data.get("created_at") else datetime.utcnow(),
-                        avatar_url=cached_data.get("avatar_url"),
-                        last_login_at=datetime.fromisoformat(cached_data["last_login_at"]) if cached_data.get("last_login_at") else None
-                    )
-                    return user
-            except Exception as e:
-                logger.warning(f"Redis 缓存读取失败 (user_id={user_id}): {type(e).__name__}: {str(e)}")
+            # 尝试从缓存获取用户信息（进程内 L1 -> Redis）
+            auth_cache = get_auth_cache()
+            cached_data = await auth_cache.get_user(user_id)
+            if cached_data:
+                logger.debug(f"从缓存获取 JWT 用户信息: user_id={user_id}")
+                return user_from_cache(cached_data)
             
             # 缓存未命中，从数据库获取
             try:
@@ -348,22 +374,8 @@ class AuthService:
                 )
             
             # 存入缓存（短期缓存，30秒）- 包含所有必需字段
-            try:
-                user_data = {
-                    "id": user.id,
-                    "username": user.username,
-                    "is_active": user.is_active,
-                    "beta": user.beta,
-                    "trust_level": user.trust_level,
-                    "is_silenced": user.is_silenced,
-                    "created_at": user.created_at.isoformat() if user.created_at else None,
-                    "avatar_url": user.avatar_url,
-                    "last_login_at": user.last_login_at.isoformat() if user.last_login_at else None
-                }
-                await self.redis.set_json(cache_key, user_data, expire=JWT_USER_CACHE_TTL)
-                logger.debug(f"JWT 用户信息已缓存: user_id={user_id}, TTL={JWT_USER_CACHE_TTL}s")
-            except Exception as e:
-                logger.warning(f"Redis 缓存写入失败 (user_id={user_id}): {type(e).__name__}: {str(e)}")
+            await auth_cache.set_user(user_id, user_to_cache(user), expire=JWT_USER_CACHE_TTL)
+            logger.debug(f"JWT 用户信息已缓存: user_id={user_id}, TTL={JWT_USER_CACHE_TTL}s")
             
             return user
             
@@ -12,7 +12,7 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, Optional, Set, Tuple
+from typing import Any, AsyncIterable, Dict, Optional, Set, Tuple, Union
 import base64
 import hashlib
 import json
@@ -27,10 +27,17 @@ import jwt
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.cache import RedisClient
+from app.cache.codex_account_pool import CodexAccountState, UserAccountPool, get_codex_account_pool
+from app.cache.credentials_cache import get_credentials_cache
+from app.cache.token_refresh_lock import RefreshLease, apply_refreshed_columns, get_token_refresh_coordinator
+from app.core.circuit_breaker import CircuitBreaker, circuit_key, get_circuit_breaker
+from app.core.http_client import UPSTREAM_CODEX, get_http_client
+from app.services.account_balancer import FILL_FIRST, choose_account, get_balance_strategy
 from app.repositories.codex_account_repository import CodexAccountRepository
 from app.repositories.codex_fallback_config_repository import CodexFallbackConfigRepository
 from app.utils.encryption import encrypt_api_key as encrypt_secret
 from app.utils.encryption import decrypt_api_key as decrypt_secret
+from app.utils.sse import aiter_sse_lines
 
 
 OPENAI_AUTH_URL = "https://auth.openai.com/oauth/authorize"
@@ -131,8 +138,13 @@ def _get_httpx_proxies() -> Optional[Dict[str, str]]:
     return {"http://": proxy_url, "https://": proxy_url}
 
 
-def _build_httpx_async_client(*, timeout: Optional[httpx.Timeout], follow_redirects: bool = False) -> httpx.AsyncClient:
-    return httpx.AsyncClient(timeout=timeout, follow_redirects=follow_redirects, proxies=_get_httpx_proxies())
+def _get_codex_http_client() -> httpx.AsyncClient:
+    """
+    借用 Codex/OpenAI 上游的共享连接池（出站代理在连接池创建时读取）。
+
+    注意：共享 client 的生命周期由 app.core.http_client 管理，调用方不要 aclose。
+    """
+    return get_http_client(UPSTREAM_CODEX)
 
 
 @dataclass(frozen=True)
@@ -255,6 +267,15 @@ def _parse_oauth_callback(input_str: str) -> Dict[str, str]:
     return {"code": code, "state": state, "error": err, "error_description": err_desc}
 
 
+def _decrypt_credentials(ciphertext: str) -> Dict[str, Any]:
+    decrypted = decrypt_secret(ciphertext)
+    try:
+        obj = json.loads(decrypted)
+    except Exception:
+        obj = {}
+    return obj if isinstance(obj, dict) else {}
+
+
 def _decode_id_token(id_token: str) -> Dict[str, Any]:
     if not id_token:
         return {}
@@ -774,6 +795,34 @@ def _normalize_codex_responses_request(request_data: Dict[str, Any]) -> Dict[str
     return body
 
 
+async def _read_completed_response(
+    source: Union[httpx.Response, AsyncIterable[bytes]],
+) -> Optional[Dict[str, Any]]:
+    """
+    边读边解析 Codex SSE，遇到 response.completed 立即返回其 response 对象（调用方随后关闭上游连接）。
+
+    只在缓冲中保留当前不完整的行；绝大多数事件是增量 delta，先用子串判断跳过，不做 JSON 解析。
+    """
+    async for line in aiter_sse_lines(source):
+        stripped = line.strip()
+        if not stripped.startswith("data:"):
+            continue
+        payload_str = stripped[5:].strip()
+        if "response.completed" not in payload_str:
+            continue
+        try:
+            payload = json.loads(payload_str)
+        except Exception:
+            continue
+        if not isinstance(payload, dict):
+            continue
+        if payload.get("type") == "response.completed":
+            resp = payload.get("response")
+            if isinstance(resp, dict):
+                return resp
+    return None
+
+
 def _build_codex_headers(
     *,
     access_token: str,
@@ -817,12 +866,42 @@ def _build_wham_usage_headers(
     return headers
 
 
+class _InFlightStream(httpx.AsyncByteStream):
+    """包装上游响应流：响应关闭时（只一次）回调 on_close，用于释放账号在途计数"""
+
+    def __init__(self, stream: Any, on_close: Any):
+        self._stream = stream
+        self._on_close = on_close
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        on_close, self._on_close = self._on_close, None
+        try:
+            await self._stream.aclose()
+        finally:
+            if on_close is not None:
+                on_close()
+
+
 class CodexService:
+    _circuit_breaker: Optional[CircuitBreaker] = None
+
     def __init__(self, db: AsyncSession, redis: RedisClient):
         self.db = db
         self.redis = redis
         self.repo = CodexAccountRepository(db)
         self.fallback_repo = CodexFallbackConfigRepository(db)
+        self.account_pool = get_codex_account_pool()
+
+    @property
+    def circuit_breaker(self) -> CircuitBreaker:
+        """按账号熔断（见 app.core.circuit_breaker）：熔断中的账号在选号时直接跳过"""
+        if self._circuit_breaker is None:
+            self._circuit_breaker = get_circuit_breaker()
+        return self._circuit_breaker
 
     async def get_models(self) -> Dict[str, Any]:
         models = _get_supported_models()
@@ -1066,6 +1145,7 @@ class CodexService:
         # 消耗 state
         await self.redis.delete(key)
 
+        await self.account_pool.update(account)
         return {"success": True, "data": account}
 
     async def import_account(
@@ -1162,6 +1242,7 @@ class CodexService:
                 last_refresh_at=last_refresh,
             )
 
+        await self.account_pool.update(account)
         return {"success": True, "data": account}
 
     async def list_accounts(self, user_id: int) -> Dict[str, Any]:
@@ -1174,39 +1255,27 @@ class CodexService:
             raise ValueError("账号不存在")
         return {"success": True, "data": account}
 
-    async def select_active_account(self, user_id: int) -> Dict[str, Any]:
+    async def select_active_account(self, user_id: int, *, strategy: Optional[str] = None) -> Dict[str, Any]:
         """
-        账号选择策略（fill-first）：
+        账号选择策略（默认 fill-first，见 app.services.account_balancer）：
         - 按账号添加顺序（id 升序）挑选
         - 只有当第一个账号被禁用或因 5 小时/周限额冻结时，才会尝试下一个
         """
-        enabled = await self.repo.list_enabled_by_user_id(user_id)
-        if not enabled:
-            all_accounts = await self.repo.list_by_user_id(user_id)
-            if all_accounts:
+        account = await self._select_active_account_obj(user_id, exclude_ids=set(), strategy=strategy)
+        if account is not None:
+            return {"success": True, "data": account}
+
+        pool = await self._get_account_pool(user_id)
+        if not pool.has_enabled():
+            if len(pool):
                 raise ValueError("没有可用账号：账号都处于禁用状态")
             raise ValueError("没有可用账号：请先添加账号")
 
-        for account in enabled:
-            if getattr(account, "effective_status", 0) == 1:
-                return {"success": True, "data": account}
-
-        earliest: Optional[datetime] = None
-        has_unknown_reset = False
-        for account in enabled:
-            if not getattr(account, "is_frozen", False):
-                continue
-            until = getattr(account, "frozen_until", None)
-            if until is None:
-                has_unknown_reset = True
-                continue
-            if until.tzinfo is None:
-                until = until.replace(tzinfo=timezone.utc)
-            if earliest is None or until < earliest:
-                earliest = until
-
-        if earliest:
-            raise ValueError(f"所有账号已冻结，预计最早解冻时间：{_iso(earliest)}")
+        earliest, has_unknown_reset = pool.earliest_unfreeze()
+        if earliest is not None:
+            raise ValueError(
+                f"所有账号已冻结，预计最早解冻时间：{_iso(datetime.fromtimestamp(earliest, tz=timezone.utc))}"
+            )
         if has_unknown_reset:
             raise ValueError("所有账号已冻结：缺少重置时间")
         raise ValueError("没有可用账号")
@@ -1256,13 +1325,9 @@ class CodexService:
         }
 
         timeout = httpx.Timeout(connect=10.0, read=None, write=30.0, pool=10.0)
-        client = _build_httpx_async_client(timeout=timeout, follow_redirects=True)
-        try:
-            req = client.build_request("POST", url, json=body, headers=headers)
-            resp = await client.send(req, stream=True)
-        except Exception:
-            await client.aclose()
-            raise
+        client = _get_codex_http_client()
+        req = client.build_request("POST", url, json=body, headers=headers, timeout=timeout)
+        resp = await client.send(req, stream=True)
 
         if 200 <= resp.status_code < 300:
             logger.warning(
@@ -1277,7 +1342,6 @@ class CodexService:
         headers_copy = resp.headers
         status_code = resp.status_code
         await resp.aclose()
-        await client.aclose()
 
         try:
             err_text = raw_err.decode("utf-8", errors="replace")
@@ -1300,16 +1364,17 @@ class CodexService:
         request_data: Dict[str, Any],
         *,
         user_agent: Optional[str] = None,
+        strategy: Optional[str] = None,
     ) -> Tuple[httpx.AsyncClient, httpx.Response, Any]:
         """
         打开到 `chatgpt.com/backend-api/codex/responses` 的 SSE 连接。
 
-        - 账号选择：fill-first（先用第一个号，满了/冻结/禁用才换下一个）
+        - 账号选择：按 strategy（默认 fill-first：先用第一个号，满了/冻结/禁用才换下一个）
         - 429：自动落库限额字段并切换下一个账号
         - 401/402/403：自动冻结并切换下一个账号（401 会先尝试刷新 token）
 
         返回：
-        - client: httpx.AsyncClient（由调用方负责 aclose）
+        - client: 共享的 httpx.AsyncClient（连接池由 app.core.http_client 管理，调用方不要 aclose）
         - resp: httpx.Response(stream=True)（由调用方负责 aclose）
         - account: 选中的 CodexAccount ORM 实例（仅用于标识/展示）
         """
@@ -1320,7 +1385,7 @@ class CodexService:
         last_error: Optional[str] = None
 
         while True:
-            selected = await self._select_active_account_obj(user_id, exclude_ids=exclude_ids)
+            selected = await self._select_active_account_obj(user_id, exclude_ids=exclude_ids, strategy=strategy)
             if selected is None:
                 fallback = await self._open_fallback_responses_stream(
                     user_id=user_id,
@@ -1335,6 +1400,11 @@ class CodexService:
 
             exclude_ids.add(int(getattr(selected, "id", 0) or 0))
 
+            account_circuit = circuit_key("codex", selected.id)
+            if self.circuit_breaker.is_open(account_circuit):
+                last_error = "账号上游持续出错（熔断中），已自动切换下一个账号"
+                continue
+
             body = _normalize_codex_responses_request(request_data)
             if "model" in body:
                 body["model"] = _resolve_codex_model_name(body.get("model"))
@@ -1361,23 +1431,26 @@ class CodexService:
 
             # SSE：read 不设超时，但 connect 必须可控，否则网络问题会“挂死”等到上层超时（前端常见 504）。
             timeout = httpx.Timeout(connect=10.0, read=None, write=30.0, pool=10.0)
-            client = _build_httpx_async_client(timeout=timeout, follow_redirects=True)
-            try:
-                req = client.build_request("POST", CODEX_RESPONSES_URL, json=body, headers=headers)
+            client = _get_codex_http_client()
+            req = client.build_request("POST", CODEX_RESPONSES_URL, json=body, headers=headers, timeout=timeout)
+            # 紧挨着上游请求再占用（可能是半开探测名额），保证任何分支都会 finish
+            permit = self.circuit_breaker.try_acquire(account_circuit)
+            if permit is None:
+                last_error = "账号上游持续出错（熔断中），已自动切换下一个账号"
+                continue
+            with permit:
                 resp = await client.send(req, stream=True)
-            except Exception:
-                await client.aclose()
-                raise
+                permit.observe_status(resp.status_code)
 
             if 200 <= resp.status_code < 300:
                 await self._update_account_after_success(selected, resp.headers)
+                self._track_in_flight(user_id, int(selected.id), resp)
                 return client, resp, selected
 
             now = _now_utc()
             retry_at = _parse_retry_after(resp.headers, now=now)
             raw_err = await resp.aread()
             await resp.aclose()
-            await client.aclose()
 
             err_text = ""
             try:
@@ -1445,21 +1518,22 @@ class CodexService:
         request_data: Dict[str, Any],
         *,
         user_agent: Optional[str] = None,
+        strategy: Optional[str] = None,
     ) -> Tuple[Dict[str, Any], Any]:
         """
-        非流式：内部仍以 stream=true 请求上游，然后从 SSE 里提取 response.completed。
+        非流式：内部仍以 stream=true 请求上游，边读边从 SSE 里提取 response.completed，拿到后立即关闭上游连接。
         返回：
         - response object（不是 event wrapper）
         - account：本次使用的 CodexAccount ORM 实例（用于计费/统计）
         """
-        client, resp, account = await self.open_codex_responses_stream(user_id, request_data, user_agent=user_agent)
+        _client, resp, account = await self.open_codex_responses_stream(
+            user_id, request_data, user_agent=user_agent, strategy=strategy
+        )
         try:
-            data = await resp.aread()
+            response_obj = await _read_completed_response(resp)
         finally:
             await resp.aclose()
-            await client.aclose()
 
-        response_obj = self._extract_response_object_from_sse(data)
         if not response_obj:
             raise ValueError("Codex 上游未返回 response.completed")
         return response_obj, account
@@ -1514,6 +1588,7 @@ class CodexService:
         account = await self.repo.update_status(account_id, user_id, status)
         if not account:
             raise ValueError("账号不存在")
+        await self.account_pool.update(account)
         return {"success": True, "data": account}
 
     async def update_account_name(self, user_id: int, account_id: int, account_name: str) -> Dict[str, Any]:
@@ -1592,6 +1667,7 @@ class CodexService:
         )
         if not account:
             raise ValueError("账号不存在")
+        await self.account_pool.update(account)
         return {"success": True, "data": account}
 
     async def get_account_wham_usage(self, user_id: int, account_id: int) -> Dict[str, Any]:
@@ -1649,7 +1725,7 @@ class CodexService:
         注意：该方法可能会触发 token 刷新/账号冻结/禁用等落库副作用（与 refresh 行为一致）。
         """
         timeout = httpx.Timeout(connect=10.0, read=30.0, write=20.0, pool=10.0)
-        client = _build_httpx_async_client(timeout=timeout, follow_redirects=True)
+        client = _get_codex_http_client()
         resp: Optional[httpx.Response] = None
         try:
             for attempt in range(2):
@@ -1666,7 +1742,7 @@ class CodexService:
                     user_agent=None,
                 )
                 try:
-                    resp = await client.get(CODEX_WHAM_USAGE_URL, headers=headers)
+                    resp = await client.get(CODEX_WHAM_USAGE_URL, headers=headers, timeout=timeout)
                 except httpx.HTTPError as e:
                     proxy_hint = _redact_proxy_url(_get_outbound_proxy_url()) or "-"
                     logger.warning(
@@ -1751,10 +1827,6 @@ class CodexService:
                     await resp.aclose()
                 except Exception:
                     pass
-            try:
-                await client.aclose()
-            except Exception:
-                pass
 
     async def refresh_account_official(self, user_id: int, account_id: int) -> Dict[str, Any]:
         """
@@ -1830,6 +1902,7 @@ class CodexService:
             if changed:
                 await self.db.flush()
                 await self.db.commit()
+                await self.account_pool.update(account)
 
             # 401 刷新 token 时，_fetch_wham_usage_raw 会把 creds 原地更新；这里同步一下给后续步骤用。
             access_token = _safe_str(creds.get("access_token")) or access_token
@@ -1862,7 +1935,7 @@ class CodexService:
 
         # 刷新只依赖响应头 ratelimit；connect 超时尽量短，避免前端/反代先 504。
         timeout = httpx.Timeout(connect=10.0, read=60.0, write=30.0, pool=10.0)
-        client = _build_httpx_async_client(timeout=timeout, follow_redirects=True)
+        client = _get_codex_http_client()
         resp: Optional[httpx.Response] = None
         try:
             # 最多重试 1 次：401 时尝试 refresh_token 刷新再打一次
@@ -1872,7 +1945,7 @@ class CodexService:
                     chatgpt_account_id=chatgpt_account_id,
                     user_agent=None,
                 )
-                req = client.build_request("POST", CODEX_RESPONSES_URL, json=body, headers=headers)
+                req = client.build_request("POST", CODEX_RESPONSES_URL, json=body, headers=headers, timeout=timeout)
                 try:
                     resp = await client.send(req, stream=True)
                 except httpx.HTTPError as e:
@@ -1971,10 +2044,6 @@ class CodexService:
                     await resp.aclose()
                 except Exception:
                     pass
-            try:
-                await client.aclose()
-            except Exception:
-                pass
 
         quota = await self._fetch_official_quota(access_token)
         if quota is not None:
@@ -1989,10 +2058,36 @@ class CodexService:
         updated = await self.repo.get_by_id_and_user_id(account_id, user_id)
         return {"success": True, "data": updated or account}
 
+    async def refresh_account_token_if_expiring(
+        self, user_id: int, account_id: int, *, within_seconds: float
+    ) -> Optional[bool]:
+        """
+        后台预刷新：token 将在 within_seconds 秒内过期时刷新，并预热新凭证的解密缓存
+
+        Returns:
+            None=无需刷新（账号不存在 / 已禁用 / 已被其他 worker 刷新），True=已刷新，False=刷新失败
+        """
+        account = await self.repo.get_by_id_and_user_id(account_id, user_id)
+        if account is None or int(getattr(account, "status", 0) or 0) != 1:
+            return None
+        expires_at = getattr(account, "token_expires_at", None)
+        if isinstance(expires_at, datetime):
+            if expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
+            if expires_at > _now_utc() + timedelta(seconds=within_seconds):
+                return None
+
+        creds = self._load_account_credentials(account)
+        if not await self._try_refresh_account(account, creds):
+            return False
+        self._load_account_credentials(account)
+        return True
+
     async def delete_account(self, user_id: int, account_id: int) -> Dict[str, Any]:
         ok = await self.repo.delete(account_id, user_id)
         if not ok:
             raise ValueError("账号不存在")
+        await self.account_pool.remove(user_id, account_id)
         return {"success": True, "data": {"deleted": True}}
 
     async def _fetch_official_quota(self, access_token: str) -> Optional[Tuple[float, str]]:
@@ -2001,29 +2096,29 @@ class CodexService:
             return None
 
         headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
-        async with _build_httpx_async_client(timeout=httpx.Timeout(20.0)) as client:
-            for url in OPENAI_CREDIT_GRANTS_URLS:
-                try:
-                    resp = await client.get(url, headers=headers)
-                except Exception:
-                    continue
-                if resp.status_code != 200:
-                    continue
-                try:
-                    data = resp.json()
-                except Exception:
-                    continue
-                if not isinstance(data, dict):
-                    continue
-                total_available = data.get("total_available")
-                if total_available is None:
-                    continue
-                try:
-                    remaining = float(total_available)
-                except Exception:
-                    continue
-                # credit_grants 接口通常不返回 currency；这里默认 USD
-                return remaining, "USD"
+        client = _get_codex_http_client()
+        for url in OPENAI_CREDIT_GRANTS_URLS:
+            try:
+                resp = await client.get(url, headers=headers, timeout=httpx.Timeout(20.0), follow_redirects=False)
+            except Exception:
+                continue
+            if resp.status_code != 200:
+                continue
+            try:
+                data = resp.json()
+            except Exception:
+                continue
+            if not isinstance(data, dict):
+                continue
+            total_available = data.get("total_available")
+            if total_available is None:
+                continue
+            try:
+                remaining = float(total_available)
+            except Exception:
+                continue
+            # credit_grants 接口通常不返回 currency；这里默认 USD
+            return remaining, "USD"
         return None
 
     async def _exchange_code_for_tokens(self, *, code: str, code_verifier: str) -> Dict[str, Any]:
@@ -2034,15 +2129,17 @@ class CodexService:
             "redirect_uri": OPENAI_REDIRECT_URI,
             "code_verifier": code_verifier,
         }
-        async with _build_httpx_async_client(timeout=httpx.Timeout(30.0)) as client:
-            resp = await client.post(
-                OPENAI_TOKEN_URL,
-                data=form,
-                headers={
-                    "Content-Type": "application/x-www-form-urlencoded",
-                    "Accept": "application/json",
-                },
-            )
+        client = _get_codex_http_client()
+        resp = await client.post(
+            OPENAI_TOKEN_URL,
+            data=form,
+            headers={
+                "Content-Type": "application/x-www-form-urlencoded",
+                "Accept": "application/json",
+            },
+            timeout=httpx.Timeout(30.0),
+            follow_redirects=False,
+        )
         if resp.status_code != 200:
             # 不直接透出 token/敏感信息
             raise ValueError(f"token 交换失败: HTTP {resp.status_code}")
@@ -2052,12 +2149,8 @@ class CodexService:
         return data
 
     def _load_account_credentials(self, account: Any) -> Dict[str, Any]:
-        decrypted = decrypt_secret(account.credentials)
-        try:
-            obj = json.loads(decrypted)
-        except Exception:
-            obj = {}
-        return obj if isinstance(obj, dict) else {}
+        # 按密文缓存解密结果（刷新后密文变化，自然不再命中）
+        return get_credentials_cache().load(account.credentials, _decrypt_credentials)
 
     def _resolve_chatgpt_account_id(self, account: Any, creds: Dict[str, Any]) -> str:
         # 优先用落库字段
@@ -2089,12 +2182,14 @@ class CodexService:
             "refresh_token": refresh_token,
             "scope": "openid profile email",
         }
-        async with _build_httpx_async_client(timeout=httpx.Timeout(30.0)) as client:
-            resp = await client.post(
-                OPENAI_TOKEN_URL,
-                data=form,
-                headers={"Content-Type": "application/x-www-form-urlencoded", "Accept": "application/json"},
-            )
+        client = _get_codex_http_client()
+        resp = await client.post(
+            OPENAI_TOKEN_URL,
+            data=form,
+            headers={"Content-Type": "application/x-www-form-urlencoded", "Accept": "application/json"},
+            timeout=httpx.Timeout(30.0),
+            follow_redirects=False,
+        )
         if resp.status_code != 200:
             raise ValueError(f"token 刷新失败: HTTP {resp.status_code}")
         data = resp.json()
@@ -2103,13 +2198,37 @@ class CodexService:
         return data
 
     async def _try_refresh_account(self, account: Any, creds: Dict[str, Any]) -> bool:
+        """
+        刷新账号 token
+
+        同一账号的并发刷新合并为一次（进程内单飞 + Redis 锁，见 app/cache/token_refresh_lock.py），
+        等待者复用同一刷新结果，并同步到自己会话里的账号实例上。
+        """
+        values = await get_token_refresh_coordinator().run(
+            f"codex:{account.id}",
+            lambda lease: self._refresh_account_tokens(account, creds, lease),
+        )
+        if not values:
+            return False
+        apply_refreshed_columns(account, values)
+        return True
+
+    async def _refresh_account_tokens(
+        self, account: Any, creds: Dict[str, Any], lease: RefreshLease
+    ) -> Optional[Dict[str, Any]]:
+        """持锁执行一次刷新，返回已提交的凭证相关列；刷新失败返回 None"""
+        # 其他 worker 可能刚刷新过（本会话里的账号实例是旧的）：库中凭证已变化则直接使用
+        current = await self.repo.get_token_state(account.id, account.user_id)
+        if current is not None and current.credentials != account.credentials:
+            return dict(current._mapping)
+
         refresh_token = _safe_str(creds.get("refresh_token"))
         if not refresh_token:
-            return False
+            return None
         try:
             token_resp = await self._refresh_tokens(refresh_token)
         except Exception:
-            return False
+            return None
 
         now = _now_utc()
         expires_at = now + timedelta(seconds=int(token_resp.get("expires_in") or 0))
@@ -2129,19 +2248,32 @@ class CodexService:
         }
 
         encrypted_credentials = encrypt_secret(json.dumps(storage_payload, ensure_ascii=False))
-        await self.repo.update_credentials_and_profile(
-            account.id,
-            account.user_id,
-            credentials=encrypted_credentials,
-            email=profile.get("email") or None,
-            openai_account_id=profile.get("openai_account_id") or None,
-            chatgpt_plan_type=profile.get("chatgpt_plan_type") or None,
-            token_expires_at=expires_at,
-            last_refresh_at=now,
-        )
-        await self.db.flush()
+        values: Dict[str, Any] = {
+            "credentials": encrypted_credentials,
+            "email": profile.get("email") or None,
+            "openai_account_id": profile.get("openai_account_id") or None,
+            "chatgpt_plan_type": profile.get("chatgpt_plan_type") or None,
+            "token_expires_at": expires_at,
+            "last_refresh_at": now,
+        }
+        values = {k: v for k, v in values.items() if v is not None}
+
+        # 以刷新前的凭证为条件写库：锁中途过期、其他 worker 已写入新凭证时不覆盖，以库中结果为准
+        if not await self.repo.update_credentials_if_unchanged(
+            account.id, account.user_id, account.credentials, **values
+        ):
+            logger.warning(
+                "codex refresh: credentials changed concurrently, using stored result: account_id=%s fence=%s",
+                account.id,
+                lease.fence,
+            )
+            current = await self.repo.get_token_state(account.id, account.user_id)
+            if current is not None and current.credentials != account.credentials:
+                return dict(current._mapping)
+            return None
+
         await self.db.commit()
-        return True
+        return values
 
     async def _ensure_account_tokens(self, account: Any, creds: Dict[str, Any]) -> Dict[str, Any]:
         now = _now_utc()
@@ -2165,6 +2297,8 @@ class CodexService:
             await self.db.commit()
         except Exception:
             await self.db.rollback()
+            return
+        await self.account_pool.update(account)
 
     async def _freeze_account(self, account: Any, *, reason: str, until: Optional[datetime] = None) -> None:
         """
@@ -2194,6 +2328,8 @@ class CodexService:
             await self.db.commit()
         except Exception:
             await self.db.rollback()
+            return
+        await self.account_pool.update(account)
 
     async def _mark_rate_limited(
         self,
@@ -2221,6 +2357,7 @@ class CodexService:
 
         await self.db.flush()
         await self.db.commit()
+        await self.account_pool.update(account)
 
     async def _sync_limits_from_wham_usage_best_effort(
         self,
@@ -2283,6 +2420,8 @@ class CodexService:
             await self.db.commit()
         except Exception:
             await self.db.rollback()
+            return
+        await self.account_pool.update(account)
 
     async def _update_account_after_success(self, account: Any, headers: httpx.Headers) -> None:
         """
@@ -2316,39 +2455,63 @@ class CodexService:
             await self.db.commit()
         except Exception:
             await self.db.rollback()
+            return
+        # 只有限额状态变化时才会广播（last_used_at 不在账号池里）
+        await self.account_pool.update(account)
+
+    async def _get_account_pool(self, user_id: int) -> UserAccountPool:
+        """取用户的内存账号池；未加载或已过期时从数据库加载一次（只查选号状态列）"""
+        pool = self.account_pool.get(user_id)
+        if pool is None:
+            rows = await self.repo.list_pool_states_by_user_id(user_id)
+            # 并发请求可能已先一步加载（之后的事件已应用在其上），不要用更旧的结果覆盖
+            pool = self.account_pool.get(user_id) or self.account_pool.load(user_id, rows)
+        return pool
+
+    def _choose_pool_account(
+        self, user_id: int, exclude_ids: Set[int], strategy: Optional[str]
+    ) -> Optional[CodexAccountState]:
+        if get_balance_strategy(strategy).name == FILL_FIRST:
+            return self.account_pool.select(user_id, exclude_ids)
+        now = _now_utc().timestamp()
+        return choose_account(
+            strategy,
+            ("codex", user_id),
+            self.account_pool.candidates(user_id, exclude_ids),
+            in_flight=lambda state: state.in_flight,
+            remaining=lambda state: state.remaining_ratio(now),
+        )
 
-    async def _select_active_account_obj(self, user_id: int, *, exclude_ids: Set[int]) -> Optional[Any]:
-        enabled = await self.repo.list_enabled_by_user_id(user_id)
-        for account in enabled:
-            if int(getattr(account, "id", 0) or 0) in exclude_ids:
-                continue
-            if getattr(account, "effective_status", 0) == 1:
-                return account
-        return None
+    async def _select_active_account_obj(
+        self,
+        user_id: int,
+        *,
+        exclude_ids: Set[int],
+        strategy: Optional[str] = None,
+    ) -> Optional[Any]:
+        """
+        选号：按负载均衡策略（默认 fill-first）在内存账号池中选出可用账号，再按主键加载该账号（后续需要凭证并落库状态）。
 
-    def _extract_response_object_from_sse(self, raw: bytes) -> Optional[Dict[str, Any]]:
-        if not raw:
-            return None
-        try:
-            text = raw.decode("utf-8", errors="replace")
-        except Exception:
-            return None
+        账号池与数据库不一致（广播尚未到达 / 库外修改）时，以数据库为准修正账号池后重选。
+        """
+        await self._get_account_pool(user_id)
+        skipped: Set[int] = set(exclude_ids)
+        while True:
+            state = self._choose_pool_account(user_id, skipped, strategy)
+            if state is None:
+                return None
+            account = await self.repo.get_by_id_and_user_id(state.id, user_id)
+            if account is not None and getattr(account, "effective_status", 0) == 1:
+                return account
 
-        for line in text.splitlines():
-            stripped = line.strip()
-            if not stripped.startswith("data:"):
-                continue
-            payload_str = stripped[5:].strip()
-            if not payload_str or payload_str == "[DONE]":
-                continue
-            try:
-                payload = json.loads(payload_str)
-            except Exception:
-                continue
-            if not isinstance(payload, dict):
-                continue
-            if payload.get("type") == "response.completed":
-                resp = payload.get("response")
-                if isinstance(resp, dict):
-                    return resp
-        return None
+            skipped.add(state.id)
+            pool = await self._get_account_pool(user_id)
+            if account is None:
+                pool.remove(state.id)
+            else:
+                pool.upsert(CodexAccountState.from_account(account))
+
+    def _track_in_flight(self, user_id: int, account_id: int, resp: httpx.Response) -> None:
+        """账号在途计数 +1，上游响应关闭时 -1"""
+        self.account_pool.acquire(user_id, account_id)
+        resp.stream = _InFlightStream(resp.stream, lambda: self.account_pool.release(user_id, account_id))
@@ -17,8 +17,10 @@ from typing import Any, Dict, List, Optional, Sequence
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.circuit_breaker import CircuitBreaker, CircuitKey, circuit_key, get_circuit_breaker
 from app.repositories.custom_account_repository import CustomAccountRepository
 from app.models.custom_account import CustomAccount
+from app.services.account_balancer import choose_account
 from app.utils.encryption import encrypt_api_key as encrypt_secret
 from app.utils.encryption import decrypt_api_key as decrypt_secret
 
@@ -29,6 +31,14 @@ class CustomAccountService:
     def __init__(self, db: AsyncSession):
         self.db = db
         self.repo = CustomAccountRepository(db)
+        self._circuit_breaker: Optional[CircuitBreaker] = None
+
+    @property
+    def circuit_breaker(self) -> CircuitBreaker:
+        """按上游 base_url 熔断（见 app.core.circuit_breaker）"""
+        if self._circuit_breaker is None:
+            self._circuit_breaker = get_circuit_breaker()
+        return self._circuit_breaker
 
     # ==================== 创建 ====================
 
@@ -117,8 +127,13 @@ class CustomAccountService:
         self,
         user_id: int,
         allowed_account_ids: Optional[List[int]] = None,
+        strategy: Optional[str] = None,
     ) -> Optional[CustomAccount]:
-        """选取一个可用的自定义账号（status=1，按 id ASC）。"""
+        """
+        按负载均衡策略（默认 fill-first）选取一个可用的自定义账号（status=1，按 id ASC）。
+
+        上游 base_url 熔断中的账号会被跳过；全部熔断时仍按原候选选取，由调用方 try_acquire 时返回 503。
+        """
         accounts = await self.repo.list_enabled_by_user_id(user_id)
         if not accounts:
             return None
@@ -127,7 +142,21 @@ class CustomAccountService:
             allowed_set = set(allowed_account_ids)
             accounts = [a for a in accounts if a.id in allowed_set]
 
-        return accounts[0] if accounts else None
+        if accounts and self.circuit_breaker.has_tripped("custom"):
+            healthy = [a for a in accounts if not self.circuit_breaker.is_open(self.upstream_circuit_key(a))]
+            accounts = healthy or accounts
+
+        return choose_account(strategy, ("custom", user_id), accounts)
+
+    def upstream_circuit_key(self, account: CustomAccount) -> CircuitKey:
+        """账号上游的熔断键：("custom", base_url)，同一 base_url 的账号共享熔断状态"""
+        base_url = account.base_url
+        if not base_url:
+            try:
+                base_url = self.get_decrypted_credentials(account).get("base_url", "")
+            except Exception:
+                base_url = ""
+        return circuit_key("custom", base_url or "")
 
     def get_decrypted_credentials(self, account: CustomAccount) -> Dict[str, Any]:
         """解密 credentials，返回 api_key + base_url（内部使用）。"""
@@ -24,7 +24,10 @@ import httpx
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.cache import RedisClient
+from app.core.circuit_breaker import CircuitBreaker, CircuitPermit, circuit_key, get_circuit_breaker
+from app.core.http_client import UPSTREAM_CLOUDCODE, get_http_client
 from app.repositories.gemini_cli_account_repository import GeminiCLIAccountRepository
+from app.services.account_balancer import choose_account
 from app.services.gemini_cli_service import (
     CLOUDCODE_PA_BASE_URL,
     DEFAULT_CLIENT_METADATA,
@@ -32,6 +35,8 @@ from app.services.gemini_cli_service import (
     DEFAULT_X_GOOG_API_CLIENT,
     GeminiCLIService,
 )
+from app.utils import jsonx
+from app.utils.sse import aiter_sse_events
 
 logger = logging.getLogger(__name__)
 
@@ -60,7 +65,7 @@ class _GeminiCLISSESampleLogger:
         self.count = 0
         self.max_events = 20
 
-    def maybe_log(self, *, data: bytes, event_obj: Any) -> None:
+    def maybe_log(self, *, data: str, event_obj: Any) -> None:
         if not self.enabled:
             return
         if self.count >= self.max_events:
@@ -78,7 +83,7 @@ class _GeminiCLISSESampleLogger:
             self.label,
             self.count,
             dt_ms,
-            len(data or b""),
+            len(data or ""),
             summary_str,
         )
 
@@ -219,7 +224,7 @@ def _openai_error_sse(message: str, *, code: int = 500, error_type: str = "upstr
             "code": int(code or 500),
         }
     }
-    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+    return b"data: " + jsonx.dumps(payload) + b"\n\n"
 
 
 def _openai_done_sse() -> bytes:
@@ -707,7 +712,7 @@ def _gemini_cli_event_to_openai_chunks(
             fname = (function_call.get("name") or "").strip()
             fargs = function_call.get("args")
             if isinstance(fargs, (dict, list)):
-                fargs_str = json.dumps(fargs, ensure_ascii=False, separators=(",", ":"))
+                fargs_str = jsonx.dumps_str(fargs)
             elif isinstance(fargs, str):
                 fargs_str = fargs
             else:
@@ -796,7 +801,7 @@ def _gemini_cli_response_to_openai_response(raw_json: Dict[str, Any]) -> Dict[st
             fname = (function_call.get("name") or "").strip()
             fargs = function_call.get("args")
             if isinstance(fargs, (dict, list)):
-                fargs_str = json.dumps(fargs, ensure_ascii=False, separators=(",", ":"))
+                fargs_str = jsonx.dumps_str(fargs)
             elif isinstance(fargs, str):
                 fargs_str = fargs
             else:
@@ -866,6 +871,14 @@ class GeminiCLIAPIService:
         self.redis = redis
         self.repo = GeminiCLIAccountRepository(db)
         self.account_service = GeminiCLIService(db, redis)
+        self._circuit_breaker: Optional[CircuitBreaker] = None
+
+    @property
+    def circuit_breaker(self) -> CircuitBreaker:
+        """按账号熔断（见 app.core.circuit_breaker）：熔断中的账号在选号时直接跳过"""
+        if self._circuit_breaker is None:
+            self._circuit_breaker = get_circuit_breaker()
+        return self._circuit_breaker
 
     async def openai_list_models(self, *, user_id: int) -> Dict[str, Any]:
         models = await self._get_models_best_effort(user_id=user_id)
@@ -935,20 +948,37 @@ class GeminiCLIAPIService:
         except Exception:
             return []
 
-    async def _prepare_account(self, user_id: int) -> Tuple[str, str]:
+    async def _prepare_account(
+        self, user_id: int, strategy: Optional[str] = None
+    ) -> Tuple[str, str, CircuitPermit]:
         """
-        选择一个可用账号，返回 (access_token, project_id)
+        按负载均衡策略（默认 fill-first）选择一个可用账号，返回 (access_token, project_id, permit)
+
+        熔断中的账号直接跳过；permit 由调用方在上游请求结束后 finish（with permit: ...）。
         """
         accounts = await self.repo.list_enabled_by_user_id(user_id)
         if not accounts:
             raise ValueError("未找到可用的 GeminiCLI 账号（请先在面板完成 OAuth 并启用账号）")
 
-        account = accounts[0]
-        project_id = _pick_first_project_id(getattr(account, "project_id", None))
-        if not project_id:
-            raise ValueError("GeminiCLI 账号缺少 project_id（请先在账号详情里填写 GCP Project ID）")
+        candidates = list(accounts)
+        while True:
+            account = choose_account(strategy, ("gemini-cli", user_id), candidates)
+            permit = self.circuit_breaker.try_acquire(circuit_key("gemini-cli", account.id))
+            if permit is not None:
+                break
+            candidates.remove(account)
+            if not candidates:
+                raise ValueError("GeminiCLI 账号上游持续出错（均处于熔断状态），请稍后重试")
 
-        access_token = await self.account_service.get_valid_access_token(user_id, int(account.id))
+        try:
+            project_id = _pick_first_project_id(getattr(account, "project_id", None))
+            if not project_id:
+                raise ValueError("GeminiCLI 账号缺少 project_id（请先在账号详情里填写 GCP Project ID）")
+
+            access_token = await self.account_service.get_valid_access_token(user_id, int(account.id))
+        except BaseException:
+            permit.finish()
+            raise
 
         # best-effort 记录 last_used_at；commit 由 get_db() 依赖统一处理
         try:
@@ -956,7 +986,7 @@ class GeminiCLIAPIService:
         except Exception:
             pass
 
-        return access_token, project_id
+        return access_token, project_id, permit
 
     def _headers(self, access_token: str, *, accept: str) -> Dict[str, str]:
         return {
@@ -968,48 +998,57 @@ class GeminiCLIAPIService:
             "Client-Metadata": DEFAULT_CLIENT_METADATA,
         }
 
-    async def openai_chat_completions(self, *, user_id: int, request_data: Dict[str, Any]) -> Dict[str, Any]:
+    async def openai_chat_completions(
+        self,
+        *,
+        user_id: int,
+        request_data: Dict[str, Any],
+        strategy: Optional[str] = None,
+    ) -> Dict[str, Any]:
         """
         OpenAI Chat（非流式）：调用 cloudcode-pa generateContent，并返回 OpenAI JSON。
         """
-        access_token, project_id = await self._prepare_account(user_id)
+        access_token, project_id, permit = await self._prepare_account(user_id, strategy)
         payload = _openai_request_to_gemini_cli_payload(request_data)
         payload["project"] = project_id
 
         url = f"{CLOUDCODE_PA_BASE_URL}:generateContent"
         headers = self._headers(access_token, accept="application/json")
 
-        async with httpx.AsyncClient(timeout=httpx.Timeout(1200.0, connect=60.0)) as client:
+        client = get_http_client(UPSTREAM_CLOUDCODE)
+        with permit:
             resp = await client.post(url, json=payload, headers=headers)
-            if resp.status_code >= 400:
-                try:
-                    error_data = resp.json()
-                except Exception:
-                    error_data = {"detail": resp.text}
-                err = httpx.HTTPStatusError(
-                    message=f"GeminiCLI upstream error: {resp.status_code}",
-                    request=resp.request,
-                    response=resp,
-                )
-                err.response_data = error_data
-                raise err
-
-            raw = resp.json()
-            if not isinstance(raw, dict):
-                raise ValueError("GeminiCLI 上游响应格式异常（非对象）")
-            return _gemini_cli_response_to_openai_response(raw)
+            permit.observe_status(resp.status_code, timed=False)
+        if resp.status_code >= 400:
+            try:
+                error_data = resp.json()
+            except Exception:
+                error_data = {"detail": resp.text}
+            err = httpx.HTTPStatusError(
+                message=f"GeminiCLI upstream error: {resp.status_code}",
+                request=resp.request,
+                response=resp,
+            )
+            err.response_data = error_data
+            raise err
+
+        raw = resp.json()
+        if not isinstance(raw, dict):
+            raise ValueError("GeminiCLI 上游响应格式异常（非对象）")
+        return _gemini_cli_response_to_openai_response(raw)
 
     async def openai_chat_completions_stream(
         self,
         *,
         user_id: int,
         request_data: Dict[str, Any],
+        strategy: Optional[str] = None,
     ) -> AsyncIterator[bytes]:
         """
         OpenAI Chat（流式）：调用 cloudcode-pa streamGenerateContent?alt=sse，
         并把每个 event 翻译成 OpenAI SSE（data: {...}\\n\\n + [DONE]）。
         """
-        access_token, project_id = await self._prepare_account(user_id)
+        access_token, project_id, permit = await self._prepare_account(user_id, strategy)
         payload = _openai_request_to_gemini_cli_payload(request_data)
         payload["project"] = project_id
 
@@ -1018,8 +1057,10 @@ class GeminiCLIAPIService:
 
         state = _OpenAIStreamState(created=int(time.time()), function_index=0)
 
-        async with httpx.AsyncClient(timeout=httpx.Timeout(1200.0, connect=60.0)) as client:
+        client = get_http_client(UPSTREAM_CLOUDCODE)
+        with permit:
             async with client.stream("POST", url, json=payload, headers=headers) as resp:
+                permit.observe_status(resp.status_code)
                 if resp.status_code >= 400:
                     body = await resp.aread()
                     msg = body.decode("utf-8", errors="replace")[:500]
@@ -1028,52 +1069,21 @@ class GeminiCLIAPIService:
                     return
 
                 sample_logger = _GeminiCLISSESampleLogger(label="openai_chat")
-                buffer = b""
-                event_data_lines: List[bytes] = []
-                async for chunk in resp.aiter_raw():
-                    if not chunk:
+                # 流结束时未以空行结尾的事件由 aiter_sse_events 尽力分发
+                async for sse_event in aiter_sse_events(resp.aiter_raw()):
+                    data = sse_event.data.strip()
+                    if not data:
+                        continue
+                    try:
+                        event_obj = jsonx.loads(data)
+                    except Exception:
+                        continue
+                    sample_logger.maybe_log(data=data, event_obj=event_obj)
+                    if not isinstance(event_obj, dict):
                         continue
-                    buffer += chunk
-                    while b"\n" in buffer:
-                        line, buffer = buffer.split(b"\n", 1)
-                        line = line.rstrip(b"\r")
-
-                        # SSE event delimiter
-                        if line == b"":
-                            if not event_data_lines:
-                                continue
-                            data = b"\n".join(event_data_lines).strip()
-                            event_data_lines = []
-                            if not data:
-                                continue
-                            try:
-                                event_obj = json.loads(data.decode("utf-8", errors="replace"))
-                            except Exception:
-                                continue
-                            sample_logger.maybe_log(data=data, event_obj=event_obj)
-                            if not isinstance(event_obj, dict):
-                                continue
-
-                            for payload_obj in _gemini_cli_event_to_openai_chunks(event_obj, state=state):
-                                yield f"data: {json.dumps(payload_obj, ensure_ascii=False)}\n\n".encode("utf-8")
-                            continue
-
-                        if line.startswith(b"data:"):
-                            event_data_lines.append(line[5:].lstrip())
-                            continue
-
-                # best-effort flush（极端情况下上游不以空行结尾）
-                if event_data_lines:
-                    data = b"\n".join(event_data_lines).strip()
-                    if data:
-                        try:
-                            event_obj = json.loads(data.decode("utf-8", errors="replace"))
-                        except Exception:
-                            event_obj = None
-                        if isinstance(event_obj, dict):
-                            sample_logger.maybe_log(data=data, event_obj=event_obj)
-                            for payload_obj in _gemini_cli_event_to_openai_chunks(event_obj, state=state):
-                                yield f"data: {json.dumps(payload_obj, ensure_ascii=False)}\n\n".encode("utf-8")
+
+                    for payload_obj in _gemini_cli_event_to_openai_chunks(event_obj, state=state):
+                        yield b"data: " + jsonx.dumps(payload_obj) + b"\n\n"
 
                 yield _openai_done_sse()
 
@@ -1083,39 +1093,42 @@ class GeminiCLIAPIService:
         user_id: int,
         model: str,
         request_data: Dict[str, Any],
+        strategy: Optional[str] = None,
     ) -> Dict[str, Any]:
         """
         Gemini v1beta generateContent（非流式）：返回 Gemini 标准 JSON。
         """
-        access_token, project_id = await self._prepare_account(user_id)
+        access_token, project_id, permit = await self._prepare_account(user_id, strategy)
         payload = _normalize_gemini_request_to_cli_request(model, request_data)
         payload["project"] = project_id
 
         url = f"{CLOUDCODE_PA_BASE_URL}:generateContent"
         headers = self._headers(access_token, accept="application/json")
 
-        async with httpx.AsyncClient(timeout=httpx.Timeout(1200.0, connect=60.0)) as client:
+        client = get_http_client(UPSTREAM_CLOUDCODE)
+        with permit:
             resp = await client.post(url, json=payload, headers=headers)
-            if resp.status_code >= 400:
-                try:
-                    error_data = resp.json()
-                except Exception:
-                    error_data = {"detail": resp.text}
-                err = httpx.HTTPStatusError(
-                    message=f"GeminiCLI upstream error: {resp.status_code}",
-                    request=resp.request,
-                    response=resp,
-                )
-                err.response_data = error_data
-                raise err
-
-            raw = resp.json()
-            if not isinstance(raw, dict):
-                raise ValueError("GeminiCLI 上游响应格式异常（非对象）")
-            response_obj = raw.get("response")
-            if isinstance(response_obj, dict):
-                return response_obj
-            return raw
+            permit.observe_status(resp.status_code, timed=False)
+        if resp.status_code >= 400:
+            try:
+                error_data = resp.json()
+            except Exception:
+                error_data = {"detail": resp.text}
+            err = httpx.HTTPStatusError(
+                message=f"GeminiCLI upstream error: {resp.status_code}",
+                request=resp.request,
+                response=resp,
+            )
+            err.response_data = error_data
+            raise err
+
+        raw = resp.json()
+        if not isinstance(raw, dict):
+            raise ValueError("GeminiCLI 上游响应格式异常（非对象）")
+        response_obj = raw.get("response")
+        if isinstance(response_obj, dict):
+            return response_obj
+        return raw
 
     async def gemini_stream_generate_content(
         self,
@@ -1123,73 +1136,42 @@ class GeminiCLIAPIService:
         user_id: int,
         model: str,
         request_data: Dict[str, Any],
+        strategy: Optional[str] = None,
     ) -> AsyncIterator[bytes]:
         """
         Gemini v1beta streamGenerateContent：输出 `data: <GeminiResponse>\\n\\n` 的 SSE（不发送 [DONE]）。
         """
-        access_token, project_id = await self._prepare_account(user_id)
+        access_token, project_id, permit = await self._prepare_account(user_id, strategy)
         payload = _normalize_gemini_request_to_cli_request(model, request_data)
         payload["project"] = project_id
 
         url = f"{CLOUDCODE_PA_BASE_URL}:streamGenerateContent?alt=sse"
         headers = self._headers(access_token, accept="text/event-stream")
 
-        async with httpx.AsyncClient(timeout=httpx.Timeout(1200.0, connect=60.0)) as client:
+        client = get_http_client(UPSTREAM_CLOUDCODE)
+        with permit:
             async with client.stream("POST", url, json=payload, headers=headers) as resp:
+                permit.observe_status(resp.status_code)
                 if resp.status_code >= 400:
                     body = await resp.aread()
                     msg = body.decode("utf-8", errors="replace")[:500]
-                    yield f"data: {json.dumps({'error': {'message': msg or 'upstream_error', 'code': resp.status_code}}, ensure_ascii=False)}\n\n".encode(
-                        "utf-8"
-                    )
+                    yield b"data: " + jsonx.dumps({"error": {"message": msg or "upstream_error", "code": resp.status_code}}) + b"\n\n"
                     return
 
                 sample_logger = _GeminiCLISSESampleLogger(label="gemini_v1beta")
-                buffer = b""
-                event_data_lines: List[bytes] = []
-                async for chunk in resp.aiter_raw():
-                    if not chunk:
+                # 流结束时未以空行结尾的事件由 aiter_sse_events 尽力分发
+                async for sse_event in aiter_sse_events(resp.aiter_raw()):
+                    data = sse_event.data.strip()
+                    if not data:
+                        continue
+                    try:
+                        event_obj = jsonx.loads(data)
+                    except Exception:
+                        continue
+                    sample_logger.maybe_log(data=data, event_obj=event_obj)
+                    if not isinstance(event_obj, dict):
+                        continue
+                    resp_obj = event_obj.get("response")
+                    if not isinstance(resp_obj, dict):
                         continue
-                    buffer += chunk
-                    while b"\n" in buffer:
-                        line, buffer = buffer.split(b"\n", 1)
-                        line = line.rstrip(b"\r")
-
-                        # SSE event delimiter
-                        if line == b"":
-                            if not event_data_lines:
-                                continue
-                            data = b"\n".join(event_data_lines).strip()
-                            event_data_lines = []
-                            if not data:
-                                continue
-                            try:
-                                event_obj = json.loads(data.decode("utf-8", errors="replace"))
-                            except Exception:
-                                continue
-                            sample_logger.maybe_log(data=data, event_obj=event_obj)
-                            if not isinstance(event_obj, dict):
-                                continue
-                            resp_obj = event_obj.get("response")
-                            if not isinstance(resp_obj, dict):
-                                continue
-                            yield f"data: {json.dumps(resp_obj, ensure_ascii=False)}\n\n".encode("utf-8")
-                            continue
-
-                        if line.startswith(b"data:"):
-                            event_data_lines.append(line[5:].lstrip())
-                            continue
-
-                # best-effort flush（极端情况下上游不以空行结尾）
-                if event_data_lines:
-                    data = b"\n".join(event_data_lines).strip()
-                    if data:
-                        try:
-                            event_obj = json.loads(data.decode("utf-8", errors="replace"))
-                        except Exception:
-                            event_obj = None
-                        if isinstance(event_obj, dict):
-                            sample_logger.maybe_log(data=data, event_obj=event_obj)
-                            resp_obj = event_obj.get("response")
-                            if isinstance(resp_obj, dict):
-                                yield f"data: {json.dumps(resp_obj, ensure_ascii=False)}\n\n".encode("utf-8")
+                    yield b"data: " + jsonx.dumps(resp_obj) + b"\n\n"
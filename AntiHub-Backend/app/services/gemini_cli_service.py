@@ -26,6 +26,9 @@ import httpx
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.cache import RedisClient
+from app.cache.credentials_cache import get_credentials_cache
+from app.cache.token_refresh_lock import RefreshLease, apply_refreshed_columns, get_token_refresh_coordinator
+from app.core.http_client import UPSTREAM_CLOUDCODE, UPSTREAM_GOOGLE_OAUTH, get_http_client
 from app.repositories.gemini_cli_account_repository import GeminiCLIAccountRepository
 from app.utils.encryption import encrypt_api_key as encrypt_secret
 from app.utils.encryption import decrypt_api_key as decrypt_secret
@@ -80,6 +83,15 @@ def _iso(dt: datetime) -> str:
     return dt.astimezone(timezone.utc).isoformat()
 
 
+def _decrypt_credentials(ciphertext: str) -> Dict[str, Any]:
+    decrypted = decrypt_secret(ciphertext)
+    try:
+        obj = json.loads(decrypted)
+    except Exception:
+        obj = {}
+    return obj if isinstance(obj, dict) else {}
+
+
 def _generate_state() -> str:
     # gem- 开头的 state，与参考项目一致
     return f"gem-{secrets.token_hex(8)}"
@@ -524,15 +536,16 @@ class GeminiCLIService:
                 "grant_type": "refresh_token",
             }
 
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                resp = await client.post(
-                    GOOGLE_TOKEN_URL,
-                    data=form,
-                    headers={
-                        "Content-Type": "application/x-www-form-urlencoded",
-                        "Accept": "application/json",
-                    },
-                )
+            client = get_http_client(UPSTREAM_GOOGLE_OAUTH)
+            resp = await client.post(
+                GOOGLE_TOKEN_URL,
+                data=form,
+                headers={
+                    "Content-Type": "application/x-www-form-urlencoded",
+                    "Accept": "application/json",
+                },
+                timeout=30.0,
+            )
 
             if resp.status_code != 200:
                 raise ValueError(f"token 刷新失败: HTTP {resp.status_code}")
@@ -731,15 +744,16 @@ class GeminiCLIService:
             "grant_type": "authorization_code",
         }
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.post(
-                GOOGLE_TOKEN_URL,
-                data=form,
-                headers={
-                    "Content-Type": "application/x-www-form-urlencoded",
-                    "Accept": "application/json",
-                },
-            )
+        client = get_http_client(UPSTREAM_GOOGLE_OAUTH)
+        resp = await client.post(
+            GOOGLE_TOKEN_URL,
+            data=form,
+            headers={
+                "Content-Type": "application/x-www-form-urlencoded",
+                "Accept": "application/json",
+            },
+            timeout=30.0,
+        )
 
         if resp.status_code != 200:
             raise ValueError(f"token 交换失败: HTTP {resp.status_code}")
@@ -759,8 +773,8 @@ class GeminiCLIService:
         url = "https://www.googleapis.com/oauth2/v1/userinfo?alt=json"
         headers = {"Authorization": f"Bearer {access_token}"}
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.get(url, headers=headers)
+        client = get_http_client(UPSTREAM_GOOGLE_OAUTH)
+        resp = await client.get(url, headers=headers, timeout=30.0)
 
         if resp.status_code != 200:
             logger.warning("get userinfo failed: HTTP %s", resp.status_code)
@@ -891,8 +905,8 @@ class GeminiCLIService:
         if project_id:
             body["cloudaicompanionProject"] = project_id
 
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            resp = await client.post(url, json=body, headers=headers)
+        client = get_http_client(UPSTREAM_CLOUDCODE)
+        resp = await client.post(url, json=body, headers=headers, timeout=60.0)
 
         if resp.status_code == 204:
             return {}
@@ -937,29 +951,29 @@ class GeminiCLIService:
         max_attempts = 5
         retry_delay_seconds = 2.0
 
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            for attempt in range(1, max_attempts + 1):
-                resp = await client.post(url, json=body, headers=headers)
+        client = get_http_client(UPSTREAM_CLOUDCODE)
+        for attempt in range(1, max_attempts + 1):
+            resp = await client.post(url, json=body, headers=headers, timeout=60.0)
 
-                if resp.status_code == 204:
-                    return {}
+            if resp.status_code == 204:
+                return {}
 
-                if resp.status_code != 200:
-                    logger.warning(
-                        "onboardUser failed: HTTP %s, response: %s",
-                        resp.status_code,
-                        resp.text[:500],
-                    )
-                    return {}
+            if resp.status_code != 200:
+                logger.warning(
+                    "onboardUser failed: HTTP %s, response: %s",
+                    resp.status_code,
+                    resp.text[:500],
+                )
+                return {}
 
-                data = resp.json() if resp.status_code == 200 else {}
-                last_payload = data if isinstance(data, dict) else {}
+            data = resp.json() if resp.status_code == 200 else {}
+            last_payload = data if isinstance(data, dict) else {}
 
-                if last_payload.get("done") is True:
-                    return last_payload
+            if last_payload.get("done") is True:
+                return last_payload
 
-                if attempt < max_attempts:
-                    await asyncio.sleep(retry_delay_seconds)
+            if attempt < max_attempts:
+                await asyncio.sleep(retry_delay_seconds)
 
         return last_payload
 
@@ -974,8 +988,8 @@ class GeminiCLIService:
         headers = {"Authorization": f"Bearer {access_token}"}
 
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                resp = await client.get(url, headers=headers)
+            client = get_http_client(UPSTREAM_GOOGLE_OAUTH)
+            resp = await client.get(url, headers=headers, timeout=60.0)
         except Exception:
             return False
 
@@ -1010,8 +1024,8 @@ class GeminiCLIService:
         headers = {"Authorization": f"Bearer {access_token}"}
 
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                resp = await client.post(url, headers=headers)
+            client = get_http_client(UPSTREAM_GOOGLE_OAUTH)
+            resp = await client.post(url, headers=headers, timeout=60.0)
         except Exception as e:
             logger.warning("enable Cloud AI API failed: project=%s error=%s", project_id, str(e))
             return False
@@ -1032,8 +1046,8 @@ class GeminiCLIService:
         headers = {"Authorization": f"Bearer {access_token}"}
 
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                resp = await client.get(url, headers=headers)
+            client = get_http_client(UPSTREAM_GOOGLE_OAUTH)
+            resp = await client.get(url, headers=headers, timeout=60.0)
         except Exception as e:
             logger.warning("fetch gcp projects failed: %s", str(e))
             return []
@@ -1080,23 +1094,44 @@ class GeminiCLIService:
         return project_ids[0] if project_ids else None
 
     def _load_account_credentials(self, account: Any) -> Dict[str, Any]:
-        """加载账号凭证（解密）"""
-        decrypted = decrypt_secret(account.credentials)
-        try:
-            obj = json.loads(decrypted)
-        except Exception:
-            obj = {}
-        return obj if isinstance(obj, dict) else {}
+        """加载账号凭证（解密；按密文缓存解密结果，刷新后密文变化自然不再命中）"""
+        return get_credentials_cache().load(account.credentials, _decrypt_credentials)
 
     async def _try_refresh_account(
         self,
         account: Any,
         creds: Dict[str, Any],
     ) -> bool:
-        """尝试刷新 access_token"""
+        """
+        尝试刷新 access_token
+
+        同一账号的并发刷新合并为一次（进程内单飞 + Redis 锁，见 app/cache/token_refresh_lock.py），
+        等待者复用同一刷新结果，并同步到自己会话里的账号实例上。
+        """
+        values = await get_token_refresh_coordinator().run(
+            f"gemini-cli:{account.id}",
+            lambda lease: self._refresh_account_tokens(account, creds, lease),
+        )
+        if not values:
+            return False
+        apply_refreshed_columns(account, values)
+        return True
+
+    async def _refresh_account_tokens(
+        self,
+        account: Any,
+        creds: Dict[str, Any],
+        lease: RefreshLease,
+    ) -> Optional[Dict[str, Any]]:
+        """持锁执行一次刷新，返回已提交的凭证相关列；刷新失败返回 None"""
+        # 其他 worker 可能刚刷新过（本会话里的账号实例是旧的）：库中凭证已变化则直接使用
+        current = await self.repo.get_token_state(account.id, account.user_id)
+        if current is not None and current.credentials != account.credentials:
+            return dict(current._mapping)
+
         refresh_token = creds.get("refresh_token", "").strip()
         if not refresh_token:
-            return False
+            return None
 
         try:
             form = {
@@ -1106,22 +1141,23 @@ class GeminiCLIService:
                 "grant_type": "refresh_token",
             }
 
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                resp = await client.post(
-                    GOOGLE_TOKEN_URL,
-                    data=form,
-                    headers={
-                        "Content-Type": "application/x-www-form-urlencoded",
-                        "Accept": "application/json",
-                    },
-                )
+            client = get_http_client(UPSTREAM_GOOGLE_OAUTH)
+            resp = await client.post(
+                GOOGLE_TOKEN_URL,
+                data=form,
+                headers={
+                    "Content-Type": "application/x-www-form-urlencoded",
+                    "Accept": "application/json",
+                },
+                timeout=30.0,
+            )
 
             if resp.status_code != 200:
-                return False
+                return None
 
             data = resp.json()
             if "error" in data:
-                return False
+                return None
 
             now = _now_utc()
             expires_in = int(data.get("expires_in") or 3600)
@@ -1142,16 +1178,32 @@ class GeminiCLIService:
                 json.dumps(storage_payload, ensure_ascii=False)
             )
 
-            await self.repo.update_credentials_and_profile(
+            values: Dict[str, Any] = {
+                "credentials": encrypted_credentials,
+                "token_expires_at": expires_at,
+                "last_refresh_at": now,
+            }
+
+            # 以刷新前的凭证为条件写库：锁中途过期、其他 worker 已写入新凭证时不覆盖，以库中结果为准
+            if not await self.repo.update_credentials_if_unchanged(
                 account.id,
                 account.user_id,
-                credentials=encrypted_credentials,
-                token_expires_at=expires_at,
-                last_refresh_at=now,
-            )
-            await self.db.flush()
+                account.credentials,
+                **values,
+            ):
+                logger.warning(
+                    "refresh gemini_cli token: credentials changed concurrently, using stored result: "
+                    "account_id=%s fence=%s",
+                    account.id,
+                    lease.fence,
+                )
+                current = await self.repo.get_token_state(account.id, account.user_id)
+                if current is not None and current.credentials != account.credentials:
+                    return dict(current._mapping)
+                return None
+
             await self.db.commit()
-            return True
+            return values
 
         except Exception as e:
             logger.warning(
@@ -1159,7 +1211,7 @@ class GeminiCLIService:
                 account.id,
                 str(e),
             )
-            return False
+            return None
 
     async def get_valid_access_token(
         self,
@@ -1213,6 +1265,35 @@ class GeminiCLIService:
 
         return access_token
 
+    async def refresh_account_token_if_expiring(
+        self,
+        user_id: int,
+        account_id: int,
+        *,
+        within_seconds: float,
+    ) -> Optional[bool]:
+        """
+        后台预刷新：token 将在 within_seconds 秒内过期时刷新，并预热新凭证的解密缓存
+
+        Returns:
+            None=无需刷新（账号不存在 / 已禁用 / 已被其他 worker 刷新），True=已刷新，False=刷新失败
+        """
+        account = await self.repo.get_by_id_and_user_id(account_id, user_id)
+        if account is None or int(getattr(account, "status", 0) or 0) != 1:
+            return None
+        expires_at = getattr(account, "token_expires_at", None)
+        if isinstance(expires_at, datetime):
+            if expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
+            if expires_at > _now_utc() + timedelta(seconds=within_seconds):
+                return None
+
+        creds = self._load_account_credentials(account)
+        if not await self._try_refresh_account(account, creds):
+            return False
+        self._load_account_credentials(account)
+        return True
+
     async def get_account_quota(
         self,
         user_id: int,
@@ -1250,8 +1331,8 @@ class GeminiCLIService:
                 "Client-Metadata": DEFAULT_CLIENT_METADATA,
             }
             body = {"project": project_id_used}
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                return await client.post(url, json=body, headers=headers)
+            client = get_http_client(UPSTREAM_CLOUDCODE)
+            return await client.post(url, json=body, headers=headers, timeout=30.0)
 
         resp: Optional[httpx.Response] = None
         try:
@@ -10,14 +10,57 @@ from __future__ import annotations
 
 import logging
 import uuid
-from typing import Any, Dict, List, Optional, Tuple
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
 
+from app.cache.kiro_history_cache import get_kiro_history_cache
 from app.schemas.anthropic import AnthropicMessagesRequest
 from app.utils.kiro_converters import generate_thinking_hint, inject_thinking_hint, is_thinking_enabled
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class _HistoryState:
+    """
+    已转换的 history 及其 tool_use/tool_result 配对状态
+
+    配对过滤是从前往后的单遍扫描，某条 history 的结果只取决于它之前的条目，
+    因此同一会话的下一轮可以在此基础上只处理新增的消息（见 KiroHistoryCache）。
+    """
+
+    model_id: str
+    header: List[Dict[str, Any]]
+    # 原始消息快照（role + content 的浅拷贝），用于逐条校验下一轮的前缀是否一致
+    snapshots: List[Any] = field(default_factory=list)
+    # 与 snapshots 一一对应的已转换、已配对过滤的 history 条目
+    entries: List[Dict[str, Any]] = field(default_factory=list)
+    tool_use_ids: Set[str] = field(default_factory=set)
+    unpaired_tool_use_ids: Set[str] = field(default_factory=set)
+    tool_result_ids: Set[str] = field(default_factory=set)
+    tool_names: List[str] = field(default_factory=list)
+
+
+def _snapshot_message(msg: Any) -> Tuple[Any, Any]:
+    content = getattr(msg, "content", None)
+    if isinstance(content, list):
+        content = [dict(block) if isinstance(block, dict) else dict(vars(block)) for block in content]
+    return getattr(msg, "role", None), content
+
+
+def _message_matches(msg: Any, snapshot: Tuple[Any, Any]) -> bool:
+    """原地比较消息与快照（不复制，避免每轮为整个前缀分配新对象）"""
+    role, content = snapshot
+    if getattr(msg, "role", None) != role:
+        return False
+    current = getattr(msg, "content", None)
+    if isinstance(current, list):
+        return isinstance(content, list) and [
+            block if isinstance(block, dict) else vars(block) for block in current
+        ] == content
+    return current == content
+
+
 class KiroAnthropicConverter:
     """
     Anthropic Messages API -> Kiro(CodeWhisperer) generateAssistantResponse 请求体转换。
@@ -51,39 +94,26 @@ class KiroAnthropicConverter:
         model_id = cls._map_model(request.model)
         thinking_cfg = getattr(request, "thinking", None)
 
-        conversation_id = cls._extract_session_id(getattr(getattr(request, "metadata", None), "user_id", None)) or str(
-            uuid.uuid4()
-        )
+        session_id = cls._extract_session_id(getattr(getattr(request, "metadata", None), "user_id", None))
+        conversation_id = session_id or str(uuid.uuid4())
         agent_continuation_id = str(uuid.uuid4())
 
         # 1) tools 定义（来自当前请求）
         tools = cls._convert_tools(getattr(request, "tools", None))
 
-        # 2) history（系统消息 + 除最后一条消息外的历史）
-        history: List[Dict[str, Any]] = []
-        cls._append_system_history(history, request, model_id, thinking_cfg)
-
-        # messages 的最后一条作为 currentMessage，前面的都进入 history
-        for msg in request.messages[:-1]:
-            if getattr(msg, "role", None) == "user":
-                history.append(cls._convert_user_history_message(msg, model_id))
-            else:
-                history.append(cls._convert_assistant_history_message(msg))
-
-        # Kiro 对 tool_use/tool_result 的配对非常严格：history 里如果出现孤立/重复的 tool_result，会直接 400。
-        # 参考 kiro.rs：对 tool_result 做配对过滤；但我们额外把“被过滤掉的 tool_result 内容”降级为纯文本，避免信息丢失。
-        cls._sanitize_history_tool_pairing(history)
+        # 2) history（系统消息 + 除最后一条消息外的历史，已做 tool_use/tool_result 配对过滤）
+        state = cls._build_history(request, model_id, thinking_cfg, session_id)
+        history = state.header + state.entries
 
         # 3) Kiro 约束兜底：history 里出现过的工具名，必须在 currentMessage.tools 有定义
-        history_tool_names = cls._collect_history_tool_names(history)
-        cls._ensure_tool_definitions(tools, history_tool_names)
+        cls._ensure_tool_definitions(tools, state.tool_names)
 
         # 4) currentMessage（最后一条消息）
         last = request.messages[-1]
         current_text, current_images, current_tool_results = cls._process_user_content(getattr(last, "content", None))
 
         # 5) 过滤 tool_use/tool_result 的配对，避免孤立/重复导致 Kiro 400
-        validated_tool_results = cls._validate_tool_pairing(history, current_tool_results)
+        validated_tool_results = cls._validate_tool_pairing(state, current_tool_results)
 
         # 如果 tool_result 被过滤（孤立/重复），把它的内容降级拼到用户文本里，避免 currentMessage 变成空内容。
         current_text = cls._append_orphan_tool_result_text(current_text, current_tool_results, validated_tool_results)
@@ -126,6 +156,54 @@ class KiroAnthropicConverter:
             "conversationState": conversation_state,
         }
 
+    @classmethod
+    def _build_history(
+        cls,
+        request: AnthropicMessagesRequest,
+        model_id: str,
+        thinking_cfg: Any,
+        session_id: Optional[str],
+    ) -> _HistoryState:
+        """
+        转换 history；带会话 ID 时复用上一轮已转换的前缀，只转换新增的消息
+
+        前缀按消息快照逐条比较（而不是哈希）：比较只是 C 层的 dict/str 相等判断，
+        比重新序列化并哈希全部历史便宜得多，也不存在碰撞。
+        """
+        header: List[Dict[str, Any]] = []
+        cls._append_system_history(header, request, model_id, thinking_cfg)
+
+        # messages 的最后一条作为 currentMessage，前面的都进入 history
+        messages = request.messages[:-1]
+
+        cache = get_kiro_history_cache() if session_id else None
+        state = cache.get(session_id) if cache is not None else None
+        reused = len(state.snapshots) if state is not None else 0
+        if (
+            state is None
+            or state.model_id != model_id
+            or state.header != header
+            or reused > len(messages)
+            or not all(map(_message_matches, messages, state.snapshots))
+        ):
+            state = _HistoryState(model_id=model_id, header=header)
+            for entry in header:
+                cls._sanitize_history_entry(state, entry)
+            reused = 0
+
+        for msg in messages[reused:]:
+            if getattr(msg, "role", None) == "user":
+                entry = cls._convert_user_history_message(msg, model_id)
+            else:
+                entry = cls._convert_assistant_history_message(msg)
+            cls._sanitize_history_entry(state, entry)
+            state.snapshots.append(_snapshot_message(msg))
+            state.entries.append(entry)
+
+        if cache is not None:
+            cache.put(session_id, state, reused=reused, converted=len(messages) - reused)
+        return state
+
     @classmethod
     def _map_model(cls, model: str) -> str:
         m = str(model or "").strip()
@@ -273,26 +351,6 @@ class KiroAnthropicConverter:
             }
         }
 
-    @classmethod
-    def _collect_history_tool_names(cls, history: List[Dict[str, Any]]) -> List[str]:
-        names: List[str] = []
-        for entry in history:
-            assistant = entry.get("assistantResponseMessage")
-            if not isinstance(assistant, dict):
-                continue
-            tool_uses = assistant.get("toolUses")
-            if not isinstance(tool_uses, list):
-                continue
-            for tu in tool_uses:
-                if not isinstance(tu, dict):
-                    continue
-                name = tu.get("name")
-                if not isinstance(name, str) or not name.strip():
-                    continue
-                if name not in names:
-                    names.append(name)
-        return names
-
     @classmethod
     def _ensure_tool_definitions(cls, tools: List[Dict[str, Any]], history_tool_names: List[str]) -> None:
         existing = {str(t.get("toolSpecification", {}).get("name", "")).lower() for t in tools if isinstance(t, dict)}
@@ -450,77 +508,79 @@ class KiroAnthropicConverter:
         return str(content).strip()
 
     @classmethod
-    def _sanitize_history_tool_pairing(cls, history: List[Dict[str, Any]]) -> None:
+    def _sanitize_history_entry(cls, state: _HistoryState, entry: Dict[str, Any]) -> None:
         """
-        对 history 中的 userInputMessageContext.toolResults 做严格配对过滤：
+        Kiro 对 tool_use/tool_result 的配对非常严格：history 里如果出现孤立/重复的 tool_result，会直接 400。
+        参考 kiro.rs，按顺序对 history 中的 userInputMessageContext.toolResults 做严格配对过滤：
         - 仅保留能匹配到「此前出现过且尚未配对」的 assistant.toolUses 的 tool_result
         - 被过滤掉的 tool_result 内容降级拼到 userInputMessage.content，避免丢信息 & 避免空消息触发上游 400
+        同时记录 history 中出现过的工具名（必须在 currentMessage.tools 中有定义）。
         """
-        unpaired_tool_use_ids: set[str] = set()
-        all_tool_use_ids: set[str] = set()
-
-        for entry in history:
-            assistant = entry.get("assistantResponseMessage")
-            if isinstance(assistant, dict):
-                tool_uses = assistant.get("toolUses")
-                if isinstance(tool_uses, list):
-                    for tu in tool_uses:
-                        if not isinstance(tu, dict):
-                            continue
-                        tid = tu.get("toolUseId")
-                        if isinstance(tid, str) and tid:
-                            all_tool_use_ids.add(tid)
-                            unpaired_tool_use_ids.add(tid)
-
-            user = entry.get("userInputMessage")
-            if not isinstance(user, dict):
-                continue
-
-            ctx = user.get("userInputMessageContext")
-            if not isinstance(ctx, dict):
-                continue
-
-            results = ctx.get("toolResults")
-            if not isinstance(results, list) or not results:
-                continue
+        assistant = entry.get("assistantResponseMessage")
+        if isinstance(assistant, dict):
+            tool_uses = assistant.get("toolUses")
+            if isinstance(tool_uses, list):
+                for tu in tool_uses:
+                    if not isinstance(tu, dict):
+                        continue
+                    tid = tu.get("toolUseId")
+                    if isinstance(tid, str) and tid:
+                        state.tool_use_ids.add(tid)
+                        state.unpaired_tool_use_ids.add(tid)
+                    name = tu.get("name")
+                    if isinstance(name, str) and name.strip() and name not in state.tool_names:
+                        state.tool_names.append(name)
+
+        user = entry.get("userInputMessage")
+        if not isinstance(user, dict):
+            return
 
-            kept: List[Dict[str, Any]] = []
-            degraded_texts: List[str] = []
+        ctx = user.get("userInputMessageContext")
+        if not isinstance(ctx, dict):
+            return
 
-            for r in results:
-                if not isinstance(r, dict):
-                    continue
-                tid = r.get("toolUseId")
-                if not isinstance(tid, str) or not tid:
-                    continue
+        results = ctx.get("toolResults")
+        if not isinstance(results, list) or not results:
+            return
 
-                if tid in unpaired_tool_use_ids:
-                    kept.append(r)
-                    unpaired_tool_use_ids.remove(tid)
-                    continue
+        kept: List[Dict[str, Any]] = []
+        degraded_texts: List[str] = []
 
-                if tid in all_tool_use_ids:
-                    logger.warning("跳过重复的 tool_result：toolUseId=%s", tid)
-                else:
-                    logger.warning("跳过孤立的 tool_result（找不到对应 tool_use）：toolUseId=%s", tid)
+        for r in results:
+            if not isinstance(r, dict):
+                continue
+            tid = r.get("toolUseId")
+            if not isinstance(tid, str) or not tid:
+                continue
 
-                text = cls._tool_result_to_text(r)
-                if text:
-                    degraded_texts.append(text)
+            if tid in state.unpaired_tool_use_ids:
+                kept.append(r)
+                state.unpaired_tool_use_ids.remove(tid)
+                state.tool_result_ids.add(tid)
+                continue
 
-            if kept:
-                ctx["toolResults"] = kept
+            if tid in state.tool_use_ids:
+                logger.warning("跳过重复的 tool_result：toolUseId=%s", tid)
             else:
-                ctx.pop("toolResults", None)
+                logger.warning("跳过孤立的 tool_result（找不到对应 tool_use）：toolUseId=%s", tid)
 
-            if degraded_texts:
-                extra = "\n".join(degraded_texts).strip()
-                if extra:
-                    original = user.get("content")
-                    if isinstance(original, str) and original.strip():
-                        user["content"] = f"{original}\n{extra}"
-                    else:
-                        user["content"] = extra
+            text = cls._tool_result_to_text(r)
+            if text:
+                degraded_texts.append(text)
+
+        if kept:
+            ctx["toolResults"] = kept
+        else:
+            ctx.pop("toolResults", None)
+
+        if degraded_texts:
+            extra = "\n".join(degraded_texts).strip()
+            if extra:
+                original = user.get("content")
+                if isinstance(original, str) and original.strip():
+                    user["content"] = f"{original}\n{extra}"
+                else:
+                    user["content"] = extra
 
     @classmethod
     def _append_orphan_tool_result_text(
@@ -563,36 +623,11 @@ class KiroAnthropicConverter:
 
     @classmethod
     def _validate_tool_pairing(
-        cls, history: List[Dict[str, Any]], tool_results: List[Dict[str, Any]]
+        cls, state: _HistoryState, tool_results: List[Dict[str, Any]]
     ) -> List[Dict[str, Any]]:
-        # 1) 收集 history 中的所有 toolUseId（来自 assistant.toolUses）
-        all_tool_use_ids = set()
-        history_tool_result_ids = set()
-
-        for entry in history:
-            assistant = entry.get("assistantResponseMessage")
-            if isinstance(assistant, dict):
-                tool_uses = assistant.get("toolUses")
-                if isinstance(tool_uses, list):
-                    for tu in tool_uses:
-                        if isinstance(tu, dict):
-                            tid = tu.get("toolUseId")
-                            if isinstance(tid, str) and tid:
-                                all_tool_use_ids.add(tid)
-
-            user = entry.get("userInputMessage")
-            if isinstance(user, dict):
-                ctx = user.get("userInputMessageContext")
-                if isinstance(ctx, dict):
-                    results = ctx.get("toolResults")
-                    if isinstance(results, list):
-                        for r in results:
-                            if isinstance(r, dict):
-                                tid = r.get("toolUseId")
-                                if isinstance(tid, str) and tid:
-                                    history_tool_result_ids.add(tid)
-
-        unpaired = set(all_tool_use_ids) - set(history_tool_result_ids)
+        # 1) history 中尚未配对的 toolUseId（配对状态已在转换 history 时累计）
+        all_tool_use_ids = state.tool_use_ids
+        unpaired = all_tool_use_ids - state.tool_result_ids
 
         # 2) 过滤当前 toolResults：只保留未配对的
         filtered: List[Dict[str, Any]] = []
@@ -14,6 +14,12 @@ import json
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import get_settings
+from app.core.http_client import (
+    UPSTREAM_PLUGIN,
+    UPSTREAM_POOL_EXHAUSTED_MESSAGE,
+    get_http_client,
+    request_timeout,
+)
 from app.repositories.plugin_api_key_repository import PluginAPIKeyRepository
 from app.utils.encryption import decrypt_api_key
 from app.cache import get_redis_client, RedisClient
@@ -185,39 +191,46 @@ class KiroService:
         url = f"{self.base_url}{path}"
         headers = {"Authorization": f"Bearer {api_key}"}
         
-        async with httpx.AsyncClient() as client:
+        client = get_http_client(UPSTREAM_PLUGIN)
+        try:
             response = await client.request(
                 method=method,
                 url=url,
                 json=json_data,
                 params=params,
                 headers=headers,
-                timeout=1200.0
+                timeout=request_timeout(UPSTREAM_PLUGIN, 1200.0)
+            )
+        except httpx.PoolTimeout:
+            raise UpstreamAPIError(
+                status_code=503,
+                message=UPSTREAM_POOL_EXHAUSTED_MESSAGE,
+                upstream_response={"detail": UPSTREAM_POOL_EXHAUSTED_MESSAGE}
             )
             
-            if response.status_code >= 400:
-                # 尝试解析上游错误响应
-                upstream_response = None
+        if response.status_code >= 400:
+            # 尝试解析上游错误响应
+            upstream_response = None
+            try:
+                upstream_response = response.json()
+            except Exception:
                 try:
-                    upstream_response = response.json()
+                    upstream_response = {"raw": response.text}
                 except Exception:
-                    try:
-                        upstream_response = {"raw": response.text}
-                    except Exception:
-                        pass
+                    pass
                 
-                logger.warning(
-                    f"上游API错误: status={response.status_code}, "
-                    f"url={url}, response={upstream_response}"
-                )
+            logger.warning(
+                f"上游API错误: status={response.status_code}, "
+                f"url={url}, response={upstream_response}"
+            )
                 
-                raise UpstreamAPIError(
-                    status_code=response.status_code,
-                    message=f"上游API返回错误: {response.status_code}",
-                    upstream_response=upstream_response
-                )
+            raise UpstreamAPIError(
+                status_code=response.status_code,
+                message=f"上游API返回错误: {response.status_code}",
+                upstream_response=upstream_response
+            )
             
-            return response.json()
+        return response.json()
     
     async def _proxy_admin_request(
         self,
@@ -237,37 +250,37 @@ class KiroService:
         url = f"{self.base_url}{path}"
         headers = {"Authorization": f"Bearer {self.admin_key}"}
 
-        async with httpx.AsyncClient() as client:
-            response = await client.request(
-                method=method,
-                url=url,
-                json=json_data,
-                params=params,
-                headers=headers,
-                timeout=1200.0,
-            )
+        client = get_http_client(UPSTREAM_PLUGIN)
+        response = await client.request(
+            method=method,
+            url=url,
+            json=json_data,
+            params=params,
+            headers=headers,
+            timeout=request_timeout(UPSTREAM_PLUGIN, 1200.0),
+        )
 
-            if response.status_code >= 400:
-                upstream_response = None
+        if response.status_code >= 400:
+            upstream_response = None
+            try:
+                upstream_response = response.json()
+            except Exception:
                 try:
-                    upstream_response = response.json()
+                    upstream_response = {"raw": response.text}
                 except Exception:
-                    try:
-                        upstream_response = {"raw": response.text}
-                    except Exception:
-                        pass
+                    pass
 
-                logger.warning(
-                    f"plug-in admin API错误: status={response.status_code}, url={url}, response={upstream_response}"
-                )
+            logger.warning(
+                f"plug-in admin API错误: status={response.status_code}, url={url}, response={upstream_response}"
+            )
 
-                raise UpstreamAPIError(
-                    status_code=response.status_code,
-                    message=f"plug-in admin API返回错误: {response.status_code}",
-                    upstream_response=upstream_response,
-                )
+            raise UpstreamAPIError(
+                status_code=response.status_code,
+                message=f"plug-in admin API返回错误: {response.status_code}",
+                upstream_response=upstream_response,
+            )
 
-            return response.json()
+        return response.json()
 
     async def _proxy_stream_request(
         self,
@@ -301,13 +314,14 @@ class KiroService:
         if api_key_id is not None:
             headers["X-Api-Key-Id"] = str(api_key_id)
 
-        async with httpx.AsyncClient() as client:
+        client = get_http_client(UPSTREAM_PLUGIN)
+        try:
             async with client.stream(
                 method=method,
                 url=url,
                 json=json_data,
                 headers=headers,
-                timeout=httpx.Timeout(1200.0, connect=60.0)
+                timeout=request_timeout(UPSTREAM_PLUGIN, 1200.0, connect=60.0)
             ) as response:
                 if response.status_code >= 400:
                     # 读取错误响应体
@@ -335,6 +349,12 @@ class KiroService:
                 async for chunk in response.aiter_raw():
                     if chunk:
                         yield chunk
+        except httpx.PoolTimeout:
+            raise UpstreamAPIError(
+                status_code=503,
+                message=UPSTREAM_POOL_EXHAUSTED_MESSAGE,
+                upstream_response={"detail": UPSTREAM_POOL_EXHAUSTED_MESSAGE}
+            )
     
     #==================== Kiro账号管理 ====================
     
@@ -373,12 +393,12 @@ class KiroService:
         """
         url = f"{self.base_url}/api/kiro/oauth/callback"
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                url=url,
-                json={"callback_url": callback_url},
-                timeout=1200.0,
-            )
+        client = get_http_client(UPSTREAM_PLUGIN)
+        response = await client.post(
+            url=url,
+            json={"callback_url": callback_url},
+            timeout=request_timeout(UPSTREAM_PLUGIN, 1200.0),
+        )
 
         if response.status_code >= 400:
             upstream_response = None
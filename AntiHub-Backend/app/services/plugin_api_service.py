@@ -6,16 +6,23 @@ Plug-in API服务
 - 添加 Redis 缓存以减少数据库查询
 - plugin_api_key 缓存 TTL 为 60 秒
 """
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 import httpx
 import logging
-import asyncio
 import json
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.circuit_breaker import CircuitBreaker, CircuitKey, CircuitPermitGroup, circuit_key, get_circuit_breaker
 from app.core.config import get_settings
+from app.core.http_client import (
+    UPSTREAM_PLUGIN,
+    UPSTREAM_POOL_EXHAUSTED_MESSAGE,
+    get_http_client,
+    request_timeout,
+)
 from app.repositories.plugin_api_key_repository import PluginAPIKeyRepository
 from app.utils.encryption import encrypt_api_key, decrypt_api_key
+from app.utils.keepalive import with_keepalive
 from app.schemas.plugin_api import (
     PluginAPIKeyCreate,
     PluginAPIKeyResponse,
@@ -28,6 +35,13 @@ logger = logging.getLogger(__name__)
 # 缓存 TTL（秒）
 PLUGIN_API_KEY_CACHE_TTL = 60
 
+# 经过熔断器的推理接口；账号管理 / 配额 / 模型列表等接口不受熔断影响
+_INFERENCE_PATH_SUFFIXES = ("/chat/completions", ":generateContent", ":streamGenerateContent")
+
+
+def _is_inference_path(path: str) -> bool:
+    return path.split("?", 1)[0].endswith(_INFERENCE_PATH_SUFFIXES)
+
 
 class PluginAPIService:
     """Plug-in API服务类"""
@@ -46,6 +60,7 @@ class PluginAPIService:
         self.base_url = self.settings.plugin_api_base_url
         self.admin_key = self.settings.plugin_api_admin_key
         self._redis = redis
+        self._circuit_breaker: Optional[CircuitBreaker] = None
     
     @property
     def redis(self) -> RedisClient:
@@ -53,6 +68,53 @@ class PluginAPIService:
         if self._redis is None:
             self._redis = get_redis_client()
         return self._redis
+
+    @property
+    def circuit_breaker(self) -> CircuitBreaker:
+        """plug-in API 推理请求的熔断器（见 app.core.circuit_breaker）"""
+        if self._circuit_breaker is None:
+            self._circuit_breaker = get_circuit_breaker()
+        return self._circuit_breaker
+
+    def _circuit_keys(self, user_id: int) -> Tuple[CircuitKey, CircuitKey]:
+        return circuit_key("plugin", self.base_url), circuit_key("plugin", f"user:{user_id}")
+
+    def _acquire_circuit(self, user_id: int, path: str) -> Optional[CircuitPermitGroup]:
+        """
+        推理请求的熔断检查，熔断中时返回 None（调用方直接返回 503，不再请求上游）
+
+        - 共享的 base_url：所有用户共用，只计网络层错误（plug-in API 不可达）
+        - 用户：按 user_id 统计 5xx / 网络错误 / 慢首字节，个别用户的账号出错只影响该用户
+        非推理接口不经过熔断，返回空的 CircuitPermitGroup。
+        """
+        if not _is_inference_path(path):
+            return CircuitPermitGroup()
+        upstream_key, user_key = self._circuit_keys(user_id)
+        upstream = self.circuit_breaker.try_acquire(upstream_key, transport_only=True)
+        if upstream is None:
+            return None
+        user = self.circuit_breaker.try_acquire(user_key)
+        if user is None:
+            # 没有结果：释放共享上游可能占用的半开探测名额
+            upstream.finish()
+            return None
+        return CircuitPermitGroup(upstream, user)
+
+    def _circuit_open_message(self, user_id: int) -> str:
+        retry_after = max(self.circuit_breaker.retry_after(key) for key in self._circuit_keys(user_id))
+        return f"plug-in API 上游持续出错（熔断中），请约 {max(1, int(retry_after))} 秒后重试"
+
+    @staticmethod
+    def _unavailable_error(method: str, url: str, message: str) -> httpx.HTTPStatusError:
+        """构造 503 错误（熔断中 / 连接池已满），与上游错误一样携带 response_data"""
+        request = httpx.Request(method, url)
+        error = httpx.HTTPStatusError(
+            message=message,
+            request=request,
+            response=httpx.Response(503, json={"detail": message}, request=request)
+        )
+        error.response_data = {"detail": message}
+        return error
     
     def _get_cache_key(self, user_id: int) -> str:
         """生成缓存键"""
@@ -231,21 +293,21 @@ class PluginAPIService:
         print(f"   Headers: {headers}")
         print(f"   Payload: {payload}")
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                url,
-                json=payload,
-                headers=headers,
-                timeout=30.0
-            )
+        client = get_http_client(UPSTREAM_PLUGIN)
+        response = await client.post(
+            url,
+            json=payload,
+            headers=headers,
+            timeout=30.0
+        )
             
-            # 打印响应详情
-            print(f"📥 收到plug-in-api响应:")
-            print(f"   Status: {response.status_code}")
-            print(f"   Response: {response.text}")
+        # 打印响应详情
+        print(f"📥 收到plug-in-api响应:")
+        print(f"   Status: {response.status_code}")
+        print(f"   Response: {response.text}")
             
-            response.raise_for_status()
-            return response.json()
+        response.raise_for_status()
+        return response.json()
     
     async def auto_create_and_bind_plugin_user(
         self,
@@ -328,35 +390,44 @@ class PluginAPIService:
         if extra_headers:
             headers.update(extra_headers)
         
-        async with httpx.AsyncClient() as client:
-            response = await client.request(
-                method=method,
-                url=url,
-                json=json_data,
-                params=params,
-                headers=headers,
-                timeout=1200.0
-            )
+        permit = self._acquire_circuit(user_id, path)
+        if permit is None:
+            raise self._unavailable_error(method, url, self._circuit_open_message(user_id))
+
+        client = get_http_client(UPSTREAM_PLUGIN)
+        try:
+            with permit:
+                response = await client.request(
+                    method=method,
+                    url=url,
+                    json=json_data,
+                    params=params,
+                    headers=headers,
+                    timeout=request_timeout(UPSTREAM_PLUGIN, 1200.0)
+                )
+                permit.observe_status(response.status_code, timed=False)
+        except httpx.PoolTimeout:
+            raise self._unavailable_error(method, url, UPSTREAM_POOL_EXHAUSTED_MESSAGE)
             
-            # 如果响应不是成功状态码，抛出包含响应内容的异常
-            if response.status_code >= 400:
-                # 尝试解析JSON响应
-                try:
-                    error_data = response.json()
-                except Exception:
-                    error_data = {"detail": response.text}
+        # 如果响应不是成功状态码，抛出包含响应内容的异常
+        if response.status_code >= 400:
+            # 尝试解析JSON响应
+            try:
+                error_data = response.json()
+            except Exception:
+                error_data = {"detail": response.text}
                 
-                # 创建HTTPStatusError并附加响应数据
-                error = httpx.HTTPStatusError(
-                    message=f"上游API返回错误: {response.status_code}",
-                    request=response.request,
-                    response=response
-                )
-                # 将错误数据附加到异常对象
-                error.response_data = error_data
-                raise error
+            # 创建HTTPStatusError并附加响应数据
+            error = httpx.HTTPStatusError(
+                message=f"上游API返回错误: {response.status_code}",
+                request=response.request,
+                response=response
+            )
+            # 将错误数据附加到异常对象
+            error.response_data = error_data
+            raise error
             
-            return response.json()
+        return response.json()
     
     async def proxy_stream_request(
         self,
@@ -395,66 +466,90 @@ class PluginAPIService:
         if extra_headers:
             headers.update(extra_headers)
         
-        async with httpx.AsyncClient() as client:
-            async with client.stream(
-                method=method,
-                url=url,
-                json=json_data,
-                headers=headers,
-                timeout=httpx.Timeout(1200.0, connect=60.0)
-            ) as response:
-                # 检查响应状态码，如果是错误状态码，读取错误内容并生成SSE格式的错误消息
-                if response.status_code >= 400:
-                    # 读取错误响应内容
-                    error_content = await response.aread()
-                    try:
-                        import json
-                        error_data = json.loads(error_content.decode('utf-8'))
-                    except Exception:
-                        error_data = {"detail": error_content.decode('utf-8', errors='replace')}
+        permit = self._acquire_circuit(user_id, path)
+        if permit is None:
+            error_response = {
+                "error": {
+                    "message": self._circuit_open_message(user_id),
+                    "type": "upstream_error",
+                    "code": 503
+                }
+            }
+            yield f"data: {json.dumps(error_response)}\n\n".encode('utf-8')
+            yield b"data: [DONE]\n\n"
+            return
+
+        client = get_http_client(UPSTREAM_PLUGIN)
+        try:
+            with permit:
+                async with client.stream(
+                    method=method,
+                    url=url,
+                    json=json_data,
+                    headers=headers,
+                    timeout=request_timeout(UPSTREAM_PLUGIN, 1200.0, connect=60.0)
+                ) as response:
+                    permit.observe_status(response.status_code)
+                    # 检查响应状态码，如果是错误状态码，读取错误内容并生成SSE格式的错误消息
+                    if response.status_code >= 400:
+                        # 读取错误响应内容
+                        error_content = await response.aread()
+                        try:
+                            error_data = json.loads(error_content.decode('utf-8'))
+                        except Exception:
+                            error_data = {"detail": error_content.decode('utf-8', errors='replace')}
                     
-                    # 记录错误日志
-                    logger.error(f"上游API返回错误: status={response.status_code}, url={url}, error={error_data}")
+                        # 记录错误日志
+                        logger.error(f"上游API返回错误: status={response.status_code}, url={url}, error={error_data}")
                     
-                    # 提取错误消息，处理多种格式
-                    error_message = None
-                    if isinstance(error_data, dict):
-                        # 尝试获取 detail 字段
-                        if "detail" in error_data:
-                            error_message = error_data["detail"]
-                        # 尝试获取 error 字段（可能是字符串或字典）
-                        elif "error" in error_data:
-                            error_field = error_data["error"]
-                            if isinstance(error_field, str):
-                                error_message = error_field
-                            elif isinstance(error_field, dict):
-                                error_message = error_field.get("message") or str(error_field)
-                            else:
-                                error_message = str(error_field)
-                        # 尝试获取 message 字段
-                        elif "message" in error_data:
-                            error_message = error_data["message"]
+                        # 提取错误消息，处理多种格式
+                        error_message = None
+                        if isinstance(error_data, dict):
+                            # 尝试获取 detail 字段
+                            if "detail" in error_data:
+                                error_message = error_data["detail"]
+                            # 尝试获取 error 字段（可能是字符串或字典）
+                            elif "error" in error_data:
+                                error_field = error_data["error"]
+                                if isinstance(error_field, str):
+                                    error_message = error_field
+                                elif isinstance(error_field, dict):
+                                    error_message = error_field.get("message") or str(error_field)
+                                else:
+                                    error_message = str(error_field)
+                            # 尝试获取 message 字段
+                            elif "message" in error_data:
+                                error_message = error_data["message"]
                     
-                    # 如果还是没有提取到消息，使用整个 error_data 的字符串表示
-                    if not error_message:
-                        error_message = str(error_data)
+                        # 如果还是没有提取到消息，使用整个 error_data 的字符串表示
+                        if not error_message:
+                            error_message = str(error_data)
                     
-                    # 生成SSE格式的错误消息
-                    import json
-                    error_response = {
-                        "error": {
-                            "message": error_message,
-                            "type": "upstream_error",
-                            "code": response.status_code
+                        # 生成SSE格式的错误消息
+                        error_response = {
+                            "error": {
+                                "message": error_message,
+                                "type": "upstream_error",
+                                "code": response.status_code
+                            }
                         }
-                    }
-                    yield f"data: {json.dumps(error_response)}\n\n".encode('utf-8')
-                    yield b"data: [DONE]\n\n"
-                    return
+                        yield f"data: {json.dumps(error_response)}\n\n".encode('utf-8')
+                        yield b"data: [DONE]\n\n"
+                        return
                 
-                async for chunk in response.aiter_raw():
-                    if chunk:
-                        yield chunk
+                    async for chunk in response.aiter_raw():
+                        if chunk:
+                            yield chunk
+        except httpx.PoolTimeout:
+            error_response = {
+                "error": {
+                    "message": UPSTREAM_POOL_EXHAUSTED_MESSAGE,
+                    "type": "upstream_error",
+                    "code": 503
+                }
+            }
+            yield f"data: {json.dumps(error_response)}\n\n".encode('utf-8')
+            yield b"data: [DONE]\n\n"
     
     # ==================== 具体API方法 ====================
     
@@ -828,89 +923,90 @@ class PluginAPIService:
         
         # 心跳间隔（秒）
         heartbeat_interval = 20
-        
-        async def make_request():
-            """发起上游请求"""
-            async with httpx.AsyncClient() as client:
+        heartbeat_event = f"event: heartbeat\ndata: {json.dumps({'status': 'still generating'})}\n\n"
+
+        permit = self._acquire_circuit(user_id, path)
+        if permit is None:
+            error_response = {
+                "error": {
+                    "message": self._circuit_open_message(user_id),
+                    "type": "upstream_error",
+                    "code": 503
+                }
+            }
+            yield f"event: error\ndata: {json.dumps(error_response)}\n\n"
+            return
+
+        async def result_events():
+            """发起上游请求并产出结果事件（等待期间由 with_keepalive 注入心跳）"""
+            client = get_http_client(UPSTREAM_PLUGIN)
+            with permit:
                 response = await client.post(
                     url,
                     json=request_data,
                     headers=headers,
-                    timeout=httpx.Timeout(1200.0, connect=60.0)
+                    timeout=request_timeout(UPSTREAM_PLUGIN, 1200.0, connect=60.0)
                 )
-                return response
-        
-        # 创建上游请求任务
-        request_task = asyncio.create_task(make_request())
-        
-        try:
-            while True:
+                permit.observe_status(response.status_code, timed=False)
+
+            if response.status_code >= 400:
+                # 上游返回错误，转发错误
                 try:
-                    # 等待请求完成，最多等待 heartbeat_interval 秒
-                    response = await asyncio.wait_for(
-                        asyncio.shield(request_task),
-                        timeout=heartbeat_interval
-                    )
-                    
-                    # 请求完成，处理响应
-                    if response.status_code >= 400:
-                        # 上游返回错误，转发错误
-                        try:
-                            error_data = response.json()
-                        except Exception:
-                            error_data = {"detail": response.text}
-                        
-                        logger.error(f"上游API返回错误: status={response.status_code}, url={url}, error={error_data}")
-                        
-                        # 提取错误消息
-                        error_message = None
-                        if isinstance(error_data, dict):
-                            if "detail" in error_data:
-                                error_message = error_data["detail"]
-                            elif "error" in error_data:
-                                error_field = error_data["error"]
-                                if isinstance(error_field, str):
-                                    error_message = error_field
-                                elif isinstance(error_field, dict):
-                                    error_message = error_field.get("message") or str(error_field)
-                                else:
-                                    error_message = str(error_field)
-                            elif "message" in error_data:
-                                error_message = error_data["message"]
-                        
-                        if not error_message:
-                            error_message = str(error_data)
-                        
-                        error_response = {
-                            "error": {
-                                "message": error_message,
-                                "type": "upstream_error",
-                                "code": response.status_code
-                            }
-                        }
-                        yield f"event: error\ndata: {json.dumps(error_response)}\n\n"
-                    else:
-                        # 成功响应，发送结果
-                        result_data = response.json()
-                        yield f"event: result\ndata: {json.dumps(result_data)}\n\n"
-                    
-                    # 请求完成，退出循环
-                    break
-                    
-                except asyncio.TimeoutError:
-                    # 超时，发送心跳
-                    heartbeat_data = {"status": "still generating"}
-                    yield f"event: heartbeat\ndata: {json.dumps(heartbeat_data)}\n\n"
-                    # 继续等待
-                    
-        except asyncio.CancelledError:
-            # 客户端断开连接，取消上游请求
-            request_task.cancel()
-            try:
-                await request_task
-            except asyncio.CancelledError:
-                pass
-            raise
+                    error_data = response.json()
+                except Exception:
+                    error_data = {"detail": response.text}
+                
+                logger.error(f"上游API返回错误: status={response.status_code}, url={url}, error={error_data}")
+                
+                # 提取错误消息
+                error_message = None
+                if isinstance(error_data, dict):
+                    if "detail" in error_data:
+                        error_message = error_data["detail"]
+                    elif "error" in error_data:
+                        error_field = error_data["error"]
+                        if isinstance(error_field, str):
+                            error_message = error_field
+                        elif isinstance(error_field, dict):
+                            error_message = error_field.get("message") or str(error_field)
+                        else:
+                            error_message = str(error_field)
+                    elif "message" in error_data:
+                        error_message = error_data["message"]
+                
+                if not error_message:
+                    error_message = str(error_data)
+                
+                error_response = {
+                    "error": {
+                        "message": error_message,
+                        "type": "upstream_error",
+                        "code": response.status_code
+                    }
+                }
+                yield f"event: error\ndata: {json.dumps(error_response)}\n\n"
+            else:
+                # 成功响应，发送结果
+                result_data = response.json()
+                yield f"event: result\ndata: {json.dumps(result_data)}\n\n"
+
+        # 上游请求在 with_keepalive 的读取任务内执行：超时以 httpx 异常抛出；客户端断开时读取任务被取消
+        try:
+            async for event in with_keepalive(
+                result_events(),
+                interval=heartbeat_interval,
+                heartbeat=heartbeat_event,
+            ):
+                yield event
+        except httpx.PoolTimeout:
+            error_response = {
+                "error": {
+                    "message": UPSTREAM_POOL_EXHAUSTED_MESSAGE,
+                    "type": "upstream_error",
+                    "code": 503
+                }
+            }
+            yield f"event: error\ndata: {json.dumps(error_response)}\n\n"
         except Exception as e:
             # 其他异常
             logger.error(f"图片生成流式请求失败: {str(e)}")
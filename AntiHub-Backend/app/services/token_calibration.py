@@ -0,0 +1,86 @@
+"""
+input_tokens 预估校准
+
+/cc/v1/messages 流式模式需要在拿到上游 usage 之前就发出 message_start，其中的 input_tokens
+只能用 count_all_tokens 预估。不同模型的分词器差异较大，这里按模型记录
+“上游真实 input_tokens / 本地预估值” 的指数滑动平均，用于修正后续请求的预估值。
+
+比例来自运行期间的真实请求（每个流结束时由 message_delta.usage 回填），进程重启后从 1.0 重新学习。
+"""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+
+@dataclass
+class _ModelRatio:
+    ratio: float = 1.0
+    samples: int = 0
+
+
+class TokenCalibrator:
+    """按模型维护 真实/预估 比例的 EMA"""
+
+    def __init__(
+        self,
+        *,
+        alpha: float = 0.2,
+        min_samples: int = 3,
+        min_ratio: float = 0.5,
+        max_ratio: float = 2.0,
+        max_models: int = 512,
+    ):
+        self.alpha = alpha
+        self.min_samples = min_samples
+        self.min_ratio = min_ratio
+        self.max_ratio = max_ratio
+        self.max_models = max_models
+        self._models: "OrderedDict[str, _ModelRatio]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def ratio(self, model: str) -> float:
+        """当前比例；样本不足时返回 1.0（不校准）"""
+        entry = self._models.get(model)
+        if entry is None or entry.samples < self.min_samples:
+            return 1.0
+        return entry.ratio
+
+    def calibrate(self, model: str, estimated: int) -> int:
+        """返回校准后的 input_tokens 预估值"""
+        if estimated <= 0:
+            return 0
+        return max(1, int(round(estimated * self.ratio(model))))
+
+    def observe(self, model: str, estimated: int, actual: int) -> None:
+        """记录一次（原始预估值, 上游真实值）样本；任一值无效时忽略"""
+        if estimated <= 0 or actual <= 0:
+            return
+        sample = min(self.max_ratio, max(self.min_ratio, actual / estimated))
+        with self._lock:
+            entry = self._models.get(model)
+            if entry is None:
+                entry = self._models[model] = _ModelRatio(ratio=sample, samples=1)
+                while len(self._models) > self.max_models:
+                    self._models.popitem(last=False)
+                return
+            self._models.move_to_end(model)
+            entry.ratio += self.alpha * (sample - entry.ratio)
+            entry.samples += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {m: {"ratio": e.ratio, "samples": e.samples} for m, e in self._models.items()}
+
+
+_token_calibrator: Optional[TokenCalibrator] = None
+
+
+def get_token_calibrator() -> TokenCalibrator:
+    """获取进程内的 input_tokens 校准器单例"""
+    global _token_calibrator
+    if _token_calibrator is None:
+        _token_calibrator = TokenCalibrator()
+    return _token_calibrator
@@ -0,0 +1,308 @@
+"""
+OAuth token 后台预刷新（定期任务）
+
+请求路径只在 token 距过期不足 60 秒时才同步刷新，这会把一次完整的 OAuth 往返加到首字节时间上。
+这里定期扫描 codex_accounts / gemini_cli_accounts 中将在 horizon 秒内过期的启用账号，提前刷新：
+- 每个账号刷新前随机等待 0 ~ jitter 秒，避免同一批到期的账号同时打到 OAuth 端点
+- 同时进行的刷新数不超过 concurrency
+- 刷新走 _try_refresh_account，与请求路径共用单飞 + Redis 锁（app/cache/token_refresh_lock.py），
+  并且刷新前会重新加载账号、确认仍需刷新，不会与请求路径或其他 worker 重复刷新
+- 刷新后预热解密凭证缓存（app/cache/credentials_cache.py），请求路径直接命中
+- 刷新失败的账号（如 refresh token 已被吊销）按指数退避跳过后续扫描，失败只计一次；
+  过期超过 SCAN_MAX_EXPIRED_SECONDS 的账号不再扫描（交给请求路径按需刷新），
+  避免一批坏账号每轮占满 SCAN_BATCH_SIZE，挤掉后面的正常账号
+
+多 worker 部署时每轮扫描用 Redis 锁互斥（Redis 不可用时各 worker 各自扫描，由账号级的锁去重）。
+horizon 应大于 interval + jitter + 60，才能保证 token 在进入请求路径的刷新窗口之前被刷新。
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.cache.redis_client import RedisClient, get_redis_client
+from app.core.config import get_settings
+from app.db.session import get_session_maker
+
+logger = logging.getLogger(__name__)
+
+# 每轮扫描的 Redis 锁（多 worker 互斥）
+SCAN_LOCK_KEY = "token_refresher:scan"
+# 扫描锁的最长持有时间（秒）：worker 异常退出时锁自动过期
+SCAN_LOCK_TTL_SECONDS = 300.0
+# 每轮每个渠道最多处理的账号数
+SCAN_BATCH_SIZE = 500
+# 过期超过该时长（秒）的账号不再扫描：多半已失效，由请求路径按需刷新
+SCAN_MAX_EXPIRED_SECONDS = 86400.0
+# 刷新失败后的退避上限（秒）；首次退避为一个扫描间隔，之后每次失败翻倍
+FAILURE_BACKOFF_MAX_SECONDS = 3600.0
+
+
+def _default_providers() -> Dict[str, Callable[..., Any]]:
+    from app.services.codex_service import CodexService
+    from app.services.gemini_cli_service import GeminiCLIService
+
+    return {"codex": CodexService, "gemini_cli": GeminiCLIService}
+
+
+class TokenRefresher:
+    """
+    token 预刷新任务
+
+    Args:
+        interval: 扫描间隔（秒）
+        horizon: 刷新将在多少秒内过期的 token
+        concurrency: 同时进行的刷新数上限
+        jitter: 每个账号刷新前的最大随机等待（秒）
+        providers: 渠道名 -> 服务类（构造参数为 (db, redis)，提供 repo.list_expiring_tokens
+            与 refresh_account_token_if_expiring）；默认 Codex 与 GeminiCLI
+    """
+
+    def __init__(
+        self,
+        *,
+        interval: float = 60.0,
+        horizon: float = 600.0,
+        concurrency: int = 4,
+        jitter: float = 5.0,
+        providers: Optional[Dict[str, Callable[..., Any]]] = None,
+        session_maker: Optional[Callable[[], Any]] = None,
+        redis: Optional[RedisClient] = None,
+        rng: Optional[random.Random] = None,
+    ):
+        self.interval = max(1.0, float(interval))
+        self.horizon = max(0.0, float(horizon))
+        self.concurrency = max(1, int(concurrency))
+        self.jitter = max(0.0, float(jitter))
+        self._providers = providers
+        self._session_maker = session_maker
+        self._redis = redis
+        self._random = rng or random.Random()
+        self._task: Optional[asyncio.Task] = None
+
+        self.runs = 0
+        self.skipped_runs = 0
+        self.scanned: Dict[str, int] = {}
+        self.refreshed: Dict[str, int] = {}
+        self.failed: Dict[str, int] = {}
+        self.not_needed: Dict[str, int] = {}
+        # (渠道, 账号 id) -> (连续失败次数, 下次重试的 monotonic 时间)；只记在本 worker 内存中
+        self._backoff: Dict[Tuple[str, int], Tuple[int, float]] = {}
+        self.last_run_seconds: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def providers(self) -> Dict[str, Callable[..., Any]]:
+        if self._providers is None:
+            self._providers = _default_providers()
+        return self._providers
+
+    @property
+    def session_maker(self) -> Callable[[], Any]:
+        if self._session_maker is None:
+            self._session_maker = get_session_maker()
+        return self._session_maker
+
+    @property
+    def redis(self) -> RedisClient:
+        if self._redis is None:
+            self._redis = get_redis_client()
+        return self._redis
+
+    @staticmethod
+    def _bump(counter: Dict[str, int], provider: str) -> None:
+        counter[provider] = counter.get(provider, 0) + 1
+
+    def _backing_off(self, provider: str) -> Dict[int, float]:
+        return {account_id: retry_at for (p, account_id), (_, retry_at) in self._backoff.items() if p == provider}
+
+    async def _scan(self, provider: str, service_cls: Callable[..., Any], before: datetime) -> list:
+        """
+        查询本轮要刷新的账号（跳过退避中的账号）
+
+        多查退避中的账号数，保证退避中的账号再多也不会挤掉正常账号；
+        不再出现在结果里的账号（已刷新、已禁用或过期太久）清除退避记录。
+        """
+        backing_off = self._backing_off(provider)
+        not_before = datetime.now(timezone.utc) - timedelta(seconds=SCAN_MAX_EXPIRED_SECONDS)
+        async with self.session_maker() as db:
+            service = service_cls(db, self.redis)
+            rows = await service.repo.list_expiring_tokens(
+                before, not_before=not_before, limit=SCAN_BATCH_SIZE + len(backing_off)
+            )
+
+        now = time.monotonic()
+        seen = set()
+        accounts = []
+        for row in rows:
+            account_id = int(row.id)
+            seen.add(account_id)
+            if backing_off.get(account_id, now) > now:
+                continue
+            if len(accounts) < SCAN_BATCH_SIZE:
+                accounts.append((account_id, int(row.user_id)))
+        for account_id in backing_off.keys() - seen:
+            self._backoff.pop((provider, account_id), None)
+        return accounts
+
+    def _record_failure(self, provider: str, account_id: int) -> None:
+        """记录一次刷新失败：只在首次失败时计入 failed，之后按指数退避重试"""
+        failures = self._backoff.get((provider, account_id), (0, 0.0))[0] + 1
+        delay = min(FAILURE_BACKOFF_MAX_SECONDS, self.interval * 2 ** (failures - 1))
+        self._backoff[(provider, account_id)] = (failures, time.monotonic() + delay)
+        if failures == 1:
+            self._bump(self.failed, provider)
+
+    async def _refresh_one(
+        self,
+        provider: str,
+        service_cls: Callable[..., Any],
+        account_id: int,
+        user_id: int,
+        semaphore: asyncio.Semaphore,
+    ) -> None:
+        if self.jitter:
+            await asyncio.sleep(self._random.uniform(0, self.jitter))
+        async with semaphore:
+            try:
+                async with self.session_maker() as db:
+                    service = service_cls(db, self.redis)
+                    result = await service.refresh_account_token_if_expiring(
+                        user_id, account_id, within_seconds=self.horizon
+                    )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                result = False
+                logger.warning(
+                    "token 预刷新失败: provider=%s account_id=%s error=%s: %s",
+                    provider,
+                    account_id,
+                    type(e).__name__,
+                    e,
+                )
+        if result is None or result:
+            self._backoff.pop((provider, account_id), None)
+            self._bump(self.not_needed if result is None else self.refreshed, provider)
+        else:
+            self._record_failure(provider, account_id)
+
+    async def run_once(self) -> Dict[str, Any]:
+        """执行一轮扫描与刷新（其他 worker 正在扫描时跳过）"""
+        fence: Optional[int] = None
+        try:
+            fence = await self.redis.acquire_lock(SCAN_LOCK_KEY, int(SCAN_LOCK_TTL_SECONDS * 1000))
+            if fence is None:
+                self.skipped_runs += 1
+                return {"skipped": True}
+        except Exception as e:
+            logger.warning("token 预刷新扫描锁不可用，本 worker 直接扫描: %s", e)
+
+        started = time.monotonic()
+        try:
+            before = datetime.now(timezone.utc) + timedelta(seconds=self.horizon)
+            semaphore = asyncio.Semaphore(self.concurrency)
+            due: Dict[str, int] = {}
+            tasks = []
+            for provider, service_cls in self.providers.items():
+                accounts = await self._scan(provider, service_cls, before)
+                due[provider] = len(accounts)
+                self.scanned[provider] = self.scanned.get(provider, 0) + len(accounts)
+                tasks.extend(
+                    self._refresh_one(provider, service_cls, account_id, user_id, semaphore)
+                    for account_id, user_id in accounts
+                )
+            await asyncio.gather(*tasks)
+        finally:
+            if fence is not None:
+                try:
+                    await self.redis.release_lock(SCAN_LOCK_KEY, fence)
+                except Exception:
+                    pass
+
+        self.runs += 1
+        self.last_run_seconds = round(time.monotonic() - started, 3)
+        if tasks:
+            logger.info("token 预刷新完成: due=%s refreshed=%s failed=%s", due, self.refreshed, self.failed)
+        return {"skipped": False, "due": due}
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+                self.last_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                logger.warning(f"token 预刷新任务失败: {self.last_error}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """启动后台任务（启动后立即执行一次）"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止后台任务"""
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "runs": self.runs,
+            "skipped_runs": self.skipped_runs,
+            "scanned": dict(self.scanned),
+            "refreshed": dict(self.refreshed),
+            "failed": dict(self.failed),
+            "not_needed": dict(self.not_needed),
+            "backing_off": len(self._backoff),
+            "last_run_seconds": self.last_run_seconds,
+            "last_error": self.last_error,
+        }
+
+
+# 全局预刷新任务实例
+_token_refresher: Optional[TokenRefresher] = None
+
+
+def get_token_refresher() -> TokenRefresher:
+    """
+    获取 token 预刷新任务
+    使用单例模式
+    """
+    global _token_refresher
+    if _token_refresher is None:
+        settings = get_settings()
+        _token_refresher = TokenRefresher(
+            interval=settings.token_refresher_interval_seconds,
+            horizon=settings.token_refresher_horizon_seconds,
+            concurrency=settings.token_refresher_concurrency,
+            jitter=settings.token_refresher_jitter_seconds,
+        )
+    return _token_refresher
+
+
+async def init_token_refresher() -> None:
+    """启动 token 预刷新任务（token_refresher_enabled=false 时不启动）"""
+    if get_settings().token_refresher_enabled:
+        get_token_refresher().start()
+
+
+async def close_token_refresher() -> None:
+    """停止 token 预刷新任务"""
+    global _token_refresher
+    if _token_refresher is not None:
+        await _token_refresher.stop()
+        _token_refresher = None
@@ -0,0 +1,414 @@
+"""
+usage_logs 保留策略（后台定期任务）
+
+usage_logs 按 created_at 月度分区后，写入路径只追加；清理统一放在这里批量执行：
+1) 预建当前及未来若干个月（至少 1 个月）的分区（避免新数据落入 DEFAULT 分区）；
+   DEFAULT 分区中已有某月的数据时（预建不及时、停机跨月），先 DETACH DEFAULT 分区，
+   建好该月分区并把数据移入，再重新 ATTACH，否则建分区会因 DEFAULT 分区约束冲突而一直失败
+2) DROP 超出保留月数的分区（整表删除，无逐行 DELETE），并删除 DEFAULT 分区中过期的行
+3) 每个 (user_id, config_type) 渠道只保留最近 N 条（一次窗口函数批量删除）
+4) 删除保留月数之前的小时汇总（usage_rollups_hourly）
+
+多 worker 部署时通过 PostgreSQL advisory lock 保证同一时刻只有一个 worker 执行。
+第 1、2 步在单独的 savepoint 中执行：分区维护失败时回滚这两步，第 3、4 步照常执行。
+usage_logs 尚未迁移为分区表时，只执行第 3、4 步。
+
+注意两者的保留范围不同：明细每个渠道只留最近 N 条，小时汇总保留整个保留窗口，
+因此用量统计（来自汇总）覆盖保留窗口内的全部请求，总数可以大于明细列表的条数。
+统计接口用 clamp_stats_start 把起始时间限定在保留窗口内，与汇总的实际保留范围一致。
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import get_settings
+from app.db.session import get_session_maker
+
+logger = logging.getLogger(__name__)
+
+PARTITION_PREFIX = "usage_logs_p"
+_PARTITION_NAME_RE = re.compile(rf"^{PARTITION_PREFIX}(\d{{4}})(\d{{2}})$")
+
+# advisory lock key（任意固定值，仅用于多 worker 互斥）
+RETENTION_LOCK_KEY = 0x75736167  # "usag"
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + (month.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    """月度分区表名，如 usage_logs_p202610"""
+    return f"{PARTITION_PREFIX}{month.year:04d}{month.month:02d}"
+
+
+def parse_partition_month(name: str) -> Optional[date]:
+    """从分区表名解析月份；非月度分区（如 usage_logs_default）返回 None"""
+    match = _PARTITION_NAME_RE.match(name)
+    if not match:
+        return None
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def retention_cutoff(*, today: date, retention_months: int) -> Optional[date]:
+    """
+    保留窗口的起始月份（早于该月份的数据过期）
+
+    保留当前月及之前 retention_months - 1 个月；retention_months <= 0 表示不按时间删除，返回 None。
+    """
+    if retention_months <= 0:
+        return None
+    return _add_months(today.replace(day=1), -(retention_months - 1))
+
+
+def retention_window_start(*, now: datetime, retention_months: int) -> Optional[datetime]:
+    """保留窗口的起始时间（UTC，所在月份的 1 日 0 点）；不按时间删除时返回 None"""
+    cutoff = retention_cutoff(today=now.astimezone(timezone.utc).date(), retention_months=retention_months)
+    if cutoff is None:
+        return None
+    return datetime(cutoff.year, cutoff.month, 1, tzinfo=timezone.utc)
+
+
+def clamp_stats_start(start_at: Optional[datetime], *, now: Optional[datetime] = None) -> Optional[datetime]:
+    """
+    用量统计的起始时间：不早于保留窗口的起点（未指定时即为保留窗口的起点）
+
+    保留任务尚未清理过期汇总时，统计范围也不会超出保留窗口。
+    """
+    window_start = retention_window_start(
+        now=now or datetime.now(timezone.utc),
+        retention_months=get_settings().usage_log_retention_months,
+    )
+    if window_start is None:
+        return start_at
+    if start_at is None:
+        return window_start
+    if start_at.tzinfo is None:
+        start_at = start_at.replace(tzinfo=timezone.utc)
+    return max(start_at, window_start)
+
+
+def expired_partitions(names: List[str], *, today: date, retention_months: int) -> List[str]:
+    """计算需要删除的分区"""
+    cutoff = retention_cutoff(today=today, retention_months=retention_months)
+    if cutoff is None:
+        return []
+    expired = []
+    for name in names:
+        month = parse_partition_month(name)
+        if month is not None and month < cutoff:
+            expired.append(name)
+    return sorted(expired)
+
+
+class UsageLogRetentionJob:
+    """
+    usage_logs 保留任务
+
+    Args:
+        interval: 执行间隔（秒）
+        retention_months: 按月保留的分区数（<=0 不按时间删除）
+        months_ahead: 预建未来分区的月数（至少 1：跨月前新月份的分区必须已存在）
+        keep_per_channel: 每个 (user_id, config_type) 保留的最近条数（<=0 不限制）
+    """
+
+    def __init__(
+        self,
+        *,
+        interval: float = 600.0,
+        retention_months: int = 6,
+        months_ahead: int = 2,
+        keep_per_channel: int = 200,
+    ):
+        self.interval = max(1.0, float(interval))
+        self.retention_months = int(retention_months)
+        self.months_ahead = max(1, int(months_ahead))
+        self.keep_per_channel = int(keep_per_channel)
+        self._task: Optional[asyncio.Task] = None
+
+        self.runs = 0
+        self.dropped_partitions = 0
+        self.trimmed_rows = 0
+        self.moved_rows = 0
+        self.last_error: Optional[str] = None
+        self.partition_error: Optional[str] = None
+
+    async def _is_partitioned(self, db: AsyncSession) -> bool:
+        result = await db.execute(
+            text(
+                "SELECT 1 FROM pg_partitioned_table pt "
+                "JOIN pg_class c ON c.oid = pt.partrelid "
+                "WHERE c.relname = 'usage_logs' AND pg_table_is_visible(c.oid)"
+            )
+        )
+        return result.scalar() is not None
+
+    async def _list_partitions(self, db: AsyncSession) -> List[str]:
+        result = await db.execute(
+            text(
+                "SELECT child.relname FROM pg_inherits i "
+                "JOIN pg_class parent ON parent.oid = i.inhparent "
+                "JOIN pg_class child ON child.oid = i.inhrelid "
+                "WHERE parent.relname = 'usage_logs' AND pg_table_is_visible(parent.oid)"
+            )
+        )
+        return [row[0] for row in result.all()]
+
+    async def _default_partition(self, db: AsyncSession) -> Optional[str]:
+        result = await db.execute(
+            text(
+                "SELECT child.relname FROM pg_inherits i "
+                "JOIN pg_class parent ON parent.oid = i.inhparent "
+                "JOIN pg_class child ON child.oid = i.inhrelid "
+                "WHERE parent.relname = 'usage_logs' AND pg_table_is_visible(parent.oid) "
+                "AND pg_get_expr(child.relpartbound, child.oid) = 'DEFAULT'"
+            )
+        )
+        return result.scalar()
+
+    async def _create_partition(self, db: AsyncSession, month: date, default: Optional[str]) -> int:
+        """
+        创建 month 的分区，返回从 DEFAULT 分区移入的行数
+
+        DEFAULT 分区中有该月数据时不能直接建分区（约束冲突）：DETACH DEFAULT 分区后建分区、
+        移动数据、再 ATTACH。整个过程持有 usage_logs 的排他锁，期间的写入会等待。
+        """
+        name = partition_name(month)
+        start, end = month.isoformat(), _add_months(month, 1).isoformat()
+        in_range = f"created_at >= '{start}' AND created_at < '{end}'"
+        has_rows = False
+        if default is not None:
+            result = await db.execute(text(f'SELECT EXISTS (SELECT 1 FROM "{default}" WHERE {in_range})'))
+            has_rows = bool(result.scalar())
+        if not has_rows:
+            await db.execute(
+                text(
+                    f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF usage_logs '
+                    f"FOR VALUES FROM ('{start}') TO ('{end}')"
+                )
+            )
+            return 0
+
+        await db.execute(text(f'ALTER TABLE usage_logs DETACH PARTITION "{default}"'))
+        await db.execute(
+            text(
+                f'CREATE TABLE "{name}" PARTITION OF usage_logs '
+                f"FOR VALUES FROM ('{start}') TO ('{end}')"
+            )
+        )
+        moved = await db.execute(
+            text(
+                f'WITH moved AS (DELETE FROM "{default}" WHERE {in_range} RETURNING *) '
+                f'INSERT INTO "{name}" SELECT * FROM moved'
+            )
+        )
+        await db.execute(text(f'ALTER TABLE usage_logs ATTACH PARTITION "{default}" DEFAULT'))
+        return int(moved.rowcount or 0)
+
+    async def ensure_partitions(self, db: AsyncSession, *, today: date) -> int:
+        """
+        预建当前月及未来 months_ahead 个月的分区；DEFAULT 分区中保留窗口内的月份也补建分区
+
+        Returns:
+            从 DEFAULT 分区移入月度分区的行数
+        """
+        existing = set(await self._list_partitions(db))
+        default = await self._default_partition(db)
+        current = today.replace(day=1)
+        months = {_add_months(current, i) for i in range(self.months_ahead + 1)}
+        if default is not None:
+            cutoff = retention_cutoff(today=today, retention_months=self.retention_months)
+            result = await db.execute(
+                text(f"SELECT DISTINCT date_trunc('month', created_at)::date FROM \"{default}\"")
+            )
+            months.update(m for (m,) in result.all() if cutoff is None or m >= cutoff)
+
+        moved = 0
+        for month in sorted(months):
+            if partition_name(month) not in existing:
+                moved += await self._create_partition(db, month, default)
+        return moved
+
+    async def drop_expired_partitions(self, db: AsyncSession, *, today: date) -> List[str]:
+        """删除超出保留月数的分区"""
+        names = expired_partitions(
+            await self._list_partitions(db),
+            today=today,
+            retention_months=self.retention_months,
+        )
+        for name in names:
+            await db.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+
+        # DEFAULT 分区不按月 DROP：逐行删除其中过期的数据
+        cutoff = retention_cutoff(today=today, retention_months=self.retention_months)
+        default = await self._default_partition(db)
+        if cutoff is not None and default is not None:
+            await db.execute(text(f"DELETE FROM \"{default}\" WHERE created_at < '{cutoff.isoformat()}'"))
+        return names
+
+    async def enforce_channel_caps(self, db: AsyncSession) -> int:
+        """
+        每个 (user_id, config_type) 渠道只保留最近 keep_per_channel 条
+
+        只对超出上限的渠道做窗口排序；config_type 为 NULL 的记录视为同一渠道。
+        """
+        if self.keep_per_channel <= 0:
+            return 0
+        result = await db.execute(
+            text(
+                """
+                WITH over_cap AS (
+                    SELECT user_id, config_type
+                    FROM usage_logs
+                    GROUP BY user_id, config_type
+                    HAVING count(*) > :keep
+                ),
+                ranked AS (
+                    SELECT u.id, u.created_at,
+                           row_number() OVER (
+                               PARTITION BY u.user_id, u.config_type
+                               ORDER BY u.created_at DESC, u.id DESC
+                           ) AS rn
+                    FROM usage_logs u
+                    JOIN over_cap o
+                      ON o.user_id = u.user_id
+                     AND o.config_type IS NOT DISTINCT FROM u.config_type
+                )
+                DELETE FROM usage_logs d
+                USING ranked r
+                WHERE r.rn > :keep AND d.id = r.id AND d.created_at = r.created_at
+                """
+            ),
+            {"keep": self.keep_per_channel},
+        )
+        return int(result.rowcount or 0)
+
+    async def drop_expired_rollups(self, db: AsyncSession, *, today: date) -> int:
+        """删除保留窗口之前的小时汇总"""
+        cutoff = retention_cutoff(today=today, retention_months=self.retention_months)
+        if cutoff is None:
+            return 0
+        result = await db.execute(
+            text("DELETE FROM usage_rollups_hourly WHERE hour < :cutoff"),
+            {"cutoff": datetime(cutoff.year, cutoff.month, 1, tzinfo=timezone.utc)},
+        )
+        return int(result.rowcount or 0)
+
+    async def run_once(self, *, today: Optional[date] = None) -> Dict[str, Any]:
+        """执行一次保留策略（未获取到 advisory lock 时跳过）"""
+        today = today or datetime.now(timezone.utc).date()
+        session_maker = get_session_maker()
+        async with session_maker() as db:
+            locked = await db.execute(
+                text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": RETENTION_LOCK_KEY}
+            )
+            if not locked.scalar():
+                await db.rollback()
+                return {"skipped": True}
+
+            dropped: List[str] = []
+            moved = 0
+            if await self._is_partitioned(db):
+                # 分区维护放在 savepoint 中：失败时只回滚这一步，不影响下面的条数裁剪与汇总过期
+                try:
+                    async with db.begin_nested():
+                        moved = await self.ensure_partitions(db, today=today)
+                        dropped = await self.drop_expired_partitions(db, today=today)
+                except Exception as e:
+                    moved, dropped = 0, []
+                    self.partition_error = f"{type(e).__name__}: {e}"
+                    logger.warning(f"usage_logs 分区维护失败: {self.partition_error}")
+                else:
+                    self.partition_error = None
+            trimmed = await self.enforce_channel_caps(db)
+            expired_rollups = await self.drop_expired_rollups(db, today=today)
+            await db.commit()
+
+        self.runs += 1
+        self.dropped_partitions += len(dropped)
+        self.trimmed_rows += trimmed
+        self.moved_rows += moved
+        if dropped or trimmed or expired_rollups or moved:
+            logger.info(
+                f"usage_logs 保留任务完成: dropped_partitions={dropped} trimmed_rows={trimmed} "
+                f"expired_rollups={expired_rollups} moved_from_default={moved}"
+            )
+        return {
+            "skipped": False,
+            "moved_from_default": moved,
+            "dropped_partitions": dropped,
+            "trimmed_rows": trimmed,
+            "expired_rollups": expired_rollups,
+        }
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+                self.last_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                logger.warning(f"usage_logs 保留任务失败: {self.last_error}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """启动后台任务（启动后立即执行一次）"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止后台任务"""
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            pass
+
+
+# 全局保留任务实例
+_retention_job: Optional[UsageLogRetentionJob] = None
+
+
+def get_usage_log_retention_job() -> UsageLogRetentionJob:
+    """
+    获取 usage_logs 保留任务
+    使用单例模式
+    """
+    global _retention_job
+    if _retention_job is None:
+        from app.services.usage_log_service import MAX_LOGS_PER_CHANNEL
+
+        settings = get_settings()
+        _retention_job = UsageLogRetentionJob(
+            interval=settings.usage_log_retention_interval_seconds,
+            retention_months=settings.usage_log_retention_months,
+            months_ahead=settings.usage_log_partitions_ahead_months,
+            keep_per_channel=MAX_LOGS_PER_CHANNEL,
+        )
+    return _retention_job
+
+
+async def init_usage_log_retention() -> None:
+    """启动 usage_logs 保留任务"""
+    get_usage_log_retention_job().start()
+
+
+async def close_usage_log_retention() -> None:
+    """停止 usage_logs 保留任务"""
+    global _retention_job
+    if _retention_job is not None:
+        await _retention_job.stop()
+        _retention_job = None
@@ -5,6 +5,7 @@
 1) 记录所有调用（成功/失败都要记录）
 2) 流式与非流式都尽量提取 usage（tokens）
 3) 记录失败原因但不影响主流程
+4) 请求路径只入队，由后台批量写入（见 AsyncBatchWriter）
 """
 
 from __future__ import annotations
@@ -12,17 +13,38 @@ from __future__ import annotations
 import json
 import logging
 from dataclasses import dataclass, field
-from typing import Any, Dict, Optional, Tuple
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
 
-from sqlalchemy import delete, select
+from sqlalchemy import insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
+from app.core.config import get_settings
 from app.db.session import get_session_maker
 from app.models.usage_log import UsageLog
+from app.models.usage_rollup import NO_API_KEY_ID, NO_DIMENSION, UsageRollupHourly, hour_bucket
+from app.utils.batch_writer import AsyncBatchWriter
+from app.utils.sse import SSELineBuffer, parse_data_line
 
 logger = logging.getLogger(__name__)
 
 MAX_ERROR_MESSAGE_LENGTH = 2000
+# 每个 (user_id, config_type) 保留的最近条数（由 UsageLogRetentionJob 批量执行）
 MAX_LOGS_PER_CHANNEL = 200
+# 单条多行 INSERT 的最大行数（asyncpg 单语句参数上限 32767）
+MAX_ROWS_PER_INSERT = 1000
+
+# 小时汇总表的维度列（主键）与需要累加的列
+ROLLUP_KEY_COLUMNS = ("user_id", "hour", "api_key_id", "config_type", "model_name", "endpoint")
+ROLLUP_SUM_COLUMNS = (
+    "request_count",
+    "success_count",
+    "input_tokens",
+    "output_tokens",
+    "total_tokens",
+    "quota_consumed",
+    "duration_ms_sum",
+)
 
 
 def _safe_int(value: Any, default: int = 0) -> int:
@@ -43,36 +65,6 @@ def _truncate_message(message: Optional[str]) -> Optional[str]:
     return msg[:MAX_ERROR_MESSAGE_LENGTH] + "…"
 
 
-def _config_type_filter(config_type: Optional[str]):
-    if config_type is None:
-        return UsageLog.config_type.is_(None)
-    return UsageLog.config_type == config_type
-
-
-async def _trim_usage_logs(
-    db,
-    *,
-    user_id: int,
-    config_type: Optional[str],
-    keep: int = MAX_LOGS_PER_CHANNEL,
-) -> None:
-    if keep <= 0:
-        stmt = delete(UsageLog).where(UsageLog.user_id == user_id).where(
-            _config_type_filter(config_type)
-        )
-        await db.execute(stmt)
-        return
-
-    ids_to_delete = (
-        select(UsageLog.id)
-        .where(UsageLog.user_id == user_id)
-        .where(_config_type_filter(config_type))
-        .order_by(UsageLog.created_at.desc(), UsageLog.id.desc())
-        .offset(keep)
-    )
-    await db.execute(delete(UsageLog).where(UsageLog.id.in_(ids_to_delete)))
-
-
 def extract_openai_usage(payload: Dict[str, Any]) -> Tuple[int, int, int]:
     """
     从 OpenAI/兼容格式中提取 token 用量。
@@ -168,9 +160,9 @@ class SSEUsageTracker:
     轻量 SSE 解析器：从流式响应里尽量捕获 usage 和 error。
 
     只解析以 `data: ` 开头的行，忽略 event: 等字段。
+    lazy=True（默认）时先做子串预检，只有可能带 usage / error 的行才 JSON 解析，结果与逐行解析一致。
     """
 
-    buffer: str = ""
     input_tokens: int = 0
     output_tokens: int = 0
     total_tokens: int = 0
@@ -178,65 +170,196 @@ class SSEUsageTracker:
     success: bool = True
     status_code: Optional[int] = None
     error_message: Optional[str] = None
+    lazy: bool = True
     _seen_usage: bool = False
+    _lines: SSELineBuffer = field(default_factory=SSELineBuffer, repr=False)
 
     def feed(self, chunk: bytes) -> None:
+        self._handle_lines(self._lines.feed(chunk))
+
+    def _handle_lines(self, lines: List[str]) -> None:
+        if not self.lazy:
+            for line in lines:
+                self._handle_line(line)
+            return
+        # 只有含键名 "usage" / "error" 的 JSON 才可能改变状态；每个流通常只有一两个这样的事件，
+        # 其余 delta 行在这里直接跳过。JSON 键名允许 \u 转义（如 "us\u0061ge"），
+        # 出现 ASCII 小写字母的转义时保守地走完整解析，保证结果与逐行解析一致。
+        for line in lines:
+            if '"usage"' in line or '"error"' in line or "\\u006" in line or "\\u007" in line:
+                self._handle_line(line)
+
+    def _handle_line(self, line: str) -> None:
+        data_str = parse_data_line(line.strip())
+        if data_str is None:
+            return
+
+        data_str = data_str.strip()
+        if data_str == "[DONE]":
+            return
+
         try:
-            self.buffer += chunk.decode("utf-8", errors="replace")
+            payload = json.loads(data_str)
         except Exception:
             return
 
-        while "\n" in self.buffer:
-            line, self.buffer = self.buffer.split("\n", 1)
-            line = line.strip()
-            if not line or not line.startswith("data:"):
-                continue
-
-            data_str = line[5:].strip()
-            if data_str == "[DONE]":
-                continue
-
-            try:
-                payload = json.loads(data_str)
-            except Exception:
-                continue
-
-            if isinstance(payload, dict):
-                # usage
-                in_tok, out_tok, total_tok, cached_tok = extract_openai_usage_details(payload)
-                if in_tok or out_tok or total_tok or cached_tok:
-                    self.input_tokens = in_tok
-                    self.output_tokens = out_tok
-                    self.total_tokens = total_tok
-                    self.cached_tokens = cached_tok
-                    self._seen_usage = True
-
-                # error（兼容 Responses: response.error）
-                err = None
-                if "error" in payload:
-                    err = payload.get("error")
-                else:
-                    response_obj = payload.get("response")
-                    if isinstance(response_obj, dict) and response_obj.get("error") is not None:
-                        err = response_obj.get("error")
-
-                if err is not None:
-                    self.success = False
-                    if isinstance(err, dict):
-                        self.error_message = _truncate_message(
-                            err.get("message") or err.get("detail") or str(err)
-                        )
-                        code = err.get("code") or err.get("status") or err.get("status_code")
-                        self.status_code = _safe_int(code, self.status_code or 500)
-                    else:
-                        self.error_message = _truncate_message(str(err))
-                        self.status_code = self.status_code or 500
+        if not isinstance(payload, dict):
+            return
+
+        # usage
+        in_tok, out_tok, total_tok, cached_tok = extract_openai_usage_details(payload)
+        if in_tok or out_tok or total_tok or cached_tok:
+            self.input_tokens = in_tok
+            self.output_tokens = out_tok
+            self.total_tokens = total_tok
+            self.cached_tokens = cached_tok
+            self._seen_usage = True
+
+        # error（兼容 Responses: response.error）
+        err = None
+        if "error" in payload:
+            err = payload.get("error")
+        else:
+            response_obj = payload.get("response")
+            if isinstance(response_obj, dict) and response_obj.get("error") is not None:
+                err = response_obj.get("error")
+
+        if err is not None:
+            self.success = False
+            if isinstance(err, dict):
+                self.error_message = _truncate_message(
+                    err.get("message") or err.get("detail") or str(err)
+                )
+                code = err.get("code") or err.get("status") or err.get("status_code")
+                self.status_code = _safe_int(code, self.status_code or 500)
+            else:
+                self.error_message = _truncate_message(str(err))
+                self.status_code = self.status_code or 500
 
     def finalize(self) -> None:
+        # 上游最后一行可能没有换行符
+        self._handle_lines(self._lines.flush())
         if not self._seen_usage:
             self.total_tokens = self.input_tokens + self.output_tokens
 
 
+def build_usage_rollups(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    把一批 usage_log 行按 (user_id, hour, api_key_id, config_type, model_name, endpoint) 聚合
+
+    返回结果按维度排序：多个 worker 并发 upsert 时按相同顺序加行锁，避免死锁。
+    """
+    buckets: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+    for row in rows:
+        created_at = row.get("created_at") or datetime.now(timezone.utc)
+        key = (
+            row["user_id"],
+            hour_bucket(created_at),
+            row.get("api_key_id") or NO_API_KEY_ID,
+            row.get("config_type") or NO_DIMENSION,
+            row.get("model_name") or NO_DIMENSION,
+            row["endpoint"],
+        )
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = {
+                "user_id": key[0],
+                "hour": key[1],
+                "api_key_id": key[2],
+                "config_type": key[3],
+                "model_name": key[4],
+                "endpoint": key[5],
+                "request_count": 0,
+                "success_count": 0,
+                "input_tokens": 0,
+                "output_tokens": 0,
+                "total_tokens": 0,
+                "quota_consumed": 0.0,
+                "duration_ms_sum": 0,
+            }
+            buckets[key] = bucket
+        bucket["request_count"] += 1
+        bucket["success_count"] += 1 if row.get("success", True) else 0
+        bucket["input_tokens"] += _safe_int(row.get("input_tokens"))
+        bucket["output_tokens"] += _safe_int(row.get("output_tokens"))
+        bucket["total_tokens"] += _safe_int(row.get("total_tokens"))
+        bucket["quota_consumed"] += float(row.get("quota_consumed") or 0.0)
+        bucket["duration_ms_sum"] += _safe_int(row.get("duration_ms"))
+    return [buckets[key] for key in sorted(buckets)]
+
+
+async def _write_usage_rows(rows: List[Dict[str, Any]]) -> None:
+    """
+    批量写入 usage_log（单条多行 INSERT，只追加），并在同一事务内累加小时汇总表
+
+    每渠道条数上限与过期数据清理由 UsageLogRetentionJob 定期批量执行。
+    任一行出错（如 api_key_id 外键已失效）时整个事务回滚，批量写入器可以安全地拆批重试。
+    """
+    if not rows:
+        return
+    rollups = build_usage_rollups(rows)
+    session_maker = get_session_maker()
+    async with session_maker() as db:
+        for i in range(0, len(rows), MAX_ROWS_PER_INSERT):
+            await db.execute(insert(UsageLog).values(rows[i:i + MAX_ROWS_PER_INSERT]))
+        for i in range(0, len(rollups), MAX_ROWS_PER_INSERT):
+            stmt = pg_insert(UsageRollupHourly).values(rollups[i:i + MAX_ROWS_PER_INSERT])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=list(ROLLUP_KEY_COLUMNS),
+                set_={
+                    name: getattr(UsageRollupHourly, name) + getattr(stmt.excluded, name)
+                    for name in ROLLUP_SUM_COLUMNS
+                },
+            )
+            await db.execute(stmt)
+        await db.commit()
+
+
+def _describe_usage_row(row: Dict[str, Any]) -> str:
+    """写入失败被丢弃时日志中的行标识"""
+    return (
+        f"(user_id={row.get('user_id')} api_key_id={row.get('api_key_id')} "
+        f"endpoint={row.get('endpoint')} created_at={row.get('created_at')})"
+    )
+
+
+# 全局 usage_log 批量写入器
+_usage_log_writer: Optional[AsyncBatchWriter[Dict[str, Any]]] = None
+
+
+def get_usage_log_writer() -> AsyncBatchWriter[Dict[str, Any]]:
+    """
+    获取 usage_log 批量写入器
+    使用单例模式
+    """
+    global _usage_log_writer
+    if _usage_log_writer is None:
+        settings = get_settings()
+        _usage_log_writer = AsyncBatchWriter(
+            _write_usage_rows,
+            name="usage_log_writer",
+            batch_size=settings.usage_log_batch_size,
+            flush_interval=settings.usage_log_flush_interval_seconds,
+            max_queue=settings.usage_log_queue_size,
+            enqueue_timeout=settings.usage_log_enqueue_timeout_seconds,
+            describe=_describe_usage_row,
+        )
+    return _usage_log_writer
+
+
+async def init_usage_log_writer() -> None:
+    """启动 usage_log 后台批量写入"""
+    get_usage_log_writer().start()
+
+
+async def close_usage_log_writer() -> None:
+    """停止 usage_log 后台写入并写完队列"""
+    global _usage_log_writer
+    if _usage_log_writer is not None:
+        await _usage_log_writer.close()
+        _usage_log_writer = None
+
+
 class UsageLogService:
     @classmethod
     async def record(
@@ -262,37 +385,37 @@ class UsageLogService:
     ) -> None:
         """
         写 usage_log（失败也写），写入失败不影响主流程。
+
+        后台写入器运行时只入队（队列持续满时丢弃），否则（脚本/测试等未启动 lifespan 的场景）直接写库。
         """
+        row = {
+            "user_id": user_id,
+            "api_key_id": api_key_id,
+            "endpoint": endpoint,
+            "method": method,
+            "model_name": model_name,
+            "config_type": config_type,
+            "stream": stream,
+            "quota_consumed": quota_consumed,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": total_tokens,
+            "success": success,
+            "status_code": status_code,
+            "error_message": _truncate_message(error_message),
+            "duration_ms": duration_ms,
+            "tts_voice_id": tts_voice_id,
+            "tts_account_id": tts_account_id,
+            # 入队时间即请求完成时间，避免批量写入延迟影响 created_at
+            "created_at": datetime.now(timezone.utc),
+        }
+
+        writer = get_usage_log_writer()
+        if writer.running:
+            await writer.submit(row)
+            return
+
         try:
-            session_maker = get_session_maker()
-            async with session_maker() as db:
-                log = UsageLog(
-                    user_id=user_id,
-                    api_key_id=api_key_id,
-                    endpoint=endpoint,
-                    method=method,
-                    model_name=model_name,
-                    config_type=config_type,
-                    stream=stream,
-                    quota_consumed=quota_consumed,
-                    input_tokens=input_tokens,
-                    output_tokens=output_tokens,
-                    total_tokens=total_tokens,
-                    success=success,
-                    status_code=status_code,
-                    error_message=_truncate_message(error_message),
-                    duration_ms=duration_ms,
-                    tts_voice_id=tts_voice_id,
-                    tts_account_id=tts_account_id,
-                )
-                db.add(log)
-                await db.commit()
-
-                try:
-                    await _trim_usage_logs(db, user_id=user_id, config_type=config_type)
-                    await db.commit()
-                except Exception as e:
-                    await db.rollback()
-                    logger.warning(f"清理 usage_log 失败: {e}")
+            await _write_usage_rows([row])
         except Exception as e:
             logger.warning(f"记录 usage_log 失败: {e}")
@@ -11,6 +11,8 @@ from app.core.security import hash_password
 from app.core.exceptions import UserNotFoundError, UserAlreadyExistsError
 from app.repositories.user_repository import UserRepository
 from app.repositories.oauth_token_repository import OAuthTokenRepository
+from app.repositories.api_key_repository import APIKeyRepository
+from app.cache import get_auth_cache
 from app.models.user import User
 from app.schemas.user import UserCreate, UserUpdate, OAuthUserCreate
 from app.schemas.token import OAuthTokenData
@@ -154,7 +156,9 @@ class UserService:
         Raises:
             UserNotFoundError: 用户不存在
         """
-        return await self.user_repo.update(user_id, **kwargs)
+        user = await self.user_repo.update(user_id, **kwargs)
+        await self._invalidate_auth_cache(user_id)
+        return user
     
     async def update_user(
         self,
@@ -176,7 +180,9 @@ class UserService:
         """
         # 只更新提供的字段
         update_data = user_data.model_dump(exclude_unset=True)
-        return await self.user_repo.update(user_id, **update_data)
+        user = await self.user_repo.update(user_id, **update_data)
+        await self._invalidate_auth_cache(user_id)
+        return user
     
     async def update_last_login(self, user_id: int) -> User:
         """
@@ -193,6 +199,15 @@ class UserService:
         """
         return await self.user_repo.update_last_login(user_id)
     
+    async def _invalidate_auth_cache(self, user_id: int) -> None:
+        """
+        用户信息变更（禁用、禁言、Beta 等）后清理认证缓存
+        
+        同时清理该用户所有 API key 的认证缓存，并广播到其他 worker
+        """
+        api_keys = await APIKeyRepository(self.db).get_by_user_id(user_id)
+        await get_auth_cache().invalidate_user(user_id, [k.key for k in api_keys])
+    
     # ==================== Beta 计划功能 ====================
     
     async def join_beta(self, user_id: int) -> User:
@@ -208,7 +223,9 @@ class UserService:
         Raises:
             UserNotFoundError: 用户不存在
         """
-        return await self.user_repo.update(user_id, beta=1)
+        user = await self.user_repo.update(user_id, beta=1)
+        await self._invalidate_auth_cache(user_id)
+        return user
     
     async def leave_beta(self, user_id: int) -> User:
         """
@@ -223,7 +240,9 @@ class UserService:
         Raises:
             UserNotFoundError: 用户不存在
         """
-        return await self.user_repo.update(user_id, beta=0)
+        user = await self.user_repo.update(user_id, beta=0)
+        await self._invalidate_auth_cache(user_id)
+        return user
     
     async def get_beta_status(self, user_id: int) -> int:
         """
@@ -246,6 +265,26 @@ class UserService:
             )
         return user.beta
     
+    # ==================== 负载均衡策略 ====================
+    
+    async def update_balance_strategy(self, user_id: int, balance_strategy: Optional[str]) -> User:
+        """
+        设置用户的多账号负载均衡策略（API key 上单独设置的策略优先）
+        
+        Args:
+            user_id: 用户 ID
+            balance_strategy: 策略名；None 表示恢复默认（fill-first）
+            
+        Returns:
+            更新后的 User 对象
+            
+        Raises:
+            UserNotFoundError: 用户不存在
+        """
+        user = await self.user_repo.update(user_id, balance_strategy=balance_strategy)
+        await self._invalidate_auth_cache(user_id)
+        return user
+    
     # ==================== OAuth 令牌存储 ====================
     
     async def save_oauth_token(
@@ -18,7 +18,9 @@ import httpx
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import get_settings
+from app.core.http_client import UPSTREAM_ZAI, get_http_client
 from app.repositories.zai_image_account_repository import ZaiImageAccountRepository
+from app.services.account_balancer import choose_account
 from app.utils.encryption import encrypt_api_key as encrypt_secret
 from app.utils.encryption import decrypt_api_key as decrypt_secret
 
@@ -118,11 +120,11 @@ class ZaiImageService:
     async def delete_account(self, user_id: int, account_id: int) -> bool:
         return await self.repo.delete(account_id, user_id)
 
-    async def select_active_account(self, user_id: int):
+    async def select_active_account(self, user_id: int, *, strategy: Optional[str] = None):
         enabled: Sequence[Any] = await self.repo.list_enabled_by_user_id(user_id)
         if not enabled:
             raise ValueError("没有可用的 ZAI Image 账号，请先在账户管理中添加账号")
-        return enabled[0]
+        return choose_account(strategy, ("zai-image", user_id), enabled)
 
     def _load_token(self, account) -> str:
         raw = decrypt_secret(account.credentials)
@@ -169,8 +171,8 @@ class ZaiImageService:
         url = f"{self.base_url}/api/proxy/images/generate"
         cookies = {"session": token}
 
-        async with httpx.AsyncClient(timeout=httpx.Timeout(120.0, connect=30.0)) as client:
-            resp = await client.post(url, json=payload, headers=self._headers(), cookies=cookies)
+        client = get_http_client(UPSTREAM_ZAI)
+        resp = await client.post(url, json=payload, headers=self._headers(), cookies=cookies)
 
         try:
             data = resp.json()
@@ -219,11 +221,11 @@ class ZaiImageService:
         if not image_url:
             raise ValueError("image_url 不能为空")
 
-        async with httpx.AsyncClient(timeout=httpx.Timeout(120.0, connect=30.0)) as client:
-            resp = await client.get(image_url)
-            resp.raise_for_status()
-            mime = _content_type_to_mime(resp.headers.get("Content-Type"))
-            return resp.content, mime
+        client = get_http_client(UPSTREAM_ZAI)
+        resp = await client.get(image_url)
+        resp.raise_for_status()
+        mime = _content_type_to_mime(resp.headers.get("Content-Type"))
+        return resp.content, mime
 
     async def fetch_image_base64(self, url: str) -> Tuple[str, str]:
         content, mime = await self.fetch_image_bytes(url)
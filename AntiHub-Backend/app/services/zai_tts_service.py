@@ -19,9 +19,12 @@ import httpx
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import get_settings
+from app.core.http_client import UPSTREAM_ZAI, get_http_client
 from app.repositories.zai_tts_account_repository import ZaiTTSAccountRepository
+from app.services.account_balancer import choose_account
 from app.utils.encryption import encrypt_api_key as encrypt_secret
 from app.utils.encryption import decrypt_api_key as decrypt_secret
+from app.utils.sse import aiter_sse_lines
 
 logger = logging.getLogger(__name__)
 
@@ -174,18 +177,24 @@ class ZaiTTSService:
     async def delete_account(self, user_id: int, account_id: int) -> bool:
         return await self.repo.delete(account_id, user_id)
 
-    async def select_active_account(self, user_id: int, *, voice_id: Optional[str] = None):
+    async def select_active_account(
+        self,
+        user_id: int,
+        *,
+        voice_id: Optional[str] = None,
+        strategy: Optional[str] = None,
+    ):
         enabled = await self.repo.list_enabled_by_user_id(user_id)
         if not enabled:
             raise ValueError("没有可用的 ZAI TTS 账号，请先添加账号")
 
         wanted = _safe_str(voice_id)
         if not wanted:
-            return enabled[0]
+            return choose_account(strategy, ("zai-tts", user_id), enabled)
 
-        for account in enabled:
-            if _safe_str(getattr(account, "voice_id", None)) == wanted:
-                return account
+        matched = [a for a in enabled if _safe_str(getattr(a, "voice_id", None)) == wanted]
+        if matched:
+            return choose_account(strategy, ("zai-tts", user_id), matched)
 
         allowed = sorted(
             {
@@ -236,12 +245,11 @@ class ZaiTTSService:
         }
 
         timeout = httpx.Timeout(connect=10.0, read=None, write=30.0, pool=10.0)
-        client = httpx.AsyncClient(timeout=timeout)
-        resp = await client.post(url, json=payload, headers=headers)
+        client = get_http_client(UPSTREAM_ZAI)
+        resp = await client.post(url, json=payload, headers=headers, timeout=timeout)
         if resp.status_code < 200 or resp.status_code >= 300:
             text = await resp.aread()
             await resp.aclose()
-            await client.aclose()
             raise httpx.HTTPStatusError(
                 f"ZAI upstream error: HTTP {resp.status_code}",
                 request=None,
@@ -250,16 +258,10 @@ class ZaiTTSService:
         return client, resp
 
     async def _iter_sse_lines(self, resp: httpx.Response) -> AsyncGenerator[str, None]:
-        buffer = ""
-        async for chunk in resp.aiter_text():
-            buffer += chunk
-            while "\n" in buffer:
-                line, buffer = buffer.split("\n", 1)
-                line = line.strip()
-                if line:
-                    yield line
-        if buffer.strip():
-            yield buffer.strip()
+        async for line in aiter_sse_lines(resp):
+            line = line.strip()
+            if line:
+                yield line
 
     async def stream_audio(
         self,
@@ -313,7 +315,6 @@ class ZaiTTSService:
                         yield audio_bytes
             finally:
                 await resp.aclose()
-                await client.aclose()
 
         return generator(), client, resp
 
@@ -363,7 +364,6 @@ class ZaiTTSService:
                     raw_chunks.append(audio_bytes)
         finally:
             await resp.aclose()
-            await client.aclose()
 
         storage_dir = self.ensure_storage_dir()
         filename = f"zai-tts-{int(time.time())}-{uuid.uuid4().hex[:8]}.wav"
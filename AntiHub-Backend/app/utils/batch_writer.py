@@ -0,0 +1,216 @@
+"""
+异步批量写入器
+
+请求处理路径只负责入队；后台任务按数量或时间攒批后调用写入函数。
+
+- 队列有界：队列满时生产者最多等待 enqueue_timeout 秒，超时丢弃并计数（内存上限固定）
+- 攒批：达到 batch_size 立即写入，否则最多等待 flush_interval 秒
+- 关闭时把队列中剩余的条目全部写完
+- 写入失败重试一次；仍失败时二分拆批重试，只丢弃拆到单条仍写不进去的条目（例如外键已失效的行），
+  并记录其标识；拆批重试的写入次数有上限（数据库整体不可用时不会放大成大量重试）
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Generic, List, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+WriteBatch = Callable[[List[T]], Awaitable[None]]
+
+# 丢弃时日志中最多列出的条目标识数
+MAX_LOGGED_DROPPED = 20
+
+
+class AsyncBatchWriter(Generic[T]):
+    """
+    有界队列 + 后台批量写入
+
+    Args:
+        write_batch: 批量写入函数
+        name: 名称（用于日志）
+        batch_size: 单批最大条目数
+        flush_interval: 攒批最长等待时间（秒）
+        max_queue: 队列容量
+        enqueue_timeout: 队列满时生产者最长等待时间（秒）
+        max_split_writes: 整批失败后二分拆批重试的最多写入次数
+        describe: 条目 -> 日志中的标识（丢弃时记录）；默认 repr
+    """
+
+    def __init__(
+        self,
+        write_batch: WriteBatch,
+        *,
+        name: str = "batch_writer",
+        batch_size: int = 200,
+        flush_interval: float = 1.0,
+        max_queue: int = 10000,
+        enqueue_timeout: float = 0.5,
+        max_split_writes: int = 32,
+        describe: Optional[Callable[[T], Any]] = None,
+    ):
+        self._write_batch = write_batch
+        self.name = name
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(0.0, float(flush_interval))
+        self.enqueue_timeout = max(0.0, float(enqueue_timeout))
+        self.max_split_writes = max(0, int(max_split_writes))
+        self._describe = describe or repr
+        self._queue: "asyncio.Queue[T]" = asyncio.Queue(maxsize=max(1, int(max_queue)))
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._idle = True
+
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed_batches = 0
+        self.failed_items = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done() and not self._stopping
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    async def submit(self, item: T) -> bool:
+        """
+        入队一个条目
+
+        Returns:
+            是否成功入队（队列持续满时返回 False，条目被丢弃）
+        """
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self._queue.put(item), timeout=self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                self.dropped += 1
+                if self.dropped == 1 or self.dropped % 1000 == 0:
+                    logger.warning(f"{self.name} 队列已满，丢弃条目: dropped={self.dropped}")
+                return False
+        self.enqueued += 1
+        return True
+
+    async def _collect(self, first: T) -> List[T]:
+        batch: List[T] = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            if self._stopping:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _flush(self, batch: List[T]) -> None:
+        error: Optional[Exception] = None
+        for _attempt in (1, 2):
+            try:
+                await self._write_batch(batch)
+                self.written += len(batch)
+                return
+            except Exception as e:
+                error = e
+
+        self.failed_batches += 1
+        budget = [self.max_split_writes]
+        dropped = await self._isolate(batch, budget)
+        if not dropped:
+            return
+        self.failed_items += len(dropped)
+        labels = ", ".join(str(self._describe(item)) for item in dropped[:MAX_LOGGED_DROPPED])
+        more = f" 等 {len(dropped)} 条" if len(dropped) > MAX_LOGGED_DROPPED else ""
+        logger.warning(
+            f"{self.name} 批量写入失败，丢弃 {len(dropped)}/{len(batch)} 条: {type(error).__name__}: {error}; "
+            f"丢弃条目: {labels}{more}"
+        )
+
+    async def _isolate(self, items: List[T], budget: List[int]) -> List[T]:
+        """items 整体写入已失败：二分后分别重试，返回最终丢弃的条目（写入次数用尽时剩余条目全部丢弃）"""
+        if len(items) <= 1:
+            return list(items)
+        mid = len(items) // 2
+        dropped: List[T] = []
+        for half in (items[:mid], items[mid:]):
+            if budget[0] <= 0:
+                dropped.extend(half)
+                continue
+            budget[0] -= 1
+            try:
+                await self._write_batch(half)
+                self.written += len(half)
+            except Exception:
+                dropped.extend(await self._isolate(half, budget))
+        return dropped
+
+    async def _run(self) -> None:
+        while True:
+            self._idle = True
+            first = await self._queue.get()
+            self._idle = False
+            await self._flush(await self._collect(first))
+            if self._stopping and self._queue.empty():
+                return
+
+    def start(self) -> None:
+        """启动后台写入任务"""
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self, timeout: float = 10.0) -> None:
+        """
+        停止后台任务并写完队列中剩余条目
+
+        Args:
+            timeout: 等待剩余条目写完的最长时间（秒）
+        """
+        self._stopping = True
+        task, self._task = self._task, None
+        if task is not None:
+            # 空闲（等待新条目）时直接取消；正在写入时等当前批次写完
+            if self._idle:
+                task.cancel()
+            try:
+                await asyncio.wait_for(task, timeout=timeout)
+            except (asyncio.CancelledError, asyncio.TimeoutError, Exception):
+                pass
+
+        async def drain() -> None:
+            while not self._queue.empty():
+                batch: List[T] = []
+                while len(batch) < self.batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                await self._flush(batch)
+
+        try:
+            await asyncio.wait_for(drain(), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.dropped += self._queue.qsize()
+            logger.warning(f"{self.name} 关闭时未能写完队列，丢弃 {self._queue.qsize()} 条")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize(),
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed_batches": self.failed_batches,
+            "failed_items": self.failed_items,
+        }
@@ -1,9 +1,11 @@
 from __future__ import annotations
 
-import json
 from dataclasses import dataclass, field
 from typing import Any, Dict, List, Optional, Tuple
 
+from app.utils import jsonx
+from app.utils.sse import SSEEvent, SSEParser
+
 
 def gemini_generate_content_request_to_openai_chat_request(
     *,
@@ -108,7 +110,7 @@ class ChatCompletionsSSEToGeminiSSETranslator:
     输出：data: <GeminiResponse>\\n\\n
     """
 
-    _buffer: bytes = b""
+    _parser: SSEParser = field(default_factory=SSEParser, repr=False)
     _finished: bool = False
     _error_emitted: bool = False
     _tool_call_seen: bool = False
@@ -120,12 +122,10 @@ class ChatCompletionsSSEToGeminiSSETranslator:
         if self._finished:
             return ([], True)
 
-        self._buffer += raw or b""
         out: List[bytes] = []
 
-        while b"\n\n" in self._buffer:
-            block, self._buffer = self._buffer.split(b"\n\n", 1)
-            for event in self._handle_sse_block(block):
+        for sse_event in self._parser.feed(raw or b""):
+            for event in self._handle_sse_event(sse_event):
                 out.append(event)
                 if self._finished:
                     break
@@ -134,27 +134,19 @@ class ChatCompletionsSSEToGeminiSSETranslator:
 
         return (out, self._finished)
 
-    def _handle_sse_block(self, block: bytes) -> List[bytes]:
+    def _handle_sse_event(self, sse_event: SSEEvent) -> List[bytes]:
         out: List[bytes] = []
 
-        # collect data lines (SSE can have multi data lines)
-        data_lines: List[bytes] = []
-        for raw_line in (block or b"").split(b"\n"):
-            line = raw_line.strip()
-            if not line.startswith(b"data:"):
-                continue
-            data_lines.append(line[5:].strip())
-
-        if not data_lines:
+        # 多行 data: 已由 SSEParser 按规范以 \n 连接
+        data = sse_event.data.strip()
+        if not data:
             return []
-
-        data = b"\n".join(data_lines).strip()
-        if data == b"[DONE]":
+        if data == "[DONE]":
             self._finished = True
             return []
 
         try:
-            payload = json.loads(data.decode("utf-8", errors="replace"))
+            payload = jsonx.loads(data)
         except Exception:
             return []
 
@@ -344,8 +336,7 @@ def _extract_openai_error(err: Any) -> Tuple[str, int]:
 
 
 def _gemini_data_sse(payload: Dict[str, Any]) -> bytes:
-    data = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
-    return f"data: {data}\n\n".encode("utf-8")
+    return b"data: " + jsonx.dumps(payload) + b"\n\n"
 
 
 def _gemini_error_sse(message: str, code: int) -> bytes:
@@ -0,0 +1,142 @@
+"""
+JSON 编解码（热路径专用）
+
+SSE 转换器每个事件都要 dumps / loads 一次，标准库 json 在这里是主要 CPU 开销之一。
+本模块按可用性自动选择后端：orjson > msgspec > 标准库 json，并统一输出格式：
+- dumps 返回 UTF-8 bytes（不转义非 ASCII，紧凑分隔符），生成器可直接拼接后 yield bytes
+- dumps_str 返回 str，供仍以 str 输出 SSE 的转换器使用
+- loads 接受 str / bytes，解析失败统一抛出 json.JSONDecodeError（ValueError 子类）
+
+第三方后端不支持的输入（非 str 键、超出 64 位的整数、NaN 字面量、孤立代理项等）自动退回标准库，
+语义与标准库一致（浮点数等的文本形式可能不同）。
+
+调用方应使用 `from app.utils import jsonx` 后通过 `jsonx.dumps(...)` 调用，以便 set_backend 切换生效。
+"""
+from __future__ import annotations
+
+import json
+from typing import Any, Callable, Dict, List, Union
+
+try:  # pragma: no cover - 取决于运行环境
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:  # pragma: no cover - 取决于运行环境
+    import msgspec
+except ImportError:  # pragma: no cover
+    msgspec = None
+
+JSONDecodeError = json.JSONDecodeError
+
+_std_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+_std_ascii_encoder = json.JSONEncoder(ensure_ascii=True, separators=(",", ":"))
+_std_decode = json.loads
+
+
+def _std_dumps_str(obj: Any) -> str:
+    return _std_encoder.encode(obj)
+
+
+def _std_dumps(obj: Any) -> bytes:
+    text = _std_encoder.encode(obj)
+    try:
+        return text.encode("utf-8")
+    except UnicodeEncodeError:
+        # 孤立代理项无法编码为 UTF-8：改为 \uXXXX 转义输出
+        return _std_ascii_encoder.encode(obj).encode("ascii")
+
+
+def _std_loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return _std_decode(data)
+
+
+def _build_orjson() -> Dict[str, Callable[..., Any]]:
+    encode = orjson.dumps
+    decode = orjson.loads
+    option = orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj: Any) -> bytes:
+        try:
+            return encode(obj, option=option)
+        except TypeError:
+            return _std_dumps(obj)
+
+    def dumps_str(obj: Any) -> str:
+        try:
+            return encode(obj, option=option).decode("utf-8")
+        except TypeError:
+            return _std_dumps_str(obj)
+
+    def loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+        try:
+            return decode(data)
+        except orjson.JSONDecodeError:
+            # NaN / Infinity 字面量、孤立代理项等 orjson 拒绝的输入交给标准库（仍非法时由标准库抛错）
+            return _std_loads(data)
+
+    return {"dumps": dumps, "dumps_str": dumps_str, "loads": loads}
+
+
+def _build_msgspec() -> Dict[str, Callable[..., Any]]:
+    encode = msgspec.json.Encoder().encode
+    decode = msgspec.json.Decoder().decode
+
+    def dumps(obj: Any) -> bytes:
+        try:
+            return encode(obj)
+        except (TypeError, ValueError, msgspec.EncodeError):
+            return _std_dumps(obj)
+
+    def dumps_str(obj: Any) -> str:
+        try:
+            return encode(obj).decode("utf-8")
+        except (TypeError, ValueError, msgspec.EncodeError):
+            return _std_dumps_str(obj)
+
+    def loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+        try:
+            return decode(data)
+        except msgspec.DecodeError:
+            return _std_loads(data)
+
+    return {"dumps": dumps, "dumps_str": dumps_str, "loads": loads}
+
+
+def available_backends() -> List[str]:
+    """当前环境可用的后端（按优先级）"""
+    names = []
+    if orjson is not None:
+        names.append("orjson")
+    if msgspec is not None:
+        names.append("msgspec")
+    names.append("json")
+    return names
+
+
+backend = "json"
+dumps: Callable[[Any], bytes] = _std_dumps
+dumps_str: Callable[[Any], str] = _std_dumps_str
+loads: Callable[[Union[str, bytes, bytearray, memoryview]], Any] = _std_loads
+
+
+def set_backend(name: str) -> None:
+    """切换后端（orjson / msgspec / json）；主要供基准测试与单测使用"""
+    global backend, dumps, dumps_str, loads
+    if name not in available_backends():
+        raise ValueError(f"JSON 后端不可用: {name}")
+    if name == "orjson":
+        funcs = _build_orjson()
+    elif name == "msgspec":
+        funcs = _build_msgspec()
+    else:
+        funcs = {"dumps": _std_dumps, "dumps_str": _std_dumps_str, "loads": _std_loads}
+    backend = name
+    dumps = funcs["dumps"]
+    dumps_str = funcs["dumps_str"]
+    loads = funcs["loads"]
+
+
+set_backend(available_backends()[0])
@@ -0,0 +1,230 @@
+"""
+流式响应保活（心跳注入）
+
+with_keepalive(source, interval=..., heartbeat=...) 包装任意异步迭代器：上游超过 interval 秒没有产出时
+插入一个心跳（默认 SSE 注释 `: ping`，也可以是 provider 自己的心跳事件），上游数据照常透传。
+
+与 `asyncio.wait({task}, timeout=...)` / `wait_for(shield(task), ...)` 的做法相比：
+- 不为每个 item 创建 Task：每条流只有一个读取任务，整条流都在该任务内迭代 source，
+  产出经 asyncio.Queue 交给消费方（最多预读一个 item）。source 内部的 anyio 取消作用域
+  （httpx/httpcore 的连接、读超时）始终绑定在同一个任务上，超时照常以 httpx.ReadTimeout 等异常抛出
+- 不为每次等待创建定时器：同一事件循环内所有保活流共用一个哈希时间轮（TimerWheel），
+  整个时间轮只有一个 loop.call_at 定时器；产出数据只更新时间戳，到期时由时间轮向队列投递心跳
+- 消费方被取消或提前关闭时取消读取任务，source 在读取任务内收到 CancelledError 并完成清理
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+import weakref
+from typing import Any, AsyncIterable, AsyncIterator, Callable, List, Optional, Set, TypeVar, Union
+
+T = TypeVar("T")
+
+SSE_PING = b": ping\n\n"
+
+# 时间轮精度（秒）：心跳最多晚一个精度周期发出
+DEFAULT_RESOLUTION = 0.5
+DEFAULT_WHEEL_SIZE = 512
+
+_PING = object()
+_ITEM = object()
+_ERROR = object()
+_END = object()
+
+
+class _KeepaliveEntry:
+    """一个保活流在时间轮中的登记项"""
+
+    __slots__ = ("interval", "last_activity", "tick", "queue", "waiting", "__weakref__")
+
+    def __init__(self, interval: float, now: float, queue: asyncio.Queue):
+        self.interval = interval
+        self.last_activity = now
+        self.tick: Optional[int] = None
+        self.queue = queue
+        # 消费方正在等待队列（只在等待时投递心跳）
+        self.waiting = False
+
+    def expire(self, wheel: "TimerWheel", now: float) -> None:
+        due = self.last_activity + self.interval
+        if due > now:
+            # 期间有过产出：按最新时间戳重新登记
+            wheel.schedule(self, due)
+            return
+        if self.waiting and self.queue.empty():
+            self.queue.put_nowait((_PING, None))
+            self.last_activity = now
+        wheel.schedule(self, now + self.interval)
+
+
+class TimerWheel:
+    """
+    单个事件循环共享的哈希时间轮
+
+    登记 / 取消 O(1)；只在有登记项时挂一个 loop.call_at 定时器，每个精度周期批量处理到期的桶。
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        *,
+        resolution: float = DEFAULT_RESOLUTION,
+        size: int = DEFAULT_WHEEL_SIZE,
+    ):
+        self._loop = loop
+        self._resolution = resolution
+        self._size = size
+        self._buckets: List[Set[_KeepaliveEntry]] = [set() for _ in range(size)]
+        self._count = 0
+        self._current = self._tick_of(loop.time())  # 已处理到的 tick
+        self._handle: Optional[asyncio.TimerHandle] = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def armed(self) -> bool:
+        return self._handle is not None
+
+    def _tick_of(self, when: float) -> int:
+        return int(when / self._resolution)
+
+    def schedule(self, entry: _KeepaliveEntry, when: float) -> None:
+        if self._handle is None:
+            self._current = self._tick_of(self._loop.time())
+        tick = max(math.ceil(when / self._resolution), self._current + 1)
+        if entry.tick is None:
+            self._count += 1
+        else:
+            self._buckets[entry.tick % self._size].discard(entry)
+        entry.tick = tick
+        self._buckets[tick % self._size].add(entry)
+        if self._handle is None:
+            self._arm()
+
+    def cancel(self, entry: _KeepaliveEntry) -> None:
+        if entry.tick is None:
+            return
+        self._buckets[entry.tick % self._size].discard(entry)
+        entry.tick = None
+        self._count -= 1
+        if self._count == 0 and self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _arm(self) -> None:
+        self._handle = self._loop.call_at((self._current + 1) * self._resolution, self._run)
+
+    def _run(self) -> None:
+        self._handle = None
+        now = self._loop.time()
+        target = self._tick_of(now)
+        # 落后超过一圈（事件循环长时间阻塞）时每个桶只需检查一次
+        start = max(self._current + 1, target - self._size + 1)
+        expired: List[_KeepaliveEntry] = []
+        for tick in range(start, target + 1):
+            bucket = self._buckets[tick % self._size]
+            if not bucket:
+                continue
+            due = [entry for entry in bucket if entry.tick <= target]
+            for entry in due:
+                bucket.discard(entry)
+                entry.tick = None
+            expired.extend(due)
+        self._count -= len(expired)
+        self._current = target
+        for entry in expired:
+            entry.expire(self, now)
+        if self._count and self._handle is None:
+            self._arm()
+
+
+_wheels: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, TimerWheel]" = weakref.WeakKeyDictionary()
+
+
+def get_timer_wheel() -> TimerWheel:
+    """获取当前事件循环共享的时间轮"""
+    loop = asyncio.get_running_loop()
+    wheel = _wheels.get(loop)
+    if wheel is None:
+        wheel = _wheels[loop] = TimerWheel(loop)
+    return wheel
+
+
+async def _pump(iterator: AsyncIterator[Any], queue: asyncio.Queue) -> None:
+    """读取任务：在同一个任务内迭代 source，逐个交给消费方（消费方取走上一个后才继续读取）"""
+    result: Any = (_END, None)
+    try:
+        async for item in iterator:
+            queue.put_nowait((_ITEM, item))
+            await queue.join()
+    except BaseException as exc:
+        # 包括 source 自己抛出的 CancelledError；被消费方取消时没有人再读队列
+        result = (_ERROR, exc)
+        if isinstance(exc, (asyncio.CancelledError, KeyboardInterrupt, SystemExit)):
+            raise
+    finally:
+        try:
+            aclose = getattr(iterator, "aclose", None)
+            if aclose is not None:
+                try:
+                    await aclose()
+                except Exception:
+                    pass
+        finally:
+            # 清理完成后再通知消费方结束
+            queue.put_nowait(result)
+
+
+async def with_keepalive(
+    source: AsyncIterable[T],
+    *,
+    interval: float,
+    heartbeat: Union[Any, Callable[[], Any]] = SSE_PING,
+    wheel: Optional[TimerWheel] = None,
+) -> AsyncIterator[Any]:
+    """
+    透传 source 的产出；上游超过 interval 秒没有产出时插入 heartbeat
+
+    Args:
+        source: 任意异步迭代器（结束或被关闭时会调用其 aclose）
+        interval: 心跳间隔（秒）
+        heartbeat: 心跳值（原样产出）；传入可调用对象时每次调用生成
+        wheel: 指定时间轮（默认使用当前事件循环共享的时间轮）
+    """
+    loop = asyncio.get_running_loop()
+    if wheel is None:
+        wheel = get_timer_wheel()
+    make_heartbeat = heartbeat if callable(heartbeat) else None
+    queue: asyncio.Queue = asyncio.Queue()
+    entry = _KeepaliveEntry(interval, loop.time(), queue)
+    wheel.schedule(entry, entry.last_activity + interval)
+    reader = loop.create_task(_pump(source.__aiter__(), queue))
+    try:
+        while True:
+            entry.waiting = True
+            try:
+                kind, value = await queue.get()
+            finally:
+                entry.waiting = False
+            queue.task_done()
+
+            if kind is _PING:
+                yield make_heartbeat() if make_heartbeat is not None else heartbeat
+                continue
+            if kind is _END:
+                return
+            if kind is _ERROR:
+                raise value
+            entry.last_activity = loop.time()
+            yield value
+            entry.last_activity = loop.time()
+    finally:
+        wheel.cancel(entry)
+        if not reader.done():
+            # 消费方提前关闭（或外层被取消）：取消读取任务，等 source 完成清理
+            reader.cancel()
+            await asyncio.wait((reader,))
+        if not reader.cancelled():
+            reader.exception()
@@ -6,6 +6,9 @@ import time
 from typing import Any, Dict, List, Optional, Tuple
 from uuid import uuid4
 
+from app.utils import jsonx
+from app.utils.sse import SSEEvent, SSEParser, SSETemplate, template_slot
+
 
 def responses_request_to_chat_completions_request(request_data: Dict[str, Any]) -> Dict[str, Any]:
     """
@@ -201,6 +204,9 @@ class _ToolCallState:
     name: str = ""
     arguments: str = ""
     item_added: bool = False
+    # function_call_arguments.delta 模板（item_id 变化时重建）
+    delta_tpl: Optional[SSETemplate] = None
+    delta_tpl_item_id: str = ""
 
 
 @dataclass
@@ -216,7 +222,7 @@ class ChatCompletionsToResponsesSSETranslator:
 
     original_request: Dict[str, Any]
 
-    _buffer: bytes = b""
+    _parser: SSEParser = field(default_factory=SSEParser, repr=False)
     _started: bool = False
     _upstream_done: bool = False
     _finalized: bool = False
@@ -227,6 +233,7 @@ class ChatCompletionsToResponsesSSETranslator:
     _created_at: int = 0
     _msg_item_id: str = ""
     _text_buf: List[str] = field(default_factory=list)
+    _text_delta_tpl: Optional[SSETemplate] = field(default=None, repr=False)
     _msg_open: bool = False
     _msg_done: bool = False
 
@@ -236,12 +243,10 @@ class ChatCompletionsToResponsesSSETranslator:
         if self._finalized:
             return ([], True)
 
-        self._buffer += raw or b""
         out: List[bytes] = []
 
-        while b"\n\n" in self._buffer:
-            block, self._buffer = self._buffer.split(b"\n\n", 1)
-            for event in self._handle_sse_block(block):
+        for sse_event in self._parser.feed(raw or b""):
+            for event in self._handle_sse_event(sse_event):
                 out.append(event)
                 if self._upstream_done or self._error_emitted:
                     return (out, True)
@@ -261,8 +266,7 @@ class ChatCompletionsToResponsesSSETranslator:
         return self._seq
 
     def _emit(self, event_name: str, payload: Dict[str, Any]) -> bytes:
-        data = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
-        return f"event: {event_name}\ndata: {data}\n\n".encode("utf-8")
+        return b"event: " + event_name.encode("utf-8") + b"\ndata: " + jsonx.dumps(payload) + b"\n\n"
 
     def _ensure_started(self, chat_chunk: Dict[str, Any]) -> List[bytes]:
         if self._started:
@@ -367,19 +371,16 @@ class ChatCompletionsToResponsesSSETranslator:
             self._emit("response.output_item.done", item_done),
         ]
 
-    def _handle_sse_block(self, block: bytes) -> List[bytes]:
-        lines = [ln.strip() for ln in block.split(b"\n") if ln.strip()]
-        data_lines = [ln for ln in lines if ln.startswith(b"data:")]
-        if not data_lines:
+    def _handle_sse_event(self, sse_event: SSEEvent) -> List[bytes]:
+        data = sse_event.data.strip()
+        if not data:
             return []
-
-        data = data_lines[-1][5:].strip()
-        if data == b"[DONE]":
+        if data == "[DONE]":
             self._upstream_done = True
             return []
 
         try:
-            payload = json.loads(data.decode("utf-8"))
+            payload = jsonx.loads(data)
         except Exception:
             return []
 
@@ -410,20 +411,21 @@ class ChatCompletionsToResponsesSSETranslator:
         if isinstance(content, str) and content:
             out.extend(self._ensure_message_open())
             self._text_buf.append(content)
-            out.append(
-                self._emit(
-                    "response.output_text.delta",
+            if self._text_delta_tpl is None:
+                # 每个 token 只有 sequence_number 与 delta 变化，其余部分预渲染一次
+                self._text_delta_tpl = SSETemplate(
                     {
                         "type": "response.output_text.delta",
-                        "sequence_number": self._next_seq(),
+                        "sequence_number": template_slot(0),
                         "item_id": self._msg_item_id,
                         "output_index": 0,
                         "content_index": 0,
-                        "delta": content,
+                        "delta": template_slot(1),
                         "logprobs": [],
                     },
+                    event="response.output_text.delta",
                 )
-            )
+            out.append(self._text_delta_tpl.render(self._next_seq(), content))
 
         finish_reason = choice0.get("finish_reason")
         if isinstance(finish_reason, str) and finish_reason:
@@ -480,18 +482,19 @@ class ChatCompletionsToResponsesSSETranslator:
                     )
                 )
 
-            out.append(
-                self._emit(
-                    "response.function_call_arguments.delta",
+            if st.delta_tpl is None or st.delta_tpl_item_id != item_id:
+                st.delta_tpl = SSETemplate(
                     {
                         "type": "response.function_call_arguments.delta",
-                        "sequence_number": self._next_seq(),
+                        "sequence_number": template_slot(0),
                         "item_id": item_id,
                         "output_index": idx,
-                        "delta": args_delta,
+                        "delta": template_slot(1),
                     },
+                    event="response.function_call_arguments.delta",
                 )
-            )
+                st.delta_tpl_item_id = item_id
+            out.append(st.delta_tpl.render(self._next_seq(), args_delta))
 
         return out
 
@@ -607,7 +610,7 @@ class ResponsesToChatCompletionsSSETranslator:
 
     original_request: Dict[str, Any]
 
-    _buffer: bytes = b""
+    _parser: SSEParser = field(default_factory=SSEParser, repr=False)
     _done: bool = False
     _error_emitted: bool = False
     _role_emitted: bool = False
@@ -620,12 +623,10 @@ class ResponsesToChatCompletionsSSETranslator:
         if self._done or self._error_emitted:
             return ([], True)
 
-        self._buffer += raw or b""
         out: List[bytes] = []
 
-        while b"\n\n" in self._buffer:
-            block, self._buffer = self._buffer.split(b"\n\n", 1)
-            out.extend(self._handle_sse_block(block))
+        for sse_event in self._parser.feed(raw or b""):
+            out.extend(self._handle_sse_event(sse_event))
             if self._done or self._error_emitted:
                 return (out, True)
 
@@ -645,8 +646,7 @@ class ResponsesToChatCompletionsSSETranslator:
         self._completion_id = f"chatcmpl_{uuid4().hex}"
 
     def _emit_chat(self, payload: Dict[str, Any]) -> bytes:
-        data = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
-        return f"data: {data}\n\n".encode("utf-8")
+        return b"data: " + jsonx.dumps(payload) + b"\n\n"
 
     def _emit_done(self) -> bytes:
         return b"data: [DONE]\n\n"
@@ -683,39 +683,19 @@ class ResponsesToChatCompletionsSSETranslator:
             payload["error"]["code"] = int(code)
         return self._emit_chat(payload)
 
-    def _handle_sse_block(self, block: bytes) -> List[bytes]:
+    def _handle_sse_event(self, sse_event: SSEEvent) -> List[bytes]:
         if self._done or self._error_emitted:
             return []
 
-        event_name = ""
-        data_lines: List[bytes] = []
-
-        for raw_line in (block or b"").split(b"\n"):
-            line = raw_line.strip()
-            if not line:
-                continue
-            if line.startswith(b"event:"):
-                try:
-                    event_name = line[len(b"event:") :].strip().decode("utf-8", errors="replace")
-                except Exception:
-                    event_name = ""
-            elif line.startswith(b"data:"):
-                data_lines.append(line[len(b"data:") :].strip())
-
-        if not data_lines:
-            return []
-
-        try:
-            data_str = b"\n".join(data_lines).decode("utf-8", errors="replace").strip()
-        except Exception:
-            return []
+        event_name = sse_event.event
+        data_str = sse_event.data.strip()
 
         if data_str == "[DONE]":
             self._done = True
             return [self._build_final_chunk(), self._emit_done()]
 
         try:
-            payload = json.loads(data_str) if data_str else None
+            payload = jsonx.loads(data_str) if data_str else None
         except Exception:
             return []
 
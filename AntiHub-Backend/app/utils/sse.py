@@ -0,0 +1,348 @@
+"""
+SSE（Server-Sent Events）增量解析
+
+全项目共用的 SSE 解析器，替代各处手写的 `buffer += chunk; buffer.split("\\n", 1)`：
+- bytearray 缓冲 + 扫描游标：每次 feed 只定位最后一个换行符，之前的完整行一次性切出；
+  缓冲中只保留最后一个不完整的行，不会像 split(..., 1) 那样每行复制剩余缓冲，整体 O(n)
+- 单行跨越多个 chunk 时从扫描游标继续查找，不会重复扫描已检查过的字节
+- 增量 UTF-8 解码：只解码到最后一个换行符为止（换行符不会出现在多字节字符内部），
+  被 chunk 边界拆开的多字节字符留在缓冲中等待后续字节；大块数据经 memoryview 解码，不额外复制
+- 行尾兼容 LF / CRLF
+
+两层 API：
+- SSELineBuffer：只负责切行，供按行处理（每个 data: 行独立解析）的调用方使用
+- SSEParser：按规范组装事件（多行 data: 以 \\n 连接、event: / id: / retry: 字段、: 注释行）
+
+输出侧：
+- SSETemplate：高频增量事件（text_delta 等）的预渲染模板，只对变化的字段做 JSON 编码
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from json.encoder import encode_basestring as _json_quote
+from typing import Any, AsyncIterable, AsyncIterator, Dict, List, Optional, Union
+
+import httpx
+
+from app.utils import jsonx
+
+Chunk = Union[bytes, bytearray, memoryview, str]
+
+# 待解码区域超过该大小时经 memoryview 解码（小块直接切片更快）
+_ZERO_COPY_MIN = 64 * 1024
+
+
+class SSELineBuffer:
+    """增量切行：feed 原始字节，返回已完整的行（已解码、不含行尾）"""
+
+    __slots__ = ("_buf", "_scan")
+
+    def __init__(self) -> None:
+        self._buf = bytearray()  # 只保存最后一个不完整的行
+        self._scan = 0  # 扫描游标：从这里继续查找换行符
+
+    def __len__(self) -> int:
+        """尚未消费的字节数"""
+        return len(self._buf)
+
+    @staticmethod
+    def _split(data: Union[bytes, bytearray], end: int) -> List[str]:
+        # data[:end] 以 \n 结尾：整段一次解码 + split，避免逐行切片；大块数据经 memoryview 解码不复制
+        if end >= _ZERO_COPY_MIN:
+            with memoryview(data) as view:
+                text = str(view[:end], "utf-8", "replace")
+        else:
+            text = data[:end].decode("utf-8", "replace")
+        if "\r" in text:
+            text = text.replace("\r\n", "\n")
+        lines = text.split("\n")
+        lines.pop()
+        return lines
+
+    def feed(self, chunk: Chunk) -> List[str]:
+        if not chunk:
+            return []
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        elif isinstance(chunk, memoryview):
+            chunk = chunk.tobytes()
+
+        buf = self._buf
+        if not buf:
+            # 没有残留的不完整行：直接在 chunk 上切行，不复制进缓冲
+            nl = chunk.rfind(b"\n")
+            if nl < 0:
+                buf += chunk
+                self._scan = len(buf)
+                return []
+            lines = self._split(chunk, nl + 1)
+            if nl + 1 < len(chunk):
+                buf += chunk[nl + 1:]
+                self._scan = len(buf)
+            return lines
+
+        buf += chunk
+        nl = buf.rfind(b"\n", self._scan)
+        if nl < 0:
+            self._scan = len(buf)
+            return []
+        lines = self._split(buf, nl + 1)
+        # CPython 的 bytearray 头部删除只移动起始偏移，不搬移剩余数据
+        del buf[:nl + 1]
+        self._scan = len(buf)
+        return lines
+
+    def flush(self) -> List[str]:
+        """流结束：返回最后一个没有换行符结尾的不完整行（若有）"""
+        if not self._buf:
+            return []
+        tail = bytes(self._buf)
+        self._buf.clear()
+        self._scan = 0
+        if tail.endswith(b"\r"):
+            tail = tail[:-1]
+        return [tail.decode("utf-8", "replace")]
+
+
+def parse_data_line(line: str) -> Optional[str]:
+    """
+    按行处理时使用：`data:` 行返回字段值（去掉冒号后的一个空格），其它行返回 None
+    """
+    if not line.startswith("data:"):
+        return None
+    value = line[5:]
+    if value[:1] == " ":
+        value = value[1:]
+    return value
+
+
+@dataclass
+class SSEEvent:
+    """一个完整的 SSE 事件"""
+
+    data: str
+    event: str = ""  # 未指定 event 字段时为空串（规范默认类型 message）
+    id: Optional[str] = None
+    retry: Optional[int] = None
+
+
+class SSEParser:
+    """
+    规范化的增量 SSE 事件解析器
+
+    - 空行分发事件；没有 data 字段的事件被忽略（规范行为）
+    - 多个 data: 行以 \\n 连接
+    - 以 : 开头的注释行（心跳）被忽略
+    - flush() 在流结束时分发最后一个未以空行结尾的事件（宽松处理，规范中会丢弃）
+    """
+
+    __slots__ = ("_lines", "_data", "_event", "_last_id", "_retry")
+
+    def __init__(self) -> None:
+        self._lines = SSELineBuffer()
+        self._data: List[str] = []
+        self._event = ""
+        self._last_id: Optional[str] = None
+        self._retry: Optional[int] = None
+
+    def feed(self, chunk: Chunk) -> List[SSEEvent]:
+        events: List[SSEEvent] = []
+        data = self._data
+        for line in self._lines.feed(chunk):
+            # 快速路径：绝大多数行是 data: 行或分隔空行
+            if line.startswith("data:"):
+                data.append(line[6:] if line[5:6] == " " else line[5:])
+            elif not line:
+                if data:
+                    events.append(self._dispatch())
+                    data = self._data
+                else:
+                    self._event = ""
+            else:
+                self._process_line(line)
+        return events
+
+    def flush(self) -> List[SSEEvent]:
+        events: List[SSEEvent] = []
+        for line in self._lines.flush():
+            event = self._process_line(line)
+            if event is not None:
+                events.append(event)
+        event = self._dispatch()
+        if event is not None:
+            events.append(event)
+        return events
+
+    def _dispatch(self) -> Optional[SSEEvent]:
+        if not self._data:
+            self._event = ""
+            return None
+        data = self._data
+        event = SSEEvent(
+            data=data[0] if len(data) == 1 else "\n".join(data),
+            event=self._event,
+            id=self._last_id,
+            retry=self._retry,
+        )
+        self._data = []
+        self._event = ""
+        return event
+
+    def _process_line(self, line: str) -> Optional[SSEEvent]:
+        if not line:
+            return self._dispatch()
+        if line[0] == ":":
+            return None
+
+        colon = line.find(":")
+        if colon < 0:
+            name, value = line, ""
+        else:
+            name, value = line[:colon], line[colon + 1:]
+            if value[:1] == " ":
+                value = value[1:]
+
+        if name == "data":
+            self._data.append(value)
+        elif name == "event":
+            self._event = value
+        elif name == "id":
+            if "\0" not in value:
+                self._last_id = value
+        elif name == "retry":
+            if value.isdigit():
+                self._retry = int(value)
+        return None
+
+
+def _iter_source(source: Union[httpx.Response, AsyncIterable[Chunk]]) -> AsyncIterable[Chunk]:
+    if isinstance(source, httpx.Response):
+        return source.aiter_bytes()
+    return source
+
+
+async def aiter_sse_lines(source: Union[httpx.Response, AsyncIterable[Chunk]]) -> AsyncIterator[str]:
+    """
+    逐行迭代 SSE 流（包括空行）
+
+    Args:
+        source: httpx 流式响应（按 aiter_bytes 读取）或任意 bytes/str 异步迭代器
+    """
+    lines = SSELineBuffer()
+    async for chunk in _iter_source(source):
+        for line in lines.feed(chunk):
+            yield line
+    for line in lines.flush():
+        yield line
+
+
+async def aiter_sse_events(source: Union[httpx.Response, AsyncIterable[Chunk]]) -> AsyncIterator[SSEEvent]:
+    """
+    逐事件迭代 SSE 流
+
+    Args:
+        source: httpx 流式响应（按 aiter_bytes 读取）或任意 bytes/str 异步迭代器
+    """
+    parser = SSEParser()
+    async for chunk in _iter_source(source):
+        for event in parser.feed(chunk):
+            yield event
+    for event in parser.flush():
+        yield event
+
+
+def template_slot(i: int) -> str:
+    """SSETemplate 的第 i 个槽位占位值（在 payload 中代替会变化的字段）"""
+    return f"\x00__sse_template_slot_{i}__\x00"
+
+
+# 槽位值的快速路径：字符串用标准库的 C 实现加引号转义（对合法字符串，与 orjson / msgspec 的转义结果相同），
+# 整数直接格式化；其它类型以及含孤立代理项的字符串交给 jsonx
+def _slot_bytes(value: Any) -> bytes:
+    t = type(value)
+    if t is str:
+        try:
+            return _json_quote(value).encode("utf-8")
+        except UnicodeEncodeError:
+            return jsonx.dumps(value)
+    if t is int:
+        return b"%d" % value
+    return jsonx.dumps(value)
+
+
+def _slot_str(value: Any) -> str:
+    t = type(value)
+    if t is str:
+        return _json_quote(value)
+    if t is int:
+        return str(value)
+    return jsonx.dumps_str(value)
+
+
+class SSETemplate:
+    """
+    预渲染的 SSE 事件模板
+
+    payload 中会变化的字段用 template_slot(0..n-1) 占位，构造时整体渲染一次并在占位处切开；
+    render(*values) / render_str(*values) 只对槽位值做 JSON 编码后与常量片段拼接，
+    输出与对完整 payload 调用 jsonx.dumps 并加上 `event:` / `data:` 帧的结果逐字节一致。
+
+    render / render_str 是按槽位数量在构造时生成的闭包（常量片段作为闭包变量），
+    避免逐 token 调用时的参数打包与属性查找。
+    """
+
+    __slots__ = ("slot_count", "render", "render_str")
+
+    def __init__(self, payload: Dict[str, Any], *, event: Optional[str] = None):
+        rendered = jsonx.dumps(payload)
+        parts: List[bytes] = []
+        i = 0
+        while True:
+            marker = jsonx.dumps(template_slot(i))
+            count = rendered.count(marker)
+            if count == 0:
+                break
+            if count > 1:
+                raise ValueError(f"模板槽位 {i} 出现了多次")
+            before, rendered = rendered.split(marker, 1)
+            parts.append(before)
+            i += 1
+        if jsonx.dumps(template_slot(i + 1)) in rendered:
+            raise ValueError(f"模板槽位必须从 0 开始连续编号（缺少槽位 {i}）")
+        parts.append(rendered)
+
+        head = b"event: " + event.encode("utf-8") + b"\n" if event else b""
+        parts[0] = head + b"data: " + parts[0]
+        parts[-1] = parts[-1] + b"\n\n"
+        self.slot_count = len(parts) - 1
+        self.render = _compile_render(tuple(parts), _slot_bytes, b"")
+        self.render_str = _compile_render(tuple(part.decode("utf-8") for part in parts), _slot_str, "")
+
+
+def _compile_render(parts: tuple, encode: Any, empty: Any) -> Any:
+    n = len(parts) - 1
+    if n == 1:
+        p0, p1 = parts
+
+        def render(value: Any) -> Any:
+            return p0 + encode(value) + p1
+
+    elif n == 2:
+        p0, p1, p2 = parts
+
+        def render(value0: Any, value1: Any) -> Any:
+            return empty.join((p0, encode(value0), p1, encode(value1), p2))
+
+    else:
+        head, tail = parts[0], parts[1:]
+
+        def render(*values: Any) -> Any:
+            if len(values) != n:
+                raise ValueError(f"模板需要 {n} 个值，实际为 {len(values)}")
+            out = [head]
+            for value, part in zip(values, tail):
+                out.append(encode(value))
+                out.append(part)
+            return empty.join(out)
+
+    return render
@@ -8,10 +8,46 @@ Token 计算模块
 - 西文字符：每个计 1 个字符单位
 - 4 个字符单位 = 1 token
 - 根据 token 数量应用系数调整（小文本有更高的开销比例）
+
+实现说明：
+- 非西文字符计数在 C 层完成：纯 ASCII 直接返回，其余用预编译正则按连续段删除西文（或非西文）字符后比较长度；
+  安装了 NumPy 时，超长文本改为在 UTF-32 码点数组上做区间比较
+- count_all_tokens 在一次请求内按文本内容记忆字符单位（Claude Code 会在多条消息里重复附带相同的长文本）；
+  system 与 tools 的 token 数按内容摘要跨请求缓存（见 app.cache.content_cache）
 """
 
 import json
-from typing import Any, Optional
+import re
+from typing import Any, Dict, Optional
+
+from app.cache.content_cache import get_content_cache
+
+try:
+    import numpy as _np
+except ImportError:  # NumPy 为可选依赖
+    _np = None
+
+# 西文字符码点区间（与 is_non_western_char 一致）
+_WESTERN_RANGES = (
+    (0x0000, 0x024F),  # 基本 ASCII + 拉丁字母扩展-A/B
+    (0x1E00, 0x1EFF),  # 拉丁字母扩展附加
+    (0x2C60, 0x2C7F),  # 拉丁字母扩展-C
+    (0xA720, 0xA7FF),  # 拉丁字母扩展-D
+    (0xAB30, 0xAB6F),  # 拉丁字母扩展-E
+)
+
+_WESTERN_CLASS = "".join(f"\\u{lo:04x}-\\u{hi:04x}" for lo, hi in _WESTERN_RANGES)
+_WESTERN_RUN_RE = re.compile(f"[{_WESTERN_CLASS}]+")
+_NON_WESTERN_RUN_RE = re.compile(f"[^{_WESTERN_CLASS}]+")
+
+# 按文本开头的采样判断以西文还是非西文为主，选择匹配段更长（匹配次数更少）的正则
+_SAMPLE_CHARS = 4096
+
+# 文本长度达到该值时优先走 NumPy（较短文本转换数组的固定开销不划算）
+_NUMPY_MIN_CHARS = 1 << 16
+
+# 请求内记忆的最小文本长度（短文本直接计算比查字典更快）
+_MEMO_MIN_CHARS = 256
 
 
 def is_non_western_char(char: str) -> bool:
@@ -53,7 +89,44 @@ def is_non_western_char(char: str) -> bool:
     return True
 
 
-def count_tokens(text: str) -> int:
+def _count_non_western_numpy(text: str) -> int:
+    codes = _np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=_np.uint32)
+    western = codes <= _WESTERN_RANGES[0][1]
+    for lo, hi in _WESTERN_RANGES[1:]:
+        western |= (codes >= lo) & (codes <= hi)
+    return int(codes.size - _np.count_nonzero(western))
+
+
+def count_non_western_chars(text: str) -> int:
+    """
+    统计文本中非西文字符的数量（结果与逐字符调用 is_non_western_char 相同）
+    """
+    if text.isascii():
+        return 0
+    if _np is not None and len(text) >= _NUMPY_MIN_CHARS:
+        return _count_non_western_numpy(text)
+    return _count_non_western_regex(text)
+
+
+def _count_non_western_regex(text: str) -> int:
+    sample = text[:_SAMPLE_CHARS]
+    if len(sample.encode("latin-1", "ignore")) * 2 >= len(sample):
+        # 以西文为主：删除西文连续段，剩下的就是非西文字符
+        return len(_WESTERN_RUN_RE.sub("", text))
+    return len(text) - len(_NON_WESTERN_RUN_RE.sub("", text))
+
+
+def _char_units(text: str, memo: Optional[Dict[str, int]]) -> int:
+    """字符单位：西文字符计 1，非西文字符计 4"""
+    if memo is None or len(text) < _MEMO_MIN_CHARS:
+        return len(text) + 3 * count_non_western_chars(text)
+    units = memo.get(text)
+    if units is None:
+        units = memo[text] = len(text) + 3 * count_non_western_chars(text)
+    return units
+
+
+def count_tokens(text: str, memo: Optional[Dict[str, int]] = None) -> int:
     """
     计算文本的 token 数量
 
@@ -65,6 +138,7 @@ def count_tokens(text: str) -> int:
 
     Args:
         text: 要计算的文本
+        memo: 请求内的文本 -> 字符单位记忆（可选）
 
     Returns:
         估算的 token 数量
@@ -72,11 +146,8 @@ def count_tokens(text: str) -> int:
     if not text:
         return 0
 
-    # 计算字符单位
-    char_units = sum(4.0 if is_non_western_char(c) else 1.0 for c in text)
-
-    # 转换为 token
-    tokens = char_units / 4.0
+    # 计算字符单位，转换为 token
+    tokens = _char_units(text, memo) / 4.0
 
     # 根据 token 数量应用系数调整（小文本有更高的开销比例）
     if tokens < 100:
@@ -93,7 +164,7 @@ def count_tokens(text: str) -> int:
     return max(1, int(acc_token))
 
 
-def count_message_tokens(content: Any) -> int:
+def count_message_tokens(content: Any, memo: Optional[Dict[str, int]] = None) -> int:
     """
     计算消息内容的 token 数量
 
@@ -103,6 +174,7 @@ def count_message_tokens(content: Any) -> int:
 
     Args:
         content: 消息内容，可以是字符串或数组
+        memo: 请求内的文本记忆（可选）
 
     Returns:
         估算的 token 数量
@@ -111,7 +183,7 @@ def count_message_tokens(content: Any) -> int:
         return 0
 
     if isinstance(content, str):
-        return count_tokens(content)
+        return count_tokens(content, memo)
 
     if isinstance(content, list):
         total = 0
@@ -121,25 +193,25 @@ def count_message_tokens(content: Any) -> int:
 
                 # 文本块
                 if block_type == "text" and "text" in block:
-                    total += count_tokens(block["text"])
+                    total += count_tokens(block["text"], memo)
 
                 # thinking 块
                 elif block_type == "thinking" and "thinking" in block:
-                    total += count_tokens(block["thinking"])
+                    total += count_tokens(block["thinking"], memo)
 
                 # 工具调用块
                 elif block_type == "tool_use":
                     if "name" in block:
-                        total += count_tokens(block["name"])
+                        total += count_tokens(block["name"], memo)
                     if "input" in block:
                         input_str = json.dumps(block["input"], ensure_ascii=False) if not isinstance(block["input"], str) else block["input"]
-                        total += count_tokens(input_str)
+                        total += count_tokens(input_str, memo)
 
                 # 工具结果块
                 elif block_type == "tool_result":
                     if "content" in block:
                         # tool_result 的 content 可以是字符串或数组
-                        total += count_message_tokens(block["content"])
+                        total += count_message_tokens(block["content"], memo)
 
                 # 图片块（base64 数据不计入 token，但有固定开销）
                 elif block_type == "image":
@@ -147,14 +219,14 @@ def count_message_tokens(content: Any) -> int:
                     total += 85  # 大约 85 tokens 的基础开销
 
             elif isinstance(block, str):
-                total += count_tokens(block)
+                total += count_tokens(block, memo)
 
         return total
 
     return 0
 
 
-def count_system_tokens(system: Any) -> int:
+def count_system_tokens(system: Any, memo: Optional[Dict[str, int]] = None) -> int:
     """
     计算系统消息的 token 数量
 
@@ -164,6 +236,7 @@ def count_system_tokens(system: Any) -> int:
 
     Args:
         system: 系统消息
+        memo: 请求内的文本记忆（可选）
 
     Returns:
         估算的 token 数量
@@ -172,27 +245,28 @@ def count_system_tokens(system: Any) -> int:
         return 0
 
     if isinstance(system, str):
-        return count_tokens(system)
+        return count_tokens(system, memo)
 
     if isinstance(system, list):
         total = 0
         for msg in system:
             if isinstance(msg, dict):
                 if "text" in msg:
-                    total += count_tokens(msg["text"])
+                    total += count_tokens(msg["text"], memo)
             elif isinstance(msg, str):
-                total += count_tokens(msg)
+                total += count_tokens(msg, memo)
         return total
 
     return 0
 
 
-def count_tools_tokens(tools: Optional[list]) -> int:
+def count_tools_tokens(tools: Optional[list], memo: Optional[Dict[str, int]] = None) -> int:
     """
     计算工具定义的 token 数量
 
     Args:
         tools: 工具定义列表
+        memo: 请求内的文本记忆（可选）
 
     Returns:
         估算的 token 数量
@@ -205,16 +279,16 @@ def count_tools_tokens(tools: Optional[list]) -> int:
         if isinstance(tool, dict):
             # 工具名称
             if "name" in tool:
-                total += count_tokens(tool["name"])
+                total += count_tokens(tool["name"], memo)
 
             # 工具描述
             if "description" in tool:
-                total += count_tokens(tool["description"])
+                total += count_tokens(tool["description"], memo)
 
             # 输入 schema
             if "input_schema" in tool:
                 schema_str = json.dumps(tool["input_schema"], ensure_ascii=False)
-                total += count_tokens(schema_str)
+                total += count_tokens(schema_str, memo)
 
     return total
 
@@ -236,17 +310,21 @@ def count_all_tokens(
         估算的总 token 数量
     """
     total = 0
+    memo: Dict[str, int] = {}
+    cache = get_content_cache()
 
-    # 系统消息
-    total += count_system_tokens(system)
+    # 系统消息（每轮请求通常完全相同，按内容缓存）
+    if system:
+        total += cache.get_or_compute("tokens:system", system, lambda: count_system_tokens(system, memo))
 
     # 用户消息
     for msg in messages:
         if isinstance(msg, dict):
             content = msg.get("content")
-            total += count_message_tokens(content)
+            total += count_message_tokens(content, memo)
 
-    # 工具定义
-    total += count_tools_tokens(tools)
+    # 工具定义（同上）
+    if tools:
+        total += cache.get_or_compute("tokens:tools", tools, lambda: count_tools_tokens(tools, memo))
 
     return max(1, total)
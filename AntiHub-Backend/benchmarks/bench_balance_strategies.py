@@ -0,0 +1,163 @@
+"""
+多账号负载均衡策略仿真：各策略的吞吐与 429 率
+
+离散事件仿真（不发真实请求），账号选择直接调用 app.services.account_balancer.choose_account：
+- 请求按泊松过程到达（--rate 个/秒），流式响应时长服从指数分布（均值 --service 秒）
+- 每个账号有并发上限（--concurrency）与每窗口请求额度（--quota-min ~ --quota-max，窗口 --window 秒，各账号相位随机）
+- 超出并发上限：429 + Retry-After（--retry-after 秒内不可用）；额度用完：429 并冻结到窗口重置
+- 429 后换下一个账号重试（同一请求不重复使用同一账号），所有账号都不可用则请求失败
+- 选号只看到网关侧信息：本地在途数，以及上一次响应带回的剩余额度比例
+
+    python -m benchmarks.bench_balance_strategies --accounts 20 --rate 4 --duration 3600
+"""
+from __future__ import annotations
+
+import argparse
+import heapq
+import random
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from app.services.account_balancer import BALANCE_STRATEGIES, choose_account
+
+
+@dataclass
+class SimAccount:
+    id: int
+    quota: int
+    window_offset: float
+    concurrency: int
+    in_flight: int = 0
+    used: int = 0
+    window_index: int = -1
+    frozen_until: float = 0.0
+    # 网关看到的剩余额度比例（上一次响应头带回的值）
+    remaining_seen: float = 1.0
+    served: int = 0
+
+
+@dataclass
+class SimResult:
+    completed: int = 0
+    failed: int = 0
+    attempts: int = 0
+    throttled: int = 0
+    served: List[int] = field(default_factory=list)
+
+
+def _roll_window(account: SimAccount, now: float, window: float) -> None:
+    index = int((now + account.window_offset) // window)
+    if index != account.window_index:
+        account.window_index = index
+        account.used = 0
+
+
+def simulate(strategy: str, args: argparse.Namespace) -> SimResult:
+    rng = random.Random(args.seed)
+    accounts = [
+        SimAccount(
+            id=i,
+            quota=rng.randint(args.quota_min, args.quota_max),
+            window_offset=rng.uniform(0, args.window),
+            concurrency=args.concurrency,
+        )
+        for i in range(1, args.accounts + 1)
+    ]
+    by_id: Dict[int, SimAccount] = {a.id: a for a in accounts}
+
+    # 到达与响应时长使用独立随机源，保证各策略面对完全相同的负载
+    arrivals = random.Random(args.seed + 1)
+    durations = random.Random(args.seed + 2)
+    events: List[tuple] = []  # (时间, 序号, 类型, 账号 id)
+    seq = 0
+    t = 0.0
+    while True:
+        t += arrivals.expovariate(args.rate)
+        if t >= args.duration:
+            break
+        events.append((t, seq, "arrive", 0))
+        seq += 1
+    heapq.heapify(events)
+
+    result = SimResult()
+    while events:
+        now, _, kind, account_id = heapq.heappop(events)
+        if kind == "finish":
+            account = by_id[account_id]
+            account.in_flight -= 1
+            continue
+
+        tried: set = set()
+        while True:
+            for account in accounts:
+                _roll_window(account, now, args.window)
+            candidates = [a for a in accounts if a.frozen_until <= now and a.id not in tried]
+            chosen: Optional[SimAccount] = choose_account(
+                strategy,
+                ("sim", 1),
+                candidates,
+                in_flight=lambda a: a.in_flight,
+                remaining=lambda a: a.remaining_seen,
+            )
+            if chosen is None:
+                result.failed += 1
+                break
+
+            tried.add(chosen.id)
+            result.attempts += 1
+            if chosen.in_flight >= chosen.concurrency:
+                result.throttled += 1
+                chosen.frozen_until = now + args.retry_after
+                continue
+            if chosen.used >= chosen.quota:
+                result.throttled += 1
+                window_end = ((chosen.window_index + 1) * args.window) - chosen.window_offset
+                chosen.frozen_until = window_end
+                chosen.remaining_seen = 1.0
+                continue
+
+            chosen.used += 1
+            chosen.in_flight += 1
+            chosen.served += 1
+            chosen.remaining_seen = 1.0 - chosen.used / chosen.quota
+            result.completed += 1
+            heapq.heappush(events, (now + durations.expovariate(1.0 / args.service), seq, "finish", chosen.id))
+            seq += 1
+            break
+
+    result.served = [a.served for a in accounts]
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--accounts", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=4.0, help="请求到达率（个/秒）")
+    parser.add_argument("--service", type=float, default=8.0, help="平均响应时长（秒）")
+    parser.add_argument("--concurrency", type=int, default=3, help="单账号并发上限")
+    parser.add_argument("--window", type=float, default=900.0, help="额度窗口（秒）")
+    parser.add_argument("--quota-min", type=int, default=100)
+    parser.add_argument("--quota-max", type=int, default=260)
+    parser.add_argument("--retry-after", type=float, default=2.0, help="并发超限时的 Retry-After（秒）")
+    parser.add_argument("--duration", type=float, default=3600.0, help="仿真时长（秒）")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print(
+        f"accounts={args.accounts} rate={args.rate}/s service={args.service}s concurrency={args.concurrency} "
+        f"quota={args.quota_min}-{args.quota_max}/{args.window:.0f}s duration={args.duration:.0f}s"
+    )
+    print(f"  {'strategy':<16} {'completed/s':>11} {'429 rate':>9} {'failed':>7} {'attempts/req':>12} {'max/min share':>13}")
+    for strategy in BALANCE_STRATEGIES:
+        r = simulate(strategy, args)
+        requests = r.completed + r.failed
+        busiest, idlest = max(r.served), min(r.served)
+        print(
+            f"  {strategy:<16} {r.completed / args.duration:11.3f} {r.throttled / max(1, r.attempts):9.2%} "
+            f"{r.failed / max(1, requests):7.2%} {r.attempts / max(1, requests):12.2f} "
+            f"{(busiest / idlest) if idlest else float('inf'):13.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
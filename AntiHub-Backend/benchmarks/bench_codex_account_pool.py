@@ -0,0 +1,229 @@
+"""
+Codex 账号选号基准：每次尝试全量扫库（改造前） vs 内存账号池（429 风暴）
+
+- db scan : 每次尝试都 list_enabled_by_user_id（加载该用户全部启用账号并逐个判断冻结状态）
+- pool    : 内存账号池选号，只按主键加载选中的账号
+
+场景：单用户 --accounts 个账号，其中 id 最小的 --limited 个账号在风暴期间一律返回 429（_mark_rate_limited 落库冻结），
+--requests 个请求以 --concurrency 并发执行完整的“选号 -> 上游 -> 429 换号”循环，直到选到未限流的账号。
+数据库为内存模拟：每次查询 sleep --db-rtt-ms，并为每行结果构造一个 CodexAccount 实例（近似 ORM 行水合开销）。
+
+    python -m benchmarks.bench_codex_account_pool --accounts 200 --limited 150 --requests 2000
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+from collections import namedtuple
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from benchmarks._common import ensure_settings_env, summarize_ms
+
+ensure_settings_env()
+
+from app.cache.codex_account_pool import CodexAccountPool  # noqa: E402
+from app.models.codex_account import CodexAccount  # noqa: E402
+from app.services.codex_service import CodexService  # noqa: E402
+
+_STATE_COLUMNS = (
+    "id",
+    "user_id",
+    "status",
+    "limit_5h_used_percent",
+    "limit_5h_reset_at",
+    "limit_week_used_percent",
+    "limit_week_reset_at",
+)
+
+_StateRow = namedtuple("_StateRow", _STATE_COLUMNS)
+
+
+class _MemoryRedis:
+    async def publish(self, channel, message):
+        return 1
+
+
+class FakeDB:
+    """内存“数据库”：查询计数、模拟往返延迟与行水合"""
+
+    def __init__(self, accounts: int, rtt: float):
+        self.rows: Dict[int, Dict[str, Any]] = {
+            i: {
+                "id": i,
+                "user_id": 1,
+                "status": 1,
+                "account_name": f"account-{i}",
+                "email": f"account-{i}@example.com",
+                "credentials": "x" * 2048,
+                "limit_5h_used_percent": None,
+                "limit_5h_reset_at": None,
+                "limit_week_used_percent": None,
+                "limit_week_reset_at": None,
+            }
+            for i in range(1, accounts + 1)
+        }
+        self.rtt = rtt
+        self.queries = 0
+        self.hydrated = 0
+
+    async def query(self, ids: List[int]) -> List[Dict[str, Any]]:
+        self.queries += 1
+        self.hydrated += len(ids)
+        if self.rtt:
+            await asyncio.sleep(self.rtt)
+        return [self.rows[i] for i in ids]
+
+
+class _Session:
+    """
+    会话内按主键去重的 ORM 实例（identity map）：
+    再次查询到同一行时用库中最新值刷新已有实例；commit 只写回被修改的状态列（与 ORM 只写脏字段一致）
+    """
+
+    def __init__(self, db: FakeDB):
+        self.db = db
+        self.loaded: Dict[int, Tuple[CodexAccount, Dict[str, Any]]] = {}
+
+    def hydrate(self, row: Dict[str, Any]) -> CodexAccount:
+        entry = self.loaded.get(row["id"])
+        if entry is None:
+            account = CodexAccount(**row)
+            self.loaded[row["id"]] = (account, {column: row[column] for column in _STATE_COLUMNS})
+            return account
+        account, original = entry
+        for column in _STATE_COLUMNS:
+            setattr(account, column, row[column])
+            original[column] = row[column]
+        return account
+
+    async def flush(self):
+        return None
+
+    async def commit(self):
+        for account, original in self.loaded.values():
+            row = self.db.rows[account.id]
+            for column in _STATE_COLUMNS:
+                value = getattr(account, column)
+                if value != original[column]:
+                    row[column] = original[column] = value
+        if self.db.rtt:
+            await asyncio.sleep(self.db.rtt)
+
+    async def rollback(self):
+        return None
+
+
+class _Repo:
+    def __init__(self, session: _Session):
+        self.session = session
+        self.db = session.db
+
+    async def _load(self, ids: List[int]) -> List[CodexAccount]:
+        return [self.session.hydrate(row) for row in await self.db.query(ids)]
+
+    async def list_enabled_by_user_id(self, user_id: int) -> List[CodexAccount]:
+        return await self._load([i for i, row in self.db.rows.items() if row["status"] == 1])
+
+    async def list_pool_states_by_user_id(self, user_id: int) -> List[Any]:
+        # 只查状态列：结果是轻量的行对象，不构造 ORM 实例
+        self.db.queries += 1
+        self.db.hydrated += len(self.db.rows)
+        if self.db.rtt:
+            await asyncio.sleep(self.db.rtt)
+        return [_StateRow(*(row[column] for column in _STATE_COLUMNS)) for row in self.db.rows.values()]
+
+    async def get_by_id_and_user_id(self, account_id: int, user_id: int) -> Optional[CodexAccount]:
+        accounts = await self._load([account_id])
+        return accounts[0] if accounts else None
+
+
+class LegacyCodexService(CodexService):
+    """改造前的选号：每次尝试都加载全部启用账号再逐个判断"""
+
+    async def _select_active_account_obj(self, user_id: int, *, exclude_ids: Set[int]) -> Optional[Any]:
+        enabled = await self.repo.list_enabled_by_user_id(user_id)
+        for account in enabled:
+            if int(getattr(account, "id", 0) or 0) in exclude_ids:
+                continue
+            if getattr(account, "effective_status", 0) == 1:
+                return account
+        return None
+
+
+async def handle_request(service: CodexService, limited: int, latencies: List[float]) -> int:
+    """一次请求的选号循环（上游对 id <= limited 的账号返回 429），返回尝试次数"""
+    exclude_ids: Set[int] = set()
+    attempts = 0
+    while True:
+        start = time.perf_counter()
+        selected = await service._select_active_account_obj(1, exclude_ids=exclude_ids)
+        latencies.append(time.perf_counter() - start)
+        attempts += 1
+        if selected is None:
+            raise RuntimeError("没有可用账号")
+        exclude_ids.add(int(selected.id))
+        if int(selected.id) <= limited:
+            await service._mark_rate_limited(selected, bucket="5h", retry_at=None, raw_error="")
+            continue
+        return attempts
+
+
+async def run(legacy: bool, args: argparse.Namespace) -> Dict[str, Any]:
+    db = FakeDB(args.accounts, args.db_rtt_ms / 1000.0)
+    pool = CodexAccountPool(_MemoryRedis())
+    latencies: List[float] = []
+    attempts: List[int] = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one() -> None:
+        async with semaphore:
+            session = _Session(db)
+            service = (LegacyCodexService if legacy else CodexService)(session, redis=None)
+            service.repo = _Repo(session)
+            service.account_pool = pool
+            attempts.append(await handle_request(service, args.limited, latencies))
+
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    await asyncio.gather(*(one() for _ in range(args.requests)))
+    return {
+        "wall": time.perf_counter() - wall,
+        "cpu": time.process_time() - cpu,
+        "queries": db.queries,
+        "hydrated": db.hydrated,
+        "attempts": sum(attempts),
+        "latencies": latencies,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--accounts", type=int, default=200)
+    parser.add_argument("--limited", type=int, default=150, help="风暴中返回 429 的账号数（id 最小的若干个）")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--db-rtt-ms", type=float, default=0.5, help="模拟的数据库往返延迟")
+    args = parser.parse_args()
+
+    print(
+        f"accounts={args.accounts} limited={args.limited} requests={args.requests} "
+        f"concurrency={args.concurrency} db_rtt={args.db_rtt_ms}ms"
+    )
+    results = {}
+    for name, legacy in (("db scan", True), ("pool", False)):
+        r = results[name] = asyncio.run(run(legacy, args))
+        print(
+            f"  {name:<8}: wall={r['wall'] * 1e3:8.1f}ms cpu={r['cpu'] * 1e3:8.1f}ms "
+            f"attempts={r['attempts']:<6} queries={r['queries']:<6} rows={r['hydrated']}"
+        )
+        print(f"            select latency {summarize_ms(r['latencies'])}")
+    base, new = results["db scan"], results["pool"]
+    print(
+        f"  speedup : wall={base['wall'] / new['wall']:5.2f}x cpu={base['cpu'] / new['cpu']:5.2f}x "
+        f"rows hydrated={base['hydrated'] / max(1, new['hydrated']):6.1f}x fewer"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+内容寻址缓存基准：回放 50 轮 Agent 会话，对比 token 预估在有无缓存时的耗时
+
+每一轮请求都带相同的 system 与 tools，messages 逐轮增长（user 文本 + assistant tool_use + tool_result）。
+1) 逐轮执行两条计数路径并校验有无缓存结果一致，打印各命名空间命中率：
+   - /v1/messages/count_tokens：原始请求体 dict -> count_all_tokens
+   - /cc/v1 预估：AnthropicMessagesRequest.model_dump -> count_all_tokens
+2) 候选项代价表：各 system / tools 计算的耗时 vs 计算内容键（规范化 JSON + SHA-256）的耗时，
+   说明为什么 tools 的格式转换（OpenAI / Gemini / Kiro）不走缓存
+
+默认使用内置的 Claude Code 风格会话（约 14k 字符 system、18 个工具）；
+也可以用 --session 指定抓取的真实会话（每行一个 /v1/messages 请求体的 JSONL）。
+
+    python -m benchmarks.bench_content_cache --turns 50
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from typing import Any, Callable, Dict, List
+
+from benchmarks._common import ensure_settings_env
+
+ensure_settings_env()
+
+from app.cache import content_cache  # noqa: E402
+from app.cache.content_cache import ContentCache, content_key  # noqa: E402
+from app.schemas.anthropic import AnthropicMessagesRequest  # noqa: E402
+from app.services.anthropic_adapter import AnthropicAdapter  # noqa: E402
+from app.services.gemini_cli_api_service import _normalize_openai_tools_to_gemini_tools  # noqa: E402
+from app.services.kiro_anthropic_converter import KiroAnthropicConverter  # noqa: E402
+from app.utils.token_counter import count_all_tokens, count_system_tokens, count_tools_tokens  # noqa: E402
+
+_TOOL_NAMES = [
+    "Task", "Bash", "Glob", "Grep", "LS", "ExitPlanMode", "Read", "Edit", "MultiEdit", "Write",
+    "NotebookEdit", "WebFetch", "TodoWrite", "WebSearch", "BashOutput", "KillShell", "SlashCommand", "Skill",
+]
+
+
+class _NoCache(ContentCache):
+    """关闭缓存：每次都直接计算"""
+
+    def get_or_compute(self, namespace, content, compute):
+        return compute()
+
+
+def synthetic_session(turns: int) -> List[Dict[str, Any]]:
+    system = [
+        {"type": "text", "text": "You are Claude Code, Anthropic's official CLI for Claude."},
+        {
+            "type": "text",
+            "text": "You are an interactive CLI tool that helps users with software engineering tasks. "
+            + "Use the instructions below and the tools available to you to assist the user. 请遵守项目约定。" * 150,
+        },
+    ]
+    tools = []
+    for i, name in enumerate(_TOOL_NAMES):
+        properties = {
+            f"param_{j}": {
+                "type": "string" if j % 3 else "array",
+                "description": f"Parameter {j} of {name}. " + "Detailed usage notes for this parameter. " * 4,
+                **({"items": {"type": "string"}} if j % 3 == 0 else {}),
+            }
+            for j in range(4 + i % 5)
+        }
+        tools.append(
+            {
+                "name": name,
+                "description": f"{name} tool. " + "Usage guidance, constraints and examples for the tool. " * 40,
+                "input_schema": {
+                    "type": "object",
+                    "properties": properties,
+                    "required": ["param_1"],
+                    "additionalProperties": False,
+                    "$schema": "http://json-schema.org/draft-07/schema#",
+                },
+            }
+        )
+
+    bodies = []
+    messages: List[Dict[str, Any]] = []
+    for turn in range(turns):
+        reminder = "<system-reminder>Keep the todo list up to date. 及时更新待办。</system-reminder>"
+        messages.append(
+            {"role": "user", "content": [{"type": "text", "text": reminder}, {"type": "text", "text": f"第 {turn} 步：继续修改代码"}]}
+        )
+        bodies.append(
+            {
+                "model": "claude-sonnet-4-5",
+                "max_tokens": 32000,
+                "stream": True,
+                "system": system,
+                "tools": tools,
+                "messages": list(messages),
+            }
+        )
+        tool_id = f"toolu_{turn:04d}"
+        messages.append(
+            {
+                "role": "assistant",
+                "content": [
+                    {"type": "text", "text": "Let me check the file."},
+                    {"type": "tool_use", "id": tool_id, "name": _TOOL_NAMES[turn % len(_TOOL_NAMES)], "input": {"param_1": f"src/module_{turn}.py"}},
+                ],
+            }
+        )
+        messages.append(
+            {"role": "user", "content": [{"type": "tool_result", "tool_use_id": tool_id, "content": "def f():\n    return 1\n" * 20}]}
+        )
+    return bodies
+
+
+def load_session(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def count_route_turn(body: Dict[str, Any]) -> int:
+    return count_all_tokens(messages=body.get("messages", []), system=body.get("system"), tools=body.get("tools"))
+
+
+def cc_estimate_turn(request: AnthropicMessagesRequest) -> int:
+    payload = request.model_dump(exclude_none=True)
+    return count_all_tokens(messages=payload.get("messages", []), system=payload.get("system"), tools=payload.get("tools"))
+
+
+def run(items: List[Any], cache: ContentCache, fn: Callable[[Any], int]) -> tuple:
+    content_cache._content_cache = cache
+    start = time.perf_counter()
+    outputs = [fn(item) for item in items]
+    return time.perf_counter() - start, outputs
+
+
+def per_call_us(fn: Callable[[], Any], repeat: int = 200) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--session", default="", help="真实会话 JSONL（每行一个 /v1/messages 请求体）")
+    args = parser.parse_args()
+
+    bodies = load_session(args.session) if args.session else synthetic_session(args.turns)
+    if not args.session:
+        for body in bodies:
+            body["metadata"] = {"user_id": "user_bench_account__session_0b4445e1-f5be-49e1-87ce-62bbc28ad705"}
+    first = bodies[0]
+    print(
+        f"turns={len(bodies)} system_chars={len(json.dumps(first.get('system'), ensure_ascii=False))} "
+        f"tools={len(first.get('tools') or [])} tools_chars={len(json.dumps(first.get('tools'), ensure_ascii=False))}"
+    )
+
+    requests = [AnthropicMessagesRequest.model_validate(body) for body in bodies]
+    for name, items, fn in (
+        ("count_tokens route", bodies, count_route_turn),
+        ("/cc/v1 estimate", requests, cc_estimate_turn),
+    ):
+        t_off, out_off = run(items, _NoCache(), fn)
+        cache = ContentCache()
+        t_on, out_on = run(items, cache, fn)
+        assert out_off == out_on, f"{name}: 缓存前后结果不一致"
+        stats = cache.stats()
+        print(
+            f"  {name:<18}: uncached={t_off / len(items) * 1e3:6.2f}ms/turn  cached={t_on / len(items) * 1e3:6.2f}ms/turn  "
+            f"speedup={t_off / t_on:.2f}x  hit_rate={stats['hit_rate']:.2%}"
+        )
+        for ns_name, ns in stats["namespaces"].items():
+            print(f"      {ns_name:<14} hits={ns['hits']}/{ns['lookups']}")
+
+    # 候选项代价表（最后一轮请求）
+    request = requests[-1]
+    payload = request.model_dump(exclude_none=True)
+    openai_tools = AnthropicAdapter._convert_anthropic_tools_to_openai(request.tools)
+    rows = [
+        ("tokens:system", lambda: count_system_tokens(payload["system"]), payload["system"]),
+        ("tokens:tools", lambda: count_tools_tokens(payload["tools"]), payload["tools"]),
+        ("openai tools", lambda: AnthropicAdapter._convert_anthropic_tools_to_openai(request.tools), request.tools),
+        ("kiro tools", lambda: KiroAnthropicConverter._convert_tools(request.tools), request.tools),
+        ("gemini tools", lambda: _normalize_openai_tools_to_gemini_tools(openai_tools), openai_tools),
+    ]
+    print("  compute vs content-key cost (per call):")
+    for name, fn, content in rows:
+        compute_us = per_call_us(fn)
+        key_us = per_call_us(lambda: content_key(content))
+        verdict = "cache" if compute_us > key_us * 1.5 else "skip"
+        print(f"      {name:<14} compute={compute_us:7.1f}us  key={key_us:7.1f}us  -> {verdict}")
+
+
+if __name__ == "__main__":
+    main()
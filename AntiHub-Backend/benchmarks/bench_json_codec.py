@@ -0,0 +1,164 @@
+"""
+JSON 编解码后端基准：各 SSE 转换器在 orjson / msgspec / 标准库 json 下的事件吞吐（events/s）
+
+每个转换器输入 --events 个上游事件（含中文文本），输出全部收集；对当前环境可用的每个后端各跑一遍。
+未安装 orjson / msgspec 时只测标准库（pip install orjson 后重新运行即可对比）。
+
+    python -m benchmarks.bench_json_codec --events 20000
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+from typing import Callable, Dict, List
+
+from benchmarks._common import ensure_settings_env
+
+ensure_settings_env()
+
+from app.services.anthropic_adapter import AnthropicAdapter  # noqa: E402
+from app.services.gemini_cli_api_service import (  # noqa: E402
+    _gemini_cli_event_to_openai_chunks,
+    _OpenAIStreamState,
+)
+from app.utils import jsonx  # noqa: E402
+from app.utils.gemini_openai_chat_compat import ChatCompletionsSSEToGeminiSSETranslator  # noqa: E402
+from app.utils.openai_responses_compat import (  # noqa: E402
+    ChatCompletionsToResponsesSSETranslator,
+    ResponsesToChatCompletionsSSETranslator,
+)
+
+
+def chat_chunks(events: int) -> List[bytes]:
+    out = []
+    for i in range(events):
+        payload = {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion.chunk",
+            "created": 1760000000,
+            "model": "gpt-bench",
+            "choices": [{"index": 0, "delta": {"content": f"token-{i} 你好，世界 "}, "finish_reason": None}],
+        }
+        out.append(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+    final = {
+        "id": "chatcmpl-bench",
+        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": events, "total_tokens": 10 + events},
+    }
+    out.append(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+    out.append(b"data: [DONE]\n\n")
+    return out
+
+
+def responses_chunks(events: int) -> List[bytes]:
+    translator = ChatCompletionsToResponsesSSETranslator(original_request={"model": "gpt-bench"})
+    out: List[bytes] = []
+    for chunk in chat_chunks(events):
+        out.extend(translator.feed(chunk)[0])
+    out.extend(translator.finalize())
+    return out
+
+
+def gemini_cli_chunks(events: int) -> List[bytes]:
+    out = []
+    for i in range(events):
+        event = {
+            "response": {
+                "responseId": "resp-bench",
+                "modelVersion": "gemini-bench",
+                "createTime": "2026-10-17T00:00:00Z",
+                "candidates": [{"content": {"role": "model", "parts": [{"text": f"token-{i} 你好，世界 "}]}}],
+            }
+        }
+        out.append(json.dumps(event, ensure_ascii=False).encode("utf-8"))
+    return out
+
+
+def run_anthropic(chunks: List[bytes]) -> int:
+    async def stream():
+        for chunk in chunks:
+            yield chunk
+
+    async def collect() -> int:
+        count = 0
+        async for _ in AnthropicAdapter.convert_openai_stream_to_anthropic(stream(), model="m", request_id="r"):
+            count += 1
+        return count
+
+    return asyncio.run(collect())
+
+
+def run_chat_to_responses(chunks: List[bytes]) -> int:
+    translator = ChatCompletionsToResponsesSSETranslator(original_request={"model": "gpt-bench"})
+    count = 0
+    for chunk in chunks:
+        count += len(translator.feed(chunk)[0])
+    return count + len(translator.finalize())
+
+
+def run_responses_to_chat(chunks: List[bytes]) -> int:
+    translator = ResponsesToChatCompletionsSSETranslator(original_request={"model": "gpt-bench"})
+    count = 0
+    for chunk in chunks:
+        count += len(translator.feed(chunk)[0])
+    return count + len(translator.finalize())
+
+
+def run_chat_to_gemini(chunks: List[bytes]) -> int:
+    translator = ChatCompletionsSSEToGeminiSSETranslator()
+    count = 0
+    for chunk in chunks:
+        count += len(translator.feed(chunk)[0])
+    return count
+
+
+def run_gemini_cli(chunks: List[bytes]) -> int:
+    # 与 GeminiCLIAPIService 的流式循环一致：loads -> 转换 -> dumps
+    state = _OpenAIStreamState()
+    count = 0
+    for data in chunks:
+        event_obj = jsonx.loads(data)
+        for payload in _gemini_cli_event_to_openai_chunks(event_obj, state=state):
+            b"data: " + jsonx.dumps(payload) + b"\n\n"
+            count += 1
+    return count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=20000)
+    args = parser.parse_args()
+
+    inputs = {
+        "chat": chat_chunks(args.events),
+        "responses": responses_chunks(args.events),
+        "gemini_cli": gemini_cli_chunks(args.events),
+    }
+    converters: Dict[str, tuple] = {
+        "AnthropicAdapter (chat->anthropic)": (run_anthropic, "chat"),
+        "ChatCompletions->Responses": (run_chat_to_responses, "chat"),
+        "Responses->ChatCompletions": (run_responses_to_chat, "responses"),
+        "ChatCompletions->Gemini": (run_chat_to_gemini, "chat"),
+        "GeminiCLI->ChatCompletions": (run_gemini_cli, "gemini_cli"),
+    }
+
+    backends = jsonx.available_backends()
+    print(f"events={args.events} backends={backends}")
+    for name, (fn, input_name) in converters.items():
+        chunks = inputs[input_name]
+        line = f"  {name:<36}"
+        for backend in backends:
+            jsonx.set_backend(backend)
+            fn(chunks[:100])  # 预热
+            start = time.perf_counter()
+            fn(chunks)
+            elapsed = time.perf_counter() - start
+            line += f"  {backend}={len(chunks) / elapsed:10.0f} ev/s"
+        print(line)
+    jsonx.set_backend(backends[0])
+
+
+if __name__ == "__main__":
+    main()
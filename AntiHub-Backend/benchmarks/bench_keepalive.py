@@ -0,0 +1,126 @@
+"""
+流式保活调度开销基准：5k 条并发流下，逐 item 建 Task + asyncio.wait(timeout) vs 共享时间轮 with_keepalive
+
+每条流产出 --items 个数据块，块间随机等待（0 ~ 2*--gap 秒）；每 --stall-every 条流中有一条
+在中途停顿 --stall 秒（> 心跳间隔），用于验证两种实现都会插入心跳。
+三种模式各跑一遍，统计进程 CPU 时间：
+- baseline：直接 async for（不保活），作为上游本身的开销
+- task-per-item：原实现（create_task(__anext__()) + asyncio.wait({task}, timeout=interval)）
+- timer-wheel：app.utils.keepalive.with_keepalive（每条流一个读取任务 + 共享时间轮）
+调度开销 = 模式 CPU - baseline CPU，按每个数据块折算。
+
+    python -m benchmarks.bench_keepalive --streams 5000 --items 40
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import time
+from typing import AsyncIterator, Callable, Dict, List
+
+from app.utils.keepalive import SSE_PING, with_keepalive
+
+
+async def upstream(delays: List[float]) -> AsyncIterator[bytes]:
+    for delay in delays:
+        await asyncio.sleep(delay)
+        yield b"data: {}\n\n"
+
+
+async def task_per_item(source: AsyncIterator[bytes], interval: float) -> AsyncIterator[bytes]:
+    """原实现：每个 item 创建一个 Task，并用 asyncio.wait 的超时判断是否发心跳"""
+    pending = asyncio.create_task(source.__anext__())
+    try:
+        while True:
+            done, _ = await asyncio.wait({pending}, timeout=interval)
+            if not done:
+                yield SSE_PING
+                continue
+            try:
+                item = pending.result()
+            except StopAsyncIteration:
+                break
+            pending = asyncio.create_task(source.__anext__())
+            yield item
+    finally:
+        if not pending.done():
+            pending.cancel()
+
+
+def plain(source: AsyncIterator[bytes], interval: float) -> AsyncIterator[bytes]:
+    return source
+
+
+def with_keepalive_adapter(source: AsyncIterator[bytes], interval: float) -> AsyncIterator[bytes]:
+    return with_keepalive(source, interval=interval)
+
+
+def build_delays(streams: int, items: int, gap: float, stall: float, stall_every: int) -> List[List[float]]:
+    rng = random.Random(42)
+    plans = []
+    for i in range(streams):
+        delays = [rng.uniform(0, 2 * gap) for _ in range(items)]
+        if stall_every and i % stall_every == 0:
+            delays[items // 2] = stall
+        plans.append(delays)
+    return plans
+
+
+async def run_mode(wrap: Callable, plans: List[List[float]], interval: float) -> Dict[str, float]:
+    counts = {"items": 0, "pings": 0}
+
+    async def consume(delays: List[float]) -> None:
+        async for chunk in wrap(upstream(delays), interval):
+            if chunk is SSE_PING:
+                counts["pings"] += 1
+            else:
+                counts["items"] += 1
+
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    await asyncio.gather(*(consume(delays) for delays in plans))
+    return {
+        "cpu": time.process_time() - cpu,
+        "wall": time.perf_counter() - wall,
+        "items": counts["items"],
+        "pings": counts["pings"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--streams", type=int, default=5000)
+    parser.add_argument("--items", type=int, default=40)
+    parser.add_argument("--gap", type=float, default=0.02, help="块间平均等待（秒）")
+    parser.add_argument("--interval", type=float, default=0.5, help="心跳间隔（秒）")
+    parser.add_argument("--stall", type=float, default=1.2, help="停顿流的停顿时长（秒）")
+    parser.add_argument("--stall-every", type=int, default=10)
+    args = parser.parse_args()
+
+    plans = build_delays(args.streams, args.items, args.gap, args.stall, args.stall_every)
+    modes = {
+        "baseline": plain,
+        "task-per-item": task_per_item,
+        "timer-wheel": with_keepalive_adapter,
+    }
+    print(
+        f"streams={args.streams} items/stream={args.items} gap~{args.gap * 1000:.0f}ms "
+        f"interval={args.interval}s stalled_streams={args.streams // args.stall_every if args.stall_every else 0}"
+    )
+    results = {name: asyncio.run(run_mode(wrap, plans, args.interval)) for name, wrap in modes.items()}
+    base = results["baseline"]
+    for name, res in results.items():
+        overhead = res["cpu"] - base["cpu"]
+        line = f"  {name:<14}: cpu={res['cpu']:6.2f}s wall={res['wall']:6.2f}s items={res['items']} pings={res['pings']}"
+        if name != "baseline":
+            line += f"  scheduler overhead={overhead:6.2f}s ({overhead / res['items'] * 1e6:5.1f}us/item)"
+        print(line)
+    legacy = results["task-per-item"]["cpu"] - base["cpu"]
+    wheel = results["timer-wheel"]["cpu"] - base["cpu"]
+    if wheel > 0:
+        print(f"  overhead reduction: {legacy / wheel:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Kiro history 转换缓存基准：回放长会话，对比每轮 to_kiro_chat_completions_request 在有无前缀缓存时的耗时
+
+会话与 bench_content_cache 相同（Claude Code 风格，每轮 assistant tool_use + user tool_result），
+tool_result 放大到 --result-chars 字符以接近真实的文件读取输出。
+逐轮校验两种模式输出的 conversationState 一致（忽略每次随机生成的 agentContinuationId）。
+
+    python -m benchmarks.bench_kiro_history --turns 200
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from typing import Any, Dict, List
+
+from benchmarks._common import ensure_settings_env
+
+ensure_settings_env()
+
+from app.cache.kiro_history_cache import get_kiro_history_cache  # noqa: E402
+from app.schemas.anthropic import AnthropicMessagesRequest  # noqa: E402
+from app.services.kiro_anthropic_converter import KiroAnthropicConverter  # noqa: E402
+from benchmarks.bench_content_cache import load_session, synthetic_session  # noqa: E402
+
+_USER_ID = "user_bench_account__session_0b4445e1-f5be-49e1-87ce-62bbc28ad705"
+
+
+def build_requests(bodies: List[Dict[str, Any]], result_chars: int) -> List[AnthropicMessagesRequest]:
+    for body in bodies:
+        body.setdefault("metadata", {"user_id": _USER_ID})
+        for msg in body["messages"]:
+            for block in msg["content"] if isinstance(msg["content"], list) else []:
+                if block.get("type") == "tool_result" and isinstance(block.get("content"), str):
+                    block["content"] = (block["content"] * (result_chars // max(1, len(block["content"])) + 1))[:result_chars]
+    return [AnthropicMessagesRequest.model_validate(body) for body in bodies]
+
+
+def replay(requests: List[AnthropicMessagesRequest], cached: bool) -> tuple:
+    cache = get_kiro_history_cache()
+    cache.clear()
+    timings: List[float] = []
+    outputs: List[Dict[str, Any]] = []
+    for request in requests:
+        if not cached:
+            cache.clear()
+        start = time.perf_counter()
+        payload = KiroAnthropicConverter.to_kiro_chat_completions_request(request)
+        timings.append(time.perf_counter() - start)
+        payload["conversationState"].pop("agentContinuationId")
+        outputs.append(payload)
+    return timings, outputs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--result-chars", type=int, default=3000, help="每个 tool_result 的字符数")
+    parser.add_argument("--session", default="", help="真实会话 JSONL（每行一个 /v1/messages 请求体）")
+    args = parser.parse_args()
+
+    bodies = load_session(args.session) if args.session else synthetic_session(args.turns)
+    requests = build_requests(bodies, args.result_chars)
+    print(f"turns={len(requests)} final_messages={len(requests[-1].messages)}")
+
+    t_off, out_off = replay(requests, cached=False)
+    t_on, out_on = replay(requests, cached=True)
+    assert out_off == out_on, "缓存前后 conversationState 不一致"
+
+    for label, lo, hi in (("first 10 turns", 0, 10), ("last 10 turns", len(requests) - 10, len(requests))):
+        off = sum(t_off[lo:hi]) / (hi - lo) * 1e3
+        on = sum(t_on[lo:hi]) / (hi - lo) * 1e3
+        print(f"  {label:<15}: uncached={off:7.3f}ms/turn  cached={on:7.3f}ms/turn  speedup={off / on:5.2f}x")
+    print(
+        f"  whole session  : uncached={sum(t_off) * 1e3:8.1f}ms  cached={sum(t_on) * 1e3:8.1f}ms  "
+        f"speedup={sum(t_off) / sum(t_on):5.2f}x"
+    )
+    print(f"  cache stats    : {get_kiro_history_cache().stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+/v1/chat/completions 请求体解析基准：Pydantic 模型往返 vs 原始 JSON 快速路径（单请求 CPU 时间）
+
+- fastapi model : 标准库 json.loads（FastAPI Request.json）+ ChatCompletionRequest 校验 + model_dump()（改造前路由的做法）
+- model path    : jsonx.loads + parse_chat_completion_request(fast_path=False)（关闭快速路径时的行为）
+- fast path     : jsonx.loads + parse_chat_completion_request(fast_path=True)
+
+负载：N 轮多模态对话历史（文本 + 工具调用）+ M 张 base64 图片，校验三种方式结果一致。
+
+    python -m benchmarks.bench_raw_body --turns 200 --images 4 --image-kb 256
+"""
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import os
+import time
+from typing import Any, Callable, Dict
+
+from app.api.deps_body import parse_chat_completion_request
+from app.schemas.plugin_api import ChatCompletionRequest
+from app.utils import jsonx
+
+
+def build_body(turns: int, images: int, image_kb: int) -> bytes:
+    messages = [{"role": "system", "content": "You are a helpful assistant. 请使用中文回答。" * 50}]
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"第 {i} 轮：请检查 src/module_{i}.py 并修复问题。" * 5})
+        messages.append(
+            {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {
+                        "id": f"call_{i}",
+                        "type": "function",
+                        "function": {"name": "read_file", "arguments": json.dumps({"path": f"src/module_{i}.py"})},
+                    }
+                ],
+            }
+        )
+        messages.append({"role": "tool", "tool_call_id": f"call_{i}", "content": "def f(x):\n    return x * 2\n" * 30})
+    for i in range(images):
+        data = base64.b64encode(os.urandom(image_kb * 1024)).decode("ascii")
+        messages.append(
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": f"图 {i}"},
+                    {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{data}"}},
+                ],
+            }
+        )
+    body = {
+        "model": "gpt-4o",
+        "messages": messages,
+        "stream": True,
+        "tools": [
+            {"type": "function", "function": {"name": "read_file", "parameters": {"type": "object", "properties": {}}}}
+        ],
+        "stream_options": {"include_usage": True},
+    }
+    return json.dumps(body, ensure_ascii=False).encode("utf-8")
+
+
+def fastapi_model(raw: bytes) -> Dict[str, Any]:
+    return ChatCompletionRequest.model_validate(json.loads(raw)).model_dump()
+
+
+def model_path(raw: bytes) -> Dict[str, Any]:
+    return parse_chat_completion_request(jsonx.loads(raw), fast_path=False)
+
+
+def fast_path(raw: bytes) -> Dict[str, Any]:
+    return parse_chat_completion_request(jsonx.loads(raw), fast_path=True)
+
+
+def cpu_ms(fn: Callable[[bytes], Any], raw: bytes, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.process_time()
+        fn(raw)
+        best = min(best, time.process_time() - start)
+    return best * 1e3
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--images", type=int, default=4)
+    parser.add_argument("--image-kb", type=int, default=256)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"jsonx backend={jsonx.backend}")
+    for turns, images in ((args.turns, 0), (args.turns, args.images), (args.turns * 5, args.images)):
+        raw = build_body(turns, images, args.image_kb)
+        expected = fastapi_model(raw)
+        assert model_path(raw) == expected and fast_path(raw) == expected, "解析结果不一致"
+
+        base = cpu_ms(fastapi_model, raw, args.repeat)
+        print(f"  body={len(raw) / 1024:8.1f}KB turns={turns:<4} images={images}:")
+        for name, fn in (("fastapi model", fastapi_model), ("model path", model_path), ("fast path", fast_path)):
+            t = cpu_ms(fn, raw, args.repeat)
+            print(f"      {name:<13}: {t:8.2f}ms cpu/request  speedup={base / t:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+SSE 解析基准：旧的手写解析（str/bytes 拼接 + split(..., 1)） vs app.utils.sse
+
+输入为约 --size-mb MB 的 ChatCompletions SSE 流（含中文多字节字符），按不同 chunk 大小切分后喂给解析器，
+统计吞吐（MB/s）。旧实现每切出一行都会复制剩余缓冲，上游一次返回大块数据时退化为 O(n²)。
+
+    python -m benchmarks.bench_sse_parser --size-mb 10
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from typing import Callable, Dict, List
+
+from app.utils.sse import SSELineBuffer, SSEParser
+
+
+def build_stream(size_bytes: int) -> bytes:
+    parts: List[bytes] = []
+    total = 0
+    i = 0
+    while total < size_bytes:
+        payload = {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion.chunk",
+            "choices": [{"index": 0, "delta": {"content": f"token-{i} 你好，世界 "}, "finish_reason": None}],
+        }
+        event = f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+        parts.append(event)
+        total += len(event)
+        i += 1
+    parts.append(b"data: [DONE]\n\n")
+    return b"".join(parts)
+
+
+def split_chunks(raw: bytes, chunk_size: int) -> List[bytes]:
+    return [raw[i:i + chunk_size] for i in range(0, len(raw), chunk_size)]
+
+
+def legacy_str_lines(chunks: List[bytes]) -> int:
+    """旧实现（SSEUsageTracker / AnthropicAdapter）：str 拼接 + split("\\n", 1)"""
+    buffer = ""
+    count = 0
+    for chunk in chunks:
+        buffer += chunk.decode("utf-8", errors="replace")
+        while "\n" in buffer:
+            line, buffer = buffer.split("\n", 1)
+            if line.strip().startswith("data:"):
+                count += 1
+    return count
+
+
+def legacy_bytes_blocks(chunks: List[bytes]) -> int:
+    """旧实现（Responses/Chat 翻译器）：bytes 拼接 + split(b"\\n\\n", 1)，再逐行提取 data 并解码"""
+    buffer = b""
+    count = 0
+    for chunk in chunks:
+        buffer += chunk
+        while b"\n\n" in buffer:
+            block, buffer = buffer.split(b"\n\n", 1)
+            data_lines = [ln.strip()[5:].strip() for ln in block.split(b"\n") if ln.strip().startswith(b"data:")]
+            if data_lines:
+                b"\n".join(data_lines).decode("utf-8", errors="replace")
+                count += 1
+    return count
+
+
+def new_lines(chunks: List[bytes]) -> int:
+    lines = SSELineBuffer()
+    count = 0
+    for chunk in chunks:
+        for line in lines.feed(chunk):
+            if line.startswith("data:"):
+                count += 1
+    return count
+
+
+def new_events(chunks: List[bytes]) -> int:
+    parser = SSEParser()
+    count = 0
+    for chunk in chunks:
+        count += len(parser.feed(chunk))
+    return count + len(parser.flush())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size-mb", type=float, default=10.0)
+    parser.add_argument("--chunk-sizes", default="64,1024,16384,262144,1048576")
+    args = parser.parse_args()
+
+    raw = build_stream(int(args.size_mb * 1024 * 1024))
+    size_mb = len(raw) / (1024 * 1024)
+    impls: Dict[str, Callable[[List[bytes]], int]] = {
+        "legacy str split": legacy_str_lines,
+        "legacy bytes split": legacy_bytes_blocks,
+        "SSELineBuffer": new_lines,
+        "SSEParser": new_events,
+    }
+
+    print(f"stream={size_mb:.1f}MB")
+    for chunk_size in (int(x) for x in args.chunk_sizes.split(",")):
+        chunks = split_chunks(raw, chunk_size)
+        print(f"chunk={chunk_size}B chunks={len(chunks)}")
+        for name, fn in impls.items():
+            start = time.perf_counter()
+            count = fn(chunks)
+            elapsed = time.perf_counter() - start
+            print(f"  {name:<20}: {size_mb / elapsed:8.1f} MB/s  ({elapsed * 1000:8.1f}ms, {count} items)")
+
+
+if __name__ == "__main__":
+    main()
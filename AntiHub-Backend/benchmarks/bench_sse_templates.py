@@ -0,0 +1,163 @@
+"""
+SSE 增量事件模板基准：逐事件构造 dict + jsonx 序列化 vs SSETemplate 预渲染
+
+1) 单事件：Anthropic content_block_delta（str）与 Responses output_text.delta（bytes），
+   对同一批 token 文本分别用两种方式生成，逐字节比对并统计每事件耗时（取 5 次最小值）
+2) 整条流：跑一遍 AnthropicAdapter / ChatCompletionsToResponsesSSETranslator，
+   把每个输出事件的 data 重新解析后用 jsonx 整体序列化，校验与模板输出逐字节一致
+
+    python -m benchmarks.bench_sse_templates --tokens 100000
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Callable, List
+
+from benchmarks._common import ensure_settings_env
+
+ensure_settings_env()
+
+from app.services.anthropic_adapter import AnthropicAdapter, _content_block_delta_template  # noqa: E402
+from app.utils import jsonx  # noqa: E402
+from app.utils.openai_responses_compat import ChatCompletionsToResponsesSSETranslator  # noqa: E402
+from app.utils.sse import SSETemplate, template_slot  # noqa: E402
+
+_ALPHABET = list("abcdefghij 你好世界\"\\\n\t/é🙂") + ["\x01", " "]
+
+
+def random_tokens(n: int, seed: int = 1) -> List[str]:
+    rng = random.Random(seed)
+    return ["".join(rng.choice(_ALPHABET) for _ in range(rng.randint(1, 8))) for _ in range(n)]
+
+
+def legacy_anthropic(tokens: List[str]) -> List[str]:
+    out = []
+    for text in tokens:
+        content_delta = {
+            "type": "content_block_delta",
+            "index": 1,
+            "delta": {"type": "text_delta", "text": text},
+        }
+        out.append(f"event: content_block_delta\ndata: {jsonx.dumps_str(content_delta)}\n\n")
+    return out
+
+
+def templated_anthropic(tokens: List[str]) -> List[str]:
+    return [_content_block_delta_template("text_delta", "text", 1).render_str(text) for text in tokens]
+
+
+def legacy_responses(tokens: List[str]) -> List[bytes]:
+    out = []
+    for seq, text in enumerate(tokens):
+        payload = {
+            "type": "response.output_text.delta",
+            "sequence_number": seq,
+            "item_id": "msg_resp_bench_0",
+            "output_index": 0,
+            "content_index": 0,
+            "delta": text,
+            "logprobs": [],
+        }
+        out.append(b"event: response.output_text.delta\ndata: " + jsonx.dumps(payload) + b"\n\n")
+    return out
+
+
+def templated_responses(tokens: List[str]) -> List[bytes]:
+    tpl = SSETemplate(
+        {
+            "type": "response.output_text.delta",
+            "sequence_number": template_slot(0),
+            "item_id": "msg_resp_bench_0",
+            "output_index": 0,
+            "content_index": 0,
+            "delta": template_slot(1),
+            "logprobs": [],
+        },
+        event="response.output_text.delta",
+    )
+    return [tpl.render(seq, text) for seq, text in enumerate(tokens)]
+
+
+def timed(fn: Callable[[List[str]], list], tokens: List[str], repeat: int = 5) -> tuple:
+    best = float("inf")
+    out: list = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn(tokens)
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+
+def chat_stream(tokens: List[str]) -> List[bytes]:
+    chunks = []
+    for text in tokens:
+        payload = {"id": "c", "model": "m", "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}]}
+        chunks.append(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+    chunks.append(b'data: {"choices":[{"index":0,"delta":{},"finish_reason":"stop"}]}\n\n')
+    chunks.append(b"data: [DONE]\n\n")
+    return chunks
+
+
+def assert_canonical(events: List[bytes]) -> int:
+    """每个事件的 data 都必须等于对其解析结果整体 jsonx 序列化（即旧实现的输出）"""
+    count = 0
+    for event in events:
+        for line in event.split(b"\n"):
+            if line.startswith(b"data: "):
+                data = line[6:]
+                assert jsonx.dumps(json.loads(data)) == data, data
+                count += 1
+    return count
+
+
+def full_stream_check(tokens: List[str]) -> None:
+    chunks = chat_stream(tokens)
+
+    async def anthropic_events() -> List[bytes]:
+        async def stream():
+            for chunk in chunks:
+                yield chunk
+
+        return [e.encode("utf-8") async for e in AnthropicAdapter.convert_openai_stream_to_anthropic(stream(), "m", "r")]
+
+    translator = ChatCompletionsToResponsesSSETranslator(original_request={"model": "m"})
+    responses_events: List[bytes] = []
+    for chunk in chunks:
+        responses_events.extend(translator.feed(chunk)[0])
+    responses_events.extend(translator.finalize())
+
+    n1 = assert_canonical(asyncio.run(anthropic_events()))
+    n2 = assert_canonical(responses_events)
+    print(f"full stream byte-identical: anthropic={n1} events, responses={n2} events")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tokens", type=int, default=100000)
+    args = parser.parse_args()
+
+    tokens = random_tokens(args.tokens)
+    print(f"tokens={len(tokens)} json_backend={jsonx.backend}")
+    for name, legacy, templated in (
+        ("anthropic content_block_delta", legacy_anthropic, templated_anthropic),
+        ("responses output_text.delta", legacy_responses, templated_responses),
+    ):
+        legacy(tokens[:1000])
+        templated(tokens[:1000])
+        t_legacy, out_legacy = timed(legacy, tokens)
+        t_tpl, out_tpl = timed(templated, tokens)
+        assert out_legacy == out_tpl, f"{name}: 模板输出与逐事件序列化不一致"
+        print(
+            f"  {name:<30}: dict+dumps={t_legacy / len(tokens) * 1e9:6.0f}ns/ev  "
+            f"template={t_tpl / len(tokens) * 1e9:6.0f}ns/ev  speedup={t_legacy / t_tpl:.1f}x  (byte-identical)"
+        )
+
+    full_stream_check(tokens[:20000])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Token 预估基准：逐字符 is_non_western_char vs 正则 / NumPy 计数
+
+1) count_tokens：1 MB（默认）的纯英文 / 中英混合 / 纯中文 / 拉丁扩展文本，新旧实现对比（取 3 次最小值），校验结果一致
+2) count_all_tokens：模拟 Claude Code 请求（长 system、几十个工具、每条消息都带相同的 system-reminder）
+
+未安装 NumPy 时只测正则路径（pip install numpy 后重新运行可对比 NumPy 路径）。
+
+    python -m benchmarks.bench_token_counter --size 1000000
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import time
+from typing import Callable, Dict, List
+
+from app.utils import token_counter
+from app.utils.token_counter import count_all_tokens, count_tokens, is_non_western_char
+
+
+def legacy_count_tokens(text: str) -> int:
+    """旧实现：生成器表达式逐字符调用 is_non_western_char"""
+    if not text:
+        return 0
+    tokens = sum(4.0 if is_non_western_char(c) else 1.0 for c in text) / 4.0
+    if tokens < 100:
+        acc_token = tokens * 1.5
+    elif tokens < 200:
+        acc_token = tokens * 1.3
+    elif tokens < 300:
+        acc_token = tokens * 1.25
+    elif tokens < 800:
+        acc_token = tokens * 1.2
+    else:
+        acc_token = tokens * 1.0
+    return max(1, int(acc_token))
+
+
+def legacy_count_all_tokens(messages: list, system: str, tools: list) -> int:
+    total = legacy_count_tokens(system)
+    for msg in messages:
+        for block in msg["content"]:
+            total += legacy_count_tokens(block["text"])
+    for tool in tools:
+        total += legacy_count_tokens(tool["name"]) + legacy_count_tokens(tool["description"])
+        total += legacy_count_tokens(json.dumps(tool["input_schema"], ensure_ascii=False))
+    return max(1, total)
+
+
+def make_texts(size: int) -> Dict[str, str]:
+    rng = random.Random(5)
+    english = "The quick brown fox jumps over the lazy dog; def f(x): return x * 2\n"
+    chinese = "敏捷的棕色狐狸跳过了懒狗，这是一个用于测试的中文句子。"
+    latin = "Ça été très façile — Łódź, Dvořák, Ærøskøbing. "
+    mixed_parts: List[str] = []
+    while sum(map(len, mixed_parts)) < size:
+        mixed_parts.append(rng.choice([english, chinese, latin]))
+    return {
+        "ascii": (english * (size // len(english) + 1))[:size],
+        "mixed": "".join(mixed_parts)[:size],
+        "chinese": (chinese * (size // len(chinese) + 1))[:size],
+        "latin-ext": (latin * (size // len(latin) + 1))[:size],
+    }
+
+
+def claude_code_request() -> tuple:
+    reminder = "<system-reminder>\n" + "Remember the project conventions; 遵守项目约定。" * 60 + "\n</system-reminder>"
+    system = "You are an interactive CLI tool. " * 2000
+    tools = [
+        {
+            "name": f"Tool{i}",
+            "description": "Performs an operation on the workspace. " * 80,
+            "input_schema": {
+                "type": "object",
+                "properties": {f"arg{j}": {"type": "string", "description": "参数说明 " * 10} for j in range(8)},
+            },
+        }
+        for i in range(40)
+    ]
+    messages = [
+        {"role": "user", "content": [{"type": "text", "text": reminder}, {"type": "text", "text": f"step {i} 请继续"}]}
+        for i in range(60)
+    ]
+    return messages, system, tools
+
+
+def timed(fn: Callable[[], int], repeat: int = 3) -> tuple:
+    best = float("inf")
+    result = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=1_000_000, help="每种文本的字符数")
+    args = parser.parse_args()
+
+    print(f"size={args.size} chars  numpy={'yes' if token_counter._np is not None else 'no'}")
+    for name, text in make_texts(args.size).items():
+        t_old, r_old = timed(lambda: legacy_count_tokens(text))
+        t_new, r_new = timed(lambda: count_tokens(text))
+        assert r_old == r_new, f"{name}: {r_old} != {r_new}"
+        line = f"  count_tokens {name:<10}: legacy={t_old * 1e3:8.2f}ms  fast={t_new * 1e3:7.3f}ms  speedup={t_old / t_new:7.1f}x"
+        if token_counter._np is not None and not text.isascii():
+            t_re, _ = timed(lambda: token_counter._count_non_western_regex(text))
+            line += f"  (regex-only={t_re * 1e3:7.3f}ms)"
+        print(line + f"  tokens={r_new}")
+
+    messages, system, tools = claude_code_request()
+    t_old, r_old = timed(lambda: legacy_count_all_tokens(messages, system, tools))
+    t_new, r_new = timed(lambda: count_all_tokens(messages, system=system, tools=tools))
+    assert r_old == r_new, f"count_all_tokens: {r_old} != {r_new}"
+    print(
+        f"  count_all_tokens (claude code-like request): legacy={t_old * 1e3:8.2f}ms  "
+        f"fast={t_new * 1e3:7.3f}ms  speedup={t_old / t_new:6.1f}x  tokens={r_new}"
+    )
+
+
+if __name__ == "__main__":
+    main()
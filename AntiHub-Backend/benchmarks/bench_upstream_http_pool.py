@@ -0,0 +1,88 @@
+"""
+上游连接池基准：每请求新建 httpx.AsyncClient（旧实现） vs 共享连接池（app.core.http_client）
+
+对本地假上游（默认启用 TLS，自签名证书）发起请求，统计首字节时间（TTFB）的 p50/p99。
+假上游与客户端运行在同一事件循环中，绝对值偏高；关注两组结果的相对差异与建连次数。
+
+    python -m benchmarks.bench_upstream_http_pool --requests 1000 --concurrency 10
+    python -m benchmarks.bench_upstream_http_pool --no-tls
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+from typing import List
+
+from benchmarks._common import FakeUpstream, ensure_settings_env, summarize_ms
+
+ensure_settings_env()
+
+import httpx  # noqa: E402
+
+from app.core.http_client import UPSTREAM_PLUGIN, get_http_client_registry  # noqa: E402
+
+
+async def _ttfb(client: httpx.AsyncClient, url: str) -> float:
+    start = time.perf_counter()
+    first_byte = None
+    async with client.stream("POST", url, json={"model": "bench", "stream": True}) as resp:
+        # 读完整个响应体，连接才能归还连接池
+        async for _chunk in resp.aiter_raw():
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+    return first_byte if first_byte is not None else time.perf_counter() - start
+
+
+async def _run(total: int, concurrency: int, worker) -> List[float]:
+    samples: List[float] = []
+    remaining = iter(range(total))
+
+    async def loop() -> None:
+        for _ in remaining:
+            samples.append(await worker())
+
+    await asyncio.gather(*(loop() for _ in range(concurrency)))
+    return samples
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--no-tls", action="store_true")
+    args = parser.parse_args()
+
+    async with FakeUpstream(tls=not args.no_tls) as upstream:
+        url = f"{upstream.base_url}/v1/chat/completions"
+        verify = upstream.client_ssl_context() if upstream.tls else True
+
+        async def per_request_client() -> float:
+            async with httpx.AsyncClient(verify=verify) as client:
+                return await _ttfb(client, url)
+
+        before_conns = upstream.connections
+        before = await _run(args.requests, args.concurrency, per_request_client)
+        before_conns = upstream.connections - before_conns
+
+        # 与注册表相同的连接池参数；仅为自签名证书替换 verify
+        spec = get_http_client_registry().get_spec(UPSTREAM_PLUGIN)
+        pooled = httpx.AsyncClient(timeout=spec.timeout(), limits=spec.limits(), verify=verify)
+
+        async def shared_client() -> float:
+            return await _ttfb(pooled, url)
+
+        after_conns = upstream.connections
+        try:
+            after = await _run(args.requests, args.concurrency, shared_client)
+        finally:
+            await pooled.aclose()
+        after_conns = upstream.connections - after_conns
+
+    print(f"upstream={'https' if upstream.tls else 'http'} requests={args.requests} concurrency={args.concurrency}")
+    print(f"before (client per request): {summarize_ms(before)} connections={before_conns}")
+    print(f"after  (shared pool)       : {summarize_ms(after)} connections={after_conns}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
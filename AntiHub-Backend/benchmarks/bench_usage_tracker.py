@@ -0,0 +1,79 @@
+"""
+SSEUsageTracker CPU 基准：逐行 JSON 解析（lazy=False） vs 子串预检（lazy=True）
+
+模拟 --streams 条并发流，每条 --events 个 delta 事件 + 末尾一个 usage 事件，按 --chunk-size 切分后喂给 tracker，
+统计 CPU 时间（process_time）与每事件耗时，并校验两种模式结果一致。
+
+    python -m benchmarks.bench_usage_tracker --streams 200 --events 2000
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from typing import List
+
+from benchmarks._common import ensure_settings_env
+
+ensure_settings_env()
+
+from app.services.usage_log_service import SSEUsageTracker  # noqa: E402
+
+
+def build_stream(events: int, *, ascii_only: bool) -> bytes:
+    parts: List[bytes] = []
+    for i in range(events):
+        payload = {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion.chunk",
+            "model": "gpt-bench",
+            "choices": [{"index": 0, "delta": {"content": f"token-{i} 你好，世界 "}, "finish_reason": None}],
+        }
+        parts.append(f"data: {json.dumps(payload, ensure_ascii=ascii_only)}\n\n".encode("utf-8"))
+    final = {
+        "id": "chatcmpl-bench",
+        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 1234, "completion_tokens": events, "total_tokens": 1234 + events,
+                  "prompt_tokens_details": {"cached_tokens": 1000}},
+    }
+    parts.append(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+    parts.append(b"data: [DONE]\n\n")
+    return b"".join(parts)
+
+
+def run(chunks: List[bytes], streams: int, lazy: bool) -> tuple:
+    result = None
+    start = time.process_time()
+    for _ in range(streams):
+        tracker = SSEUsageTracker(lazy=lazy)
+        for chunk in chunks:
+            tracker.feed(chunk)
+        tracker.finalize()
+        result = (tracker.input_tokens, tracker.output_tokens, tracker.total_tokens, tracker.cached_tokens)
+    return time.process_time() - start, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--streams", type=int, default=200)
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--chunk-size", type=int, default=512)
+    args = parser.parse_args()
+
+    total_events = args.streams * (args.events + 2)
+    for ascii_only in (False, True):
+        raw = build_stream(args.events, ascii_only=ascii_only)
+        chunks = [raw[i:i + args.chunk_size] for i in range(0, len(raw), args.chunk_size)]
+        print(f"ensure_ascii={ascii_only} stream={len(raw) / 1024:.0f}KB chunks={len(chunks)} streams={args.streams}")
+        results = {}
+        for lazy in (False, True):
+            elapsed, result = run(chunks, args.streams, lazy)
+            results[lazy] = (elapsed, result)
+            name = "lazy (marker scan)" if lazy else "eager (json per line)"
+            print(f"  {name:<22}: cpu={elapsed * 1000:8.1f}ms  {elapsed / total_events * 1e6:6.2f}us/event  usage={result}")
+        assert results[True][1] == results[False][1], "lazy/eager 结果不一致"
+        print(f"  speedup: {results[False][0] / results[True][0]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
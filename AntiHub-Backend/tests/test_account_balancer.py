@@ -0,0 +1,99 @@
+import random
+import unittest
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from app.cache.codex_account_pool import CodexAccountPool, CodexAccountState
+from app.services.account_balancer import (
+    FILL_FIRST,
+    LEAST_IN_FLIGHT,
+    ROUND_ROBIN,
+    WEIGHTED_QUOTA,
+    BalanceStrategy,
+    WeightedQuotaStrategy,
+    choose_account,
+    resolve_balance_strategy,
+)
+
+
+class _MemoryRedis:
+    async def publish(self, channel, message):
+        return 1
+
+
+class TestBalanceStrategies(unittest.TestCase):
+    def test_fill_first_and_round_robin(self) -> None:
+        accounts = [1, 2, 3]
+        self.assertEqual([choose_account(FILL_FIRST, "k", accounts) for _ in range(3)], [1, 1, 1])
+        self.assertEqual([choose_account(ROUND_ROBIN, "rr", accounts) for _ in range(4)], [1, 2, 3, 1])
+        # 未知策略按 fill-first 处理
+        self.assertEqual(choose_account("random", "k", accounts), 1)
+        self.assertIsNone(choose_account(ROUND_ROBIN, "rr", []))
+
+    def test_least_in_flight_rotates_ties(self) -> None:
+        in_flight = {1: 2, 2: 0, 3: 0}
+        picks = [choose_account(LEAST_IN_FLIGHT, "lif", [1, 2, 3], in_flight=in_flight.get) for _ in range(4)]
+        self.assertEqual(sorted(set(picks)), [2, 3])
+        self.assertEqual(Counter(picks), Counter({2: 2, 3: 2}))
+
+    def test_weighted_quota_prefers_remaining(self) -> None:
+        strategy = WeightedQuotaStrategy(random.Random(0))
+        remaining = {1: 0.9, 2: 0.1}.get
+        picks = Counter(
+            strategy.choose("w", [1, 2], in_flight=lambda _: 0, remaining=remaining) for _ in range(2000)
+        )
+        self.assertGreater(picks[1], picks[2] * 5)
+
+    def test_resolve_prefers_api_key_setting(self) -> None:
+        self.assertEqual(resolve_balance_strategy(SimpleNamespace()), FILL_FIRST)
+        self.assertEqual(resolve_balance_strategy(SimpleNamespace(balance_strategy=ROUND_ROBIN)), ROUND_ROBIN)
+        user = SimpleNamespace(balance_strategy=ROUND_ROBIN, _balance_strategy=WEIGHTED_QUOTA)
+        self.assertEqual(resolve_balance_strategy(user), WEIGHTED_QUOTA)
+        self.assertEqual(resolve_balance_strategy(SimpleNamespace(_balance_strategy="bogus")), FILL_FIRST)
+
+    def test_strategy_must_implement_choose(self) -> None:
+        class _Incomplete(BalanceStrategy):
+            name = "incomplete"
+
+        with self.assertRaises(TypeError):
+            _Incomplete()
+        with self.assertRaises(TypeError):
+            BalanceStrategy()
+
+
+class TestCodexPoolCandidates(unittest.TestCase):
+    def test_remaining_ratio_and_candidates(self) -> None:
+        now = datetime.now(timezone.utc)
+        pool = CodexAccountPool(_MemoryRedis())
+        user_pool = pool.load(
+            1,
+            [
+                SimpleNamespace(
+                    id=1, user_id=1, status=1,
+                    limit_5h_used_percent=80, limit_5h_reset_at=now + timedelta(hours=1),
+                    limit_week_used_percent=10, limit_week_reset_at=None,
+                ),
+                SimpleNamespace(
+                    id=2, user_id=1, status=1,
+                    limit_5h_used_percent=90, limit_5h_reset_at=now - timedelta(minutes=1),
+                    limit_week_used_percent=None, limit_week_reset_at=None,
+                ),
+                SimpleNamespace(
+                    id=3, user_id=1, status=0,
+                    limit_5h_used_percent=None, limit_5h_reset_at=None,
+                    limit_week_used_percent=None, limit_week_reset_at=None,
+                ),
+            ],
+        )
+        ts = now.timestamp()
+        self.assertAlmostEqual(user_pool.accounts[1].remaining_ratio(ts), 0.2)
+        # 5h 窗口已重置：视为限额已恢复
+        self.assertEqual(user_pool.accounts[2].remaining_ratio(ts), 1.0)
+        self.assertEqual([s.id for s in pool.candidates(1)], [1, 2])
+        self.assertEqual([s.id for s in pool.candidates(1, {1})], [2])
+        self.assertIsInstance(pool.candidates(1)[0], CodexAccountState)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import json
+import unittest
+from unittest import mock
+
+from app.cache.auth_cache import (
+    API_KEY_AUTH_PREFIX,
+    INVALIDATION_CHANNEL,
+    JWT_USER_PREFIX,
+    AuthCache,
+    TTLCache,
+)
+
+
+class _MemoryRedis:
+    def __init__(self) -> None:
+        self.data = {}
+        self.published = []
+        self.reads = 0
+
+    async def get_json(self, key):
+        self.reads += 1
+        return self.data.get(key)
+
+    async def set_json(self, key, value, expire=None):
+        self.data[key] = value
+        return True
+
+    async def delete(self, key):
+        return 1 if self.data.pop(key, None) is not None else 0
+
+    async def publish(self, channel, message):
+        self.published.append((channel, message))
+        return 1
+
+
+class TestTTLCache(unittest.TestCase):
+    def test_lru_and_ttl(self) -> None:
+        cache = TTLCache(max_size=2, ttl=10.0)
+        with mock.patch("app.cache.auth_cache.time.monotonic", return_value=100.0):
+            cache.set("a", 1)
+            cache.set("b", 2)
+            self.assertEqual(cache.get("a"), 1)
+            cache.set("c", 3)
+            self.assertIsNone(cache.get("b"))
+        with mock.patch("app.cache.auth_cache.time.monotonic", return_value=111.0):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 1)
+
+
+class TestAuthCache(unittest.IsolatedAsyncioTestCase):
+    async def test_l1_hit_skips_redis(self) -> None:
+        redis = _MemoryRedis()
+        cache = AuthCache(redis)
+        await cache.set_api_key("sk-a", {"id": 1, "username": "u"}, expire=60)
+
+        for _ in range(3):
+            self.assertEqual((await cache.get_api_key("sk-a"))["id"], 1)
+
+        self.assertEqual(redis.reads, 0)
+        stats = cache.stats()
+        self.assertEqual(stats["l1_hits"], 3)
+        self.assertEqual(stats["hit_rate"], 1.0)
+
+    async def test_l2_hit_populates_l1(self) -> None:
+        redis = _MemoryRedis()
+        redis.data[f"{JWT_USER_PREFIX}7"] = {"id": 7, "username": "u"}
+        cache = AuthCache(redis)
+
+        self.assertIsNone(await cache.get_api_key("sk-missing"))
+        await cache.get_user(7)
+        await cache.get_user(7)
+
+        self.assertEqual((cache.misses, cache.l2_hits, cache.l1_hits), (1, 1, 1))
+
+    async def test_invalidate_api_key_clears_all_tiers_and_publishes(self) -> None:
+        redis = _MemoryRedis()
+        cache = AuthCache(redis)
+        await cache.set_api_key("sk-a", {"id": 1}, expire=60)
+
+        await cache.invalidate_api_key("sk-a")
+
+        self.assertNotIn(f"{API_KEY_AUTH_PREFIX}sk-a", redis.data)
+        self.assertIsNone(await cache.get_api_key("sk-a"))
+        channel, message = redis.published[0]
+        self.assertEqual(channel, INVALIDATION_CHANNEL)
+        self.assertEqual(json.loads(message), {"type": "api_key", "keys": ["sk-a"]})
+
+    async def test_remote_user_invalidation_drops_user_keys(self) -> None:
+        cache = AuthCache(_MemoryRedis())
+        await cache.set_api_key("sk-a", {"id": 1}, expire=60)
+        await cache.set_api_key("sk-b", {"id": 2}, expire=60)
+        await cache.set_user(1, {"id": 1}, expire=30)
+
+        cache.apply_invalidation(json.dumps({"type": "user", "user_id": 1, "keys": []}))
+
+        self.assertEqual(len(cache._api_keys), 1)
+        self.assertIsNone(cache._users.get(1))
+        self.assertIsNotNone(cache._api_keys.get("sk-b"))
+
+    async def test_last_used_throttled_locally(self) -> None:
+        cache = AuthCache(_MemoryRedis())
+        self.assertTrue(cache.should_touch_last_used("sk-a"))
+        self.assertFalse(cache.should_touch_last_used("sk-a"))
+        await cache.invalidate_api_key("sk-a")
+        self.assertTrue(cache.should_touch_last_used("sk-a"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import asyncio
+import unittest
+
+from app.utils.batch_writer import AsyncBatchWriter
+
+
+class TestAsyncBatchWriter(unittest.IsolatedAsyncioTestCase):
+    def _writer(self, **kwargs):
+        batches = []
+
+        async def write(batch):
+            batches.append(list(batch))
+
+        kwargs.setdefault("batch_size", 3)
+        kwargs.setdefault("flush_interval", 10.0)
+        return AsyncBatchWriter(write, **kwargs), batches
+
+    async def test_flushes_on_batch_size(self) -> None:
+        writer, batches = self._writer()
+        writer.start()
+        for i in range(3):
+            await writer.submit(i)
+        await asyncio.sleep(0.01)
+        self.assertEqual(batches, [[0, 1, 2]])
+        await writer.close()
+
+    async def test_flushes_on_interval(self) -> None:
+        writer, batches = self._writer(flush_interval=0.05)
+        writer.start()
+        await writer.submit("a")
+        await asyncio.sleep(0.01)
+        self.assertEqual(batches, [])
+        await asyncio.sleep(0.1)
+        self.assertEqual(batches, [["a"]])
+        await writer.close()
+
+    async def test_close_drains_queue(self) -> None:
+        writer, batches = self._writer()
+        writer.start()
+        for i in range(7):
+            await writer.submit(i)
+        await writer.close()
+        self.assertEqual(sorted(x for b in batches for x in b), list(range(7)))
+        self.assertEqual(writer.written, 7)
+        self.assertFalse(writer.running)
+
+    async def test_full_queue_drops_after_timeout(self) -> None:
+        writer, _ = self._writer(max_queue=2, enqueue_timeout=0.01)
+        self.assertTrue(await writer.submit(1))
+        self.assertTrue(await writer.submit(2))
+        self.assertFalse(await writer.submit(3))
+        self.assertEqual(writer.dropped, 1)
+        await writer.close()
+
+    async def test_failed_batch_is_retried_then_dropped(self) -> None:
+        calls = []
+
+        async def write(batch):
+            calls.append(list(batch))
+            raise RuntimeError("db down")
+
+        writer = AsyncBatchWriter(write, batch_size=2, flush_interval=0.0)
+        writer.start()
+        await writer.submit(1)
+        await writer.close()
+        self.assertEqual(calls, [[1], [1]])
+        self.assertEqual(writer.failed_batches, 1)
+
+    async def test_poisoned_row_is_isolated_and_dropped_alone(self) -> None:
+        written = []
+
+        async def write(batch):
+            # 模拟多行 INSERT：任一行出错时整批回滚
+            if any(row["api_key_id"] == 404 for row in batch):
+                raise RuntimeError("foreign key violation")
+            written.extend(batch)
+
+        rows = [{"id": i, "api_key_id": 404 if i == 137 else 1} for i in range(200)]
+        writer = AsyncBatchWriter(write, batch_size=200, flush_interval=0.0, describe=lambda row: f"id={row['id']}")
+        with self.assertLogs("app.utils.batch_writer", level="WARNING") as logs:
+            await writer._flush(rows)
+
+        self.assertEqual(sorted(row["id"] for row in written), [i for i in range(200) if i != 137])
+        self.assertEqual(writer.written, 199)
+        self.assertEqual(writer.failed_batches, 1)
+        self.assertEqual(writer.failed_items, 1)
+        self.assertIn("丢弃 1/200 条", logs.output[0])
+        self.assertIn("id=137", logs.output[0])
+
+    async def test_split_writes_are_bounded_when_everything_fails(self) -> None:
+        calls = []
+
+        async def write(batch):
+            calls.append(len(batch))
+            raise RuntimeError("db down")
+
+        writer = AsyncBatchWriter(write, batch_size=200, flush_interval=0.0, max_split_writes=8)
+        with self.assertLogs("app.utils.batch_writer", level="WARNING"):
+            await writer._flush(list(range(200)))
+        # 整批 2 次 + 拆批最多 8 次
+        self.assertEqual(len(calls), 10)
+        self.assertEqual(writer.failed_items, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import asyncio
+import json
+import unittest
+
+from app.services.anthropic_adapter import AnthropicAdapter
+from app.services.token_calibration import TokenCalibrator
+
+
+def _openai_stream():
+    chunks = [
+        {"choices": [{"index": 0, "delta": {"content": "你好"}, "finish_reason": None}]},
+        {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+         "usage": {"prompt_tokens": 120, "completion_tokens": 7}},
+    ]
+
+    async def gen():
+        for chunk in chunks:
+            yield f"data: {json.dumps(chunk)}\n\n".encode("utf-8")
+        yield b"data: [DONE]\n\n"
+
+    return gen()
+
+
+def _event_payload(event: str) -> dict:
+    data_line = next(line for line in event.splitlines() if line.startswith("data: "))
+    return json.loads(data_line[6:])
+
+
+async def _collect(**kwargs):
+    usages = []
+    events = [
+        e
+        async for e in AnthropicAdapter.convert_openai_stream_to_anthropic_cc(
+            _openai_stream(),
+            model="m",
+            request_id="r",
+            on_usage=lambda i, o: usages.append((i, o)),
+            **kwargs,
+        )
+    ]
+    return events, usages
+
+
+class TestCCStreamModes(unittest.TestCase):
+    def test_estimate_mode_emits_estimate_in_message_start(self) -> None:
+        events, usages = asyncio.run(_collect(estimated_input_tokens=100))
+        start = _event_payload(events[0])
+        self.assertEqual(start["type"], "message_start")
+        self.assertEqual(start["message"]["usage"]["input_tokens"], 100)
+        delta = _event_payload(next(e for e in events if e.startswith("event: message_delta")))
+        self.assertEqual(delta["usage"], {"input_tokens": 120, "output_tokens": 7})
+        self.assertEqual(usages, [(120, 7)])
+
+    def test_buffer_mode_emits_real_usage_in_message_start(self) -> None:
+        events, usages = asyncio.run(_collect())
+        start = _event_payload(events[0])
+        self.assertEqual(start["message"]["usage"], {"input_tokens": 120, "output_tokens": 7})
+        self.assertEqual(sum(e.startswith("event: message_start") for e in events), 1)
+        self.assertEqual(usages, [(120, 7)])
+
+
+class TestTokenCalibrator(unittest.TestCase):
+    def test_no_calibration_until_min_samples(self) -> None:
+        calibrator = TokenCalibrator(min_samples=3)
+        calibrator.observe("m", 100, 150)
+        calibrator.observe("m", 100, 150)
+        self.assertEqual(calibrator.calibrate("m", 100), 100)
+        calibrator.observe("m", 100, 150)
+        self.assertEqual(calibrator.calibrate("m", 100), 150)
+        self.assertEqual(calibrator.calibrate("other", 100), 100)
+
+    def test_ratio_is_clamped_and_invalid_samples_ignored(self) -> None:
+        calibrator = TokenCalibrator(min_samples=1, max_ratio=2.0)
+        calibrator.observe("m", 100, 0)
+        self.assertEqual(calibrator.ratio("m"), 1.0)
+        calibrator.observe("m", 10, 1000)
+        self.assertEqual(calibrator.ratio("m"), 2.0)
+
+    def test_evicts_least_recent_model(self) -> None:
+        calibrator = TokenCalibrator(min_samples=1, max_models=2)
+        for model in ("a", "b", "c"):
+            calibrator.observe(model, 100, 120)
+        self.assertEqual(set(calibrator.snapshot()), {"b", "c"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,445 @@
+import unittest
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from unittest import mock
+
+import httpx
+
+from fastapi import HTTPException
+
+from app.api.routes import v1
+from app.core.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, circuit_key
+from app.services.codex_service import CodexService
+from app.services.custom_account_service import CustomAccountService
+from app.services.gemini_cli_api_service import GeminiCLIAPIService
+from app.services.plugin_api_service import PluginAPIService
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _breaker(clock: _Clock, **kwargs) -> CircuitBreaker:
+    options = {"window": 60, "min_calls": 4, "failure_rate": 0.5, "open_seconds": 10, "max_open_seconds": 35}
+    options.update(kwargs)
+    return CircuitBreaker(clock=clock, **options)
+
+
+def _call(breaker: CircuitBreaker, key, status_code: int = 200, *, latency: float = 0.0, timed: bool = True, clock=None):
+    permit = breaker.try_acquire(key)
+    if permit is None:
+        return False
+    if clock is not None:
+        clock.now += latency
+    permit.observe_status(status_code, timed=timed)
+    permit.finish()
+    return True
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = _Clock()
+        self.breaker = _breaker(self.clock)
+        self.key = circuit_key("codex", 1)
+
+    def _trip(self) -> None:
+        for _ in range(4):
+            _call(self.breaker, self.key, 502)
+        self.assertEqual(self.breaker.state(self.key), OPEN)
+
+    def test_opens_on_failure_rate_after_min_calls(self) -> None:
+        for _ in range(3):
+            _call(self.breaker, self.key, 503)
+        # 调用数不足 min_calls：不熔断
+        self.assertEqual(self.breaker.state(self.key), CLOSED)
+        _call(self.breaker, self.key, 200)
+        self.assertEqual(self.breaker.state(self.key), OPEN)
+        self.assertTrue(self.breaker.is_open(self.key))
+        self.assertIsNone(self.breaker.try_acquire(self.key))
+        self.assertTrue(self.breaker.has_tripped("codex"))
+        self.assertFalse(self.breaker.has_tripped("custom"))
+        # 其他账号不受影响
+        self.assertIsNotNone(self.breaker.try_acquire(circuit_key("codex", 2)))
+
+    def test_client_errors_and_old_calls_do_not_count(self) -> None:
+        for _ in range(10):
+            _call(self.breaker, self.key, 429)
+        self.assertEqual(self.breaker.state(self.key), CLOSED)
+
+        for _ in range(3):
+            _call(self.breaker, self.key, 500)
+        self.clock.now += 61
+        # 窗口外的失败已过期：3 次成功 + 1 次失败，失败率 25%
+        for _ in range(3):
+            _call(self.breaker, self.key, 200)
+        _call(self.breaker, self.key, 500)
+        self.assertEqual(self.breaker.state(self.key), CLOSED)
+
+    def test_half_open_allows_single_probe_and_closes_on_success(self) -> None:
+        self._trip()
+        self.clock.now += 10
+        self.assertFalse(self.breaker.is_open(self.key))
+
+        probe = self.breaker.try_acquire(self.key)
+        self.assertIsNotNone(probe)
+        self.assertTrue(probe.probe)
+        self.assertEqual(self.breaker.state(self.key), HALF_OPEN)
+        # 探测进行中：其他请求仍被拒绝
+        self.assertIsNone(self.breaker.try_acquire(self.key))
+        self.assertTrue(self.breaker.is_open(self.key))
+
+        probe.observe_status(200)
+        probe.finish()
+        self.assertEqual(self.breaker.state(self.key), CLOSED)
+        self.assertFalse(self.breaker.has_tripped("codex"))
+        self.assertEqual(self.breaker.stats()["recovered"], 1)
+
+    def test_failed_probe_reopens_with_backoff(self) -> None:
+        self._trip()
+        self.assertEqual(self.breaker.retry_after(self.key), 10)
+        # 冷却时间逐次翻倍，不超过 max_open_seconds
+        for cool_down in (20, 35, 35):
+            self.clock.now += self.breaker.retry_after(self.key)
+            self.assertTrue(_call(self.breaker, self.key, 504))
+            self.assertEqual(self.breaker.state(self.key), OPEN)
+            self.assertEqual(self.breaker.retry_after(self.key), cool_down)
+
+        # 恢复后连续熔断次数清零
+        self.clock.now += 35
+        self.assertTrue(_call(self.breaker, self.key, 200))
+        self._trip()
+        self.assertEqual(self.breaker.retry_after(self.key), 10)
+
+    def test_probe_without_outcome_releases_slot(self) -> None:
+        self._trip()
+        self.clock.now += 10
+        probe = self.breaker.try_acquire(self.key)
+        probe.observe_exception(ValueError("client went away"))
+        probe.finish()
+        self.assertEqual(self.breaker.state(self.key), HALF_OPEN)
+        self.assertIsNotNone(self.breaker.try_acquire(self.key))
+
+    def test_stale_probe_allows_another(self) -> None:
+        self._trip()
+        self.clock.now += 10
+        self.assertIsNotNone(self.breaker.try_acquire(self.key))
+        self.assertIsNone(self.breaker.try_acquire(self.key))
+        self.clock.now += self.breaker.probe_timeout
+        self.assertIsNotNone(self.breaker.try_acquire(self.key))
+
+    def test_slow_first_byte_trips(self) -> None:
+        breaker = _breaker(self.clock, slow_call_seconds=5, slow_call_rate=0.75)
+        # 非流式整包响应不计慢调用
+        for _ in range(4):
+            _call(breaker, self.key, 200, latency=30, timed=False, clock=self.clock)
+        self.assertEqual(breaker.state(self.key), CLOSED)
+        self.clock.now += 60
+        _call(breaker, self.key, 200, latency=1, clock=self.clock)
+        for _ in range(2):
+            _call(breaker, self.key, 200, latency=6, clock=self.clock)
+        self.assertEqual(breaker.state(self.key), CLOSED)
+        # 4 次中 3 次慢调用：达到 75%
+        _call(breaker, self.key, 200, latency=6, clock=self.clock)
+        self.assertEqual(breaker.state(self.key), OPEN)
+
+    def test_slow_probe_reopens(self) -> None:
+        breaker = _breaker(self.clock, slow_call_seconds=5)
+        for _ in range(4):
+            _call(breaker, self.key, 500)
+        self.clock.now += 10
+        _call(breaker, self.key, 200, latency=6, clock=self.clock)
+        self.assertEqual(breaker.state(self.key), OPEN)
+
+    def test_context_manager_records_transport_errors(self) -> None:
+        for _ in range(4):
+            with self.assertRaises(httpx.ConnectError):
+                with self.breaker.try_acquire(self.key):
+                    raise httpx.ConnectError("refused")
+        self.assertEqual(self.breaker.state(self.key), OPEN)
+
+    def test_idle_closed_circuits_are_evicted(self) -> None:
+        for i in range(100):
+            _call(self.breaker, circuit_key("custom", f"https://{i}.example"), 200)
+        self._trip()
+        self.assertEqual(len(self.breaker._circuits), 101)
+
+        # 一个窗口之后：空闲的 closed 键被清理，熔断中的键与仍有调用的键保留
+        self.clock.now += 61
+        _call(self.breaker, circuit_key("custom", "https://0.example"), 200)
+        self.assertEqual(set(self.breaker._circuits), {self.key, circuit_key("custom", "https://0.example")})
+        self.assertEqual(self.breaker.state(self.key), OPEN)
+
+    def test_probe_timeout_comes_from_settings(self) -> None:
+        from app.core import circuit_breaker as module
+
+        settings = SimpleNamespace(
+            circuit_breaker_enabled=True,
+            circuit_breaker_window_seconds=60.0,
+            circuit_breaker_min_calls=5,
+            circuit_breaker_failure_rate=0.5,
+            circuit_breaker_slow_call_seconds=30.0,
+            circuit_breaker_slow_call_rate=0.8,
+            circuit_breaker_open_seconds=30.0,
+            circuit_breaker_max_open_seconds=600.0,
+            circuit_breaker_probe_timeout_seconds=45.0,
+        )
+        with mock.patch.object(module, "_circuit_breaker", None), \
+                mock.patch.object(module, "get_settings", return_value=settings):
+            self.assertEqual(module.get_circuit_breaker().probe_timeout, 45.0)
+
+    def test_disabled_breaker_always_allows(self) -> None:
+        breaker = _breaker(self.clock, enabled=False)
+        for _ in range(10):
+            self.assertTrue(_call(breaker, self.key, 500))
+        self.assertEqual(breaker.state(self.key), CLOSED)
+
+
+class TestCircuitBreakerIntegration(unittest.IsolatedAsyncioTestCase):
+    async def test_gemini_cli_skips_open_accounts(self) -> None:
+        breaker = _breaker(_Clock())
+        for _ in range(4):
+            _call(breaker, circuit_key("gemini-cli", 1), 500)
+
+        accounts = [SimpleNamespace(id=1, project_id="p1"), SimpleNamespace(id=2, project_id="p2")]
+        tokens = []
+
+        class _Repo:
+            async def list_enabled_by_user_id(self, user_id):
+                return list(accounts)
+
+            async def update_last_used_at(self, account_id, user_id):
+                return None
+
+        class _AccountService:
+            async def get_valid_access_token(self, user_id, account_id):
+                tokens.append(account_id)
+                return f"token-{account_id}"
+
+        service = GeminiCLIAPIService.__new__(GeminiCLIAPIService)
+        service.repo = _Repo()
+        service.account_service = _AccountService()
+        service._circuit_breaker = breaker
+
+        access_token, project_id, permit = await service._prepare_account(7)
+        self.assertEqual((access_token, project_id, permit.key), ("token-2", "p2", ("gemini-cli", "2")))
+        self.assertEqual(tokens, [2])
+
+        for _ in range(4):
+            _call(breaker, circuit_key("gemini-cli", 2), 500)
+        with self.assertRaises(ValueError):
+            await service._prepare_account(7)
+
+    async def test_custom_accounts_skip_open_base_urls(self) -> None:
+        breaker = _breaker(_Clock())
+        for _ in range(4):
+            _call(breaker, circuit_key("custom", "https://a.example/v1/"), 500)
+
+        accounts = [
+            SimpleNamespace(id=1, base_url="https://a.example/v1"),
+            SimpleNamespace(id=2, base_url="https://b.example/v1"),
+        ]
+
+        class _Repo:
+            async def list_enabled_by_user_id(self, user_id):
+                return list(accounts)
+
+        service = CustomAccountService.__new__(CustomAccountService)
+        service.repo = _Repo()
+        service._circuit_breaker = breaker
+
+        self.assertEqual((await service.select_active_account(7)).id, 2)
+        # 只剩熔断中的上游时仍返回账号，由调用方 try_acquire 返回 503
+        self.assertEqual((await service.select_active_account(7, allowed_account_ids=[1])).id, 1)
+
+    async def test_codex_token_error_does_not_hold_half_open_probe(self) -> None:
+        clock = _Clock()
+        breaker = _breaker(clock)
+        key = circuit_key("codex", 1)
+        for _ in range(4):
+            _call(breaker, key, 500)
+        clock.now += 10
+
+        service = CodexService.__new__(CodexService)
+        service._circuit_breaker = breaker
+        account = SimpleNamespace(id=1)
+
+        async def select(user_id, *, exclude_ids, strategy):
+            return None if 1 in exclude_ids else account
+
+        async def ensure_tokens(selected, creds):
+            raise RuntimeError("refresh failed")
+
+        service._select_active_account_obj = select
+        service._load_account_credentials = lambda selected: {}
+        service._ensure_account_tokens = ensure_tokens
+
+        with self.assertRaises(RuntimeError):
+            await service.open_codex_responses_stream(1, {"model": "gpt-5"})
+        # 没有真正请求上游：半开探测名额仍可用
+        self.assertIsNotNone(breaker.try_acquire(key))
+
+    def _plugin_service(self, breaker: CircuitBreaker, handler) -> PluginAPIService:
+        service = PluginAPIService.__new__(PluginAPIService)
+        service.base_url = "http://plugin.local"
+        service._circuit_breaker = breaker
+
+        async def get_user_api_key(user_id):
+            return f"key-{user_id}"
+
+        async def update_last_used(user_id):
+            return None
+
+        service.get_user_api_key = get_user_api_key
+        service.update_last_used = update_last_used
+        self.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        self.addAsyncCleanup(self.client.aclose)
+        return service
+
+    async def _plugin_call(self, service: PluginAPIService, user_id: int, path: str) -> int:
+        with mock.patch("app.services.plugin_api_service.get_http_client", return_value=self.client):
+            try:
+                await service.proxy_request(user_id=user_id, method="POST", path=path, json_data={})
+            except httpx.HTTPStatusError as exc:
+                return exc.response.status_code
+            return 200
+
+    async def test_plugin_5xx_only_trips_that_user_and_management_is_not_gated(self) -> None:
+        breaker = _breaker(_Clock())
+
+        def handler(request):
+            if request.headers["Authorization"] == "Bearer key-1":
+                return httpx.Response(500, json={"detail": "broken account"})
+            return httpx.Response(200, json={"ok": True})
+
+        service = self._plugin_service(breaker, handler)
+        for _ in range(4):
+            self.assertEqual(await self._plugin_call(service, 1, "/v1/chat/completions"), 500)
+
+        self.assertTrue(breaker.is_open(circuit_key("plugin", "user:1")))
+        self.assertFalse(breaker.is_open(circuit_key("plugin", "http://plugin.local")))
+        # 熔断中的用户：推理请求直接 503；管理接口照常请求上游
+        self.assertEqual(await self._plugin_call(service, 1, "/v1/chat/completions"), 503)
+        self.assertEqual(await self._plugin_call(service, 1, "/api/accounts"), 500)
+        # 其他用户不受影响
+        self.assertEqual(await self._plugin_call(service, 2, "/v1/chat/completions"), 200)
+
+    async def test_plugin_base_url_trips_on_transport_errors_only(self) -> None:
+        breaker = _breaker(_Clock())
+
+        def handler(request):
+            raise httpx.ConnectError("refused", request=request)
+
+        service = self._plugin_service(breaker, handler)
+        for user_id in range(1, 5):
+            with self.assertRaises(httpx.ConnectError):
+                await self._plugin_call(service, user_id, "/v1/chat/completions")
+
+        self.assertTrue(breaker.is_open(circuit_key("plugin", "http://plugin.local")))
+        self.assertEqual(await self._plugin_call(service, 9, "/v1/chat/completions"), 503)
+        with self.assertRaises(httpx.ConnectError):
+            await self._plugin_call(service, 9, "/api/accounts")
+
+    async def test_plugin_pool_timeout_is_503_and_not_counted(self) -> None:
+        breaker = _breaker(_Clock())
+        timeouts = []
+
+        def handler(request):
+            timeouts.append(request.extensions["timeout"])
+            raise httpx.PoolTimeout("pool full", request=request)
+
+        service = self._plugin_service(breaker, handler)
+        for _ in range(6):
+            self.assertEqual(await self._plugin_call(service, 1, "/v1/chat/completions"), 503)
+
+        # 连接池满不说明上游状况：两个熔断都不计失败
+        self.assertFalse(breaker.is_open(circuit_key("plugin", "user:1")))
+        self.assertFalse(breaker.is_open(circuit_key("plugin", "http://plugin.local")))
+        # 等待空闲连接的时间取连接池配置，而不是 1200 秒的读超时
+        self.assertEqual(timeouts[0], {"connect": 1200.0, "read": 1200.0, "write": 1200.0, "pool": 10.0})
+
+    async def _custom_chat(self, breaker: CircuitBreaker, handler):
+        account = SimpleNamespace(id=1, api_format="openai_compatible", proxy_url=None)
+
+        class _Service:
+            def __init__(self, db) -> None:
+                pass
+
+            async def select_active_account(self, user_id, allowed_ids, *, strategy):
+                return account
+
+            def get_decrypted_credentials(self, selected):
+                return {"api_key": "sk-test", "base_url": "https://a.example/v1"}
+
+            async def mark_last_used(self, account_id):
+                return None
+
+        class _Session:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+            async def commit(self):
+                return None
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        self.addAsyncCleanup(client.aclose)
+
+        @asynccontextmanager
+        async def lease(base_url, proxy):
+            yield client
+
+        user = SimpleNamespace(id=7, _config_type="custom", _api_key_id=None, _allowed_account_ids=None)
+        raw_request = SimpleNamespace(url=SimpleNamespace(path="/v1/chat/completions"), method="POST", headers={})
+        # 流式响应体在返回之后才消费：patch 保持到用例结束
+        for patcher in (
+            mock.patch("app.services.custom_account_service.CustomAccountService", _Service),
+            mock.patch("app.db.session.get_session_maker", return_value=_Session),
+            mock.patch.object(v1, "get_circuit_breaker", return_value=breaker),
+            mock.patch.object(v1, "lease_upstream_client", lease),
+            mock.patch.object(v1.UsageLogService, "record", mock.AsyncMock()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        return await v1.chat_completions(
+            raw_request,
+            current_user=user,
+            request_data={"model": "gpt-x", "stream": True, "messages": []},
+            antigravity_service=None,
+            kiro_service=None,
+            codex_service=None,
+            gemini_cli_service=None,
+            zai_image_service=None,
+        )
+
+    async def test_custom_stream_takes_permit_when_body_starts(self) -> None:
+        clock = _Clock()
+        breaker = _breaker(clock)
+        key = circuit_key("custom", "https://a.example/v1")
+        for _ in range(4):
+            _call(breaker, key, 500)
+
+        def handler(request):
+            return httpx.Response(200, content=b"data: [DONE]\n\n")
+
+        # 熔断中：构造响应前直接 503
+        with self.assertRaises(HTTPException) as ctx:
+            await self._custom_chat(breaker, handler)
+        self.assertEqual(ctx.exception.status_code, 503)
+
+        # 半开：返回 StreamingResponse 但尚未消费时不占用探测名额
+        clock.now += 10
+        resp = await self._custom_chat(breaker, handler)
+        self.assertFalse(breaker.is_open(key))
+        body = b"".join([chunk async for chunk in resp.body_iterator])
+        self.assertEqual(body, b"data: [DONE]\n\n")
+        self.assertEqual(breaker.state(key), CLOSED)
+
+
+if __name__ == "__main__":
+    unittest.main()
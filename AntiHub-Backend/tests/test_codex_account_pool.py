@@ -0,0 +1,187 @@
+import json
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from app.cache.codex_account_pool import SYNC_CHANNEL, CodexAccountPool
+from app.models.codex_account import CodexAccount
+from app.services.codex_service import CodexService
+
+
+class _MemoryRedis:
+    def __init__(self) -> None:
+        self.published = []
+
+    async def publish(self, channel, message):
+        self.published.append((channel, message))
+        return 1
+
+
+class _FakeSession:
+    async def flush(self):
+        return None
+
+    async def commit(self):
+        return None
+
+    async def rollback(self):
+        return None
+
+
+class _FakeRepo:
+    """内存中的 CodexAccountRepository（只实现选号用到的方法）"""
+
+    def __init__(self, accounts) -> None:
+        self.accounts = {a.id: a for a in accounts}
+        self.pool_loads = 0
+        self.pk_loads = 0
+
+    async def list_pool_states_by_user_id(self, user_id):
+        self.pool_loads += 1
+        return [a for a in sorted(self.accounts.values(), key=lambda a: a.id) if a.user_id == user_id]
+
+    async def get_by_id_and_user_id(self, account_id, user_id):
+        self.pk_loads += 1
+        account = self.accounts.get(account_id)
+        return account if account is not None and account.user_id == user_id else None
+
+
+def _account(account_id: int, *, user_id: int = 1, status: int = 1, **limits) -> CodexAccount:
+    return CodexAccount(id=account_id, user_id=user_id, status=status, account_name=f"a{account_id}", **limits)
+
+
+def _service(accounts, pool: CodexAccountPool) -> CodexService:
+    service = CodexService(_FakeSession(), redis=None)
+    service.repo = _FakeRepo(accounts)
+    service.account_pool = pool
+    return service
+
+
+class TestUserAccountPool(unittest.TestCase):
+    def test_fill_first_freeze_and_thaw(self) -> None:
+        now = time.time()
+        pool = CodexAccountPool(_MemoryRedis())
+        user_pool = pool.load(
+            1,
+            [
+                _account(3),
+                _account(1, status=0),
+                _account(2, limit_5h_used_percent=100, limit_5h_reset_at=datetime.fromtimestamp(now + 60, timezone.utc)),
+                _account(4, limit_week_used_percent=100),
+            ],
+        )
+
+        self.assertEqual(user_pool.select(now=now).id, 3)
+        self.assertIsNone(user_pool.select({3}, now=now))
+        # 5h 重置时间到达后自动解冻，fill-first 重新选回 id 更小的账号
+        self.assertEqual(user_pool.select(now=now + 61).id, 2)
+        self.assertEqual(user_pool.earliest_unfreeze(now + 61), (None, True))
+        self.assertTrue(user_pool.has_enabled())
+
+
+class TestCodexAccountPoolSync(unittest.IsolatedAsyncioTestCase):
+    async def test_update_publishes_changes_and_other_worker_applies(self) -> None:
+        redis = _MemoryRedis()
+        worker_a, worker_b = CodexAccountPool(redis), CodexAccountPool(redis)
+        accounts = [_account(1), _account(2)]
+        worker_a.load(1, accounts)
+        worker_b.load(1, accounts)
+
+        await worker_a.update(accounts[0])
+        self.assertEqual(redis.published, [])
+
+        accounts[0].limit_5h_used_percent = 100
+        accounts[0].limit_5h_reset_at = datetime.now(timezone.utc) + timedelta(hours=1)
+        await worker_a.update(accounts[0])
+        self.assertEqual(len(redis.published), 1)
+        channel, message = redis.published[0]
+        self.assertEqual(channel, SYNC_CHANNEL)
+
+        self.assertEqual(worker_b.select(1).id, 1)
+        worker_b.apply_message(message)
+        self.assertEqual(worker_b.select(1).id, 2)
+
+        await worker_a.remove(1, 2)
+        worker_b.apply_message(redis.published[-1][1])
+        self.assertIsNone(worker_b.select(1))
+        self.assertEqual(json.loads(redis.published[-1][1])["type"], "remove")
+
+
+class TestCodexServiceSelection(unittest.IsolatedAsyncioTestCase):
+    async def test_rate_limit_storm_uses_pool_without_rescans(self) -> None:
+        accounts = [_account(i) for i in range(1, 201)]
+        service = _service(accounts, CodexAccountPool(_MemoryRedis()))
+
+        exclude = set()
+        for _ in range(150):
+            selected = await service._select_active_account_obj(1, exclude_ids=exclude)
+            exclude.add(selected.id)
+            await service._mark_rate_limited(selected, bucket="5h", retry_at=None, raw_error="")
+
+        selected = await service._select_active_account_obj(1, exclude_ids=set())
+        self.assertEqual(selected.id, 151)
+        self.assertEqual(service.repo.pool_loads, 1)
+        self.assertEqual(service.repo.pk_loads, 151)
+
+    async def test_stale_pool_is_corrected_from_db(self) -> None:
+        accounts = [_account(1), _account(2)]
+        service = _service(accounts, CodexAccountPool(_MemoryRedis()))
+        self.assertEqual((await service.select_active_account(1))["data"].id, 1)
+
+        # 其他进程直接改库（没有广播）：选号时按主键加载发现已冻结，修正账号池后选下一个
+        reset = datetime.now(timezone.utc) + timedelta(hours=2)
+        accounts[0].limit_week_used_percent = 100
+        accounts[0].limit_week_reset_at = reset
+        self.assertEqual((await service.select_active_account(1))["data"].id, 2)
+
+        accounts[1].status = 0
+        with self.assertRaisesRegex(ValueError, "预计最早解冻时间"):
+            await service.select_active_account(1)
+
+    async def test_in_flight_released_when_response_closes(self) -> None:
+        pool = CodexAccountPool(_MemoryRedis())
+        service = _service([_account(1)], pool)
+        await service._get_account_pool(1)
+
+        resp = SimpleNamespace(stream=SimpleNamespace(aclose=_noop))
+        service._track_in_flight(1, 1, resp)
+        self.assertEqual(pool.get(1).accounts[1].in_flight, 1)
+        await resp.stream.aclose()
+        await resp.stream.aclose()
+        self.assertEqual(pool.get(1).accounts[1].in_flight, 0)
+
+    async def test_in_flight_survives_ttl_reload_and_resubscribe(self) -> None:
+        pool = CodexAccountPool(_MemoryRedis())
+        service = _service([_account(1), _account(2)], pool)
+        await service._get_account_pool(1)
+        streams = [SimpleNamespace(stream=SimpleNamespace(aclose=_noop)) for _ in range(3)]
+        for resp in streams:
+            service._track_in_flight(1, 1, resp)
+
+        # TTL 到期：重新加载后在途计数保留，之后结束的流仍能正确扣减
+        pool._users[1].loaded_at -= pool.ttl + 1
+        self.assertIsNone(pool.get(1))
+        await service._get_account_pool(1)
+        self.assertEqual(service.repo.pool_loads, 2)
+        self.assertEqual(pool.get(1).accounts[1].in_flight, 3)
+        await streams[0].stream.aclose()
+        self.assertEqual(pool.get(1).accounts[1].in_flight, 2)
+
+        # 重新订阅作废本地池：同样保留在途计数
+        pool.clear_local()
+        self.assertIsNone(pool.get(1))
+        await service._get_account_pool(1)
+        self.assertEqual(service.repo.pool_loads, 3)
+        self.assertEqual(pool.get(1).accounts[1].in_flight, 2)
+        for resp in streams[1:]:
+            await resp.stream.aclose()
+        self.assertEqual(pool.get(1).accounts[1].in_flight, 0)
+
+
+async def _noop():
+    return None
+
+
+if __name__ == "__main__":
+    unittest.main()
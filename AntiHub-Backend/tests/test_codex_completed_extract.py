@@ -0,0 +1,40 @@
+import asyncio
+import json
+import unittest
+
+from app.services.codex_service import _read_completed_response
+
+
+def _event(payload: dict) -> bytes:
+    return f"event: {payload['type']}\ndata: {json.dumps(payload)}\n\n".encode("utf-8")
+
+
+class TestReadCompletedResponse(unittest.TestCase):
+    def test_returns_on_completed_without_draining_stream(self) -> None:
+        consumed = []
+        completed = {"id": "resp_1", "status": "completed", "output": [{"type": "message"}]}
+
+        async def stream():
+            for i in range(3):
+                consumed.append(i)
+                yield _event({"type": "response.output_text.delta", "delta": f"response.completed {i}"})
+            raw = _event({"type": "response.completed", "response": completed})
+            consumed.append("completed")
+            yield raw[:10]
+            yield raw[10:]
+            consumed.append("after")
+            raise AssertionError("上游在 response.completed 之后不应再被读取")
+
+        self.assertEqual(asyncio.run(_read_completed_response(stream())), completed)
+        self.assertEqual(consumed, [0, 1, 2, "completed"])
+
+    def test_missing_completed_returns_none(self) -> None:
+        async def stream():
+            yield _event({"type": "response.created", "response": {"id": "x"}})
+            yield b"data: [DONE]\n\n"
+
+        self.assertIsNone(asyncio.run(_read_completed_response(stream())))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import asyncio
+import json
+import unittest
+
+from app.services.anthropic_adapter import AnthropicAdapter
+
+
+def _sse(chunks) -> bytes:
+    body = "".join(f"data: {json.dumps(c, ensure_ascii=False)}\n\n" for c in chunks)
+    return (body + "data: [DONE]\n\n").encode("utf-8")
+
+
+def _collect(raw: bytes, piece: int, thinking_enabled: bool = False) -> dict:
+    async def stream():
+        for i in range(0, len(raw), piece):
+            yield raw[i:i + piece]
+
+    return asyncio.run(
+        AnthropicAdapter.collect_openai_stream_to_response(stream(), thinking_enabled=thinking_enabled)
+    )
+
+
+class TestCollectOpenAIStream(unittest.TestCase):
+    def test_text_thinking_and_usage_with_split_multibyte(self) -> None:
+        raw = _sse([
+            {"id": "chatcmpl-1", "model": "m", "choices": [{"delta": {"content": "<thinking>想"}}]},
+            {"id": "ignored", "choices": [{"delta": {"content": "法</thinking>你好🙂"}, "finish_reason": "stop"}]},
+            {"choices": [], "usage": {"prompt_tokens": 5, "completion_tokens": 3}},
+        ])
+        for piece in (1, 5, len(raw)):
+            resp = _collect(raw, piece, thinking_enabled=True)
+            message = resp["choices"][0]["message"]
+            self.assertEqual(resp["id"], "chatcmpl-1")
+            self.assertEqual(resp["model"], "m")
+            self.assertEqual(message["content"], "你好🙂")
+            self.assertEqual(message["reasoning_content"], "想法")
+            self.assertEqual(resp["choices"][0]["finish_reason"], "stop")
+            self.assertEqual(resp["usage"], {"prompt_tokens": 5, "completion_tokens": 3, "total_tokens": 8})
+
+    def test_tool_calls_merge_by_id(self) -> None:
+        raw = _sse([
+            {"choices": [{"delta": {"tool_calls": [
+                {"index": 0, "id": "call_a", "function": {"name": "f", "arguments": "{\"x\""},
+                 "extra_content": {"google": {"thought_signature": "sig"}}},
+            ]}}]},
+            {"choices": [{"delta": {"tool_calls": [{"index": 0, "function": {"arguments": ": 1}"}}]}}]},
+            # 部分上游对第二个工具调用仍使用 index 0，按 id 分配新槽位
+            {"choices": [{"delta": {"tool_calls": [{"index": 0, "id": "call_b", "function": {"name": "g", "arguments": "{}"}}]}}]},
+        ])
+        message = _collect(raw, 16)["choices"][0]["message"]
+        self.assertEqual(
+            [(tc["id"], tc["function"]["name"], tc["function"]["arguments"]) for tc in message["tool_calls"]],
+            [("call_a", "f", "{\"x\": 1}"), ("call_b", "g", "{}")],
+        )
+        self.assertEqual(message["signature"], "sig")
+        self.assertIsNone(message["content"])
+
+    def test_plain_json_body(self) -> None:
+        full = {"object": "chat.completion", "id": "x", "choices": []}
+        self.assertEqual(_collect(json.dumps(full).encode(), 4), full)
+
+        chunk = {"id": "y", "model": "m", "choices": [{"message": {"content": "hi"}, "finish_reason": "length"}]}
+        resp = _collect(b"  " + json.dumps(chunk).encode(), 4)
+        self.assertEqual(resp["choices"][0]["message"]["content"], "hi")
+        self.assertEqual(resp["choices"][0]["finish_reason"], "length")
+
+
+if __name__ == "__main__":
+    unittest.main()
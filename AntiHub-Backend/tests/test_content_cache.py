@@ -0,0 +1,67 @@
+import unittest
+
+from app.cache.content_cache import ContentCache, get_content_cache
+from app.utils.token_counter import count_all_tokens, count_system_tokens, count_tokens, count_tools_tokens
+
+_TOOLS = [
+    {
+        "name": "Read",
+        "description": "读取文件",
+        "input_schema": {"type": "object", "properties": {"path": {"type": "string"}}, "required": ["path"]},
+    },
+    {"name": "Bash", "description": "Run a shell command", "input_schema": {"type": "object", "properties": {}}},
+]
+
+
+class TestContentCache(unittest.TestCase):
+    def setUp(self) -> None:
+        get_content_cache().clear()
+
+    def test_hits_are_keyed_by_content_and_namespace(self) -> None:
+        cache = ContentCache(max_entries=2)
+        calls = []
+
+        def compute(tag):
+            calls.append(tag)
+            return tag
+
+        self.assertEqual(cache.get_or_compute("a", {"x": [1, 2]}, lambda: compute("first")), "first")
+        # 内容相同的新对象命中；不同命名空间不共享
+        self.assertEqual(cache.get_or_compute("a", {"x": [1, 2]}, lambda: compute("second")), "first")
+        self.assertEqual(cache.get_or_compute("b", {"x": [1, 2]}, lambda: compute("third")), "third")
+        self.assertEqual(calls, ["first", "third"])
+
+        stats = cache.stats()
+        self.assertEqual((stats["lookups"], stats["hits"], stats["size"]), (3, 1, 2))
+        self.assertEqual(stats["namespaces"]["a"], {"lookups": 2, "hits": 1, "hit_rate": 0.5})
+
+        # LRU：容量 2，插入第三个键淘汰最久未用的
+        cache.get_or_compute("c", "z", lambda: "z")
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get_or_compute("a", {"x": [1, 2]}, lambda: "recomputed"), "recomputed")
+
+    def test_unserializable_content_is_computed_without_caching(self) -> None:
+        cache = ContentCache()
+        self.assertEqual(cache.get_or_compute("a", "\ud800", lambda: 1), 1)
+        self.assertEqual(cache.get_or_compute("a", "\ud800", lambda: 2), 2)
+        self.assertEqual(len(cache), 0)
+
+    def test_token_counts_match_uncached(self) -> None:
+        messages = [{"role": "user", "content": "hello 你好"}]
+        expected = count_system_tokens("You are helpful.") + count_tools_tokens(_TOOLS) + count_tokens("hello 你好")
+        for _ in range(3):
+            self.assertEqual(count_all_tokens(messages, system="You are helpful.", tools=_TOOLS), expected)
+        namespaces = get_content_cache().stats()["namespaces"]
+        self.assertEqual(namespaces["tokens:tools"]["hits"], 2)
+        self.assertEqual(namespaces["tokens:system"]["hits"], 2)
+
+        # 内容变化即视为新键
+        changed = [dict(_TOOLS[0], description="读取文件内容"), _TOOLS[1]]
+        self.assertEqual(
+            count_all_tokens(messages, system="You are helpful.", tools=changed),
+            count_system_tokens("You are helpful.") + count_tools_tokens(changed) + count_tokens("hello 你好"),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+
+from app.db.session import REQUEST_SESSIONS_SCOPE_KEY, DBSessionReleaseMiddleware
+
+
+class _FakeSession:
+    def __init__(self, in_transaction: bool = True, fail_commit: bool = False) -> None:
+        self._in_transaction = in_transaction
+        self.fail_commit = fail_commit
+        self.events = []
+
+    def in_transaction(self) -> bool:
+        return self._in_transaction
+
+    async def commit(self) -> None:
+        self.events.append("commit")
+        if self.fail_commit:
+            raise RuntimeError("commit failed")
+        self._in_transaction = False
+
+    async def rollback(self) -> None:
+        self.events.append("rollback")
+        self._in_transaction = False
+
+
+class TestDBSessionReleaseMiddleware(unittest.IsolatedAsyncioTestCase):
+    async def _run(self, *sessions: _FakeSession):
+        sent = []
+
+        async def app(scope, receive, send):
+            scope.setdefault(REQUEST_SESSIONS_SCOPE_KEY, []).extend(sessions)
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            for session in sessions:
+                session.events.append("body")
+            await send({"type": "http.response.body", "body": b"data: x\n\n", "more_body": False})
+
+        async def send(message):
+            sent.append(message["type"])
+
+        async def receive():
+            return {"type": "http.disconnect"}
+
+        await DBSessionReleaseMiddleware(app)({"type": "http"}, receive, send)
+        return sent
+
+    async def test_commits_before_body_starts(self) -> None:
+        session = _FakeSession()
+        sent = await self._run(session)
+        self.assertEqual(session.events, ["commit", "body"])
+        self.assertEqual(sent, ["http.response.start", "http.response.body"])
+
+    async def test_untouched_session_is_skipped(self) -> None:
+        session = _FakeSession(in_transaction=False)
+        await self._run(session)
+        self.assertEqual(session.events, ["body"])
+
+    async def test_commit_failure_rolls_back(self) -> None:
+        session = _FakeSession(fail_commit=True)
+        sent = await self._run(session)
+        self.assertEqual(session.events, ["commit", "rollback", "body"])
+        self.assertEqual(sent[0], "http.response.start")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import json
+import math
+import unittest
+
+from app.utils import jsonx
+
+
+class TestJsonx(unittest.TestCase):
+    def tearDown(self) -> None:
+        jsonx.set_backend(jsonx.available_backends()[0])
+
+    def _each_backend(self):
+        for name in jsonx.available_backends():
+            jsonx.set_backend(name)
+            with self.subTest(backend=name):
+                yield name
+
+    def test_dumps_is_compact_utf8_bytes(self) -> None:
+        obj = {"a": "你好", "b": [1, 2.5, None, True]}
+        for _ in self._each_backend():
+            out = jsonx.dumps(obj)
+            self.assertIsInstance(out, bytes)
+            self.assertEqual(out, '{"a":"你好","b":[1,2.5,null,true]}'.encode("utf-8"))
+            self.assertEqual(jsonx.dumps_str(obj), out.decode("utf-8"))
+
+    def test_inputs_unsupported_by_fast_backends_fall_back(self) -> None:
+        for _ in self._each_backend():
+            self.assertEqual(json.loads(jsonx.dumps({1: "x"})), {"1": "x"})
+            self.assertEqual(json.loads(jsonx.dumps({"big": 2**70})), {"big": 2**70})
+            self.assertEqual(json.loads(jsonx.dumps({"s": "\ud800"})), {"s": "\ud800"})
+            self.assertEqual(jsonx.loads(b'{"x":[1,{"y":"\xc3\xa9"}]}'), {"x": [1, {"y": "é"}]})
+            self.assertTrue(math.isnan(jsonx.loads('{"a": NaN}')["a"]))
+
+    def test_invalid_input_raises_json_decode_error(self) -> None:
+        for _ in self._each_backend():
+            for bad in ("{", "", b"nope"):
+                with self.assertRaises(json.JSONDecodeError):
+                    jsonx.loads(bad)
+
+    def test_unknown_backend_is_rejected(self) -> None:
+        with self.assertRaises(ValueError):
+            jsonx.set_backend("simplejson")
+
+
+if __name__ == "__main__":
+    unittest.main()
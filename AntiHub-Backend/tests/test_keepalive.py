@@ -0,0 +1,180 @@
+import asyncio
+import contextvars
+import unittest
+
+import httpx
+
+from app.utils.keepalive import SSE_PING, TimerWheel, get_timer_wheel, with_keepalive
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+
+
+async def _collect(agen):
+    return [item async for item in agen]
+
+
+class TestKeepalive(unittest.TestCase):
+    def test_passes_items_through_and_pings_while_idle(self) -> None:
+        async def source():
+            yield b"a"
+            await asyncio.sleep(0.35)
+            yield b"b"
+            await asyncio.sleep(0)
+            yield b"c"
+
+        async def run():
+            wheel = TimerWheel(asyncio.get_running_loop(), resolution=0.01)
+            tasks_before = len(asyncio.all_tasks())
+            out = []
+            async for item in with_keepalive(source(), interval=0.1, wheel=wheel):
+                out.append(item)
+                # 整条流只有一个读取任务，不随 item 增加
+                self.assertLessEqual(len(asyncio.all_tasks()), tasks_before + 1)
+            await asyncio.sleep(0)
+            self.assertEqual(len(asyncio.all_tasks()), tasks_before)
+            self.assertEqual(len(wheel), 0)
+            self.assertFalse(wheel.armed)
+            return out
+
+        out = asyncio.run(run())
+        self.assertEqual(out[0], b"a")
+        self.assertEqual(out[-2:], [b"b", b"c"])
+        self.assertIn(len(out) - 3, (2, 3))
+        self.assertTrue(all(item == SSE_PING for item in out[1:-2]))
+
+    def test_callable_heartbeat_and_no_ping_for_fast_source(self) -> None:
+        async def fast():
+            for i in range(100):
+                await asyncio.sleep(0)
+                yield i
+
+        async def slow():
+            await asyncio.sleep(0.15)
+            yield "done"
+
+        async def run():
+            wheel = TimerWheel(asyncio.get_running_loop(), resolution=0.01)
+            fast_out = await _collect(with_keepalive(fast(), interval=1.0, wheel=wheel))
+            slow_out = await _collect(with_keepalive(slow(), interval=0.05, heartbeat=lambda: "hb", wheel=wheel))
+            return fast_out, slow_out
+
+        fast_out, slow_out = asyncio.run(run())
+        self.assertEqual(fast_out, list(range(100)))
+        self.assertEqual(slow_out[-1], "done")
+        self.assertGreaterEqual(slow_out.count("hb"), 1)
+
+    def test_source_exception_and_context_propagate(self) -> None:
+        async def source():
+            yield _request_id.get()
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        async def run():
+            _request_id.set("req-1")
+            out = []
+            with self.assertRaises(ValueError):
+                async for item in with_keepalive(source(), interval=1.0):
+                    out.append(item)
+            self.assertEqual(len(get_timer_wheel()), 0)
+            return out
+
+        self.assertEqual(asyncio.run(run()), ["req-1"])
+
+    def test_httpx_read_timeout_inside_anyio_scope_propagates(self) -> None:
+        # httpcore 在 anyio.fail_after 作用域内读取响应，超时后抛出 httpx.ReadTimeout
+        async def stalled_server(reader, writer):
+            await reader.readuntil(b"\r\n\r\n")
+            writer.write(b"HTTP/1.1 200 OK\r\ntransfer-encoding: chunked\r\n\r\n5\r\nfirst\r\n")
+            await writer.drain()
+            await asyncio.sleep(5)
+
+        async def run():
+            server = await asyncio.start_server(stalled_server, "127.0.0.1", 0)
+            url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/"
+
+            async def source():
+                async with httpx.AsyncClient() as client:
+                    async with client.stream("GET", url, timeout=httpx.Timeout(0.3)) as resp:
+                        async for chunk in resp.aiter_raw():
+                            yield chunk
+
+            wheel = TimerWheel(asyncio.get_running_loop(), resolution=0.01)
+            out = []
+            try:
+                async for item in with_keepalive(source(), interval=0.05, heartbeat="hb", wheel=wheel):
+                    out.append(item)
+            except httpx.ReadTimeout as exc:
+                out.append(f"error: {type(exc).__name__}")
+            finally:
+                server.close()
+            return out
+
+        out = asyncio.run(run())
+        self.assertIn(b"first", out)
+        self.assertIn("hb", out)
+        self.assertEqual(out[-1], "error: ReadTimeout")
+
+    def test_cancellation_reaches_source_cleanup(self) -> None:
+        events = []
+
+        async def source():
+            try:
+                yield "first"
+                await asyncio.sleep(10)
+                yield "never"
+            except asyncio.CancelledError:
+                events.append("cancelled")
+                raise
+            finally:
+                await asyncio.sleep(0)
+                events.append("cleanup")
+
+        async def consume(out):
+            async for item in with_keepalive(source(), interval=0.05):
+                out.append(item)
+
+        async def run():
+            out = []
+            task = asyncio.create_task(consume(out))
+            await asyncio.sleep(0.2)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            self.assertEqual(len(get_timer_wheel()), 0)
+            return out
+
+        out = asyncio.run(run())
+        self.assertEqual(out[0], "first")
+        self.assertNotIn("never", out)
+        self.assertEqual(events, ["cancelled", "cleanup"])
+
+    def test_early_close_after_heartbeat_closes_source(self) -> None:
+        events = []
+
+        async def source():
+            try:
+                await asyncio.sleep(10)
+                yield "never"
+            finally:
+                events.append("cleanup")
+
+        async def run():
+            stream = with_keepalive(source(), interval=0.02, heartbeat="hb")
+            self.assertEqual(await stream.__anext__(), "hb")
+            await stream.aclose()
+
+        asyncio.run(run())
+        self.assertEqual(events, ["cleanup"])
+
+    def test_wheel_is_shared_per_loop(self) -> None:
+        async def run():
+            return get_timer_wheel() is get_timer_wheel(), get_timer_wheel()
+
+        same, wheel_a = asyncio.run(run())
+        _, wheel_b = asyncio.run(run())
+        self.assertTrue(same)
+        self.assertIsNot(wheel_a, wheel_b)
+
+
+if __name__ == "__main__":
+    unittest.main()
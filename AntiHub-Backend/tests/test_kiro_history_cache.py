@@ -0,0 +1,82 @@
+import unittest
+
+from app.cache.kiro_history_cache import get_kiro_history_cache
+from app.schemas.anthropic import AnthropicMessagesRequest
+from app.services.kiro_anthropic_converter import KiroAnthropicConverter
+
+_SESSION_USER_ID = "user_abc_account__session_0b4445e1-f5be-49e1-87ce-62bbc28ad705"
+
+
+def _convert(messages, *, system="You are helpful.", cached=True):
+    body = {
+        "model": "claude-sonnet-4-5",
+        "max_tokens": 1024,
+        "system": system,
+        "tools": [{"name": "Read", "description": "读取文件", "input_schema": {"type": "object", "properties": {}}}],
+        "messages": messages,
+    }
+    if cached:
+        body["metadata"] = {"user_id": _SESSION_USER_ID}
+    state = KiroAnthropicConverter.to_kiro_chat_completions_request(AnthropicMessagesRequest.model_validate(body))[
+        "conversationState"
+    ]
+    state.pop("agentContinuationId")
+    state.pop("conversationId")
+    return state
+
+
+def _turn(i, *, orphan=False):
+    tool_id = f"toolu_{i}"
+    results = [{"type": "tool_result", "tool_use_id": tool_id, "content": f"result {i}"}]
+    if orphan:
+        # 孤立的 tool_result 与重复的 tool_result：会被降级为文本
+        results.append({"type": "tool_result", "tool_use_id": "toolu_missing", "content": "orphan"})
+        results.append({"type": "tool_result", "tool_use_id": "toolu_0", "content": "duplicate"})
+    return [
+        {"role": "assistant", "content": [{"type": "tool_use", "id": tool_id, "name": f"Tool{i % 3}", "input": {"i": i}}]},
+        {"role": "user", "content": results},
+    ]
+
+
+class TestKiroHistoryCache(unittest.TestCase):
+    def setUp(self) -> None:
+        get_kiro_history_cache().clear()
+
+    def test_growing_session_matches_full_conversion(self) -> None:
+        messages = [{"role": "user", "content": "开始"}]
+        for i in range(8):
+            self.assertEqual(_convert(messages), _convert(messages, cached=False))
+            messages = messages + _turn(i, orphan=i == 3)
+
+        stats = get_kiro_history_cache().stats()
+        self.assertEqual((stats["lookups"], stats["hits"]), (8, 6))
+        self.assertGreater(stats["reuse_rate"], 0.5)
+
+        # 上一轮的最后一条 user 消息进入 history 后，配对状态与全量转换一致
+        state = _convert(messages)
+        self.assertEqual(state, _convert(messages, cached=False))
+        tools = state["currentMessage"]["userInputMessage"]["userInputMessageContext"]["tools"]
+        self.assertEqual([t["toolSpecification"]["name"] for t in tools], ["Read", "Tool0", "Tool1", "Tool2"])
+
+    def test_changed_prefix_is_rebuilt(self) -> None:
+        messages = [{"role": "user", "content": "开始"}]
+        for i in range(4):
+            messages = messages + _turn(i)
+        _convert(messages)
+
+        # 中间的 tool_result 被客户端改写（如清理旧的工具输出）
+        edited = [dict(m) for m in messages]
+        edited[4] = {"role": "user", "content": [{"type": "tool_result", "tool_use_id": "toolu_1", "content": "[cleared]"}]}
+        self.assertEqual(_convert(edited), _convert(edited, cached=False))
+
+        # 回退到更短的历史
+        self.assertEqual(_convert(messages[:3]), _convert(messages[:3], cached=False))
+
+        # system 变化
+        self.assertEqual(_convert(messages, system="Be brief."), _convert(messages, system="Be brief.", cached=False))
+
+        self.assertEqual(get_kiro_history_cache().stats()["hits"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+from unittest import mock
+
+from app.core.http_client import ProxyClientCache, UpstreamPoolSpec
+
+
+class TestProxyClientCache(unittest.IsolatedAsyncioTestCase):
+    def _cache(self, **kwargs) -> ProxyClientCache:
+        kwargs.setdefault("max_size", 2)
+        kwargs.setdefault("idle_ttl", 300.0)
+        return ProxyClientCache(spec=UpstreamPoolSpec(), **kwargs)
+
+    async def test_reuses_client_per_proxy_and_host(self) -> None:
+        cache = self._cache()
+        async with cache.lease("http://127.0.0.1:7890", "https://api.example.com/v1") as a:
+            pass
+        async with cache.lease("http://127.0.0.1:7890", "https://API.example.com/other") as b:
+            pass
+        async with cache.lease("http://127.0.0.1:7890", "https://api.other.com/v1") as c:
+            pass
+        self.assertIs(a, b)
+        self.assertIsNot(a, c)
+        self.assertEqual(cache.created, 2)
+        await cache.close()
+
+    async def test_lru_eviction_closes_idle_client(self) -> None:
+        cache = self._cache(max_size=1)
+        async with cache.lease("http://127.0.0.1:7890", "https://a.example.com") as a:
+            pass
+        async with cache.lease("http://127.0.0.1:7890", "https://b.example.com") as b:
+            pass
+        self.assertTrue(a.is_closed)
+        self.assertFalse(b.is_closed)
+        self.assertEqual(len(cache), 1)
+        await cache.close()
+        self.assertTrue(b.is_closed)
+
+    async def test_evicted_client_stays_open_until_released(self) -> None:
+        cache = self._cache(max_size=1)
+        async with cache.lease("http://127.0.0.1:7890", "https://a.example.com") as a:
+            async with cache.lease("http://127.0.0.1:7890", "https://b.example.com"):
+                self.assertFalse(a.is_closed)
+        self.assertTrue(a.is_closed)
+        await cache.close()
+
+    async def test_idle_ttl_eviction(self) -> None:
+        cache = self._cache(max_size=8, idle_ttl=10.0)
+        with mock.patch("app.core.http_client.time.monotonic", return_value=100.0):
+            async with cache.lease("http://127.0.0.1:7890", "https://a.example.com") as a:
+                pass
+        with mock.patch("app.core.http_client.time.monotonic", return_value=200.0):
+            await cache.sweep()
+        self.assertTrue(a.is_closed)
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
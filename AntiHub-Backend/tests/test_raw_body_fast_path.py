@@ -0,0 +1,71 @@
+import asyncio
+import copy
+import unittest
+
+from fastapi import Request
+from fastapi.exceptions import RequestValidationError
+
+from app.api.deps_body import parse_chat_completion_request, read_json_body
+from app.schemas.plugin_api import ChatCompletionRequest
+
+_IMAGE = {"type": "image_url", "image_url": {"url": "data:image/png;base64," + "iVBORw0KGgo" * 100}}
+
+
+def _model_path(body):
+    return ChatCompletionRequest.model_validate(copy.deepcopy(body)).model_dump()
+
+
+def _request(body: bytes) -> Request:
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    return Request({"type": "http", "method": "POST", "headers": []}, receive)
+
+
+class TestRawBodyFastPath(unittest.TestCase):
+    def test_fast_path_matches_model_dump(self) -> None:
+        bodies = [
+            {"model": "gpt-4o", "messages": [{"role": "user", "content": "hi"}]},
+            {
+                "model": "gpt-4o",
+                "messages": [{"role": "user", "content": [{"type": "text", "text": "看图"}, _IMAGE]}],
+                "stream": False,
+                "temperature": 0,
+                "max_tokens": 512,
+                "tools": [{"type": "function", "function": {"name": "f", "parameters": {}}}],
+                "tool_choice": "auto",
+                "stream_options": {"include_usage": True},
+            },
+            {"model": "m", "messages": [], "temperature": None, "max_tokens": None, "tools": None},
+        ]
+        for body in bodies:
+            self.assertEqual(parse_chat_completion_request(copy.deepcopy(body), fast_path=True), _model_path(body))
+
+    def test_non_canonical_types_fall_back_to_model(self) -> None:
+        for body in (
+            {"model": "m", "messages": [], "stream": "false"},
+            {"model": "m", "messages": [], "max_tokens": 100.0},
+            {"model": "m", "messages": [], "temperature": "0.5"},
+        ):
+            self.assertEqual(parse_chat_completion_request(copy.deepcopy(body), fast_path=True), _model_path(body))
+
+    def test_invalid_body_raises_request_validation_error(self) -> None:
+        for body in ({"messages": []}, {"model": "m", "messages": ["x"]}, [1, 2]):
+            with self.assertRaises(RequestValidationError) as ctx:
+                parse_chat_completion_request(body, fast_path=True)
+            self.assertEqual(ctx.exception.errors()[0]["loc"][0], "body")
+
+        with self.assertRaises(RequestValidationError) as ctx:
+            parse_chat_completion_request({"messages": []}, fast_path=True)
+        self.assertEqual(ctx.exception.errors()[0]["loc"], ("body", "model"))
+
+    def test_read_json_body(self) -> None:
+        self.assertEqual(asyncio.run(read_json_body(_request(b'{"model": "m"}'))), {"model": "m"})
+        for raw, error_type in ((b"{bad", "json_invalid"), (b"", "missing")):
+            with self.assertRaises(RequestValidationError) as ctx:
+                asyncio.run(read_json_body(_request(raw)))
+            self.assertEqual(ctx.exception.errors()[0]["type"], error_type)
+
+
+if __name__ == "__main__":
+    unittest.main()
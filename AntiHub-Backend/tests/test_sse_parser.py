@@ -0,0 +1,109 @@
+import asyncio
+import unittest
+
+from app.utils.sse import (
+    SSEEvent,
+    SSELineBuffer,
+    SSEParser,
+    aiter_sse_events,
+    aiter_sse_lines,
+    parse_data_line,
+)
+
+
+def _feed_in_pieces(parser, raw: bytes, size: int):
+    out = []
+    for i in range(0, len(raw), size):
+        out.extend(parser.feed(raw[i:i + size]))
+    out.extend(parser.flush())
+    return out
+
+
+class TestSSELineBuffer(unittest.TestCase):
+    def test_every_split_point_yields_same_lines(self) -> None:
+        raw = "data: 你好\r\n\r\ndata: {\"a\": \"é\"}\n\n: ping\nevent: x\ndata: tail".encode("utf-8")
+        expected = ["data: 你好", "", "data: {\"a\": \"é\"}", "", ": ping", "event: x", "data: tail"]
+        for cut in range(len(raw) + 1):
+            buf = SSELineBuffer()
+            lines = buf.feed(raw[:cut]) + buf.feed(raw[cut:]) + buf.flush()
+            self.assertEqual(lines, expected, msg=f"cut={cut}")
+
+    def test_byte_by_byte_multibyte(self) -> None:
+        raw = "data: 多字节🙂字符\n".encode("utf-8")
+        self.assertEqual(_feed_in_pieces(SSELineBuffer(), raw, 1), ["data: 多字节🙂字符"])
+
+    def test_accepts_str_chunks(self) -> None:
+        buf = SSELineBuffer()
+        self.assertEqual(buf.feed("data: a\nda"), ["data: a"])
+        self.assertEqual(buf.feed("ta: b\n"), ["data: b"])
+        self.assertEqual(len(buf), 0)
+
+    def test_long_line_across_many_chunks(self) -> None:
+        buf = SSELineBuffer()
+        payload = b"x" * 200_000
+        for i in range(0, len(payload), 1000):
+            self.assertEqual(buf.feed(payload[i:i + 1000]), [])
+        self.assertEqual(buf.feed(b"\n"), ["x" * 200_000])
+        self.assertEqual(len(buf), 0)
+
+    def test_parse_data_line(self) -> None:
+        self.assertEqual(parse_data_line("data: {}"), "{}")
+        self.assertEqual(parse_data_line("data:{}"), "{}")
+        self.assertEqual(parse_data_line("data:  x"), " x")
+        self.assertIsNone(parse_data_line("event: data"))
+
+
+class TestSSEParser(unittest.TestCase):
+    def test_multiline_data_and_fields(self) -> None:
+        raw = (
+            b": keepalive\n"
+            b"event: response.output_text.delta\n"
+            b"id: 7\n"
+            b"retry: 1500\n"
+            b"data: line1\n"
+            b"data:line2\n"
+            b"\n"
+            b"data: [DONE]\n\n"
+        )
+        events = _feed_in_pieces(SSEParser(), raw, 3)
+        self.assertEqual(
+            events,
+            [
+                SSEEvent(data="line1\nline2", event="response.output_text.delta", id="7", retry=1500),
+                SSEEvent(data="[DONE]", event="", id="7", retry=1500),
+            ],
+        )
+
+    def test_event_without_data_is_ignored(self) -> None:
+        events = _feed_in_pieces(SSEParser(), b"event: ping\n\ndata: x\n\n", 5)
+        self.assertEqual([e.data for e in events], ["x"])
+        self.assertEqual(events[0].event, "")
+
+    def test_flush_dispatches_unterminated_event(self) -> None:
+        parser = SSEParser()
+        self.assertEqual(parser.feed(b"data: {\"a\":1}"), [])
+        self.assertEqual([e.data for e in parser.flush()], ['{"a":1}'])
+
+    def test_crlf_delimited_events(self) -> None:
+        events = _feed_in_pieces(SSEParser(), b"data: a\r\n\r\ndata: b\r\n\r\n", 4)
+        self.assertEqual([e.data for e in events], ["a", "b"])
+
+
+class TestAsyncIterators(unittest.TestCase):
+    def test_aiter_sse_events_and_lines(self) -> None:
+        async def source():
+            for chunk in (b"data: 1\n", b"\ndata", b": 2\n\n", "data: 3"):
+                yield chunk
+
+        async def collect():
+            events = [e.data async for e in aiter_sse_events(source())]
+            lines = [l async for l in aiter_sse_lines(source())]
+            return events, lines
+
+        events, lines = asyncio.run(collect())
+        self.assertEqual(events, ["1", "2", "3"])
+        self.assertEqual(lines, ["data: 1", "", "data: 2", "", "data: 3"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import random
+import unittest
+
+from app.utils import jsonx
+from app.utils.sse import SSETemplate, template_slot
+
+_ALPHABET = list('ab "\\/\n\r\t\b\f\x00\x01\x1f\x7f你é🙂 ') + ["\ud800"]
+
+
+def _random_text(rng: random.Random) -> str:
+    return "".join(rng.choice(_ALPHABET) for _ in range(rng.randint(0, 12)))
+
+
+class TestSSETemplate(unittest.TestCase):
+    def tearDown(self) -> None:
+        jsonx.set_backend(jsonx.available_backends()[0])
+
+    def test_render_matches_full_serialization(self) -> None:
+        rng = random.Random(7)
+        for backend in jsonx.available_backends():
+            jsonx.set_backend(backend)
+            tpl = SSETemplate(
+                {"type": "response.output_text.delta", "sequence_number": template_slot(0),
+                 "item_id": "msg_1", "delta": template_slot(1), "logprobs": []},
+                event="response.output_text.delta",
+            )
+            for _ in range(500):
+                seq, text = rng.randint(0, 10**9), _random_text(rng)
+                payload = {"type": "response.output_text.delta", "sequence_number": seq,
+                           "item_id": "msg_1", "delta": text, "logprobs": []}
+                expected = b"event: response.output_text.delta\ndata: " + jsonx.dumps(payload) + b"\n\n"
+                self.assertEqual(tpl.render(seq, text), expected, msg=f"{backend} {text!r}")
+                expected_str = f"event: response.output_text.delta\ndata: {jsonx.dumps_str(payload)}\n\n"
+                self.assertEqual(tpl.render_str(seq, text), expected_str, msg=f"{backend} {text!r}")
+
+    def test_single_and_many_slots_and_non_str_values(self) -> None:
+        one = SSETemplate({"delta": {"text": template_slot(0)}})
+        self.assertEqual(one.slot_count, 1)
+        self.assertEqual(one.render("x"), b'data: {"delta":{"text":"x"}}\n\n')
+        self.assertEqual(one.render_str(None), 'data: {"delta":{"text":null}}\n\n')
+
+        three = SSETemplate({"a": template_slot(0), "b": [template_slot(1), template_slot(2)]}, event="e")
+        self.assertEqual(three.render(True, 1.5, {"k": "v"}), b'event: e\ndata: {"a":true,"b":[1.5,{"k":"v"}]}\n\n')
+        with self.assertRaises(ValueError):
+            three.render(1, 2)
+
+    def test_invalid_slot_layout_is_rejected(self) -> None:
+        with self.assertRaises(ValueError):
+            SSETemplate({"a": template_slot(0), "b": template_slot(0)})
+        with self.assertRaises(ValueError):
+            SSETemplate({"a": template_slot(0), "b": template_slot(2)})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import random
+import unittest
+
+from app.utils import token_counter
+from app.utils.token_counter import count_all_tokens, count_non_western_chars, count_tokens, is_non_western_char
+
+# 各西文区间的边界码点 + 代理区 + 非 BMP
+_EDGES = [
+    0x00, 0x7F, 0x80, 0x24F, 0x250, 0x1DFF, 0x1E00, 0x1EFF, 0x1F00, 0x2C5F, 0x2C60, 0x2C7F, 0x2C80,
+    0xA71F, 0xA720, 0xA7FF, 0xA800, 0xAB2F, 0xAB30, 0xAB6F, 0xAB70, 0xD800, 0xDFFF, 0xFFFF, 0x10000, 0x10FFFF,
+]
+
+
+def _reference_tokens(text: str) -> int:
+    """旧实现：逐字符调用 is_non_western_char"""
+    if not text:
+        return 0
+    tokens = sum(4.0 if is_non_western_char(c) else 1.0 for c in text) / 4.0
+    if tokens < 100:
+        acc_token = tokens * 1.5
+    elif tokens < 200:
+        acc_token = tokens * 1.3
+    elif tokens < 300:
+        acc_token = tokens * 1.25
+    elif tokens < 800:
+        acc_token = tokens * 1.2
+    else:
+        acc_token = tokens * 1.0
+    return max(1, int(acc_token))
+
+
+def _random_text(rng: random.Random, length: int) -> str:
+    chars = []
+    for _ in range(length):
+        roll = rng.random()
+        if roll < 0.3:
+            chars.append(chr(rng.choice(_EDGES)))
+        elif roll < 0.4:
+            chars.append(chr(rng.randint(0, 0x10FFFF)))
+        else:
+            chars.append(rng.choice("abc xyz\n{}\"中文日本語éß"))
+    return "".join(chars)
+
+
+class TestTokenCounter(unittest.TestCase):
+    def test_matches_per_character_reference(self) -> None:
+        rng = random.Random(3)
+        for _ in range(2000):
+            text = _random_text(rng, rng.choice([0, 1, 7, 120, 900, 4000]))
+            self.assertEqual(count_tokens(text), _reference_tokens(text))
+            self.assertEqual(count_non_western_chars(text), sum(map(is_non_western_char, text)))
+
+    def test_numpy_path_matches_when_available(self) -> None:
+        if token_counter._np is None:
+            self.skipTest("numpy not installed")
+        rng = random.Random(4)
+        text = _random_text(rng, token_counter._NUMPY_MIN_CHARS + 17)
+        expected = token_counter._count_non_western_regex(text)
+        self.assertEqual(count_non_western_chars(text), expected)
+
+    def test_request_memo_does_not_change_totals(self) -> None:
+        reminder = "<system-reminder>" + "保持简洁 keep it short. " * 40 + "</system-reminder>"
+        messages = [
+            {"role": "user", "content": [{"type": "text", "text": reminder}, {"type": "text", "text": f"问题 {i}"}]}
+            for i in range(20)
+        ]
+        tools = [{"name": "Read", "description": "读取文件 " * 100, "input_schema": {"type": "object"}}]
+        expected = sum(_reference_tokens(reminder) + _reference_tokens(f"问题 {i}") for i in range(20))
+        expected += _reference_tokens("You are helpful.")
+        expected += _reference_tokens("Read") + _reference_tokens("读取文件 " * 100) + _reference_tokens('{"type": "object"}')
+        self.assertEqual(count_all_tokens(messages, system="You are helpful.", tools=tools), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,258 @@
+import asyncio
+import json
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from app.cache.token_refresh_lock import RefreshLease, TokenRefreshCoordinator
+from app.models.codex_account import CodexAccount
+from app.models.gemini_cli_account import GeminiCLIAccount
+from app.services.codex_service import CodexService
+from app.services.gemini_cli_service import GeminiCLIService
+
+CONCURRENCY = 500
+
+
+class _MemoryRedis:
+    """内存中的 Redis 锁（acquire_lock / release_lock）"""
+
+    def __init__(self) -> None:
+        self.locks = {}
+        self.fences = {}
+
+    async def acquire_lock(self, name, ttl_ms):
+        if name in self.locks:
+            return None
+        fence = self.fences[name] = self.fences.get(name, 0) + 1
+        self.locks[name] = fence
+        return fence
+
+    async def release_lock(self, name, fence):
+        if self.locks.get(name) != fence:
+            return False
+        del self.locks[name]
+        return True
+
+
+class _FakeSession:
+    async def flush(self):
+        return None
+
+    async def commit(self):
+        return None
+
+
+class _Row:
+    def __init__(self, values) -> None:
+        self._mapping = dict(values)
+        self.__dict__.update(values)
+
+
+class _Store:
+    """所有“会话”共享的账号行"""
+
+    def __init__(self, **row) -> None:
+        self.row = row
+        self.writes = 0
+
+
+class _FakeRepo:
+    """每个请求一个：账号实例只属于本会话（模拟 identity map）"""
+
+    def __init__(self, store: _Store, model) -> None:
+        self.store = store
+        self.account = model(**store.row)
+
+    async def get_by_id_and_user_id(self, account_id, user_id):
+        return self.account
+
+    async def get_token_state(self, account_id, user_id):
+        return _Row({k: self.store.row[k] for k in ("credentials", "token_expires_at", "last_refresh_at")})
+
+    async def update_credentials_if_unchanged(self, account_id, user_id, expected_credentials, **values):
+        if self.store.row["credentials"] != expected_credentials:
+            return False
+        self.store.writes += 1
+        self.store.row.update(values)
+        return True
+
+
+def _expiring_row(**extra):
+    return dict(
+        id=1,
+        user_id=1,
+        status=1,
+        credentials=json.dumps({"access_token": "old", "refresh_token": "r1"}),
+        token_expires_at=datetime.now(timezone.utc) + timedelta(seconds=10),
+        last_refresh_at=None,
+        **extra,
+    )
+
+
+def _identity(value):
+    return value
+
+
+class TestTokenRefreshCoordinator(unittest.IsolatedAsyncioTestCase):
+    async def test_waiters_share_result_and_exception(self) -> None:
+        coordinator = TokenRefreshCoordinator(_MemoryRedis())
+        calls = 0
+
+        async def refresh(lease):
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return calls
+
+        results = await asyncio.gather(*(coordinator.run("k", refresh) for _ in range(50)))
+        self.assertEqual(results, [1] * 50)
+        self.assertEqual(coordinator.stats()["joined"], 49)
+
+        async def failing(lease):
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        outcomes = await asyncio.gather(*(coordinator.run("k", failing) for _ in range(3)), return_exceptions=True)
+        self.assertTrue(all(isinstance(o, ValueError) for o in outcomes))
+        # 刷新结束后不再合并：下一次调用重新刷新
+        self.assertEqual(await coordinator.run("k", refresh), 2)
+
+    async def test_cancelled_leader_hands_over(self) -> None:
+        coordinator = TokenRefreshCoordinator(_MemoryRedis(), poll_interval=0.001)
+        started = asyncio.Event()
+
+        async def slow(lease):
+            started.set()
+            await asyncio.sleep(10)
+
+        async def fast(lease):
+            return "ok"
+
+        leader = asyncio.ensure_future(coordinator.run("k", slow))
+        await started.wait()
+        waiter = asyncio.ensure_future(coordinator.run("k", fast))
+        await asyncio.sleep(0)
+        leader.cancel()
+        self.assertEqual(await waiter, "ok")
+
+
+class TestCodexSingleFlightRefresh(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.upstream_calls = 0
+
+        async def refresh_tokens(service, refresh_token):
+            self.upstream_calls += 1
+            await asyncio.sleep(0.02)
+            return {"access_token": "new", "refresh_token": "r2", "expires_in": 3600}
+
+        for patcher in (
+            mock.patch.object(CodexService, "_refresh_tokens", refresh_tokens),
+            mock.patch("app.services.codex_service.encrypt_secret", _identity),
+            mock.patch("app.services.codex_service.decrypt_secret", _identity),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def _request(self, store: _Store, coordinator: TokenRefreshCoordinator) -> str:
+        service = CodexService(_FakeSession(), redis=None)
+        service.repo = _FakeRepo(store, CodexAccount)
+        account = service.repo.account
+        with mock.patch("app.services.codex_service.get_token_refresh_coordinator", return_value=coordinator):
+            creds = await service._ensure_account_tokens(account, service._load_account_credentials(account))
+        return creds["access_token"]
+
+    async def test_concurrent_requests_refresh_once(self) -> None:
+        store = _Store(**_expiring_row())
+        coordinator = TokenRefreshCoordinator(_MemoryRedis())
+        tokens = await asyncio.gather(*(self._request(store, coordinator) for _ in range(CONCURRENCY)))
+
+        self.assertEqual(self.upstream_calls, 1)
+        self.assertEqual(store.writes, 1)
+        self.assertEqual(set(tokens), {"new"})
+        self.assertEqual(json.loads(store.row["credentials"])["refresh_token"], "r2")
+        self.assertEqual(coordinator.stats()["joined"], CONCURRENCY - 1)
+
+    async def test_two_workers_refresh_once(self) -> None:
+        store = _Store(**_expiring_row())
+        redis = _MemoryRedis()
+        workers = [TokenRefreshCoordinator(redis, poll_interval=0.001) for _ in range(2)]
+        tokens = await asyncio.gather(
+            *(self._request(store, workers[i % 2]) for i in range(CONCURRENCY))
+        )
+
+        # 后拿到锁的 worker 回查到库中凭证已更新，不再请求上游
+        self.assertEqual(self.upstream_calls, 1)
+        self.assertEqual(store.writes, 1)
+        self.assertEqual(set(tokens), {"new"})
+        self.assertEqual(sum(w.stats()["lock_waits"] for w in workers), 1)
+        self.assertEqual(redis.locks, {})
+
+    async def test_write_is_conditional_on_previous_credentials(self) -> None:
+        store = _Store(**_expiring_row())
+        service = CodexService(_FakeSession(), redis=None)
+        service.repo = _FakeRepo(store, CodexAccount)
+        account = service.repo.account
+        creds = service._load_account_credentials(account)
+        # 锁在刷新途中过期（或根本没拿到锁）：库中凭证未变时照常保存本次轮换
+        lease = RefreshLease("token_refresh:lock:codex:1", None)
+
+        values = await service._refresh_account_tokens(account, creds, lease)
+        self.assertEqual(json.loads(values["credentials"])["refresh_token"], "r2")
+        self.assertEqual(store.row["credentials"], values["credentials"])
+        self.assertEqual(store.writes, 1)
+
+        # 刷新途中其他 worker 写入了新凭证：不覆盖，返回库中的结果
+        store.row["credentials"] = account.credentials
+        other = json.dumps({"access_token": "other", "refresh_token": "r3"})
+
+        async def refresh_tokens(service, refresh_token):
+            store.row["credentials"] = other
+            return {"access_token": "new", "refresh_token": "r2", "expires_in": 3600}
+
+        with mock.patch.object(CodexService, "_refresh_tokens", refresh_tokens):
+            values = await service._refresh_account_tokens(account, creds, lease)
+        self.assertEqual(values["credentials"], other)
+        self.assertEqual(store.row["credentials"], other)
+        self.assertEqual(store.writes, 1)
+
+
+class _FakeGoogleResponse:
+    status_code = 200
+
+    def json(self):
+        return {"access_token": "new", "refresh_token": "r2", "expires_in": 3600}
+
+
+class TestGeminiCLISingleFlightRefresh(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_requests_refresh_once(self) -> None:
+        upstream_calls = 0
+
+        class _Client:
+            async def post(self, url, **kwargs):
+                nonlocal upstream_calls
+                upstream_calls += 1
+                await asyncio.sleep(0.02)
+                return _FakeGoogleResponse()
+
+        store = _Store(**_expiring_row())
+        coordinator = TokenRefreshCoordinator(_MemoryRedis())
+
+        async def request() -> str:
+            service = GeminiCLIService(_FakeSession(), redis=None)
+            service.repo = _FakeRepo(store, GeminiCLIAccount)
+            return await service.get_valid_access_token(1, 1)
+
+        with mock.patch("app.services.gemini_cli_service.get_http_client", return_value=_Client()), mock.patch(
+            "app.services.gemini_cli_service.encrypt_secret", _identity
+        ), mock.patch("app.services.gemini_cli_service.decrypt_secret", _identity), mock.patch(
+            "app.services.gemini_cli_service.get_token_refresh_coordinator", return_value=coordinator
+        ):
+            tokens = await asyncio.gather(*(request() for _ in range(CONCURRENCY)))
+
+        self.assertEqual(upstream_calls, 1)
+        self.assertEqual(store.writes, 1)
+        self.assertEqual(set(tokens), {"new"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,196 @@
+import asyncio
+import random
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from app.cache.credentials_cache import CredentialsCache
+from app.services import token_refresher
+from app.services.token_refresher import TokenRefresher
+
+
+class _MemoryRedis:
+    def __init__(self) -> None:
+        self.locks = {}
+
+    async def acquire_lock(self, name, ttl_ms):
+        if name in self.locks:
+            return None
+        self.locks[name] = 1
+        return 1
+
+    async def release_lock(self, name, fence):
+        return self.locks.pop(name, None) is not None
+
+
+class _Session:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class _Provider:
+    """假的渠道服务：id 为奇数的账号刷新成功，为 3 的倍数的账号已被别处刷新，id=4 抛异常"""
+
+    def __init__(self, accounts, gauge=None) -> None:
+        self.accounts = accounts
+        # 跨渠道共享的在途计数
+        self.gauge = gauge if gauge is not None else {"active": 0, "max": 0}
+        self.calls = []
+
+    def __call__(self, db, redis):
+        provider = self
+
+        class _Repo:
+            async def list_expiring_tokens(self, before, *, not_before=None, limit):
+                return [SimpleNamespace(id=i, user_id=1) for i in provider.accounts][:limit]
+
+        class _Service:
+            repo = _Repo()
+
+            async def refresh_account_token_if_expiring(self, user_id, account_id, *, within_seconds):
+                provider.calls.append(account_id)
+                gauge = provider.gauge
+                gauge["active"] += 1
+                gauge["max"] = max(gauge["max"], gauge["active"])
+                try:
+                    await asyncio.sleep(0.01)
+                finally:
+                    gauge["active"] -= 1
+                if account_id == 4:
+                    raise RuntimeError("boom")
+                if account_id % 3 == 0:
+                    return None
+                return account_id % 2 == 1
+
+        return _Service()
+
+
+class _RevokedProvider:
+    """假的渠道服务：revoked 中的账号每次刷新都失败（且按过期时间排在最前），其余账号刷新成功"""
+
+    def __init__(self, accounts, revoked) -> None:
+        self.accounts = list(accounts)
+        self.revoked = set(revoked)
+        self.calls = []
+
+    def __call__(self, db, redis):
+        provider = self
+
+        class _Repo:
+            async def list_expiring_tokens(self, before, *, not_before=None, limit):
+                return [SimpleNamespace(id=i, user_id=1) for i in provider.accounts][:limit]
+
+        class _Service:
+            repo = _Repo()
+
+            async def refresh_account_token_if_expiring(self, user_id, account_id, *, within_seconds):
+                provider.calls.append(account_id)
+                if account_id in provider.revoked:
+                    return False
+                provider.accounts.remove(account_id)
+                return True
+
+        return _Service()
+
+
+class TestTokenRefresher(unittest.IsolatedAsyncioTestCase):
+    async def test_refreshes_due_accounts_with_bounded_concurrency(self) -> None:
+        gauge = {"active": 0, "max": 0}
+        codex = _Provider(range(1, 21), gauge)
+        gemini = _Provider([1, 2], gauge)
+        refresher = TokenRefresher(
+            concurrency=3,
+            jitter=0.01,
+            providers={"codex": codex, "gemini_cli": gemini},
+            session_maker=_Session,
+            redis=_MemoryRedis(),
+            rng=random.Random(0),
+        )
+
+        result = await refresher.run_once()
+
+        self.assertEqual(result, {"skipped": False, "due": {"codex": 20, "gemini_cli": 2}})
+        self.assertEqual(sorted(codex.calls), list(range(1, 21)))
+        self.assertEqual(gauge["max"], 3)
+        stats = refresher.stats()
+        # 1..20 中：3 的倍数 6 个无需刷新；其余奇数 7 个成功；其余偶数 7 个失败（含抛异常的 4）
+        self.assertEqual(stats["not_needed"]["codex"], 6)
+        self.assertEqual(stats["refreshed"], {"codex": 7, "gemini_cli": 1})
+        self.assertEqual(stats["failed"], {"codex": 7, "gemini_cli": 1})
+        self.assertEqual(refresher.redis.locks, {})
+
+    async def test_failed_accounts_back_off_and_do_not_starve_others(self) -> None:
+        provider = _RevokedProvider(range(1, 13), revoked=range(1, 5))
+        refresher = TokenRefresher(
+            jitter=0, providers={"codex": provider}, session_maker=_Session, redis=_MemoryRedis()
+        )
+
+        with mock.patch.object(token_refresher, "SCAN_BATCH_SIZE", 5):
+            await refresher.run_once()
+            self.assertEqual(sorted(provider.calls), [1, 2, 3, 4, 5])
+            provider.calls.clear()
+
+            # 吊销的账号在退避中：本轮批次全部留给后面的正常账号，失败也不重复计数
+            result = await refresher.run_once()
+            self.assertEqual(result["due"], {"codex": 5})
+            self.assertEqual(sorted(provider.calls), [6, 7, 8, 9, 10])
+            stats = refresher.stats()
+            self.assertEqual(stats["failed"], {"codex": 4})
+            self.assertEqual(stats["refreshed"], {"codex": 6})
+            self.assertEqual(stats["backing_off"], 4)
+
+            # 退避到期后重试；再次失败退避时间翻倍
+            refresher._backoff = {key: (failures, 0.0) for key, (failures, _) in refresher._backoff.items()}
+            provider.calls.clear()
+            await refresher.run_once()
+            self.assertEqual(sorted(provider.calls), [1, 2, 3, 4, 11])
+            self.assertEqual(refresher.stats()["failed"], {"codex": 4})
+            self.assertEqual(refresher._backoff[("codex", 1)][0], 2)
+
+            # 账号不再出现在扫描结果中（已禁用/已被别处刷新）时清除退避记录
+            provider.accounts = [12]
+            await refresher.run_once()
+            self.assertEqual(refresher.stats()["backing_off"], 0)
+
+    async def test_skips_when_another_worker_scans(self) -> None:
+        redis = _MemoryRedis()
+        await redis.acquire_lock("token_refresher:scan", 1000)
+        provider = _Provider([1])
+        refresher = TokenRefresher(providers={"codex": provider}, session_maker=_Session, redis=redis)
+
+        self.assertEqual(await refresher.run_once(), {"skipped": True})
+        self.assertEqual(provider.calls, [])
+        self.assertEqual(refresher.stats()["skipped_runs"], 1)
+
+
+class TestCredentialsCache(unittest.TestCase):
+    def test_caches_by_ciphertext_and_returns_copies(self) -> None:
+        calls = []
+
+        def decrypt(ciphertext):
+            calls.append(ciphertext)
+            return {"access_token": ciphertext.upper()}
+
+        cache = CredentialsCache(max_size=10, ttl=60)
+        first = cache.load("abc", decrypt)
+        first["access_token"] = "mutated"
+        self.assertEqual(cache.load("abc", decrypt), {"access_token": "ABC"})
+        # 刷新后密文变化：按新密文重新解密
+        self.assertEqual(cache.load("def", decrypt), {"access_token": "DEF"})
+        self.assertEqual(calls, ["abc", "def"])
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    def test_entries_expire(self) -> None:
+        cache = CredentialsCache(max_size=10, ttl=0.01)
+        cache.load("abc", lambda c: {"v": c})
+        time.sleep(0.02)
+        cache.load("abc", lambda c: {"v": c})
+        self.assertEqual(cache.stats()["misses"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from sqlalchemy.dialects import postgresql
+
+from app.repositories.usage_log_repository import UsageLogRepository, decode_cursor, encode_cursor
+
+
+class _FakeResult:
+    def __init__(self, items):
+        self._items = items
+
+    def scalars(self):
+        return self
+
+    def all(self):
+        return self._items
+
+
+class _FakeSession:
+    def __init__(self, items):
+        self.items = items
+        self.statements = []
+
+    async def execute(self, stmt):
+        self.statements.append(stmt)
+        return _FakeResult(self.items)
+
+
+class TestUsageLogCursor(unittest.TestCase):
+    def test_roundtrip(self) -> None:
+        created_at = datetime(2026, 10, 17, 9, 30, 1, 123456, tzinfo=timezone.utc)
+        cursor = encode_cursor(created_at, 42)
+        self.assertNotIn("|", cursor)
+        self.assertEqual(decode_cursor(cursor), (created_at, 42))
+
+    def test_invalid_cursor_raises_value_error(self) -> None:
+        for bad in ("not-a-cursor", "", encode_cursor(datetime.now(timezone.utc), 1)[:-3] + "!!"):
+            with self.assertRaises(ValueError):
+                decode_cursor(bad)
+
+
+class TestListLogsAfter(unittest.IsolatedAsyncioTestCase):
+    async def test_returns_next_cursor_when_more_rows_exist(self) -> None:
+        base = datetime(2026, 10, 17, tzinfo=timezone.utc)
+        logs = [SimpleNamespace(id=10 - i, created_at=base - timedelta(minutes=i)) for i in range(3)]
+        db = _FakeSession(logs)
+        page, next_cursor = await UsageLogRepository(db).list_logs_after(user_id=1, limit=2)
+        self.assertEqual([l.id for l in page], [10, 9])
+        self.assertEqual(decode_cursor(next_cursor), (logs[1].created_at, 9))
+
+    async def test_last_page_has_no_cursor_and_applies_keyset(self) -> None:
+        created_at = datetime(2026, 10, 17, tzinfo=timezone.utc)
+        db = _FakeSession([SimpleNamespace(id=1, created_at=created_at)])
+        page, next_cursor = await UsageLogRepository(db).list_logs_after(
+            user_id=1, limit=2, cursor=encode_cursor(created_at, 5)
+        )
+        self.assertEqual(len(page), 1)
+        self.assertIsNone(next_cursor)
+        sql = str(db.statements[0].compile(dialect=postgresql.dialect()))
+        self.assertIn("(usage_logs.created_at, usage_logs.id) < (", sql)
+        self.assertIn("ORDER BY usage_logs.created_at DESC, usage_logs.id DESC", sql)
+
+
+if __name__ == "__main__":
+    unittest.main()
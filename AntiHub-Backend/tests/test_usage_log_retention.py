@@ -0,0 +1,221 @@
+import copy
+import re
+import unittest
+from datetime import date, datetime, timezone
+from types import SimpleNamespace
+from unittest import mock
+
+from app.services.usage_log_retention import (
+    UsageLogRetentionJob,
+    clamp_stats_start,
+    expired_partitions,
+    parse_partition_month,
+    partition_name,
+    retention_window_start,
+)
+
+
+class TestUsageLogPartitions(unittest.TestCase):
+    def test_partition_name_roundtrip(self) -> None:
+        self.assertEqual(partition_name(date(2026, 1, 1)), "usage_logs_p202601")
+        self.assertEqual(parse_partition_month("usage_logs_p202612"), date(2026, 12, 1))
+        self.assertIsNone(parse_partition_month("usage_logs_default"))
+
+    def test_expired_partitions_keeps_current_and_previous_months(self) -> None:
+        names = [
+            "usage_logs_default",
+            "usage_logs_p202604",
+            "usage_logs_p202605",
+            "usage_logs_p202610",
+            "usage_logs_p202611",
+        ]
+        expired = expired_partitions(names, today=date(2026, 10, 17), retention_months=6)
+        self.assertEqual(expired, ["usage_logs_p202604"])
+
+    def test_expired_partitions_across_year_boundary(self) -> None:
+        names = ["usage_logs_p202511", "usage_logs_p202512", "usage_logs_p202601"]
+        expired = expired_partitions(names, today=date(2026, 2, 3), retention_months=2)
+        self.assertEqual(expired, ["usage_logs_p202511", "usage_logs_p202512"])
+
+    def test_retention_disabled(self) -> None:
+        self.assertEqual(
+            expired_partitions(["usage_logs_p200001"], today=date(2026, 10, 1), retention_months=0),
+            [],
+        )
+
+
+class TestStatsWindow(unittest.TestCase):
+    def test_retention_window_start(self) -> None:
+        now = datetime(2026, 10, 17, 8, tzinfo=timezone.utc)
+        self.assertEqual(retention_window_start(now=now, retention_months=6), datetime(2026, 5, 1, tzinfo=timezone.utc))
+        self.assertIsNone(retention_window_start(now=now, retention_months=0))
+
+    def test_clamp_stats_start_to_retention_window(self) -> None:
+        now = datetime(2026, 10, 17, 8, tzinfo=timezone.utc)
+        window_start = datetime(2026, 5, 1, tzinfo=timezone.utc)
+        inside = datetime(2026, 9, 1, tzinfo=timezone.utc)
+        with mock.patch(
+            "app.services.usage_log_retention.get_settings",
+            return_value=SimpleNamespace(usage_log_retention_months=6),
+        ):
+            self.assertEqual(clamp_stats_start(None, now=now), window_start)
+            self.assertEqual(clamp_stats_start(datetime(2025, 1, 1), now=now), window_start)
+            self.assertEqual(clamp_stats_start(inside, now=now), inside)
+        with mock.patch(
+            "app.services.usage_log_retention.get_settings",
+            return_value=SimpleNamespace(usage_log_retention_months=0),
+        ):
+            self.assertIsNone(clamp_stats_start(None, now=now))
+
+
+class _Result:
+    def __init__(self, value=None, rows=(), rowcount=0) -> None:
+        self._value = value
+        self._rows = list(rows)
+        self.rowcount = rowcount
+
+    def scalar(self):
+        return self._value
+
+    def all(self):
+        return self._rows
+
+
+class _FakePartitionedDB:
+    """
+    按语句模式模拟分区表：partitions 为 名称 -> (起始, 结束)，rows 为 表名 -> created_at 日期列表
+
+    与 PostgreSQL 一致：DEFAULT 分区挂载时，若其中已有目标范围的行，创建该范围的分区会失败。
+    """
+
+    def __init__(self, partitions, default_rows, *, fail_on=None) -> None:
+        self.state = {
+            "partitions": dict(partitions),
+            "rows": {name: [] for name in partitions},
+            "default_attached": True,
+        }
+        self.state["rows"]["usage_logs_default"] = list(default_rows)
+        self.fail_on = fail_on
+        self.statements = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def commit(self):
+        return None
+
+    async def rollback(self):
+        return None
+
+    def begin_nested(self):
+        db = self
+
+        class _Savepoint:
+            async def __aenter__(self):
+                self.snapshot = copy.deepcopy(db.state)
+
+            async def __aexit__(self, exc_type, exc, tb):
+                if exc is not None:
+                    db.state = self.snapshot
+                return False
+
+        return _Savepoint()
+
+    async def execute(self, statement, params=None):
+        sql = " ".join(str(statement).split())
+        self.statements.append(sql)
+        if self.fail_on and self.fail_on in sql:
+            raise RuntimeError(f"failed: {self.fail_on}")
+        state = self.state
+        default_rows = state["rows"]["usage_logs_default"]
+        if "pg_try_advisory_xact_lock" in sql or "pg_partitioned_table" in sql:
+            return _Result(1)
+        if "pg_get_expr" in sql:
+            return _Result("usage_logs_default" if state["default_attached"] else None)
+        if "pg_inherits" in sql:
+            names = list(state["partitions"]) + (["usage_logs_default"] if state["default_attached"] else [])
+            return _Result(rows=[(name,) for name in names])
+        if sql.startswith("SELECT DISTINCT date_trunc"):
+            months = sorted({date.fromisoformat(d).replace(day=1) for d in default_rows})
+            return _Result(rows=[(m,) for m in months])
+        bounds = re.search(r"created_at >= '([\d-]+)' AND created_at < '([\d-]+)'", sql)
+        if sql.startswith("SELECT EXISTS"):
+            return _Result(any(bounds.group(1) <= d < bounds.group(2) for d in default_rows))
+        if sql.startswith("CREATE TABLE"):
+            name, start, end = re.search(r'"(\w+)" PARTITION OF usage_logs FOR VALUES FROM \(\'([\d-]+)\'\) TO \(\'([\d-]+)\'\)', sql).groups()
+            if name in state["partitions"]:
+                return _Result()
+            if state["default_attached"] and any(start <= d < end for d in default_rows):
+                raise RuntimeError("updated partition constraint for default partition would be violated")
+            state["partitions"][name] = (start, end)
+            state["rows"][name] = []
+            return _Result()
+        if "DETACH PARTITION" in sql:
+            state["default_attached"] = False
+            return _Result()
+        if "ATTACH PARTITION" in sql:
+            state["default_attached"] = True
+            return _Result()
+        if sql.startswith("WITH moved AS"):
+            target = re.search(r'INSERT INTO "(\w+)"', sql).group(1)
+            moved = [d for d in default_rows if bounds.group(1) <= d < bounds.group(2)]
+            state["rows"]["usage_logs_default"] = [d for d in default_rows if d not in moved]
+            state["rows"][target].extend(moved)
+            return _Result(rowcount=len(moved))
+        if sql.startswith('DELETE FROM "usage_logs_default"'):
+            cutoff = re.search(r"created_at < '([\d-]+)'", sql).group(1)
+            state["rows"]["usage_logs_default"] = [d for d in default_rows if d >= cutoff]
+            return _Result()
+        return _Result(rowcount=0)
+
+
+class TestDefaultPartitionRecovery(unittest.IsolatedAsyncioTestCase):
+    async def _run(self, db: _FakePartitionedDB, **kwargs):
+        job = UsageLogRetentionJob(retention_months=6, **kwargs)
+        with mock.patch("app.services.usage_log_retention.get_session_maker", return_value=lambda: db):
+            result = await job.run_once(today=date(2026, 11, 2))
+        return job, result
+
+    async def test_rows_in_default_are_moved_into_new_month_partition(self) -> None:
+        # 未预建下月分区（或停机跨月）：11 月的行落入 DEFAULT；另有一行早已过期
+        db = _FakePartitionedDB(
+            {"usage_logs_p202610": ("2026-10-01", "2026-11-01")},
+            ["2026-11-01", "2026-11-02", "2025-01-15"],
+        )
+        job, result = await self._run(db, months_ahead=0)
+
+        self.assertEqual(job.months_ahead, 1)
+        self.assertEqual(result["moved_from_default"], 2)
+        self.assertEqual(db.state["rows"]["usage_logs_p202611"], ["2026-11-01", "2026-11-02"])
+        self.assertIn("usage_logs_p202612", db.state["partitions"])
+        self.assertTrue(db.state["default_attached"])
+        # DEFAULT 分区中过期的行被删除
+        self.assertEqual(db.state["rows"]["usage_logs_default"], [])
+        self.assertIsNone(job.partition_error)
+
+        # 下一轮不再需要移动数据，也不再失败
+        _, result = await self._run(db)
+        self.assertEqual(result["moved_from_default"], 0)
+
+    async def test_partition_failure_does_not_block_trimming_and_rollup_expiry(self) -> None:
+        db = _FakePartitionedDB(
+            {"usage_logs_p202610": ("2026-10-01", "2026-11-01")},
+            ["2026-11-01"],
+            fail_on="ATTACH PARTITION",
+        )
+        job, result = await self._run(db)
+
+        self.assertIn("ATTACH PARTITION", job.partition_error)
+        # savepoint 回滚：DEFAULT 分区仍挂载、数据仍在
+        self.assertTrue(db.state["default_attached"])
+        self.assertEqual(db.state["rows"]["usage_logs_default"], ["2026-11-01"])
+        self.assertEqual(result["moved_from_default"], 0)
+        self.assertTrue(any("WITH over_cap" in sql for sql in db.statements))
+        self.assertTrue(any("DELETE FROM usage_rollups_hourly" in sql for sql in db.statements))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from app.models.usage_rollup import hour_bucket
+from app.services.usage_log_service import build_usage_rollups
+
+
+def _row(created_at, **overrides):
+    row = {
+        "user_id": 1,
+        "api_key_id": 7,
+        "endpoint": "/v1/chat/completions",
+        "model_name": "gpt-x",
+        "config_type": "codex",
+        "quota_consumed": 0.5,
+        "input_tokens": 10,
+        "output_tokens": 20,
+        "total_tokens": 30,
+        "success": True,
+        "duration_ms": 100,
+        "created_at": created_at,
+    }
+    row.update(overrides)
+    return row
+
+
+class TestUsageRollups(unittest.TestCase):
+    def test_hour_bucket_truncates_to_utc_hour(self) -> None:
+        cst = timezone(timedelta(hours=8))
+        self.assertEqual(
+            hour_bucket(datetime(2026, 10, 17, 9, 59, 30, tzinfo=cst)),
+            datetime(2026, 10, 17, 1, tzinfo=timezone.utc),
+        )
+        self.assertEqual(
+            hour_bucket(datetime(2026, 10, 17, 9, 5)),
+            datetime(2026, 10, 17, 9, tzinfo=timezone.utc),
+        )
+
+    def test_rows_in_same_bucket_are_summed(self) -> None:
+        t = datetime(2026, 10, 17, 9, 10, tzinfo=timezone.utc)
+        rollups = build_usage_rollups([
+            _row(t),
+            _row(t + timedelta(minutes=30), success=False, duration_ms=300),
+        ])
+        self.assertEqual(len(rollups), 1)
+        r = rollups[0]
+        self.assertEqual(r["hour"], datetime(2026, 10, 17, 9, tzinfo=timezone.utc))
+        self.assertEqual(r["request_count"], 2)
+        self.assertEqual(r["success_count"], 1)
+        self.assertEqual(r["total_tokens"], 60)
+        self.assertAlmostEqual(r["quota_consumed"], 1.0)
+        self.assertEqual(r["duration_ms_sum"], 400)
+
+    def test_dimensions_split_buckets_and_nulls_use_sentinels(self) -> None:
+        t = datetime(2026, 10, 17, 9, 10, tzinfo=timezone.utc)
+        rollups = build_usage_rollups([
+            _row(t + timedelta(hours=1)),
+            _row(t, model_name="other"),
+            _row(t, api_key_id=None, config_type=None, model_name=None),
+            _row(t),
+        ])
+        self.assertEqual(len(rollups), 4)
+        null_bucket = [r for r in rollups if r["api_key_id"] == 0]
+        self.assertEqual(len(null_bucket), 1)
+        self.assertEqual(null_bucket[0]["config_type"], "")
+        self.assertEqual(null_bucket[0]["model_name"], "")
+        # 按维度排序，保证并发 upsert 的加锁顺序一致
+        keys = [(r["user_id"], r["hour"], r["api_key_id"], r["config_type"], r["model_name"], r["endpoint"]) for r in rollups]
+        self.assertEqual(keys, sorted(keys))
+
+
+if __name__ == "__main__":
+    unittest.main()
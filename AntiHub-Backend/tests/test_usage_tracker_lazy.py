@@ -0,0 +1,127 @@
+import json
+import random
+import unittest
+
+from app.services.usage_log_service import SSEUsageTracker
+
+_FIELDS = ("input_tokens", "output_tokens", "total_tokens", "cached_tokens", "success", "status_code", "error_message")
+
+
+def _escape_key(key: str, rng: random.Random) -> str:
+    """随机把键名中的字母写成 \\uXXXX（json.loads 解码后仍是同一个键）"""
+    return "".join(f"\\u{ord(c):04{rng.choice('xX')}}" if rng.random() < 0.3 else c for c in key)
+
+
+def _encode(obj, rng: random.Random) -> str:
+    if isinstance(obj, dict):
+        items = []
+        for k, v in obj.items():
+            key = _escape_key(k, rng) if rng.random() < 0.2 else k
+            items.append(f'"{key}":{rng.choice(["", " "])}{_encode(v, rng)}')
+        return "{" + ",".join(items) + "}"
+    if isinstance(obj, list):
+        return "[" + ",".join(_encode(v, rng) for v in obj) + "]"
+    return json.dumps(obj, ensure_ascii=rng.random() < 0.5)
+
+
+def _random_usage(rng: random.Random) -> dict:
+    usage = {}
+    for key in ("prompt_tokens", "completion_tokens", "total_tokens", "input_tokens", "output_tokens", "cached_tokens"):
+        if rng.random() < 0.4:
+            usage[key] = rng.choice([0, rng.randint(1, 5000), str(rng.randint(1, 50)), None, "x"])
+    if rng.random() < 0.3:
+        usage[rng.choice(["prompt_tokens_details", "input_tokens_details"])] = {"cached_tokens": rng.randint(0, 100)}
+    return usage
+
+
+def _random_error(rng: random.Random):
+    return rng.choice([
+        None,
+        "boom",
+        {"message": "限流 usage", "code": rng.choice([429, "500", None, "bad"])},
+        {"detail": "x", "status": 503},
+        {},
+    ])
+
+
+def _random_payload(rng: random.Random):
+    kind = rng.random()
+    if kind < 0.6:
+        text = rng.choice(["你好", "usage", '"usage"', "error", "éé", "\\u0061", "plain", "\n"])
+        return {"id": "c", "choices": [{"index": 0, "delta": {"content": text}}]}
+    payload = {}
+    if rng.random() < 0.5:
+        payload["usage"] = _random_usage(rng)
+    if rng.random() < 0.3:
+        payload["response"] = {"usage": _random_usage(rng)}
+        if rng.random() < 0.5:
+            payload["response"]["error"] = _random_error(rng)
+    if rng.random() < 0.2:
+        payload["x_groq"] = {"usage": _random_usage(rng)}
+    if rng.random() < 0.2:
+        payload["error"] = _random_error(rng)
+    if rng.random() < 0.1:
+        return rng.choice([[payload], "usage", 1])
+    return payload
+
+
+def _random_stream(rng: random.Random) -> bytes:
+    lines = []
+    for _ in range(rng.randint(0, 30)):
+        r = rng.random()
+        if r < 0.08:
+            lines.append("data: [DONE]")
+        elif r < 0.12:
+            lines.append('data: {"usage": ')  # 不完整 JSON
+        elif r < 0.16:
+            lines.append("event: response.completed")
+        elif r < 0.2:
+            lines.append(': ping "usage"')
+        else:
+            sep = rng.choice(["data: ", "data:", "  data: "])
+            lines.append(sep + _encode(_random_payload(rng), rng))
+        lines.append("")
+    eol = rng.choice(["\n", "\r\n"])
+    raw = eol.join(lines)
+    if raw and rng.random() < 0.3:
+        raw = raw.rstrip("\r\n")  # 最后一行没有换行符
+    return raw.encode("utf-8")
+
+
+def _run(raw: bytes, cuts, lazy: bool) -> tuple:
+    tracker = SSEUsageTracker(lazy=lazy)
+    prev = 0
+    for cut in cuts + [len(raw)]:
+        tracker.feed(raw[prev:cut])
+        prev = cut
+    tracker.finalize()
+    return tuple(getattr(tracker, name) for name in _FIELDS)
+
+
+class TestLazyUsageTracker(unittest.TestCase):
+    def test_lazy_matches_eager_on_random_streams(self) -> None:
+        rng = random.Random(20261017)
+        for i in range(2000):
+            raw = _random_stream(rng)
+            cuts = sorted(rng.sample(range(len(raw) + 1), min(len(raw) + 1, rng.randint(0, 6))))
+            self.assertEqual(
+                _run(raw, cuts, lazy=True),
+                _run(raw, cuts, lazy=False),
+                msg=f"case={i} raw={raw!r} cuts={cuts}",
+            )
+
+    def test_escaped_usage_key_is_still_parsed(self) -> None:
+        raw = b'data: {"us\\u0061ge": {"prompt_tokens": 3, "completion_tokens": 4}}\n\n'
+        self.assertEqual(_run(raw, [], lazy=True)[:3], (3, 4, 7))
+
+    def test_delta_lines_are_not_json_decoded(self) -> None:
+        tracker = SSEUsageTracker()
+        tracker.feed(b'data: {"choices": [{"delta": {"content": "x"}}]\n\n')  # 非法 JSON，但无需解析
+        tracker.feed(b'data: {"choices": [], "usage": {"prompt_tokens": 1, "completion_tokens": 2}}\n\n')
+        tracker.finalize()
+        self.assertEqual((tracker.input_tokens, tracker.output_tokens, tracker.total_tokens), (1, 2, 3))
+        self.assertTrue(tracker.success)
+
+
+if __name__ == "__main__":
+    unittest.main()